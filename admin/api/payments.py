@@ -20,6 +20,7 @@ from shared.models import (
     Currency, AnalyticsEvent, EventType
 )
 from shared.schemas.admin import ResponseSchema, PaginationSchema
+from shared.services.user_cache import user_cache
 from shared.utils.helpers import format_date, format_currency, format_relative_time
 from ..config import get_admin_settings
 from ..dependencies import get_current_admin, require_permission, get_pagination
@@ -259,10 +260,12 @@ async def refund_payment(
         payment.process_refund(refund_amount, reason)
         
         # Если полный возврат Premium подписки, отключаем её
+        deactivated_telegram_id = None
         if refund_amount >= payment.amount and payment.subscription_plan:
             user = await session.query(User).filter(User.id == payment.user_id).first()
             if user and user.is_premium:
                 user.deactivate_premium()
+                deactivated_telegram_id = user.telegram_id
                 background_tasks.add_task(
                     notify_user_premium_cancelled, 
                     user.telegram_id,
@@ -271,6 +274,9 @@ async def refund_payment(
         
         await session.commit()
         
+        if deactivated_telegram_id:
+            await user_cache.invalidate(deactivated_telegram_id)
+        
         # Запускаем обработку возврата в платёжной системе
         background_tasks.add_task(process_payment_refund, payment_id, refund_amount)
         
@@ -338,6 +344,9 @@ async def mark_payment_completed(
         
         await session.commit()
         
+        if user:
+            await user_cache.invalidate(user.telegram_id)
+        
         logger.info(
             f"Payment manually completed",
             payment_id=payment_id,
@@ -437,6 +446,7 @@ async def grant_premium_manually(
         user.activate_premium(duration_days)
         
         await session.commit()
+        await user_cache.invalidate(user.telegram_id)
         
         # Уведомляем пользователя
         background_tasks.add_task(
@@ -18,6 +18,7 @@ from shared.schemas.base import PaginationSchema
 from shared.models import User, DownloadTask, Payment, AnalyticsEvent
 from shared.services.database import get_db_session
 from shared.services.analytics import AnalyticsService
+from shared.services.user_cache import user_cache
 from ..dependencies import get_current_admin, require_permission, get_analytics_service
 from ..services.user_service import UserService
 from ..utils.export import export_users_to_csv, export_users_to_excel
@@ -217,6 +218,7 @@ async def ban_user(
             )
             
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Записываем в аналитику
             background_tasks.add_task(
@@ -278,6 +280,7 @@ async def unban_user(
             # Разблокируем пользователя
             user.unban_user()
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Записываем в аналитику
             background_tasks.add_task(
@@ -327,6 +330,7 @@ async def grant_premium(
             user.premium_auto_renew = premium_data.auto_renew
             
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Записываем в аналитику
             background_tasks.add_task(
@@ -387,6 +391,7 @@ async def grant_trial(
             # Запускаем trial
             user.start_trial(duration_minutes=trial_data.duration_minutes)
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Записываем в аналитику
             background_tasks.add_task(
@@ -447,6 +452,7 @@ async def delete_user(
             # Мягкое удаление
             user.delete()
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Записываем в аналитику
             await analytics_service.track_user_event(
@@ -554,6 +560,7 @@ async def bulk_ban_users(
     try:
         async with get_db_session() as session:
             banned_count = 0
+            banned_telegram_ids = []
             errors = []
             
             for user_id in user_ids:
@@ -565,6 +572,7 @@ async def bulk_ban_users(
                             duration_days=ban_data.duration_days
                         )
                         banned_count += 1
+                        banned_telegram_ids.append(user.telegram_id)
                         
                         # Аналитика
                         background_tasks.add_task(
@@ -584,6 +592,9 @@ async def bulk_ban_users(
             
             await session.commit()
             
+            for telegram_id in banned_telegram_ids:
+                await user_cache.invalidate(telegram_id)
+            
             logger.info(
                 f"Bulk ban completed",
                 banned_count=banned_count,
@@ -67,6 +67,9 @@ class BotConfig:
         self.trial_duration_minutes = settings.TRIAL_DURATION_MINUTES
         self.trial_requires_subscription = getattr(settings, 'TRIAL_REQUIRES_SUBSCRIPTION', False)
         self.required_subs_enabled = settings.REQUIRED_SUBS_ENABLED
+        self.subscription_cache_ttl = settings.SUBSCRIPTION_CACHE_TTL
+        self.subscription_negative_cache_ttl = settings.SUBSCRIPTION_NEGATIVE_CACHE_TTL
+        self.subscription_check_concurrency = settings.SUBSCRIPTION_CHECK_CONCURRENCY
         self.batch_processing_enabled = settings.BATCH_PROCESSING_ENABLED
         self.premium_system_enabled = settings.PREMIUM_SYSTEM_ENABLED
         
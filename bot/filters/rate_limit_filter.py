@@ -8,12 +8,18 @@ from typing import Union, Dict, Optional
 from datetime import datetime, timedelta
 from aiogram import types
 from aiogram.filters import BaseFilter
-import asyncio
-import redis.asyncio as aioredis
 
 from bot.config import bot_config
 from shared.config.database import get_async_session
 from shared.models import User
+from shared.utils.rate_limiter import RateLimitResult, RedisRateLimitEngine
+from bot.utils.throttle import throttle_registry
+
+# Общий движок лимитов поверх клиента RedisService
+rate_limit_engine = RedisRateLimitEngine()
+
+# Пауза перед повторным обращением к Redis после ошибки
+REDIS_RETRY_DELAY = 30
 
 class RateLimitFilter(BaseFilter):
     """Базовый фильтр для ограничения частоты запросов"""
@@ -33,65 +39,25 @@ class RateLimitFilter(BaseFilter):
         self.rate_limit = rate_limit
         self.window = window
         self.key_suffix = key_suffix
-        self._redis = None
-        self._memory_storage = {}  # Fallback при недоступности Redis
+        self._engine = rate_limit_engine
+        self._redis_retry_at = 0.0
+        self._memory_limiter = throttle_registry.window(f"rate_limit:{key_suffix}", window)  # Fallback при недоступности Redis
     
-    async def _get_redis(self):
-        """Получить подключение к Redis"""
-        if self._redis is None:
+    async def _check_rate_limit(self, key: str, limit: Optional[int] = None) -> RateLimitResult:
+        """Проверка лимита: скользящее окно в Redis, при ошибке - в памяти"""
+        limit = limit or self.rate_limit
+        
+        if time.monotonic() >= self._redis_retry_at:
             try:
-                self._redis = aioredis.from_url(
-                    bot_config.redis_url or "redis://localhost:6379",
-                    decode_responses=True
-                )
-                # Проверяем подключение
-                await self._redis.ping()
+                return await self._engine.sliding_window(key, limit, self.window)
             except Exception:
-                self._redis = False  # Отмечаем как недоступный
-        return self._redis if self._redis is not False else None
-    
-    async def _check_rate_limit_redis(self, key: str) -> bool:
-        """Проверка лимита через Redis"""
-        redis = await self._get_redis()
-        if not redis:
-            return await self._check_rate_limit_memory(key)
-        
-        try:
-            pipe = redis.pipeline()
-            pipe.incr(key)
-            pipe.expire(key, self.window)
-            results = await pipe.execute()
-            
-            count = results[0]
-            return count <= self.rate_limit
-            
-        except Exception:
-            return await self._check_rate_limit_memory(key)
-    
-    async def _check_rate_limit_memory(self, key: str) -> bool:
-        """Fallback проверка через память"""
-        current_time = time.time()
-        
-        if key not in self._memory_storage:
-            self._memory_storage[key] = []
-        
-        # Очистка старых записей
-        self._memory_storage[key] = [
-            timestamp for timestamp in self._memory_storage[key]
-            if current_time - timestamp < self.window
-        ]
-        
-        # Проверка лимита
-        if len(self._memory_storage[key]) >= self.rate_limit:
-            return False
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_DELAY
         
-        # Добавляем новую запись
-        self._memory_storage[key].append(current_time)
-        return True
+        return self._memory_limiter.hit(key, limit)
     
     def _get_rate_limit_key(self, user_id: int) -> str:
         """Генерация ключа для rate limiting"""
-        return f"rate_limit:{user_id}:{self.key_suffix}"
+        return f"{user_id}:{self.key_suffix}"
     
     async def __call__(self, message: types.Message) -> Union[bool, dict]:
         """Проверка rate limit"""
@@ -105,14 +71,15 @@ class RateLimitFilter(BaseFilter):
             return True
         
         key = self._get_rate_limit_key(user_id)
-        allowed = await self._check_rate_limit_redis(key)
+        result = await self._check_rate_limit(key)
         
-        if not allowed:
+        if not result.allowed:
             return False
         
         return {
             'user_id': user_id,
             'rate_limit_passed': True,
+            'rate_limit_remaining': result.remaining,
             'key': key
         }
 
@@ -127,18 +94,7 @@ class SpamFilter(BaseFilter):
         """
         self.max_messages = max_messages
         self.window = window
-        self.user_messages = {}
-    
-    def _clean_old_messages(self, user_id: int):
-        """Очистка старых сообщений"""
-        if user_id not in self.user_messages:
-            return
-        
-        current_time = time.time()
-        self.user_messages[user_id] = [
-            msg_time for msg_time in self.user_messages[user_id]
-            if current_time - msg_time < self.window
-        ]
+        self._limiter = throttle_registry.window("spam", window)
     
     async def __call__(self, message: types.Message) -> Union[bool, dict]:
         """Проверка на спам"""
@@ -151,25 +107,14 @@ class SpamFilter(BaseFilter):
         if bot_config.is_admin(user_id):
             return True
         
-        current_time = time.time()
-        
-        # Инициализация и очистка
-        if user_id not in self.user_messages:
-            self.user_messages[user_id] = []
-        
-        self._clean_old_messages(user_id)
-        
-        # Проверка лимита
-        if len(self.user_messages[user_id]) >= self.max_messages:
+        result = self._limiter.hit(user_id, self.max_messages)
+        if not result.allowed:
             return False
         
-        # Добавляем текущее сообщение
-        self.user_messages[user_id].append(current_time)
-        
         return {
             'user_id': user_id,
             'spam_check_passed': True,
-            'messages_count': len(self.user_messages[user_id])
+            'messages_count': self.max_messages - result.remaining
         }
 
 class DownloadRateLimitFilter(RateLimitFilter):
@@ -200,28 +145,30 @@ class DownloadRateLimitFilter(RateLimitFilter):
                 # Определяем лимиты на основе типа пользователя
                 user_type = user.current_user_type
                 
+                # Лимит передается в проверку, а не сохраняется в
+                # экземпляре: фильтр общий для всех пользователей
                 if user_type == 'premium' or user.is_trial_active:
                     # Premium и Trial: 10 запросов в минуту
-                    self.rate_limit = 10
+                    limit = 10
                 elif user_type == 'free':
                     # Free: 3 запроса в минуту
-                    self.rate_limit = 3
+                    limit = 3
                 else:
                     # По умолчанию
-                    self.rate_limit = 2
+                    limit = 2
                 
                 # Проверяем rate limit
                 key = self._get_rate_limit_key(user_id)
-                allowed = await self._check_rate_limit_redis(key)
+                result = await self._check_rate_limit(key, limit)
                 
-                if not allowed:
+                if not result.allowed:
                     return False
                 
                 return {
                     'user_id': user_id,
                     'user_type': user_type,
                     'rate_limit_passed': True,
-                    'download_rate_limit': self.rate_limit
+                    'download_rate_limit': limit
                 }
                 
         except Exception:
@@ -239,18 +186,7 @@ class CallbackRateLimitFilter(BaseFilter):
         """
         self.rate_limit = rate_limit
         self.window = window
-        self.user_callbacks = {}
-    
-    def _clean_old_callbacks(self, user_id: int):
-        """Очистка старых callback'ов"""
-        if user_id not in self.user_callbacks:
-            return
-        
-        current_time = time.time()
-        self.user_callbacks[user_id] = [
-            cb_time for cb_time in self.user_callbacks[user_id]
-            if current_time - cb_time < self.window
-        ]
+        self._limiter = throttle_registry.window("callback", window)
     
     async def __call__(self, callback: types.CallbackQuery) -> Union[bool, dict]:
         """Проверка rate limit для callback"""
@@ -263,98 +199,62 @@ class CallbackRateLimitFilter(BaseFilter):
         if bot_config.is_admin(user_id):
             return True
         
-        current_time = time.time()
-        
-        # Инициализация и очистка
-        if user_id not in self.user_callbacks:
-            self.user_callbacks[user_id] = []
-        
-        self._clean_old_callbacks(user_id)
-        
-        # Проверка лимита
-        if len(self.user_callbacks[user_id]) >= self.rate_limit:
+        result = self._limiter.hit(user_id, self.rate_limit)
+        if not result.allowed:
             return False
         
-        # Добавляем текущий callback
-        self.user_callbacks[user_id].append(current_time)
-        
         return {
             'user_id': user_id,
             'callback_rate_limit_passed': True,
-            'callbacks_count': len(self.user_callbacks[user_id])
+            'callbacks_count': self.rate_limit - result.remaining
         }
 
 class FloodProtectionFilter(BaseFilter):
     """Усиленная защита от флуда"""
     
     def __init__(self):
-        self.user_activity = {}
         self.warning_threshold = 5  # Предупреждение при 5 сообщениях за 10 сек
         self.ban_threshold = 15     # Временный бан при 15 сообщениях за 30 сек
         self.warning_window = 10    # Окно для предупреждения
         self.ban_window = 30        # Окно для бана
-    
-    def _track_user_activity(self, user_id: int):
-        """Отслеживание активности пользователя"""
-        current_time = time.time()
-        
-        if user_id not in self.user_activity:
-            self.user_activity[user_id] = {
-                'messages': [],
-                'warnings': 0,
-                'temp_ban_until': None
-            }
+        self.ban_duration = 300     # 5 минут бана
         
-        user_data = self.user_activity[user_id]
-        
-        # Очистка старых сообщений
-        user_data['messages'] = [
-            msg_time for msg_time in user_data['messages']
-            if current_time - msg_time < self.ban_window
-        ]
-        
-        # Добавляем текущее сообщение
-        user_data['messages'].append(current_time)
-        
-        return user_data
+        self._warning_limiter = throttle_registry.window("flood_warning", self.warning_window)
+        self._ban_limiter = throttle_registry.window("flood_ban", self.ban_window)
+        self._warnings = throttle_registry.window("flood_warnings", 3600)
+        self._bans = throttle_registry.cooldown("flood_bans")
     
-    def _check_flood_status(self, user_data: dict) -> dict:
-        """Проверка статуса флуда"""
-        current_time = time.time()
-        messages = user_data['messages']
-        
+    def _check_flood_status(self, user_id: int) -> dict:
+        """Учет сообщения и проверка статуса флуда"""
         # Проверка временного бана
-        if user_data.get('temp_ban_until') and current_time < user_data['temp_ban_until']:
+        banned_for = self._bans.blocked_for(user_id)
+        if banned_for:
             return {
                 'status': 'banned',
-                'until': user_data['temp_ban_until'],
+                'until': time.time() + banned_for,
                 'reason': 'temporary_flood_ban'
             }
         
-        # Счетчики для разных окон
-        warning_count = len([
-            t for t in messages 
-            if current_time - t < self.warning_window
-        ])
-        ban_count = len(messages)
-        
-        # Проверка на бан
-        if ban_count >= self.ban_threshold:
-            user_data['temp_ban_until'] = current_time + 300  # 5 минут бана
+        # Порог включает текущее сообщение: срабатывает на ban_threshold-м
+        ban_check = self._ban_limiter.hit(user_id, self.ban_threshold - 1)
+        if not ban_check.allowed:
+            self._bans.block(user_id, self.ban_duration)
+            self._ban_limiter.reset(user_id)
             return {
                 'status': 'flood_detected',
                 'action': 'temporary_ban',
-                'ban_duration': 300,
-                'messages_count': ban_count
+                'ban_duration': self.ban_duration,
+                'messages_count': self.ban_threshold
             }
         
         # Проверка на предупреждение
-        if warning_count >= self.warning_threshold:
-            user_data['warnings'] += 1
+        warning_check = self._warning_limiter.hit(user_id, self.warning_threshold - 1)
+        if not warning_check.allowed:
+            self._warnings.hit(user_id, self.ban_threshold)
             return {
                 'status': 'warning',
-                'warning_count': user_data['warnings'],
-                'messages_count': warning_count
+                'warning_count': self._warnings.count(user_id),
+                'messages_count': self.warning_threshold
             }
         
         return {'status': 'ok'}
@@ -370,9 +270,7 @@ class FloodProtectionFilter(BaseFilter):
         if bot_config.is_admin(user_id):
             return True
         
-        # Отслеживаем активность
-        user_data = self._track_user_activity(user_id)
-        flood_status = self._check_flood_status(user_data)
+        flood_status = self._check_flood_status(user_id)
         
         # Блокируем при флуде или бане
         if flood_status['status'] in ['banned', 'flood_detected']:
@@ -388,8 +286,8 @@ class UserThrottleFilter(BaseFilter):
     """Персональный троттлинг для каждого пользователя"""
     
     def __init__(self):
-        self.user_throttles = {}
         self.default_cooldown = 2  # секунды между сообщениями
+        self._limiter = throttle_registry.cooldown("throttle")
     
     def _get_user_cooldown(self, user_type: str) -> float:
         """Получить кулдаун для типа пользователя"""
@@ -407,7 +305,6 @@ class UserThrottleFilter(BaseFilter):
             return False
         
         user_id = message.from_user.id
-        current_time = time.time()
         
         # Админы без ограничений
         if bot_config.is_admin(user_id):
@@ -423,14 +320,9 @@ class UserThrottleFilter(BaseFilter):
                 user_type = user.current_user_type
                 cooldown = self._get_user_cooldown(user_type)
                 
-                # Проверяем последнее сообщение
-                if user_id in self.user_throttles:
-                    last_message_time = self.user_throttles[user_id]
-                    if current_time - last_message_time < cooldown:
-                        return False
-                
-                # Обновляем время последнего сообщения
-                self.user_throttles[user_id] = current_time
+                # Проверяем паузу после последнего сообщения
+                if not self._limiter.hit(user_id, cooldown).allowed:
+                    return False
                 
                 return {
                     'user_id': user_id,
@@ -441,13 +333,7 @@ class UserThrottleFilter(BaseFilter):
                 
         except Exception:
             # Fallback к базовому кулдауну
-            if user_id in self.user_throttles:
-                last_message_time = self.user_throttles[user_id]
-                if current_time - last_message_time < self.default_cooldown:
-                    return False
-            
-            self.user_throttles[user_id] = current_time
-            return True
+            return self._limiter.hit(user_id, self.default_cooldown).allowed
 
 class BulkActionFilter(BaseFilter):
     """Фильтр для ограничения массовых действий"""
@@ -460,18 +346,7 @@ class BulkActionFilter(BaseFilter):
         """
         self.max_actions = max_actions
         self.window = window
-        self.user_actions = {}
-    
-    def _clean_old_actions(self, user_id: int):
-        """Очистка старых действий"""
-        if user_id not in self.user_actions:
-            return
-        
-        current_time = time.time()
-        self.user_actions[user_id] = [
-            action_time for action_time in self.user_actions[user_id]
-            if current_time - action_time < self.window
-        ]
+        self._limiter = throttle_registry.window("bulk_action", window)
     
     async def __call__(self, message: types.Message) -> Union[bool, dict]:
         """Проверка лимита массовых действий"""
@@ -479,7 +354,6 @@ class BulkActionFilter(BaseFilter):
             return False
         
         user_id = message.from_user.id
-        current_time = time.time()
         
         # Админы и Premium пользователи имеют увеличенные лимиты
         try:
@@ -500,23 +374,14 @@ class BulkActionFilter(BaseFilter):
         except Exception:
             max_actions = self.max_actions
         
-        # Инициализация и очистка
-        if user_id not in self.user_actions:
-            self.user_actions[user_id] = []
-        
-        self._clean_old_actions(user_id)
-        
-        # Проверка лимита
-        if len(self.user_actions[user_id]) >= max_actions:
+        result = self._limiter.hit(user_id, max_actions)
+        if not result.allowed:
             return False
         
-        # Добавляем текущее действие
-        self.user_actions[user_id].append(current_time)
-        
         return {
             'user_id': user_id,
             'bulk_action_passed': True,
-            'actions_count': len(self.user_actions[user_id]),
+            'actions_count': max_actions - result.remaining,
             'max_actions': max_actions
         }
 
@@ -531,37 +396,19 @@ class GlobalRateLimitFilter(BaseFilter):
         """
         self.global_limit = global_limit
         self.window = window
-        self.requests = []
-        self._lock = asyncio.Lock()
-    
-    async def _clean_old_requests(self):
-        """Очистка старых запросов"""
-        current_time = time.time()
-        self.requests = [
-            req_time for req_time in self.requests
-            if current_time - req_time < self.window
-        ]
+        self._limiter = throttle_registry.window("global", window, max_keys=1)
     
     async def __call__(self, message: types.Message) -> Union[bool, dict]:
         """Проверка глобального rate limit"""
-        async with self._lock:
-            current_time = time.time()
-            
-            # Очищаем старые запросы
-            await self._clean_old_requests()
-            
-            # Проверяем глобальный лимит
-            if len(self.requests) >= self.global_limit:
-                return False
-            
-            # Добавляем текущий запрос
-            self.requests.append(current_time)
-            
-            return {
-                'global_rate_limit_passed': True,
-                'current_load': len(self.requests),
-                'max_load': self.global_limit
-            }
+        result = self._limiter.hit("global", self.global_limit)
+        if not result.allowed:
+            return False
+        
+        return {
+            'global_rate_limit_passed': True,
+            'current_load': self.global_limit - result.remaining,
+            'max_load': self.global_limit
+        }
 
 # Предопределенные экземпляры фильтров
 general_rate_limit = RateLimitFilter(rate_limit=10, window=60)
@@ -18,6 +18,7 @@ from sqlalchemy import text, select
 from shared.config.database import get_async_session, DatabaseHealthCheck
 from shared.models import User, DownloadBatch, Payment, RequiredChannel, BroadcastMessage, EventType
 from shared.models.analytics import track_user_event
+from shared.services.user_cache import user_cache
 from shared.config.settings import settings
 from bot.config import bot_config, is_admin
 from bot.utils.user_manager import get_or_create_user
@@ -426,6 +427,7 @@ async def handle_grant_premium(callback: CallbackQuery):
             # Выдаем Premium на 30 дней
             user.activate_premium(duration_days=30)
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Уведомляем пользователя
             try:
@@ -474,6 +476,7 @@ async def handle_ban_user(callback: CallbackQuery):
             
             user.ban_user("Заблокирован администратором")
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             await callback.answer("Пользователь заблокирован", show_alert=True)
             await show_user_details(callback.message, user)
@@ -13,6 +13,7 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
+from sqlalchemy import select
 
 from shared.config.database import get_async_session
 from shared.models import User, DownloadBatch, DownloadTask, EventType, Platform
@@ -23,6 +24,7 @@ from bot.utils.url_extractor import extract_video_urls, validate_url, detect_pla
 from bot.utils.subscription_checker import check_required_subscriptions
 from bot.keyboards.inline import create_batch_options_keyboard, create_batch_selection_keyboard
 from bot.middlewares.rate_limit import rate_limit
+from bot.services.progress_notifier import progress_notifier
 from worker.tasks.batch_tasks import process_batch_download
 
 logger = structlog.get_logger(__name__)
@@ -180,6 +182,10 @@ async def process_single_download(message: Message, url: str, user: User):
             )
             await session.commit()
             
+            download_task_id = await session.scalar(
+                select(DownloadTask.id).where(DownloadTask.batch_id == batch.id)
+            )
+            
             # Аналитика
             await track_download_event(
                 event_type=EventType.DOWNLOAD_STARTED,
@@ -198,6 +204,10 @@ async def process_single_download(message: Message, url: str, user: User):
             f"📊 Batch ID: {batch.batch_id}"
         )
         
+        # Прогресс приходит событиями от worker'а
+        if download_task_id:
+            progress_notifier.track(download_task_id, message.chat.id, processing_msg.message_id)
+        
         logger.info(
             f"Single download started",
             user_id=user.telegram_id,
@@ -16,6 +16,7 @@ from aiogram.fsm.state import StatesGroup, State
 from shared.config.database import get_async_session
 from shared.models import User, Payment, PaymentStatus, PaymentMethod, SubscriptionPlan, Currency, EventType
 from shared.models.analytics import track_payment_event
+from shared.services.user_cache import user_cache
 from shared.config.settings import settings
 from bot.config import bot_config, get_message, MessageType
 from bot.utils.user_manager import get_or_create_user, update_user_activity
@@ -401,6 +402,7 @@ async def handle_successful_payment(message: Message, state: FSMContext):
             user.activate_premium(duration_days=plan["duration_days"])
             
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Аналитика
             await track_payment_event(
@@ -565,6 +567,9 @@ async def check_premium_expiry():
             
             await session.commit()
             
+            for user in expired_users:
+                await user_cache.invalidate(user.telegram_id)
+            
             if expired_users:
                 logger.info(f"Deactivated {len(expired_users)} expired Premium subscriptions")
     
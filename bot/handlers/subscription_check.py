@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
 from aiogram import Router, Bot, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.enums import ChatMemberStatus
 
@@ -18,7 +18,7 @@ from shared.models import User, RequiredChannel, EventType
 from shared.models.analytics import track_user_event
 from bot.config import bot_config, get_message, MessageType
 from bot.utils.user_manager import update_user_activity
-from bot.utils.subscription_checker import SubscriptionChecker
+from bot.utils.subscription_checker import SubscriptionChecker, subscription_store, is_subscribed_member
 
 logger = structlog.get_logger(__name__)
 
@@ -206,6 +206,29 @@ async def handle_subscription_recheck(callback: CallbackQuery):
         await show_subscription_check(callback.message, subscription_status)
 
 
+@router.chat_member()
+async def handle_channel_member_update(update: ChatMemberUpdated):
+    """
+    Обновление статуса подписки по событию из канала
+    
+    Приходит, если бот - администратор канала. Статус пишется в общее
+    хранилище, и следующая проверка обходится без запроса к API.
+    """
+    member = update.new_chat_member
+    if member.user.is_bot:
+        return
+    
+    try:
+        await subscription_store.set_from_chat(
+            user_id=member.user.id,
+            chat_id=update.chat.id,
+            username=update.chat.username,
+            is_subscribed=is_subscribed_member(member)
+        )
+    except Exception as e:
+        logger.error(f"Error handling chat member update: {e}", chat_id=update.chat.id)
+
+
 async def periodic_subscription_cleanup():
     """Периодическая очистка кэша подписок"""
     if subscription_checker:
@@ -15,6 +15,7 @@ from aiogram.fsm.state import StatesGroup, State
 from shared.config.database import get_async_session
 from shared.models import User, EventType
 from shared.models.analytics import track_user_event
+from shared.services.user_cache import user_cache
 from shared.config.settings import settings
 from bot.config import bot_config, get_message, MessageType
 from bot.utils.user_manager import get_or_create_user, update_user_activity
@@ -282,6 +283,7 @@ async def handle_trial_activation(callback: CallbackQuery, state: FSMContext):
             user.start_trial(duration_minutes=settings.TRIAL_DURATION_MINUTES)
             
             await session.commit()
+            await user_cache.invalidate(user.telegram_id)
             
             # Аналитика
             await track_user_event(
@@ -18,18 +18,24 @@ import structlog
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 from aiohttp import web
 
 from shared.config.settings import settings
 from shared.config.database import init_database, close_database
 from shared.config.redis import init_redis, close_redis
+from shared.services.analytics_buffer import analytics_buffer
+from shared.services.user_cache import user_cache
 
 # Импорты бота
 from bot.config import bot_config
 from bot.handlers import setup_handlers
 from bot.middlewares import setup_middlewares
 from bot.services import initialize_services, cleanup_services
+from bot.services.progress_notifier import progress_notifier
+from bot.services.update_queue import UpdateQueue, QueuedRequestHandler
+from bot.services.sharding import ShardRouter, ShardWorker
+from bot.utils.activity_buffer import activity_buffer
 
 # Настройка логирования
 logging.basicConfig(
@@ -72,6 +78,9 @@ class BotApplication:
         self.web_app = None
         self.runner = None
         self.site = None
+        self.update_queue = None
+        self.shard_router = None
+        self.shard_worker = None
         self._shutdown_event = asyncio.Event()
         
     async def initialize(self):
@@ -111,6 +120,7 @@ class BotApplication:
             # 7. Инициализация сервисов
             logger.info("🔧 Initializing services...")
             await initialize_services(self.bot)
+            progress_notifier.start(self.bot)
             
             # 8. Тестовое подключение к Telegram
             bot_info = await self.bot.get_me()
@@ -146,23 +156,46 @@ class BotApplication:
         await self.bot.set_webhook(
             url=webhook_url,
             secret_token=settings.WEBHOOK_SECRET,
-            drop_pending_updates=True
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            # Перезапуск одного из шардов не должен терять обновления
+            drop_pending_updates=not settings.BOT_SHARDS
         )
         
+        # Очередь обновлений: webhook отвечает сразу, обработка - в воркерах
+        self.update_queue = UpdateQueue(self.dp, self.bot)
+        self.update_queue.start()
+        sink = self.update_queue
+        
+        if settings.BOT_SHARDS:
+            # Шардированный режим: webhook любого процесса пишет обновление
+            # в stream шарда, обрабатывает его процесс - владелец шарда
+            self.shard_router = ShardRouter(self.bot)
+            self.shard_worker = ShardWorker(self.update_queue)
+            await self.shard_worker.start()
+            sink = self.shard_router
+        
         # Создание web приложения
         self.web_app = web.Application()
         setup_application(self.web_app, self.dp, bot=self.bot)
 
         # Настройка webhook handler
-        SimpleRequestHandler(
-            dispatcher=self.dp,
-            bot=self.bot,
+        QueuedRequestHandler(
+            sink,
             secret_token=settings.WEBHOOK_SECRET
         ).register(self.web_app, path=settings.WEBHOOK_PATH)
         
         # Добавление health check endpoint
         async def health_check(request):
-            return web.json_response({"status": "ok", "bot": "VideoBot Pro"})
+            return web.json_response({
+                "status": "ok",
+                "bot": "VideoBot Pro",
+                "update_queue": self.update_queue.get_stats(),
+                "sharding": {
+                    "router": self.shard_router.get_stats(),
+                    "worker": self.shard_worker.get_stats()
+                } if self.shard_worker else None
+            })
         
         self.web_app.router.add_get("/health", health_check)
         
@@ -185,21 +218,33 @@ class BotApplication:
         logger.info("🛑 Shutting down VideoBot Pro...")
         
         try:
-            # 1. Остановка webhook если запущен
+            # 1. Остановка webhook если запущен и обработка принятых обновлений
             if self.site:
                 await self.site.stop()
+            if self.shard_worker:
+                await self.shard_worker.stop()
+            if self.update_queue:
+                await self.update_queue.stop()
             if self.runner:
                 await self.runner.cleanup()
             
-            # 2. Удаление webhook
+            # 2. Удаление webhook (в шардированном режиме webhook общий
+            # для всех процессов и остается)
             if self.bot:
-                await self.bot.delete_webhook(drop_pending_updates=True)
+                if not self.shard_worker:
+                    await self.bot.delete_webhook(drop_pending_updates=True)
                 await self.bot.session.close()
             
             # 3. Очистка сервисов
             await cleanup_services()
             
-            # 4. Закрытие подключений
+            # 4. Запись накопленной активности и событий аналитики
+            await activity_buffer.stop()
+            await analytics_buffer.stop()
+            await user_cache.stop()
+            await progress_notifier.stop()
+            
+            # 5. Закрытие подключений
             await close_redis()
             await close_database()
             
@@ -234,6 +279,9 @@ async def main():
             # Webhook режим для production
             await app.start_webhook()
             logger.info("🎯 VideoBot Pro is running in WEBHOOK mode")
+            
+            # Ожидание сигнала завершения
+            await app._shutdown_event.wait()
         else:
             # Polling режим для разработки
             logger.info("🎯 VideoBot Pro is running in POLLING mode")
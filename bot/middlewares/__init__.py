@@ -35,17 +35,20 @@ def setup_middlewares(dp: Dispatcher) -> None:
     """
     # Порядок важен! Middleware выполняются в порядке регистрации
     
-    # Authentication and user management (создаем/получаем пользователя)
-    dp.message.middleware(AuthMiddleware())
-    dp.callback_query.middleware(AuthMiddleware())
+    # Authentication and user management (создаем/получаем пользователя).
+    # Один экземпляр на оба типа событий, чтобы кеш пользователей был общим
+    auth_middleware = AuthMiddleware()
+    dp.message.middleware(auth_middleware)
+    dp.callback_query.middleware(auth_middleware)
     
     # Rate limiting
     dp.message.middleware(RateLimitMiddleware())
     dp.callback_query.middleware(RateLimitMiddleware())
     
     # Analytics (последним для сбора полных данных)
-    dp.message.middleware(AnalyticsMiddleware())
-    dp.callback_query.middleware(AnalyticsMiddleware())
+    analytics_middleware = AnalyticsMiddleware()
+    dp.message.middleware(analytics_middleware)
+    dp.callback_query.middleware(analytics_middleware)
 
     dp.callback_query.middleware(CallbackDebugMiddleware())
 
@@ -11,11 +11,8 @@ from datetime import datetime
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, Update, InlineQuery
 
-from shared.config.database import get_async_session
 from shared.models import User, EventType
-from shared.models.analytics import track_user_event
-
-from shared.services.analytics import AnalyticsService
+from shared.models.analytics import track_user_event, track_system_event
 
 logger = structlog.get_logger(__name__)
 
@@ -75,7 +72,7 @@ class AnalyticsMiddleware(BaseMiddleware):
             self.stats['total_execution_time'] += execution_time
             
             # Отправляем в аналитику
-            await self._track_success(event_info, execution_time)
+            await self._track_success(event_info, execution_time, data.get('user'))
             
             return result
         
@@ -90,7 +87,7 @@ class AnalyticsMiddleware(BaseMiddleware):
             self.stats['errors'][error_type] += 1
             
             # Отправляем в аналитику
-            await self._track_error(event_info, e, execution_time)
+            await self._track_error(event_info, e, execution_time, data.get('user'))
             
             # Пробрасываем ошибку дальше
             raise
@@ -140,67 +137,68 @@ class AnalyticsMiddleware(BaseMiddleware):
         
         return info
     
-    async def _track_success(self, event_info: Dict[str, Any], execution_time: float):
-        """Отправить успешное событие в аналитику"""
+    async def _track_success(self, event_info: Dict[str, Any], execution_time: float,
+                             user: Optional[User] = None):
+        """
+        Отправить успешное событие в аналитику
+        
+        Пользователь берется из данных AuthMiddleware, а событие уходит в
+        буфер аналитики - обработчик не ждет ни запросов, ни commit.
+        """
         try:
-            if not event_info.get('user_id'):
+            if not event_info.get('user_id') or not user:
                 return
             
-            # Получаем пользователя из БД
-            async with get_async_session() as session:
-                user = await session.get(User, event_info['user_id'])
-                if not user:
-                    return
-                
-                # Определяем тип события
-                if event_info.get('command'):
-                    event_type = EventType.COMMAND_USED
-                    event_data = {
-                        'command': event_info['command'],
-                        'execution_time': execution_time
-                    }
-                elif event_info.get('callback_data'):
-                    event_type = EventType.CALLBACK_PRESSED
-                    event_data = {
-                        'callback': event_info['callback_data'],
-                        'execution_time': execution_time
-                    }
-                else:
-                    event_type = EventType.MESSAGE_RECEIVED
-                    event_data = {
-                        'chat_type': event_info.get('chat_type'),
+            # Определяем тип события
+            if event_info.get('command'):
+                event_type = EventType.COMMAND_USED
+                event_data = {
+                    'command': event_info['command'],
+                    'execution_time': execution_time
+                }
+            elif event_info.get('callback_data'):
+                event_type = EventType.CALLBACK_PRESSED
+                event_data = {
+                    'callback': event_info['callback_data'],
+                    'execution_time': execution_time
+                }
+            else:
+                event_type = EventType.MESSAGE_RECEIVED
+                event_data = {
+                    'chat_type': event_info.get('chat_type'),
+                    'execution_time': execution_time
+                }
+            
+            # Отправляем событие
+            await track_user_event(
+                event_type=event_type,
+                user_id=user.id,
+                telegram_user_id=event_info['user_id'],
+                user_type=user.current_user_type,
+                event_data=event_data
+            )
+            
+            # Трекаем производительность
+            if self.track_performance and execution_time > 1.0:
+                await track_system_event(
+                    event_type=EventType.SLOW_REQUEST,
+                    event_data={
+                        'user_id': event_info['user_id'],
+                        'command': event_info.get('command'),
+                        'callback': event_info.get('callback_data'),
                         'execution_time': execution_time
                     }
-                
-                # Отправляем событие
-                await track_user_event(
-                    event_type=event_type,
-                    user_id=user.id,
-                    telegram_user_id=event_info['user_id'],
-                    user_type=user.current_user_type,
-                    event_data=event_data
                 )
-                
-                # Трекаем производительность
-                if self.track_performance and execution_time > 1.0:
-                    await AnalyticsService.track_system_event(
-                        event_type=EventType.SLOW_REQUEST,
-                        event_data={
-                            'user_id': event_info['user_id'],
-                            'command': event_info.get('command'),
-                            'callback': event_info.get('callback_data'),
-                            'execution_time': execution_time
-                        }
-                    )
         
         except Exception as e:
             logger.error(f"Error tracking analytics: {e}")
     
-    async def _track_error(self, event_info: Dict[str, Any], error: Exception, execution_time: float):
+    async def _track_error(self, event_info: Dict[str, Any], error: Exception, execution_time: float,
+                           user: Optional[User] = None):
         """Отправить ошибку в аналитику"""
         try:
             # Отправляем системное событие об ошибке
-            await AnalyticsService.track_system_event(
+            await track_system_event(
                 event_type=EventType.ERROR_OCCURRED,
                 event_data={
                     'user_id': event_info.get('user_id'),
@@ -213,19 +211,16 @@ class AnalyticsMiddleware(BaseMiddleware):
             )
             
             # Если есть пользователь, трекаем и для него
-            if event_info.get('user_id'):
-                async with get_async_session() as session:
-                    user = await session.get(User, event_info['user_id'])
-                    if user:
-                        await track_user_event(
-                            event_type=EventType.ERROR_OCCURRED,
-                            user_id=user.id,
-                            telegram_user_id=event_info['user_id'],
-                            event_data={
-                                'error_type': type(error).__name__,
-                                'error_message': str(error)[:500]
-                            }
-                        )
+            if event_info.get('user_id') and user:
+                await track_user_event(
+                    event_type=EventType.ERROR_OCCURRED,
+                    user_id=user.id,
+                    telegram_user_id=event_info['user_id'],
+                    event_data={
+                        'error_type': type(error).__name__,
+                        'error_message': str(error)[:500]
+                    }
+                )
         
         except Exception as e:
             logger.error(f"Error tracking error analytics: {e}")
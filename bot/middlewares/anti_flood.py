@@ -3,13 +3,14 @@ VideoBot Pro - Anti-Flood Middleware
 Защита от флуда сообщений
 """
 
-import time
 import structlog
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, Update
 
+from bot.utils.throttle import throttle_registry
+
 logger = structlog.get_logger(__name__)
 
 class AntiFloodMiddleware(BaseMiddleware):
@@ -23,7 +24,7 @@ class AntiFloodMiddleware(BaseMiddleware):
         """
         self.threshold = threshold
         self.window = window
-        self.user_messages = {}
+        self._limiter = throttle_registry.window("anti_flood", window)
     
     async def __call__(
         self,
@@ -43,19 +44,7 @@ class AntiFloodMiddleware(BaseMiddleware):
             return await handler(event, data)
         
         # Проверяем флуд
-        current_time = time.time()
-        
-        if user_id not in self.user_messages:
-            self.user_messages[user_id] = []
-        
-        # Очищаем старые сообщения
-        self.user_messages[user_id] = [
-            msg_time for msg_time in self.user_messages[user_id]
-            if current_time - msg_time < self.window
-        ]
-        
-        # Проверяем лимит
-        if len(self.user_messages[user_id]) >= self.threshold:
+        if not self._limiter.hit(user_id, self.threshold).allowed:
             logger.warning(f"Flood detected for user {user_id}")
             if isinstance(event, Message):
                 await event.answer("⚡ Слишком много сообщений. Подождите немного.")
@@ -63,7 +52,4 @@ class AntiFloodMiddleware(BaseMiddleware):
                 await event.answer("⚡ Подождите перед следующим действием", show_alert=True)
             return None
         
-        # Добавляем текущее сообщение
-        self.user_messages[user_id].append(current_time)
-        
         return await handler(event, data)
\ No newline at end of file
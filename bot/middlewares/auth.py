@@ -15,8 +15,10 @@ from sqlalchemy import text, select
 from shared.config.database import get_async_session
 from shared.models import User, EventType
 from shared.models.analytics import track_user_event
+from shared.services.user_cache import user_cache
 from bot.config import bot_config
-from bot.utils.user_manager import get_or_create_user, update_user_activity
+from bot.utils.user_manager import get_or_create_user
+from bot.utils.activity_buffer import activity_buffer
 
 logger = structlog.get_logger(__name__)
 
@@ -37,10 +39,6 @@ class AuthMiddleware(BaseMiddleware):
         """
         self.auto_create_users = auto_create_users
         self.update_user_info = update_user_info
-        
-        # Кеш для часто запрашиваемых пользователей
-        self._user_cache = {}
-        self._cache_ttl = 300  # 5 минут
     
     async def __call__(
         self,
@@ -60,7 +58,8 @@ class AuthMiddleware(BaseMiddleware):
         try:
             user = await self._get_or_create_user(telegram_user)
             
-            # Добавляем пользователя в данные для следующих middleware
+            # Снимок пользователя загружается один раз на update и
+            # используется всеми следующими middleware и обработчиком
             data['user'] = user
             data['telegram_user'] = telegram_user
             
@@ -101,12 +100,10 @@ class AuthMiddleware(BaseMiddleware):
         """Получить или создать пользователя"""
         user_id = telegram_user.id
         
-        # Проверяем кеш
-        cache_key = f"user_{user_id}"
-        if cache_key in self._user_cache:
-            cached_user, cached_time = self._user_cache[cache_key]
-            if (datetime.utcnow() - cached_time).total_seconds() < self._cache_ttl:
-                return cached_user
+        # Проверяем кеш (память процесса, затем Redis)
+        cached_user = await user_cache.get(user_id)
+        if cached_user:
+            return cached_user
         
         try:
             async with get_async_session() as session:
@@ -129,7 +126,7 @@ class AuthMiddleware(BaseMiddleware):
                 
                 # Кешируем пользователя
                 if user:
-                    self._user_cache[cache_key] = (user, datetime.now(timezone.utc))
+                    await user_cache.set(user)
                 
                 return user
         
@@ -159,6 +156,7 @@ class AuthMiddleware(BaseMiddleware):
                     if db_user:
                         db_user.unban_user()
                         await session.commit()
+                        await user_cache.invalidate(user.telegram_id)
                         logger.info(f"Auto-unbanned user", user_id=user.telegram_id)
                         return  # Не блокируем, пользователь разблокирован
             except Exception as e:
@@ -174,7 +172,12 @@ class AuthMiddleware(BaseMiddleware):
             logger.error(f"Error sending ban message: {e}")
     
     async def _update_user_activity(self, event: Update, user: User):
-        """Обновить активность пользователя"""
+        """
+        Обновить активность пользователя
+        
+        Снимок пользователя обновляется сразу, а запись в БД выполняется
+        пакетно буфером активности.
+        """
         try:
             message_id = None
             if isinstance(event, Message):
@@ -182,35 +185,21 @@ class AuthMiddleware(BaseMiddleware):
             elif isinstance(event, CallbackQuery) and event.message:
                 message_id = event.message.message_id
             
-            async with get_async_session() as session:
-                # Получаем свежую копию пользователя из БД
-                result = await session.execute(
-                    select(User).where(User.id == user.id)
-                )
-                fresh_user = result.scalar_one_or_none()
-                if fresh_user:
-                    await update_user_activity(session, fresh_user, message_id)
-                    await session.commit()
+            activity_buffer.record(user, message_id)
         
         except Exception as e:
             logger.error(f"Error updating user activity: {e}", user_id=user.telegram_id)
     
     def clear_cache(self, user_id: Optional[int] = None):
-        """Очистить кеш пользователей"""
+        """Очистить кеш пользователей в памяти процесса"""
         if user_id:
-            cache_key = f"user_{user_id}"
-            self._user_cache.pop(cache_key, None)
+            user_cache.discard_local(user_id)
         else:
-            self._user_cache.clear()
+            user_cache.clear_local()
     
     def get_cached_user(self, user_id: int) -> Optional[User]:
         """Получить пользователя из кеша"""
-        cache_key = f"user_{user_id}"
-        if cache_key in self._user_cache:
-            cached_user, cached_time = self._user_cache[cache_key]
-            if (datetime.now(timezone.utc) - cached_time).total_seconds() < self._cache_ttl:
-                return cached_user
-        return None
+        return user_cache.get_local(user_id)
 
 class RequireAuthMiddleware(BaseMiddleware):
     """Middleware для обязательной аутентификации"""
@@ -5,7 +5,6 @@ VideoBot Pro - Subscription Check Middleware
 
 import structlog
 from typing import Any, Awaitable, Callable, Dict, Optional
-from datetime import datetime, timedelta
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, Update, InlineKeyboardMarkup, InlineKeyboardButton
@@ -24,21 +23,21 @@ class SubscriptionCheckMiddleware(BaseMiddleware):
     def __init__(
         self,
         checker: Optional[SubscriptionChecker] = None,
-        check_interval: int = 300,  # 5 минут
         exempt_commands: Optional[list] = None
     ):
         """
         Инициализация middleware
         
+        Статусы подписок кешируются в Redis самим SubscriptionChecker,
+        поэтому повторные сообщения не требуют запросов к API.
+        
         Args:
             checker: Экземпляр SubscriptionChecker
-            check_interval: Интервал между проверками в секундах
             exempt_commands: Команды, освобожденные от проверки
         """
         self.checker = checker
-        self.check_interval = check_interval
         self.exempt_commands = exempt_commands or ['/start', '/help', '/premium']
-        self._last_check = {}
+        self._skipped = set()
     
     async def __call__(
         self,
@@ -64,28 +63,27 @@ class SubscriptionCheckMiddleware(BaseMiddleware):
             return await handler(event, data)
         
         # Проверяем нужна ли проверка
-        if not await self._should_check_subscription(user_id):
+        user = data.get('user')
+        if not await self._should_check_subscription(user_id, user):
             return await handler(event, data)
         
         # Выполняем проверку подписок
-        is_subscribed = await self._check_user_subscriptions(user_id)
+        is_subscribed = await self._check_user_subscriptions(user_id, user)
         
         if not is_subscribed:
             await self._handle_missing_subscriptions(event)
             return None
         
-        # Обновляем время последней проверки
-        self._last_check[user_id] = datetime.utcnow()
-        
         # Передаем управление следующему handler
         return await handler(event, data)
     
-    async def _should_check_subscription(self, user_id: int) -> bool:
+    async def _should_check_subscription(self, user_id: int, user: Optional[User] = None) -> bool:
         """
         Определить нужна ли проверка подписки
         
         Args:
             user_id: ID пользователя
+            user: Снимок пользователя из AuthMiddleware
             
         Returns:
             True если нужна проверка
@@ -94,35 +92,30 @@ class SubscriptionCheckMiddleware(BaseMiddleware):
         if bot_config.is_admin(user_id):
             return False
         
-        # Проверяем тип пользователя
-        async with get_async_session() as session:
-            user = await session.get(User, user_id)
-            
-            if not user:
-                return True
-            
-            # Premium и admin пользователи освобождены
-            if user.current_user_type in ['premium', 'admin']:
-                return False
-            
-            # Trial пользователи тоже могут быть освобождены
-            if user.current_user_type == 'trial' and not bot_config.trial_requires_subscription:
-                return False
+        if not user:
+            return True
         
-        # Проверяем интервал с последней проверки
-        if user_id in self._last_check:
-            last_check = self._last_check[user_id]
-            if datetime.utcnow() - last_check < timedelta(seconds=self.check_interval):
-                return False
+        # Premium и admin пользователи освобождены
+        if user.current_user_type in ['premium', 'admin']:
+            return False
+        
+        # Trial пользователи тоже могут быть освобождены
+        if user.current_user_type == 'trial' and not bot_config.trial_requires_subscription:
+            return False
+        
+        # Проверка временно отключена для пользователя
+        if user_id in self._skipped:
+            return False
         
         return True
     
-    async def _check_user_subscriptions(self, user_id: int) -> bool:
+    async def _check_user_subscriptions(self, user_id: int, user: Optional[User] = None) -> bool:
         """
         Проверить подписки пользователя
         
         Args:
             user_id: ID пользователя
+            user: Снимок пользователя из AuthMiddleware
             
         Returns:
             True если подписан на все каналы
@@ -135,7 +128,8 @@ class SubscriptionCheckMiddleware(BaseMiddleware):
                 result = await self.checker.check_user_subscriptions(
                     user_id=user_id,
                     session=session,
-                    force_check=False
+                    force_check=False,
+                    user=user
                 )
                 
                 return result.get('all_subscribed', False)
@@ -176,17 +170,15 @@ class SkipSubscriptionCheck:
     def __init__(self, middleware: SubscriptionCheckMiddleware, user_id: int):
         self.middleware = middleware
         self.user_id = user_id
-        self.original_value = None
+        self.was_skipped = False
     
     def __enter__(self):
-        # Временно отмечаем что проверка выполнена
-        self.original_value = self.middleware._last_check.get(self.user_id)
-        self.middleware._last_check[self.user_id] = datetime.utcnow()
+        # Временно отключаем проверку для пользователя
+        self.was_skipped = self.user_id in self.middleware._skipped
+        self.middleware._skipped.add(self.user_id)
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # Восстанавливаем оригинальное значение
-        if self.original_value:
-            self.middleware._last_check[self.user_id] = self.original_value
-        else:
-            self.middleware._last_check.pop(self.user_id, None)
\ No newline at end of file
+        # Восстанавливаем исходное состояние
+        if not self.was_skipped:
+            self.middleware._skipped.discard(self.user_id)
@@ -10,9 +10,7 @@ from datetime import datetime
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, Update
 
-from shared.config.database import get_async_session
-from shared.models import User
-from bot.utils.user_manager import update_user_activity
+from bot.utils.activity_buffer import activity_buffer
 
 logger = structlog.get_logger(__name__)
 
@@ -43,13 +41,8 @@ class UserActivityMiddleware(BaseMiddleware):
                 elif isinstance(event, CallbackQuery) and event.message:
                     message_id = event.message.message_id
                 
-                async with get_async_session() as session:
-                    # Получаем свежую копию пользователя
-                    fresh_user = await session.get(User, user.id)
-                    if fresh_user:
-                        await update_user_activity(session, fresh_user, message_id)
-                        await session.commit()
-                        
+                activity_buffer.record(user, message_id)
+            
             except Exception as e:
                 logger.error(f"Error updating user activity: {e}")
         
@@ -6,6 +6,9 @@ VideoBot Pro - Services Package
 from .download_service import download_service, DownloadService, DownloadError
 from .batch_service import batch_service, BatchService, BatchError
 from .notification_service import notification_service, NotificationService, NotificationType
+from .update_queue import UpdateQueue, QueuedRequestHandler
+from .sharding import ShardRouter, ShardWorker, shard_for
+from .progress_notifier import progress_notifier, ProgressNotifier
 from .analytics_service import (
     analytics_service, 
     AnalyticsService, 
@@ -94,12 +97,19 @@ __all__ = [
     'batch_service', 
     'notification_service',
     'analytics_service',
+    'progress_notifier',
     
     # Классы сервисов
     'DownloadService',
     'BatchService',
     'NotificationService', 
     'AnalyticsService',
+    'UpdateQueue',
+    'QueuedRequestHandler',
+    'ShardRouter',
+    'ShardWorker',
+    'shard_for',
+    'ProgressNotifier',
     
     # Исключения
     'DownloadError',
@@ -8,9 +8,10 @@ from typing import Dict, List, Optional, Any, Union
 from datetime import datetime, timedelta
 from uuid import uuid4
 import asyncio
-from sqlalchemy import text
+from sqlalchemy import text, insert, select, update
 
 from shared.config.database import get_async_session
+from shared.config.settings import settings
 from shared.models import User, DownloadBatch, DownloadTask, Platform, EventType
 from shared.models.analytics import BatchStatus
 from shared.models.analytics import track_download_event
@@ -228,8 +229,7 @@ class BatchService:
                 if not batch:
                     return {'error': 'Batch not found'}
                 
-                # Получаем статистику задач
-                task_stats = await self._get_batch_task_stats(session, batch_id)
+                task_stats = await self._get_task_stats(session, batch)
                 
                 result = {
                     'batch_id': batch.id,
@@ -308,6 +308,17 @@ class BatchService:
                         {'batch_id': batch_id}
                     )
                     
+                    # Все незавершенные URL считаются отмененными
+                    await session.execute(
+                        update(DownloadBatch)
+                        .where(DownloadBatch.id == batch_id)
+                        .values(
+                            cancelled_count=DownloadBatch.total_urls - DownloadBatch.completed_count
+                            - DownloadBatch.failed_count - DownloadBatch.skipped_count,
+                            processing_count=0
+                        )
+                    )
+                    
                     # Обновляем статус batch'а
                     batch.mark_as_cancelled()
                     await session.commit()
@@ -342,29 +353,19 @@ class BatchService:
         """
         try:
             async with get_async_session() as session:
-                query = """
-                    SELECT 
-                        id, batch_id, status, total_urls, delivery_method,
-                        created_at, completed_at, total_size_mb
-                    FROM download_batches 
-                    WHERE user_id = :user_id
-                """
-                params = {'user_id': user_id}
+                query = select(DownloadBatch).where(DownloadBatch.user_id == user_id)
                 
                 if status:
-                    query += " AND status = :status"
-                    params['status'] = status.value
+                    query = query.where(DownloadBatch.status == status.value)
                 
-                query += " ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
-                params.update({'limit': limit, 'offset': offset})
+                query = query.order_by(DownloadBatch.created_at.desc()).limit(limit).offset(offset)
                 
-                result = await session.execute(text(query), params)
-                batches = result.fetchall()
+                result = await session.execute(query)
+                batches = result.scalars().all()
                 
                 batch_list = []
                 for batch in batches:
-                    # Получаем статистику задач для каждого batch'а
-                    task_stats = await self._get_batch_task_stats(session, batch.id)
+                    task_stats = await self._get_task_stats(session, batch)
                     
                     batch_list.append({
                         'batch_id': batch.id,
@@ -406,6 +407,7 @@ class BatchService:
                 batch.error_message = None
                 batch.failed_at = None
                 batch.retry_count = (batch.retry_count or 0) + 1
+                batch.failed_count = 0
                 
                 # Сбрасываем неудачные задачи
                 await session.execute(
@@ -551,11 +553,17 @@ class BatchService:
         user: User,
         urls: List[str]
     ) -> List[DownloadTask]:
-        """Создать задачи для batch'а"""
-        tasks = []
+        """
+        Создать задачи для batch'а
         
-        for i, url in enumerate(urls):
-            task = DownloadTask.create_from_url(
+        Все строки вставляются одним INSERT ... RETURNING вместо
+        session.add() на каждый URL
+        """
+        if not urls:
+            return []
+        
+        rows = [
+            DownloadTask.values_from_url(
                 url=url,
                 user_id=user.id,
                 telegram_user_id=user.telegram_id,
@@ -564,11 +572,23 @@ class BatchService:
                 priority=batch.priority,
                 send_to_chat=batch.send_to_chat
             )
-            
-            session.add(task)
-            tasks.append(task)
+            for i, url in enumerate(urls)
+        ]
+        
+        result = await session.scalars(insert(DownloadTask).returning(DownloadTask), rows)
+        return list(result)
+    
+    async def _get_task_stats(self, session, batch: DownloadBatch) -> Dict[str, Any]:
+        """
+        Статистика задач batch'а
         
-        return tasks
+        Счетчики в строке batch'а ведут worker и отмена задачи в боте, для
+        существующих batch'ей их заполняет миграция. С выключенным
+        BATCH_COUNTERS_ENABLED статистика агрегируется по download_tasks
+        """
+        if settings.BATCH_COUNTERS_ENABLED:
+            return batch.get_task_counters()
+        return await self._get_batch_task_stats(session, batch.id)
     
     async def _get_batch_task_stats(self, session, batch_id: int) -> Dict[str, Any]:
         """Получить статистику задач batch'а"""
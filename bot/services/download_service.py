@@ -22,6 +22,8 @@ from bot.utils.url_extractor import (
 )
 from bot.config import bot_config
 from worker.tasks.__init__ import process_single_download
+from shared.services.progress import get_progress, request_cancel, TERMINAL_STATUSES
+from bot.services.progress_notifier import progress_notifier
 
 logger = structlog.get_logger(__name__)
 
@@ -135,12 +137,14 @@ class DownloadService:
             logger.error(f"Error creating download task: {e}")
             raise DownloadError(f"Не удалось создать задачу: {e}")
     
-    async def start_download(self, task: DownloadTask) -> str:
+    async def start_download(self, task: DownloadTask, message_id: Optional[int] = None) -> str:
         """
         Запустить загрузку
         
         Args:
             task: Задача загрузки
+            message_id: Сообщение в чате пользователя для показа прогресса
+                (без него прогресс придет новым сообщением)
             
         Returns:
             ID Celery задачи
@@ -163,6 +167,9 @@ class DownloadService:
                     db_task.celery_task_id = celery_task.id
                     await session.commit()
             
+            # Прогресс приходит событиями от worker'а
+            progress_notifier.track(task.id, task.telegram_user_id, message_id)
+            
             logger.info(
                 "Download started",
                 task_id=task.id,
@@ -210,6 +217,15 @@ class DownloadService:
                     'user_id': task.telegram_user_id
                 }
                 
+                # Промежуточные этапы worker публикует только в Redis
+                if task.status not in TERMINAL_STATUSES:
+                    progress = await get_progress(task_id)
+                    if progress:
+                        result['status'] = progress['status']
+                        result['stage'] = progress.get('message')
+                        if progress.get('percent') is not None:
+                            result['progress'] = progress['percent']
+                
                 # Дополнительные поля в зависимости от статуса
                 if task.status == TaskStatus.COMPLETED:
                     result.update({
@@ -249,7 +265,8 @@ class DownloadService:
         """
         try:
             async with get_async_session() as session:
-                task = await session.get(DownloadTask, task_id)
+                # Блокировка строки: worker не учтет завершение этой же задачи параллельно
+                task = await session.get(DownloadTask, task_id, with_for_update=True)
                 
                 if not task:
                     return False
@@ -265,6 +282,16 @@ class DownloadService:
                         from worker.celery_app import celery_app
                         celery_app.control.revoke(task.celery_task_id, terminate=True)
                     
+                    # Останавливаем ffmpeg/ffprobe задачи, если worker еще работает
+                    await request_cancel(task_id)
+                    
+                    # Задача пакета учитывается в счетчиках пакета
+                    if task.batch_id:
+                        deltas = {'cancelled_count': 1}
+                        if task.status == 'processing':
+                            deltas['processing_count'] = -1
+                        await session.execute(DownloadBatch.counters_update(task.batch_id, **deltas))
+                    
                     # Обновляем статус
                     task.mark_as_cancelled()
                     await session.commit()
@@ -0,0 +1,222 @@
+"""
+VideoBot Pro - Progress Notifier
+Обновление сообщений с прогрессом загрузки по событиям worker'ов из
+Redis pub/sub, без опроса базы данных
+"""
+
+import json
+import time
+import asyncio
+import structlog
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot
+
+from shared.config.settings import settings
+from shared.services.redis import get_redis_client
+from shared.services.progress import PROGRESS_CHANNEL, TERMINAL_STATUSES
+from bot.utils.message_builder import build_download_progress_message
+
+logger = structlog.get_logger(__name__)
+
+STATUS_TEXTS = {
+    'pending': "⏳ В очереди...",
+    'downloading': "⬇️ Скачиваю...",
+    'processing': "⚙️ Обрабатываю видео...",
+    'uploading': "☁️ Загружаю в облако...",
+    'completed': "✅ Готово!",
+    'failed': "❌ Не удалось скачать видео",
+    'cancelled': "🚫 Загрузка отменена"
+}
+
+class _TrackedMessage:
+    """Сообщение с прогрессом одной задачи"""
+
+    __slots__ = ('chat_id', 'message_id', 'text', 'last_edit', 'last_event', 'pending', 'flush')
+
+    def __init__(self, chat_id: int, message_id: Optional[int]):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text: Optional[str] = None
+        self.last_edit = 0.0
+        self.last_event = time.monotonic()
+        self.pending: Optional[Dict[str, Any]] = None
+        self.flush: Optional[asyncio.Task] = None
+
+class ProgressNotifier:
+    """
+    Подписчик на события прогресса задач
+
+    Процесс бота, запустивший загрузку, регистрирует сообщение через
+    track(); события других задач игнорируются. Сообщение редактируется
+    не чаще edit_interval: промежуточные события между правками
+    схлопываются в последнее, завершающее событие показывается сразу.
+    """
+
+    def __init__(self, edit_interval: float = None, max_tracked: int = 10000):
+        self.edit_interval = edit_interval if edit_interval is not None else settings.PROGRESS_EDIT_INTERVAL
+        self.max_tracked = max_tracked
+        self.bot: Optional[Bot] = None
+
+        self._tracked: Dict[str, _TrackedMessage] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._edits: Set[asyncio.Task] = set()
+
+        self.stats = {'events': 0, 'edits': 0, 'coalesced': 0, 'errors': 0}
+
+    def start(self, bot: Bot):
+        """Запуск подписчика в текущем event loop"""
+        self.bot = bot
+        if self._listener and not self._listener.done():
+            return
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("Progress notifier started", edit_interval=self.edit_interval)
+
+    def track(self, task_id: Any, chat_id: int, message_id: Optional[int] = None):
+        """
+        Показывать прогресс задачи в чате
+
+        Args:
+            task_id: ID задачи загрузки
+            chat_id: Чат пользователя
+            message_id: Сообщение для правки (без него будет отправлено новое)
+        """
+        self._evict()
+        self._tracked[str(task_id)] = _TrackedMessage(chat_id, message_id)
+
+    def untrack(self, task_id: Any):
+        tracked = self._tracked.pop(str(task_id), None)
+        if tracked and tracked.flush:
+            tracked.flush.cancel()
+
+    def _evict(self):
+        """Удаление задач без событий дольше TTL состояния и сверх лимита"""
+        cutoff = time.monotonic() - settings.PROGRESS_STATE_TTL
+        stale = [key for key, tracked in self._tracked.items() if tracked.last_event < cutoff]
+        for key in stale:
+            self.untrack(key)
+
+        while len(self._tracked) >= self.max_tracked:
+            self.untrack(next(iter(self._tracked)))
+
+    async def _listen(self):
+        """Прием событий прогресса от worker'ов"""
+        while True:
+            pubsub = None
+            try:
+                redis_client = await get_redis_client()
+                pubsub = await redis_client.create_subscription(PROGRESS_CHANNEL)
+                if not pubsub:
+                    await asyncio.sleep(5)
+                    continue
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if not message or message.get('type') != 'message':
+                        continue
+
+                    try:
+                        event = json.loads(message['data'])
+                    except (json.JSONDecodeError, TypeError):
+                        continue
+
+                    if isinstance(event, dict):
+                        self._handle(event)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Progress subscription error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if pubsub:
+                    try:
+                        await pubsub.unsubscribe()
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    def _handle(self, event: Dict[str, Any]):
+        key = str(event.get('task_id'))
+        tracked = self._tracked.get(key)
+        if tracked is None:
+            return
+
+        self.stats['events'] += 1
+        tracked.last_event = time.monotonic()
+
+        if event.get('status') in TERMINAL_STATUSES:
+            # Итог показываем сразу, отложенная правка больше не нужна
+            self._tracked.pop(key, None)
+            if tracked.flush:
+                tracked.flush.cancel()
+            task = asyncio.create_task(self._edit(tracked, event))
+            self._edits.add(task)
+            task.add_done_callback(self._edits.discard)
+            return
+
+        if tracked.pending is not None:
+            self.stats['coalesced'] += 1
+        tracked.pending = event
+
+        if tracked.flush is None or tracked.flush.done():
+            delay = max(0.0, tracked.last_edit + self.edit_interval - time.monotonic())
+            tracked.flush = asyncio.create_task(self._flush(tracked, delay))
+
+    async def _flush(self, tracked: _TrackedMessage, delay: float):
+        if delay:
+            await asyncio.sleep(delay)
+        event, tracked.pending = tracked.pending, None
+        if event is not None:
+            await self._edit(tracked, event)
+
+    async def _edit(self, tracked: _TrackedMessage, event: Dict[str, Any]):
+        text = self.render(event)
+        if text == tracked.text or not self.bot:
+            return
+
+        tracked.last_edit = time.monotonic()
+        try:
+            if tracked.message_id is None:
+                message = await self.bot.send_message(tracked.chat_id, text)
+                tracked.message_id = message.message_id
+            else:
+                await self.bot.edit_message_text(
+                    text, chat_id=tracked.chat_id, message_id=tracked.message_id
+                )
+            tracked.text = text
+            self.stats['edits'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.debug(f"Progress message update failed: {e}", chat_id=tracked.chat_id)
+
+    @staticmethod
+    def render(event: Dict[str, Any]) -> str:
+        """Текст сообщения для события прогресса"""
+        status = event.get('status')
+        text = STATUS_TEXTS.get(status, STATUS_TEXTS['processing'])
+
+        percent = event.get('percent')
+        if percent is not None and status not in TERMINAL_STATUSES:
+            text += "\n" + build_download_progress_message(float(percent))
+
+        return text
+
+    async def stop(self):
+        """Остановка подписчика"""
+        task, self._listener = self._listener, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        for key in list(self._tracked):
+            self.untrack(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'tracked': len(self._tracked)}
+
+# Глобальный экземпляр
+progress_notifier = ProgressNotifier()
@@ -0,0 +1,207 @@
+"""
+VideoBot Pro - Shard Replay Harness
+Локальная проверка шардирования: несколько процессов-воркеров, поток
+записанных обновлений через ShardRouter, проверка порядка внутри чатов
+и распределения чатов по процессам
+
+Нужен Redis из REDIS_URL; ключи создаются в отдельном пространстве имен
+и удаляются после прогона. Обработчики бота не вызываются - воркеры
+только записывают факт обработки.
+
+    python -m bot.services.shard_replay updates.jsonl --workers 3 --shards 16
+    python -m bot.services.shard_replay --generate 5000 --chats 300 --kill-after 2000 --join-after 3000
+
+Файл - JSON обновлений Telegram по одному на строку (как их присылает
+webhook или возвращает getUpdates).
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import multiprocessing
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from aiogram import Bot
+from aiogram.types import Update
+
+from shared.services.redis import get_redis_client
+from .update_queue import UpdateQueue, update_key
+from .sharding import ShardRouter, ShardWorker
+
+# Bot нужен только как контекст для Update, запросов к API нет
+REPLAY_TOKEN = "123456:replay-harness"
+LEASE_TTL = 3
+
+class RecordingDispatcher:
+    """Замена Dispatcher: имитация работы и запись факта обработки"""
+
+    def __init__(self, log_key: str, worker_id: str, delay: float):
+        self.log_key = log_key
+        self.worker_id = worker_id
+        self.delay = delay
+
+    async def feed_update(self, bot: Bot, update: Update):
+        await asyncio.sleep(random.uniform(0, self.delay))
+        redis_client = await get_redis_client()
+        await redis_client.list_push(self.log_key, {
+            'worker': self.worker_id,
+            'key': str(update_key(update)),
+            'update_id': update.update_id
+        }, left=False)
+
+def _run_worker(namespace: str, shards: int, log_key: str, delay: float):
+    """Процесс-воркер: владеет частью шардов до завершения процесса"""
+    async def main():
+        worker_id = f"replay-{os.getpid()}"
+        queue = UpdateQueue(RecordingDispatcher(log_key, worker_id, delay), Bot(REPLAY_TOKEN), workers=16)
+        queue.start()
+        worker = ShardWorker(queue, shards=shards, namespace=namespace,
+                             worker_id=worker_id, lease_ttl=LEASE_TTL)
+        await worker.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+def generate_updates(count: int, chats: int) -> List[Dict[str, Any]]:
+    """Синтетические текстовые сообщения от chats пользователей"""
+    now = int(time.time())
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = random.randint(1, chats)
+        updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': now,
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"},
+                'text': f"message {update_id}"
+            }
+        })
+    return updates
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def analyze(updates: List[Update], records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Сверка журнала обработки с исходным потоком
+
+    Повторная обработка допустима только после аварийной остановки
+    воркера; нарушение порядка - ошибка.
+    """
+    position = {update.update_id: i for i, update in enumerate(updates)}
+    expected_keys = {str(update_key(update)) for update in updates}
+
+    seen = set()
+    duplicates = 0
+    last_position: Dict[str, int] = {}
+    order_violations = 0
+    workers_per_key = defaultdict(set)
+    per_worker = defaultdict(int)
+
+    for record in records:
+        update_id, key = record['update_id'], record['key']
+        per_worker[record['worker']] += 1
+        workers_per_key[key].add(record['worker'])
+
+        if update_id in seen:
+            duplicates += 1
+            continue
+        seen.add(update_id)
+
+        if position[update_id] < last_position.get(key, -1):
+            order_violations += 1
+        last_position[key] = position[update_id]
+
+    return {
+        'updates': len(updates),
+        'processed': len(seen),
+        'missing': len(updates) - len(seen),
+        'duplicates': duplicates,
+        'order_violations': order_violations,
+        'chats': len(expected_keys),
+        'chats_moved_between_workers': sum(1 for workers in workers_per_key.values() if len(workers) > 1),
+        'per_worker': dict(per_worker)
+    }
+
+async def replay(args) -> int:
+    namespace = f"shard_replay:{uuid.uuid4().hex[:8]}"
+    log_key = f"{namespace}:log"
+    context = multiprocessing.get_context("spawn")
+
+    def spawn():
+        process = context.Process(
+            target=_run_worker, args=(namespace, args.shards, log_key, args.delay), daemon=True
+        )
+        process.start()
+        return process
+
+    bot = Bot(REPLAY_TOKEN)
+    raw = load_updates(args.file) if args.file else generate_updates(args.generate, args.chats)
+    updates = [Update.model_validate(data, context={"bot": bot}) for data in raw]
+
+    processes = [spawn() for _ in range(args.workers)]
+    # Даем воркерам разобрать шарды
+    await asyncio.sleep(LEASE_TTL)
+
+    redis_client = await get_redis_client()
+    router = ShardRouter(bot, shards=args.shards, namespace=namespace, max_stream=10 ** 9)
+
+    try:
+        started = time.monotonic()
+        for i, update in enumerate(updates):
+            while not await router.put(update):
+                await asyncio.sleep(0.1)
+            if args.kill_after and i == args.kill_after:
+                print(f"Killing worker pid={processes[0].pid} after {i} updates")
+                processes[0].kill()
+            if args.join_after and i == args.join_after:
+                processes.append(spawn())
+                print(f"Started worker pid={processes[-1].pid} after {i} updates")
+
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            if await redis_client.list_length(log_key) >= len(updates):
+                # Короткая пауза, чтобы увидеть возможные повторы
+                await asyncio.sleep(LEASE_TTL)
+                break
+            await asyncio.sleep(0.5)
+
+        report = analyze(updates, await redis_client.list_range(log_key))
+        report['seconds'] = round(time.monotonic() - started, 2)
+        print(json.dumps(report, indent=2))
+        return 0 if not report['missing'] and not report['order_violations'] else 1
+
+    finally:
+        for process in processes:
+            process.kill()
+        keys = [log_key, router.members]
+        keys += [router.stream(shard) for shard in range(args.shards)]
+        keys += [router.lease(shard) for shard in range(args.shards)]
+        for key in keys:
+            await redis_client.delete(key)
+        await bot.session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay updates through sharded bot workers")
+    parser.add_argument('file', nargs='?', help="JSONL file with Telegram updates")
+    parser.add_argument('--generate', type=int, default=2000, help="Synthetic updates if no file given")
+    parser.add_argument('--chats', type=int, default=200, help="Chats for synthetic updates")
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--delay', type=float, default=0.005, help="Max simulated handler time (seconds)")
+    parser.add_argument('--kill-after', type=int, default=0, help="Kill one worker after N updates")
+    parser.add_argument('--join-after', type=int, default=0, help="Start one more worker after N updates")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    sys.exit(asyncio.run(replay(parser.parse_args())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+VideoBot Pro - Bot Sharding
+Распределение обновлений между процессами бота: маршрутизация по хэшу
+чата в Redis streams и распределение шардов между процессами через
+аренды в Redis
+"""
+
+import os
+import math
+import time
+import uuid
+import zlib
+import socket
+import asyncio
+import structlog
+from functools import partial
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from aiogram.types import Update
+
+from shared.config.settings import settings
+from shared.services.redis import get_redis_client
+from .update_queue import UpdateQueue, update_key
+
+logger = structlog.get_logger(__name__)
+
+GROUP = "bot-shards"
+
+# Продление и снятие аренды только ее владельцем
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Обработанная запись больше не нужна: XLEN stream равен необработанному остатку
+ACK_SCRIPT = """
+redis.call('XACK', KEYS[1], ARGV[1], ARGV[2])
+return redis.call('XDEL', KEYS[1], ARGV[2])
+"""
+
+def shard_for(key: Hashable, shards: int) -> int:
+    """Номер шарда ключа (одинаков во всех процессах, в отличие от hash())"""
+    return zlib.crc32(str(key).encode()) % shards
+
+class _ShardKeys:
+    """Имена ключей Redis для набора шардов"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.members = f"{namespace}:members"
+
+    def stream(self, shard: int) -> str:
+        return f"{self.namespace}:updates:{shard}"
+
+    def lease(self, shard: int) -> str:
+        return f"{self.namespace}:lease:{shard}"
+
+    def member(self, worker_id: str) -> str:
+        return f"{self.namespace}:member:{worker_id}"
+
+class ShardRouter(_ShardKeys):
+    """
+    Маршрутизатор обновлений
+
+    Записывает обновление в stream шарда, выбранного по хэшу чата. Все
+    обновления чата попадают в один stream, поэтому их порядок сохраняется,
+    а чат всегда обрабатывается процессом, владеющим шардом, - его
+    локальные кэши остаются горячими. Используется как приемник для
+    QueuedRequestHandler вместо UpdateQueue.
+    """
+
+    def __init__(self, bot, shards: int = None, namespace: str = "bot_shards",
+                 max_stream: int = None):
+        super().__init__(namespace)
+        self.bot = bot
+        self.shards = shards or settings.BOT_SHARDS
+        self.max_stream = max_stream or settings.BOT_SHARD_STREAM_MAX
+        self._lengths: Dict[int, Tuple[float, int]] = {}
+        self.stats = {'routed': 0, 'rejected': 0, 'errors': 0}
+
+    async def put(self, update: Update) -> bool:
+        """Запись обновления в stream шарда (False - шард перегружен)"""
+        shard = shard_for(update_key(update), self.shards)
+        redis_client = await get_redis_client()
+
+        if await self._is_full(redis_client, shard):
+            self.stats['rejected'] += 1
+            return False
+
+        entry_id = await redis_client.stream_add(
+            self.stream(shard), {'update': update.model_dump_json(exclude_unset=True)}
+        )
+        if entry_id is None:
+            self.stats['errors'] += 1
+            return False
+
+        self.stats['routed'] += 1
+        return True
+
+    async def _is_full(self, redis_client, shard: int) -> bool:
+        # Длина stream проверяется не чаще раза в секунду на шард
+        checked_at, length = self._lengths.get(shard, (0.0, 0))
+        now = time.monotonic()
+        if now - checked_at >= 1.0:
+            length = await redis_client.stream_length(self.stream(shard))
+            self._lengths[shard] = (now, length)
+        return length >= self.max_stream
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'shards': self.shards}
+
+class ShardConsumer:
+    """
+    Чтение stream одного шарда в локальную UpdateQueue
+
+    Имя потребителя в группе привязано к шарду, а не к процессу: новый
+    владелец шарда сначала перечитывает неподтвержденные записи прежнего
+    владельца (ID "0"), затем переходит к новым (">"). Запись
+    подтверждается и удаляется после обработки.
+    """
+
+    def __init__(self, keys: _ShardKeys, shard: int, queue: UpdateQueue):
+        self.keys = keys
+        self.shard = shard
+        self.queue = queue
+        self.stream = keys.stream(shard)
+        self.consumer = f"shard-{shard}"
+
+        self._in_flight: Set[str] = set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name=f"shard-consumer-{self.shard}")
+
+    async def _run(self):
+        redis_client = await get_redis_client()
+        while not await redis_client.stream_create_group(self.stream, GROUP):
+            await asyncio.sleep(1)
+
+        last_id = "0"
+        while True:
+            pending_mode = last_id != ">"
+            entries = await redis_client.stream_read_group(
+                self.stream, GROUP, self.consumer, last_id=last_id,
+                count=100, block=None if pending_mode else 1000
+            )
+            if entries is None:
+                await asyncio.sleep(1)
+                continue
+
+            if pending_mode:
+                last_id = entries[-1][0] if entries else ">"
+
+            for entry_id, fields in entries:
+                await self._dispatch(entry_id, fields)
+
+    async def _dispatch(self, entry_id: str, fields: Optional[Dict[str, str]]):
+        data = (fields or {}).get('update')
+        try:
+            update = Update.model_validate_json(data, context={"bot": self.queue.bot})
+        except Exception as e:
+            logger.error(f"Broken update in shard stream: {e}", shard=self.shard, entry_id=entry_id)
+            await self._ack(entry_id)
+            return
+
+        self._in_flight.add(entry_id)
+        self._drained.clear()
+
+        # Локальная очередь заполнена - ждем, записи остаются в stream
+        try:
+            while not await self.queue.put(update, on_done=partial(self._ack, entry_id)):
+                pass
+        except asyncio.CancelledError:
+            # Запись не попала в очередь и останется неподтвержденной
+            self._forget(entry_id)
+            raise
+
+    async def _ack(self, entry_id: str):
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.eval_script(ACK_SCRIPT, [self.stream], [GROUP, entry_id])
+        finally:
+            self._forget(entry_id)
+
+    def _forget(self, entry_id: str):
+        self._in_flight.discard(entry_id)
+        if not self._in_flight:
+            self._drained.set()
+
+    async def wait_drained(self, timeout: float) -> bool:
+        """Ожидание обработки прочитанных записей (True - все обработаны)"""
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self):
+        """Прекращение чтения (прочитанные записи дообрабатываются)"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+class ShardWorker(_ShardKeys):
+    """
+    Участник шардированной группы процессов
+
+    Каждые lease_ttl/3 секунд процесс продлевает свою отметку участника,
+    считает живых участников и держит ceil(shards / участники) аренд
+    шардов: продлевает свои, лишние отдает, недостающие захватывает.
+    Лишний шард отдается после обработки уже прочитанных записей, поэтому
+    при штатной перебалансировке порядок внутри чата не нарушается. Если
+    процесс умер, его аренды истекают, и шарды забирают остальные;
+    неподтвержденные записи при этом обрабатываются повторно.
+    """
+
+    def __init__(self, queue: UpdateQueue, shards: int = None, namespace: str = "bot_shards",
+                 worker_id: str = None, lease_ttl: int = None):
+        super().__init__(namespace)
+        self.queue = queue
+        self.shards = shards or settings.BOT_SHARDS
+        self.lease_ttl = lease_ttl or settings.BOT_SHARD_LEASE_TTL
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._owned: Dict[int, ShardConsumer] = {}
+        self._releasing: Dict[int, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'members': 0, 'target': 0, 'claimed': 0, 'released': 0, 'lost': 0}
+
+    async def start(self):
+        """Регистрация в группе и запуск координации"""
+        await self._rebalance()
+        self._task = asyncio.create_task(self._coordinate(), name="shard-coordinator")
+        logger.info("Shard worker started", worker_id=self.worker_id, shards=sorted(self._owned))
+
+    async def _coordinate(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self._rebalance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Shard rebalance failed: {e}", worker_id=self.worker_id)
+
+    async def _rebalance(self):
+        redis_client = await get_redis_client()
+
+        # 1. Отметка участника и список живых
+        await redis_client.set(self.member(self.worker_id), time.time(), expire=self.lease_ttl)
+        await redis_client.set_add(self.members, self.worker_id)
+
+        members = [str(member) for member in await redis_client.set_members(self.members)]
+        heartbeats = await redis_client.get_many([self.member(member) for member in members])
+        alive = {member for member, beat in zip(members, heartbeats) if beat is not None}
+        alive.add(self.worker_id)
+
+        dead = [member for member in members if member not in alive]
+        if dead:
+            await redis_client.set_remove(self.members, *dead)
+
+        target = math.ceil(self.shards / len(alive))
+        self.stats['members'] = len(alive)
+        self.stats['target'] = target
+
+        # 2. Продление своих аренд (отдаваемые продлевает _release)
+        for shard in list(self._owned):
+            if not await self._renew(redis_client, shard):
+                # Аренду перехватили: прекращаем чтение без ожидания
+                self.stats['lost'] += 1
+                logger.warning("Shard lease lost", shard=shard, worker_id=self.worker_id)
+                await self._owned.pop(shard).stop()
+
+        # 3. Лишние шарды - другим участникам
+        while len(self._owned) > target:
+            shard = max(self._owned)
+            consumer = self._owned.pop(shard)
+            self._releasing[shard] = asyncio.create_task(self._release(shard, consumer))
+
+        # 4. Захват свободных шардов
+        if len(self._owned) < target:
+            start = shard_for(self.worker_id, self.shards)
+            for offset in range(self.shards):
+                shard = (start + offset) % self.shards
+                if shard in self._owned or shard in self._releasing:
+                    continue
+                if await redis_client.set_if_not_exists(self.lease(shard), self.worker_id, expire=self.lease_ttl):
+                    consumer = ShardConsumer(self, shard, self.queue)
+                    consumer.start()
+                    self._owned[shard] = consumer
+                    self.stats['claimed'] += 1
+                    if len(self._owned) >= target:
+                        break
+
+    async def _renew(self, redis_client, shard: int) -> bool:
+        renewed = await redis_client.eval_script(
+            RENEW_LEASE_SCRIPT, [self.lease(shard)], [self.worker_id, self.lease_ttl * 1000]
+        )
+        return bool(renewed)
+
+    async def _release(self, shard: int, consumer: ShardConsumer, drain_timeout: float = 60.0):
+        """Передача шарда: дообработка прочитанных записей и снятие аренды"""
+        try:
+            await consumer.stop()
+            redis_client = await get_redis_client()
+
+            # Пока записи дообрабатываются, аренда должна оставаться за нами
+            deadline = time.monotonic() + drain_timeout
+            while not await consumer.wait_drained(self.lease_ttl / 3):
+                if time.monotonic() >= deadline:
+                    logger.warning("Shard not drained before release", shard=shard)
+                    break
+                await self._renew(redis_client, shard)
+
+            await redis_client.eval_script(RELEASE_LEASE_SCRIPT, [self.lease(shard)], [self.worker_id])
+            self.stats['released'] += 1
+        finally:
+            self._releasing.pop(shard, None)
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """Выход из группы с передачей всех шардов"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        owned, self._owned = self._owned, {}
+        for shard, consumer in owned.items():
+            self._releasing[shard] = asyncio.create_task(self._release(shard, consumer, drain_timeout))
+        await asyncio.gather(*self._releasing.values(), return_exceptions=True)
+
+        redis_client = await get_redis_client()
+        await redis_client.delete(self.member(self.worker_id))
+        await redis_client.set_remove(self.members, self.worker_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'worker_id': self.worker_id,
+            'owned': sorted(self._owned),
+            'releasing': sorted(self._releasing)
+        }
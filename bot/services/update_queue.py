@@ -0,0 +1,256 @@
+"""
+VideoBot Pro - Update Queue
+Прием webhook обновлений с немедленным ответом Telegram и их обработка
+пулом воркеров с сохранением порядка внутри чата
+"""
+
+import hmac
+import time
+import asyncio
+import structlog
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from shared.config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+DoneCallback = Callable[[], Awaitable[Any]]
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def update_key(update: Update) -> Hashable:
+    """
+    Ключ упорядочивания обновления
+
+    Обновления одного чата (а без чата - одного пользователя)
+    обрабатываются строго по очереди. Служебные обновления без чата и
+    пользователя независимы друг от друга.
+    """
+    event = update.event
+    chat = getattr(event, 'chat', None)
+    if chat is None:
+        # CallbackQuery: чат берется из сообщения с кнопкой
+        chat = getattr(getattr(event, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, 'from_user', None) or getattr(event, 'user', None)
+    if user is not None:
+        return user.id
+
+    return ('update', update.update_id)
+
+class UpdateQueue:
+    """
+    Ограниченная очередь обновлений
+
+    У каждого ключа (чата) своя очередь; в общей очереди готовности ключ
+    находится не больше одного раза, и пока воркер обрабатывает его
+    обновление, следующее обновление того же ключа не начнется. Разные
+    чаты обрабатываются параллельно, медленный обработчик задерживает
+    только свой чат. При заполнении очереди put() ждет свободного места,
+    а по таймауту отказывает - Telegram повторит доставку позже.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int = None,
+                 max_size: int = None, put_timeout: float = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = workers or settings.UPDATE_QUEUE_WORKERS
+        self.max_size = max_size or settings.UPDATE_QUEUE_MAX_SIZE
+        self.put_timeout = put_timeout if put_timeout is not None else settings.UPDATE_QUEUE_PUT_TIMEOUT
+
+        self._pending: Dict[Hashable, Deque[Tuple[float, Update, Optional[DoneCallback]]]] = {}
+        self._scheduled: Set[Hashable] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._space: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._size = 0
+        self._in_flight = 0
+
+        self.stats = {
+            'received': 0, 'processed': 0, 'failed': 0, 'rejected': 0,
+            'backpressure_waits': 0, 'lag_avg': 0.0, 'lag_max': 0.0, 'lag_last': 0.0
+        }
+
+    @property
+    def depth(self) -> int:
+        """Количество обновлений, ожидающих обработки"""
+        return self._size
+
+    def start(self):
+        """Запуск воркеров в текущем event loop"""
+        if self._tasks:
+            return
+
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("Update queue started", workers=self.workers, max_size=self.max_size)
+
+    async def put(self, update: Update, on_done: Optional[DoneCallback] = None) -> bool:
+        """
+        Постановка обновления в очередь
+
+        Args:
+            update: Обновление Telegram
+            on_done: Вызывается после обработки (в том числе неудачной)
+
+        Returns:
+            False, если места не появилось за put_timeout
+        """
+        if self._size >= self.max_size:
+            self.stats['backpressure_waits'] += 1
+            try:
+                await asyncio.wait_for(self._wait_for_space(), timeout=self.put_timeout)
+            except asyncio.TimeoutError:
+                self.stats['rejected'] += 1
+                if self.stats['rejected'] % 100 == 1:
+                    logger.warning("Update queue full, rejecting updates",
+                                   depth=self._size, rejected=self.stats['rejected'])
+                return False
+
+        key = update_key(update)
+        queue = self._pending.get(key)
+        if queue is None:
+            queue = self._pending[key] = deque()
+        queue.append((time.monotonic(), update, on_done))
+
+        self._size += 1
+        self._idle.clear()
+        self.stats['received'] += 1
+
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+
+        return True
+
+    async def _wait_for_space(self):
+        while self._size >= self.max_size:
+            self._space.clear()
+            await self._space.wait()
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            enqueued_at, update, on_done = queue.popleft()
+
+            self._size -= 1
+            self._in_flight += 1
+            self._space.set()
+            self._record_lag(time.monotonic() - enqueued_at)
+
+            cancelled = False
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.stats['processed'] += 1
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Error processing update: {e}", update_id=update.update_id, exc_info=True)
+            finally:
+                # Прерванное обновление не подтверждаем: его доставят повторно
+                if on_done and not cancelled:
+                    try:
+                        await on_done()
+                    except Exception as e:
+                        logger.error(f"Update done callback failed: {e}", update_id=update.update_id)
+
+                self._in_flight -= 1
+                if queue:
+                    # Следующее обновление чата - в конец очереди готовности,
+                    # чтобы активный чат не занимал воркер целиком
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    self._scheduled.discard(key)
+
+                if not self._size and not self._in_flight:
+                    self._idle.set()
+
+    def _record_lag(self, lag: float):
+        self.stats['lag_last'] = lag
+        self.stats['lag_max'] = max(self.stats['lag_max'], lag)
+        # Экспоненциальное среднее по последним ~100 обновлениям
+        self.stats['lag_avg'] += (lag - self.stats['lag_avg']) * 0.01
+
+    async def stop(self, timeout: float = 30.0):
+        """Обработка оставшихся обновлений и остановка воркеров"""
+        if not self._tasks:
+            return
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Update queue not drained on shutdown",
+                           depth=self._size, in_flight=self._in_flight)
+
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди: глубина, обработка и задержка (секунды)"""
+        return {
+            **self.stats,
+            'depth': self._size,
+            'max_size': self.max_size,
+            'in_flight': self._in_flight,
+            'active_chats': len(self._pending),
+            'workers': len(self._tasks)
+        }
+
+class QueuedRequestHandler:
+    """
+    Webhook обработчик: проверка секрета, разбор обновления и постановка
+    в UpdateQueue. Telegram получает ответ до запуска обработчиков.
+    """
+
+    def __init__(self, queue, secret_token: Optional[str] = None):
+        """
+        Args:
+            queue: UpdateQueue или ShardRouter - объект с атрибутом bot
+                и методом put(update)
+            secret_token: Секрет webhook
+        """
+        self.queue = queue
+        self.secret_token = secret_token
+
+    def register(self, app: web.Application, path: str):
+        app.router.add_post(path, self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token:
+            token = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(token, self.secret_token):
+                return web.Response(status=401, text="Unauthorized")
+
+        bot = self.queue.bot
+        try:
+            data = await request.json(loads=bot.session.json_loads)
+            update = Update.model_validate(data, context={"bot": bot})
+        except Exception as e:
+            logger.warning(f"Invalid webhook update: {e}")
+            return web.Response(status=400, text="Bad Request")
+
+        if not await self.queue.put(update):
+            # Не 2xx: Telegram повторит доставку позже
+            return web.Response(status=503, text="Busy")
+
+        return web.Response()
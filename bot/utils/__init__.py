@@ -19,8 +19,15 @@ from .user_manager import (
     reset_user_daily_limits
 )
 
+from .activity_buffer import UserActivityBuffer, activity_buffer
+from .throttle import ThrottleRegistry, throttle_registry
+
 from .subscription_checker import (
     SubscriptionChecker,
+    SubscriptionStatusStore,
+    TelegramApiLimiter,
+    subscription_store,
+    telegram_api_limiter,
     check_required_subscriptions,
     is_user_subscribed_to_required_channels
 )
@@ -62,9 +69,17 @@ __all__ = [
     'check_user_limits',
     'increment_user_downloads',
     'reset_user_daily_limits',
+    'UserActivityBuffer',
+    'activity_buffer',
+    'ThrottleRegistry',
+    'throttle_registry',
     
     # Subscription checking
     'SubscriptionChecker',
+    'SubscriptionStatusStore',
+    'TelegramApiLimiter',
+    'subscription_store',
+    'telegram_api_limiter',
     'check_required_subscriptions',
     'is_user_subscribed_to_required_channels',
     
@@ -0,0 +1,206 @@
+"""
+VideoBot Pro - User Activity Buffer
+Накопление отметок активности пользователей и их запись одним
+пакетным UPDATE вместо commit на каждое сообщение
+"""
+
+import asyncio
+import structlog
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import BigInteger, DateTime, Integer, bindparam, case, func, update
+
+from shared.config.database import get_async_session
+from shared.models import User
+
+logger = structlog.get_logger(__name__)
+
+# Пауза, после которой следующее сообщение считается новой сессией
+SESSION_GAP = timedelta(hours=1)
+
+class UserActivityBuffer:
+    """
+    Буфер активности пользователей
+
+    На пользователя хранится одна запись: время последней активности,
+    ID последнего сообщения и число начатых сессий. Повторные сообщения
+    между сбросами только перезаписывают запись. Раз в flush_interval
+    секунд все записи уходят одним executemany UPDATE по первичному ключу.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_pending: int = 10000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.stats = {'recorded': 0, 'written': 0, 'flushes': 0, 'failed_flushes': 0}
+
+    def _bind_loop(self):
+        """Привязка примитивов синхронизации к текущему event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def _ensure_started(self):
+        self._bind_loop()
+        if not self._flush_task or self._flush_task.done():
+            self._flush_task = self._loop.create_task(self._flush_loop())
+
+    def record(self, user: User, message_id: Optional[int] = None):
+        """
+        Отметка активности пользователя
+
+        Объект пользователя обновляется сразу, поэтому следующие
+        middleware и обработчики видят актуальные значения, а запись в БД
+        откладывается до ближайшего сброса.
+
+        Args:
+            user: Снимок пользователя из data['user']
+            message_id: ID последнего сообщения
+        """
+        self._ensure_started()
+
+        now = datetime.now(timezone.utc)
+        new_session = not user.last_session_at or (now - user.last_session_at) > SESSION_GAP
+
+        user.last_active_at = now
+        if message_id:
+            user.last_message_id = message_id
+        if new_session:
+            user.session_count = (user.session_count or 0) + 1
+            user.last_session_at = now
+
+        entry = self._pending.get(user.id)
+        if entry is None:
+            entry = self._pending[user.id] = {
+                'b_id': user.id,
+                'b_active_at': now,
+                'b_message_id': None,
+                'b_sessions': 0,
+                'b_session_at': None,
+            }
+
+        entry['b_active_at'] = now
+        if message_id:
+            entry['b_message_id'] = message_id
+        if new_session:
+            entry['b_sessions'] += 1
+            entry['b_session_at'] = now
+
+        self.stats['recorded'] += 1
+
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"User activity flush loop error: {e}")
+
+    async def flush(self) -> int:
+        """
+        Запись накопленной активности
+
+        Returns:
+            Количество обновленных пользователей
+        """
+        if not self._pending:
+            return 0
+
+        self._bind_loop()
+
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            rows = list(pending.values())
+
+            try:
+                await self._write(rows)
+            except BaseException as e:
+                # Возвращаем записи, не затирая более свежие отметки
+                for user_id, entry in pending.items():
+                    newer = self._pending.get(user_id)
+                    if newer:
+                        newer['b_sessions'] += entry['b_sessions']
+                        newer['b_message_id'] = newer['b_message_id'] or entry['b_message_id']
+                        newer['b_session_at'] = newer['b_session_at'] or entry['b_session_at']
+                    else:
+                        self._pending[user_id] = entry
+
+                if not isinstance(e, asyncio.CancelledError):
+                    self.stats['failed_flushes'] += 1
+                    logger.error(f"Error flushing user activity: {e}", users=len(rows))
+                    return 0
+                raise
+
+            self.stats['written'] += len(rows)
+            self.stats['flushes'] += 1
+            return len(rows)
+
+    async def _write(self, rows):
+        """Пакетный UPDATE по первичному ключу"""
+        table = User.__table__
+        active_at = bindparam('b_active_at', type_=DateTime(timezone=True))
+        sessions = bindparam('b_sessions', type_=Integer)
+
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('b_id', type_=BigInteger))
+            .values(
+                last_active_at=func.greatest(func.coalesce(table.c.last_active_at, active_at), active_at),
+                last_message_id=func.coalesce(
+                    bindparam('b_message_id', type_=BigInteger), table.c.last_message_id
+                ),
+                session_count=func.coalesce(table.c.session_count, 0) + sessions,
+                last_session_at=case(
+                    (sessions > 0, bindparam('b_session_at', type_=DateTime(timezone=True))),
+                    else_=table.c.last_session_at
+                )
+            )
+        )
+
+        async with get_async_session() as session:
+            await session.execute(stmt, rows)
+            await session.commit()
+
+    async def stop(self):
+        """Остановка фонового сброса и запись оставшихся отметок"""
+        task, self._flush_task = self._flush_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing user activity on shutdown: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика буфера"""
+        return {**self.stats, 'pending': len(self._pending)}
+
+# Глобальный экземпляр буфера
+activity_buffer = UserActivityBuffer()
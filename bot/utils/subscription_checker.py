@@ -3,39 +3,194 @@ VideoBot Pro - Subscription Checker
 Утилиты для проверки подписок на обязательные каналы
 """
 
+import time
+import asyncio
 import structlog
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
 from aiogram import Bot
 from aiogram.enums import ChatMemberStatus
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from shared.models import User, RequiredChannel
+from shared.services.redis import get_redis_client
 from bot.config import bot_config
 
 logger = structlog.get_logger(__name__)
 
+# Статусы, которые считаются подпиской
+SUBSCRIBED_STATUSES = {
+    ChatMemberStatus.CREATOR,
+    ChatMemberStatus.ADMINISTRATOR,
+    ChatMemberStatus.MEMBER,
+    ChatMemberStatus.RESTRICTED
+}
+
+
+def is_subscribed_member(member) -> bool:
+    """Считается ли участник подписчиком канала"""
+    if member.status == ChatMemberStatus.RESTRICTED:
+        # Ограниченный пользователь мог уже покинуть канал
+        return bool(getattr(member, 'is_member', True))
+    return member.status in SUBSCRIBED_STATUSES
+
+
+class TelegramApiLimiter:
+    """
+    Ограничитель вызовов Bot API
+    
+    Ограничивает число одновременных запросов и их темп (Telegram
+    начинает отвечать 429 примерно после 30 запросов в секунду на бота),
+    а при TelegramRetryAfter приостанавливает все вызовы на указанное
+    время и повторяет запрос.
+    """
+    
+    def __init__(self, concurrency: int = 10, rate_per_second: float = 25.0, max_retries: int = 2):
+        self.concurrency = concurrency
+        self.interval = 1.0 / rate_per_second
+        self.max_retries = max_retries
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+    
+    async def _wait_slot(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._blocked_until)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+    
+    async def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнить вызов API с учетом ограничений"""
+        async with self._get_semaphore():
+            for attempt in range(self.max_retries + 1):
+                await self._wait_slot()
+                try:
+                    return await func(*args, **kwargs)
+                except TelegramRetryAfter as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + e.retry_after)
+                    logger.warning("Telegram API flood control", retry_after=e.retry_after)
+
+
+class SubscriptionStatusStore:
+    """
+    Статусы подписок в Redis
+    
+    Один ключ на пару (канал, пользователь): положительный результат
+    хранится долго, отрицательный - коротко, чтобы только что
+    подписавшийся пользователь быстро проходил проверку. Обновления
+    chat_member перезаписывают статус сразу.
+    """
+    
+    KEY_PREFIX = "subscription"
+    
+    def __init__(self, positive_ttl: int = None, negative_ttl: int = None):
+        self.positive_ttl = positive_ttl or bot_config.subscription_cache_ttl
+        self.negative_ttl = negative_ttl or bot_config.subscription_negative_cache_ttl
+    
+    def _key(self, channel_id: str, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{channel_id}:{user_id}"
+    
+    async def get_many(self, user_id: int, channel_ids: List[str]) -> Dict[str, Optional[bool]]:
+        """
+        Статусы пользователя по списку каналов одним запросом
+        
+        Returns:
+            {channel_id: True/False или None если статус неизвестен}
+        """
+        try:
+            redis_client = await get_redis_client()
+            values = await redis_client.get_many([self._key(ch, user_id) for ch in channel_ids])
+        except Exception as e:
+            logger.warning(f"Subscription store lookup failed: {e}", user_id=user_id)
+            values = [None] * len(channel_ids)
+        
+        return {
+            channel_id: (None if value is None else bool(value))
+            for channel_id, value in zip(channel_ids, values)
+        }
+    
+    async def set(self, user_id: int, channel_id: str, is_subscribed: bool):
+        """Сохранить статус подписки"""
+        ttl = self.positive_ttl if is_subscribed else self.negative_ttl
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.set(self._key(channel_id, user_id), 1 if is_subscribed else 0, expire=ttl)
+        except Exception as e:
+            logger.warning(f"Subscription store update failed: {e}", user_id=user_id)
+    
+    async def set_from_chat(self, user_id: int, chat_id: int, username: Optional[str], is_subscribed: bool):
+        """
+        Сохранить статус из обновления chat_member
+        
+        Каналы в настройках задаются либо числовым ID, либо @username,
+        поэтому статус пишется под обоими идентификаторами.
+        """
+        channel_ids = [str(chat_id)]
+        if username:
+            channel_ids.append(f"@{username}")
+        
+        await asyncio.gather(*(self.set(user_id, ch, is_subscribed) for ch in channel_ids))
+    
+    async def forget(self, user_id: int, channel_ids: Iterable[str]):
+        """Удалить сохраненные статусы пользователя"""
+        try:
+            redis_client = await get_redis_client()
+            for channel_id in channel_ids:
+                await redis_client.delete(self._key(channel_id, user_id))
+        except Exception as e:
+            logger.warning(f"Subscription store cleanup failed: {e}", user_id=user_id)
+
+
+# Глобальные экземпляры
+telegram_api_limiter = TelegramApiLimiter(concurrency=bot_config.subscription_check_concurrency)
+subscription_store = SubscriptionStatusStore()
+
 
 class SubscriptionChecker:
     """Класс для проверки подписок пользователей"""
     
-    def __init__(self, bot: Bot):
+    def __init__(
+        self,
+        bot: Bot,
+        store: Optional[SubscriptionStatusStore] = None,
+        limiter: Optional[TelegramApiLimiter] = None
+    ):
         """
         Инициализация проверяльщика подписок
         
         Args:
             bot: Экземпляр бота
+            store: Хранилище статусов подписок
+            limiter: Ограничитель вызовов Bot API
         """
         self.bot = bot
-        self._cache = {}
-        self._cache_ttl = 300  # 5 минут
+        self.store = store or subscription_store
+        self.limiter = limiter or telegram_api_limiter
+        
+        # Список обязательных каналов меняется редко
+        self._channels: Optional[List[RequiredChannel]] = None
+        self._channels_loaded_at = 0.0
+        self._channels_ttl = 60
     
     async def check_user_subscriptions(
         self,
         user_id: int,
         session: AsyncSession,
-        force_check: bool = False
+        force_check: bool = False,
+        user: Optional[User] = None
     ) -> Dict:
         """
         Проверить подписки пользователя на все обязательные каналы
@@ -44,20 +199,16 @@ class SubscriptionChecker:
             user_id: Telegram ID пользователя
             session: Сессия базы данных
             force_check: Принудительная проверка без кеша
+            user: Уже загруженный пользователь (например, из AuthMiddleware)
             
         Returns:
             Результаты проверки
         """
-        # Проверяем кеш
-        cache_key = f"subs_{user_id}"
-        if not force_check and cache_key in self._cache:
-            cached = self._cache[cache_key]
-            if datetime.utcnow() - cached['timestamp'] < timedelta(seconds=self._cache_ttl):
-                return cached['result']
-        
         try:
             # Получаем пользователя
-            user = await session.get(User, user_id)
+            if user is None:
+                result = await session.execute(select(User).where(User.telegram_id == user_id))
+                user = result.scalar_one_or_none()
             if not user:
                 return {
                     'error': 'user_not_found',
@@ -68,29 +219,24 @@ class SubscriptionChecker:
             channels = await self._get_required_channels(session, user.current_user_type)
             
             if not channels:
-                result = {
+                return {
                     'all_subscribed': True,
                     'subscribed_channels': [],
                     'missing_channels': [],
                     'error_channels': [],
-                    'channels_checked': 0
+                    'channels_checked': 0,
+                    'api_calls': 0
                 }
-            else:
-                # Проверяем каждый канал
-                result = await self._check_channels(user_id, channels)
-                
-                # Обновляем данные пользователя
+            
+            result = await self._check_channels(user_id, channels, force_check)
+            
+            # Обновляем данные пользователя, только если были свежие данные из API
+            if result['api_calls'] and user in session:
                 user.subscribed_channels = result['subscribed_channels']
                 user.last_subscription_check = datetime.utcnow()
                 user.subscription_check_passed = result['all_subscribed']
                 await session.flush()
             
-            # Кешируем результат
-            self._cache[cache_key] = {
-                'timestamp': datetime.utcnow(),
-                'result': result
-            }
-            
             return result
         
         except Exception as e:
@@ -119,69 +265,83 @@ class SubscriptionChecker:
         if user_type in ['premium', 'admin']:
             return []
         
-        # Получаем активные каналы
-        result = await session.execute(
-            """
-            SELECT * FROM required_channels 
-            WHERE is_active = true 
-            AND (required_for_free = true OR required_for_trial = true)
-            ORDER BY priority DESC
-            """
-        )
-        
-        channels = result.scalars().all()
+        if self._channels is None or time.monotonic() - self._channels_loaded_at > self._channels_ttl:
+            result = await session.execute(
+                select(RequiredChannel)
+                .where(
+                    RequiredChannel.is_active == True,
+                    RequiredChannel.is_required == True,
+                    RequiredChannel.check_enabled == True
+                )
+                .order_by(RequiredChannel.priority, RequiredChannel.order_index)
+            )
+            self._channels = list(result.scalars().all())
+            self._channels_loaded_at = time.monotonic()
         
-        # Фильтруем по типу пользователя
-        if user_type == 'trial':
-            return [ch for ch in channels if ch.required_for_trial]
-        else:  # free
-            return [ch for ch in channels if ch.required_for_free]
+        # Фильтруем по типу пользователя и расписанию канала
+        return [ch for ch in self._channels if ch.applies_to_user_type(user_type)]
     
     async def _check_channels(
         self,
         user_id: int,
-        channels: List[RequiredChannel]
+        channels: List[RequiredChannel],
+        force_check: bool = False
     ) -> Dict:
         """
         Проверить подписки на список каналов
         
+        Статусы берутся из хранилища, в API уходят только неизвестные -
+        все одновременно, в пределах ограничений Bot API.
+        
         Args:
             user_id: Telegram ID пользователя
             channels: Список каналов для проверки
+            force_check: Игнорировать сохраненные статусы
             
         Returns:
             Результаты проверки
         """
-        subscribed = []
-        missing = []
-        errors = []
+        channel_ids = [channel.channel_id for channel in channels]
+        if force_check:
+            statuses = dict.fromkeys(channel_ids)
+        else:
+            statuses = await self.store.get_many(user_id, channel_ids)
         
-        for channel in channels:
-            try:
-                is_subscribed = await self._check_channel_subscription(
-                    user_id,
-                    channel.channel_id
-                )
-                
-                if is_subscribed:
-                    subscribed.append(channel.channel_id)
-                else:
-                    missing.append({
-                        'channel_id': channel.channel_id,
-                        'channel_name': channel.channel_name,
-                        'url': channel.telegram_url or f"https://t.me/{channel.channel_id.replace('@', '')}",
-                        'invite_link': channel.invite_link
-                    })
-            
-            except Exception as e:
+        to_fetch = [channel for channel in channels if statuses.get(channel.channel_id) is None]
+        fetched = await asyncio.gather(
+            *(self._check_channel_subscription(user_id, channel.channel_id) for channel in to_fetch),
+            return_exceptions=True
+        )
+        
+        errors = []
+        for channel, outcome in zip(to_fetch, fetched):
+            if isinstance(outcome, Exception):
                 logger.warning(
-                    f"Error checking channel {channel.channel_id}: {e}",
+                    f"Error checking channel {channel.channel_id}: {outcome}",
                     user_id=user_id
                 )
                 errors.append({
                     'channel_id': channel.channel_id,
                     'channel_name': channel.channel_name,
-                    'error': str(e)
+                    'error': str(outcome)
+                })
+                continue
+            
+            statuses[channel.channel_id] = outcome
+            await self.store.set(user_id, channel.channel_id, outcome)
+        
+        subscribed = []
+        missing = []
+        for channel in channels:
+            status = statuses.get(channel.channel_id)
+            if status:
+                subscribed.append(channel.channel_id)
+            elif status is False:
+                missing.append({
+                    'channel_id': channel.channel_id,
+                    'channel_name': channel.channel_name,
+                    'url': channel.telegram_url or f"https://t.me/{channel.channel_id.replace('@', '')}",
+                    'invite_link': channel.invite_link
                 })
         
         return {
@@ -189,7 +349,8 @@ class SubscriptionChecker:
             'subscribed_channels': subscribed,
             'missing_channels': missing,
             'error_channels': errors,
-            'channels_checked': len(channels)
+            'channels_checked': len(channels),
+            'api_calls': len(to_fetch)
         }
     
     async def _check_channel_subscription(
@@ -208,17 +369,8 @@ class SubscriptionChecker:
             True если подписан
         """
         try:
-            member = await self.bot.get_chat_member(channel_id, user_id)
-            
-            # Статусы, которые считаются подписанными
-            subscribed_statuses = [
-                ChatMemberStatus.CREATOR,
-                ChatMemberStatus.ADMINISTRATOR,
-                ChatMemberStatus.MEMBER,
-                ChatMemberStatus.RESTRICTED
-            ]
-            
-            return member.status in subscribed_statuses
+            member = await self.limiter.call(self.bot.get_chat_member, channel_id, user_id)
+            return is_subscribed_member(member)
         
         except TelegramBadRequest as e:
             error_text = str(e).lower()
@@ -243,13 +395,15 @@ class SubscriptionChecker:
         Очистить кеш проверок
         
         Args:
-            user_id: ID пользователя для очистки (None - очистить весь)
+            user_id: ID пользователя для очистки (None - обновить список каналов)
         """
-        if user_id:
-            cache_key = f"subs_{user_id}"
-            self._cache.pop(cache_key, None)
-        else:
-            self._cache.clear()
+        if user_id is None:
+            self._channels = None
+            return
+        
+        if self._channels:
+            channel_ids = [channel.channel_id for channel in self._channels]
+            asyncio.get_running_loop().create_task(self.store.forget(user_id, channel_ids))
     
     async def get_channel_members_count(self, channel_id: str) -> Optional[int]:
         """
@@ -413,16 +567,15 @@ async def bulk_check_subscriptions(
     Returns:
         Словарь {user_id: is_subscribed}
     """
-    results = {}
-    
-    for user_id in user_ids:
+    async def check(user_id: int) -> bool:
         try:
-            member = await bot.get_chat_member(channel_id, user_id)
-            results[user_id] = member.status not in [
-                ChatMemberStatus.LEFT,
-                ChatMemberStatus.KICKED
-            ]
+            member = await telegram_api_limiter.call(bot.get_chat_member, channel_id, user_id)
         except Exception:
-            results[user_id] = False
+            return False
+        
+        is_subscribed = is_subscribed_member(member)
+        await subscription_store.set(user_id, channel_id, is_subscribed)
+        return is_subscribed
     
-    return results
\ No newline at end of file
+    statuses = await asyncio.gather(*(check(user_id) for user_id in user_ids))
+    return dict(zip(user_ids, statuses))
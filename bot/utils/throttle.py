@@ -0,0 +1,258 @@
+"""
+VideoBot Pro - Throttle Registry
+Общий реестр ограничителей частоты в памяти процесса бота: счетчики
+фиксированного размера на пользователя и вытеснение неактивных записей
+"""
+
+import time
+import structlog
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+from shared.utils.rate_limiter import RateLimitResult
+
+logger = structlog.get_logger(__name__)
+
+# Сколько устаревших записей вытесняется за одно обращение. Каждое
+# обращение добавляет не больше одной записи, поэтому очистка успевает
+# за ростом, а стоимость вызова остается постоянной.
+EVICT_BATCH = 4
+
+class _BoundedLimiter(ABC):
+    """Основа ограничителя: записи в порядке последнего обращения"""
+
+    def __init__(self, name: str, max_keys: int):
+        self.name = name
+        self.max_keys = max_keys
+        self._entries: 'OrderedDict[Hashable, list]' = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _touch(self, key: Hashable, entry: list):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+    def _evict(self, now: float):
+        """Удаление неактивных записей с начала очереди"""
+        entries = self._entries
+        for _ in range(EVICT_BATCH):
+            if not entries:
+                return
+            key = next(iter(entries))
+            if not self._is_idle(entries[key], now):
+                break
+            del entries[key]
+            self.evicted += 1
+
+        # Жесткий предел памяти: вытесняем самые давние записи
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+            self.evicted += 1
+
+    @abstractmethod
+    def _is_idle(self, entry: list, now: float) -> bool:
+        """Запись больше не влияет на решения и может быть вытеснена"""
+        pass
+
+    def reset(self, key: Hashable):
+        """Сброс состояния ключа"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+class WindowLimiter(_BoundedLimiter):
+    """
+    Скользящее окно на двух счетчиках
+
+    На ключ хранятся номер текущего окна и счетчики текущего и
+    предыдущего окна - тот же алгоритм, что и в Lua скрипте
+    RedisRateLimitEngine. Запись вытесняется, когда ее счетчики полностью
+    вышли из окна (2 * window без обращений), так что вытеснение не
+    влияет на решения.
+    """
+
+    def __init__(self, name: str, window: float, max_keys: int):
+        super().__init__(name, max_keys)
+        self.window = window
+
+    def _is_idle(self, entry: list, now: float) -> bool:
+        return entry[3] <= now - 2 * self.window
+
+    def _state(self, key: Hashable, now: float):
+        index = int(now // self.window)
+        entry = self._entries.get(key)
+        if entry is None:
+            return index, 0, 0
+        if entry[0] == index:
+            return index, entry[1], entry[2]
+        # Окно сменилось: текущий счетчик становится предыдущим
+        return index, 0, entry[1] if entry[0] == index - 1 else 0
+
+    def _estimate(self, index: int, cur: int, prev: int, now: float) -> float:
+        elapsed = now - index * self.window
+        return prev * (self.window - elapsed) / self.window + cur
+
+    def hit(self, key: Hashable, limit: int, cost: int = 1,
+            now: Optional[float] = None) -> RateLimitResult:
+        """
+        Учет запроса
+
+        Args:
+            key: Ключ клиента (обычно ID пользователя)
+            limit: Лимит запросов в окне
+            cost: Стоимость запроса
+        """
+        now = time.monotonic() if now is None else now
+        index, cur, prev = self._state(key, now)
+        estimated = self._estimate(index, cur, prev, now)
+
+        if estimated + cost <= limit:
+            self._touch(key, [index, cur + cost, prev, now])
+            self._evict(now)
+            return RateLimitResult(
+                allowed=True, limit=limit, remaining=int(limit - estimated - cost)
+            )
+
+        elapsed = now - index * self.window
+        if cur + cost <= limit:
+            wait = self.window - (limit - cur - cost) * self.window / prev - elapsed
+        else:
+            carry = max(0.0, self.window - (limit - cost) * self.window / cur) if cur else 0.0
+            wait = self.window - elapsed + carry
+
+        return RateLimitResult(
+            allowed=False,
+            limit=limit,
+            remaining=max(0, int(limit - estimated)),
+            retry_after=max(0.0, wait)
+        )
+
+    def count(self, key: Hashable, now: Optional[float] = None) -> int:
+        """Оценка числа запросов в окне (без учета нового)"""
+        now = time.monotonic() if now is None else now
+        return int(round(self._estimate(*self._state(key, now), now)))
+
+class CooldownLimiter(_BoundedLimiter):
+    """
+    Пауза между запросами и временные блокировки
+
+    На ключ хранится только момент, с которого следующий запрос
+    разрешен. После этого момента запись не нужна и вытесняется.
+    """
+
+    def _is_idle(self, entry: list, now: float) -> bool:
+        return entry[0] <= now
+
+    def hit(self, key: Hashable, interval: float, now: Optional[float] = None) -> RateLimitResult:
+        """Запрос разрешен, если с предыдущего прошло не меньше interval секунд"""
+        now = time.monotonic() if now is None else now
+        entry = self._entries.get(key)
+
+        if entry is not None and entry[0] > now:
+            return RateLimitResult(allowed=False, limit=1, remaining=0, retry_after=entry[0] - now)
+
+        if interval > 0:
+            self._touch(key, [now + interval])
+        self._evict(now)
+        return RateLimitResult(allowed=True, limit=1, remaining=0)
+
+    def block(self, key: Hashable, duration: float, now: Optional[float] = None):
+        """Блокировка ключа на duration секунд"""
+        now = time.monotonic() if now is None else now
+        self._touch(key, [now + duration])
+        self._evict(now)
+
+    def blocked_for(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Сколько секунд осталось до конца блокировки"""
+        now = time.monotonic() if now is None else now
+        entry = self._entries.get(key)
+        return max(0.0, entry[0] - now) if entry else 0.0
+
+class ThrottleRegistry:
+    """
+    Реестр ограничителей бота
+
+    Фильтры и middleware получают ограничители здесь, а не держат
+    собственные словари со списками времен. Память на пользователя
+    постоянна, неактивные записи вытесняются по ходу работы, общее число
+    записей каждого ограничителя ограничено max_keys.
+    """
+
+    def __init__(self, max_keys: int = 200000):
+        self.max_keys = max_keys
+        self._limiters: List[_BoundedLimiter] = []
+
+    def window(self, name: str, window: float, max_keys: int = None) -> WindowLimiter:
+        """Новый ограничитель со скользящим окном"""
+        limiter = WindowLimiter(name, window, max_keys or self.max_keys)
+        self._limiters.append(limiter)
+        return limiter
+
+    def cooldown(self, name: str, max_keys: int = None) -> CooldownLimiter:
+        """Новый ограничитель с паузой между запросами"""
+        limiter = CooldownLimiter(name, max_keys or self.max_keys)
+        self._limiters.append(limiter)
+        return limiter
+
+    def reset_user(self, key: Hashable):
+        """Сброс всех ограничений для ключа"""
+        for limiter in self._limiters:
+            limiter.reset(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Количество записей по ограничителям"""
+        return {
+            'limiters': {
+                f"{limiter.name}#{i}": {'keys': len(limiter), 'evicted': limiter.evicted}
+                for i, limiter in enumerate(self._limiters)
+            },
+            'total_keys': sum(len(limiter) for limiter in self._limiters)
+        }
+
+# Глобальный экземпляр реестра
+throttle_registry = ThrottleRegistry()
+
+def benchmark(users: int = 100000, updates: int = 200000) -> Dict[str, float]:
+    """
+    Замер стоимости одного обновления при заданном числе активных
+    пользователей
+
+    Запуск: python -m bot.utils.throttle
+    """
+    import random
+
+    registry = ThrottleRegistry(max_keys=users * 2)
+    spam = registry.window("spam", 60)
+    flood = registry.window("flood", 10)
+    throttle = registry.cooldown("throttle")
+
+    def run(active: int) -> float:
+        # Прогрев: у каждого пользователя уже есть запись
+        for user_id in range(active):
+            spam.hit(user_id, 8)
+            flood.hit(user_id, 5)
+            throttle.hit(user_id, 1)
+
+        ids = [random.randrange(active) for _ in range(updates)]
+        started = time.perf_counter()
+        for user_id in ids:
+            spam.hit(user_id, 8)
+            flood.hit(user_id, 5)
+            throttle.hit(user_id, 1)
+        return (time.perf_counter() - started) / updates * 1_000_000
+
+    results = {}
+    for active in (1000, 10000, users):
+        for limiter in (spam, flood, throttle):
+            limiter.clear()
+        results[active] = run(active)
+        print(f"{active:>7} active users: {results[active]:.2f} us/update "
+              f"({registry.get_stats()['total_keys']} keys)")
+    return results
+
+if __name__ == "__main__":
+    benchmark()
@@ -78,11 +78,13 @@ async def download_file(
         if range_header:
             # Поддержка Range запросов для потокового воспроизведения
             return await file_service.serve_file_range(
-                file_path, range_header, file_info
+                file_path, range_header, file_info, request_headers=request.headers
             )
         else:
-            # Обычное скачивание файла
-            return await file_service.serve_file(file_path, file_info)
+            # Обычное скачивание файла (с поддержкой условных запросов)
+            return await file_service.serve_file(
+                file_path, file_info, request_headers=request.headers
+            )
     
     except HTTPException:
         raise
@@ -5,6 +5,7 @@ VideoBot Pro - Updated CDN Main Application
 
 import asyncio
 import logging
+import aiofiles
 import structlog
 import uvicorn
 from contextlib import asynccontextmanager
@@ -18,7 +19,7 @@ from shared import (
     settings, initialize_shared_components, cleanup_shared_components,
     DatabaseHealthCheck, get_shared_info
 )
-from .config import CDNConfig, cdn_config
+from .config import cdn_config
 from .api import files_router, auth_router, stats_router
 from .middleware import AuthMiddleware, RateLimitMiddleware, LoggingMiddleware
 from .services import FileService, CleanupService
@@ -346,6 +347,115 @@ def create_app() -> FastAPI:
             logger.error(f"File migration failed: {e}")
             raise HTTPException(status_code=500, detail="Migration failed")
     
+    @app.post("/api/v1/admin/upload")
+    async def admin_upload_file(
+        request: Request,
+        file: UploadFile = File(...),
+        user_type: str = Form("free"),
+        public: bool = Form(False)
+    ):
+        """Административная загрузка файла в облачное хранилище"""
+        try:
+            user = getattr(request.state, 'user', None)
+            if not user or user.user_type not in ['admin', 'owner']:
+                raise HTTPException(status_code=403, detail="Admin access required")
+            
+            # Сохраняем временный файл по чанкам, не читая его целиком в память
+            import os
+            import tempfile
+            file_size = 0
+            temp_fd, temp_file_path = tempfile.mkstemp()
+            os.close(temp_fd)
+            
+            try:
+                async with aiofiles.open(temp_file_path, 'wb') as temp_file:
+                    while True:
+                        chunk = await file.read(settings.CDN_UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        await temp_file.write(chunk)
+                        file_size += len(chunk)
+                
+                # Размер, заявленный клиентом, должен совпасть с принятым
+                expected_size = request.headers.get('X-File-Size')
+                if expected_size is not None and (not expected_size.isdigit() or int(expected_size) != file_size):
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size mismatch: expected {expected_size}, received {file_size}"
+                    )
+                
+                # Загружаем в облачное хранилище
+                result = await cdn_storage_manager.upload_file(
+                    local_file_path=temp_file_path,
+                    file_key=file.filename,
+                    user=user,
+                    metadata={
+                        'admin_upload': 'true',
+                        'public': str(public),
+                        'original_size': str(file_size)
+                    }
+                )
+                
+                return {
+                    "success": True,
+                    "filename": file.filename,
+                    "size": file_size,
+                    "upload_result": result
+                }
+                
+            finally:
+                # Удаляем временный файл
+                try:
+                    os.unlink(temp_file_path)
+                except:
+                    pass
+                    
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Admin upload failed: {e}")
+            raise HTTPException(status_code=500, detail="Upload failed")
+    
+    @app.get("/api/v1/admin/storage/stats")
+    async def get_storage_statistics(request: Request):
+        """Получение детальной статистики хранилищ"""
+        try:
+            user = getattr(request.state, 'user', None)
+            if not user or user.user_type not in ['admin', 'owner']:
+                raise HTTPException(status_code=403, detail="Admin access required")
+            
+            stats = await cdn_storage_manager.get_storage_statistics()
+            return stats
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Get storage stats failed: {e}")
+            raise HTTPException(status_code=500, detail="Failed to get storage statistics")
+    
+    @app.post("/api/v1/admin/storage/cleanup")
+    async def cleanup_storage(request: Request):
+        """Принудительная очистка всех хранилищ"""
+        try:
+            user = getattr(request.state, 'user', None)
+            if not user or user.user_type not in ['admin', 'owner']:
+                raise HTTPException(status_code=403, detail="Admin access required")
+            
+            # Запускаем очистку
+            cleanup_result = await cdn_storage_manager.cleanup_expired_files()
+            
+            return {
+                "success": True,
+                "cleanup_result": cleanup_result,
+                "timestamp": structlog.processors.TimeStamper(fmt="iso")(None, None, {})["timestamp"]
+            }
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Storage cleanup failed: {e}")
+            raise HTTPException(status_code=500, detail="Cleanup failed")
+    
     # Статические файлы (для локального хранения)
     if settings.DEBUG:
         app.mount("/static", StaticFiles(directory="storage"), name="static")
@@ -490,98 +600,4 @@ def main():
     )
 
 if __name__ == "__main__":
-    main()app.post("/api/v1/admin/upload")
-    async def admin_upload_file(
-        request: Request,
-        file: UploadFile = File(...),
-        user_type: str = Form("free"),
-        public: bool = Form(False)
-    ):
-        """Административная загрузка файла в облачное хранилище"""
-        try:
-            user = getattr(request.state, 'user', None)
-            if not user or user.user_type not in ['admin', 'owner']:
-                raise HTTPException(status_code=403, detail="Admin access required")
-            
-            # Сохраняем временный файл
-            import tempfile
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_file_path = temp_file.name
-            
-            try:
-                # Загружаем в облачное хранилище
-                result = await cdn_storage_manager.upload_file(
-                    local_file_path=temp_file_path,
-                    file_key=file.filename,
-                    user=user,
-                    metadata={
-                        'admin_upload': 'true',
-                        'public': str(public),
-                        'original_size': str(len(content))
-                    }
-                )
-                
-                return {
-                    "success": True,
-                    "filename": file.filename,
-                    "size": len(content),
-                    "upload_result": result
-                }
-                
-            finally:
-                # Удаляем временный файл
-                import os
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
-                    
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Admin upload failed: {e}")
-            raise HTTPException(status_code=500, detail="Upload failed")
-    
-    @app.get("/api/v1/admin/storage/stats")
-    async def get_storage_statistics(request: Request):
-        """Получение детальной статистики хранилищ"""
-        try:
-            user = getattr(request.state, 'user', None)
-            if not user or user.user_type not in ['admin', 'owner']:
-                raise HTTPException(status_code=403, detail="Admin access required")
-            
-            stats = await cdn_storage_manager.get_storage_statistics()
-            return stats
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Get storage stats failed: {e}")
-            raise HTTPException(status_code=500, detail="Failed to get storage statistics")
-    
-    @app.post("/api/v1/admin/storage/cleanup")
-    async def cleanup_storage(request: Request):
-        """Принудительная очистка всех хранилищ"""
-        try:
-            user = getattr(request.state, 'user', None)
-            if not user or user.user_type not in ['admin', 'owner']:
-                raise HTTPException(status_code=403, detail="Admin access required")
-            
-            # Запускаем очистку
-            cleanup_result = await cdn_storage_manager.cleanup_expired_files()
-            
-            return {
-                "success": True,
-                "cleanup_result": cleanup_result,
-                "timestamp": structlog.processors.TimeStamper(fmt="iso")(None, None, {})["timestamp"]
-            }
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Storage cleanup failed: {e}")
-            raise HTTPException(status_code=500, detail="Cleanup failed")
-    
-    @
\ No newline at end of file
+    main()
@@ -5,8 +5,12 @@ VideoBot Pro - CDN Services Module
 
 from .file_service import FileService
 from .cleanup_service import CleanupService
+from .cache_fill import CacheFillEngine, CacheFillError, cache_fill_engine
 
 __all__ = [
     'FileService',
-    'CleanupService'
+    'CleanupService',
+    'CacheFillEngine',
+    'CacheFillError',
+    'cache_fill_engine'
 ]
\ No newline at end of file
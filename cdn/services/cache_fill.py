@@ -0,0 +1,217 @@
+"""
+VideoBot Pro - CDN Cache Fill
+Заполнение локального кэша из облачного хранилища: одна загрузка на
+ключ, атомарная публикация файла и отдача клиентам по мере поступления
+"""
+
+import os
+import uuid
+import asyncio
+import aiofiles
+import structlog
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from ..storage_integration import cdn_storage_manager
+from .cache_index import FILL_TIMEOUT, cache_index
+
+logger = structlog.get_logger(__name__)
+
+class CacheFillError(Exception):
+    """Ошибка заполнения кэша"""
+    pass
+
+class CacheFill:
+    """
+    Заполнение одного файла кэша
+
+    Данные пишутся во временный файл рядом с итоговым путем и после
+    завершения атомарно переименовываются. Читатели открывают файл до
+    переименования (дескриптор остается действительным) и получают байты
+    по мере записи.
+    """
+
+    def __init__(self, file_key: str, cache_path: Path, expected_size: Optional[int]):
+        self.file_key = file_key
+        self.cache_path = cache_path
+        self.temp_path = cache_path.with_name(f".{cache_path.name}.{uuid.uuid4().hex}.part")
+        self.expected_size = expected_size or None
+        self.written = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._progress = asyncio.Event()
+        self._temp_created = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.done or self.error is not None
+
+    def _notify(self):
+        # Будим всех ожидающих и готовим событие для следующей порции
+        event, self._progress = self._progress, asyncio.Event()
+        event.set()
+
+    async def run(self, chunk_size: int):
+        """Загрузка файла из хранилища во временный файл"""
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+            async with aiofiles.open(self.temp_path, 'wb') as f:
+                self._temp_created.set()
+
+                # Дольше FILL_TIMEOUT не ждем: такие .part файлы считаются брошенными
+                await asyncio.wait_for(self._stream_to(f, chunk_size), timeout=FILL_TIMEOUT)
+
+            if self.expected_size and self.written != self.expected_size:
+                raise CacheFillError(
+                    f"Size mismatch: expected {self.expected_size}, got {self.written}"
+                )
+
+            os.replace(self.temp_path, self.cache_path)
+            self.done = True
+
+            index_key = cache_index.relative_key(self.cache_path)
+            if index_key:
+                await cache_index.record(index_key, self.written)
+            logger.info("Cache filled", file_key=self.file_key, size=self.written)
+
+        except BaseException as e:
+            self.error = e
+            self._temp_created.set()
+            try:
+                os.unlink(self.temp_path)
+            except OSError:
+                pass
+
+            if not isinstance(e, asyncio.CancelledError):
+                logger.error(f"Cache fill failed: {e}", file_key=self.file_key)
+            raise
+
+        finally:
+            self._notify()
+
+    async def _stream_to(self, f, chunk_size: int):
+        """Запись файла из хранилища с уведомлением читателей о каждой порции"""
+        async for chunk in cdn_storage_manager.stream_file(self.file_key, chunk_size):
+            await f.write(chunk)
+            await f.flush()
+            self.written += len(chunk)
+            self._notify()
+
+    async def wait_for(self, offset: int):
+        """
+        Ожидание, пока в файле появится байт с указанным смещением
+        (или пока загрузка не завершится)
+        """
+        while True:
+            if self.error is not None:
+                raise CacheFillError(f"Cache fill failed: {self.error}")
+            if self.written > offset or self.done:
+                return
+            await self._progress.wait()
+
+    async def wait_complete(self):
+        """Ожидание полного заполнения кэша"""
+        while not self.finished:
+            await self._progress.wait()
+        if self.error is not None:
+            raise CacheFillError(f"Cache fill failed: {self.error}")
+
+    async def _open(self) -> int:
+        """Открытие файла на чтение независимо от стадии заполнения"""
+        await self._temp_created.wait()
+        try:
+            return os.open(self.temp_path, os.O_RDONLY)
+        except FileNotFoundError:
+            # Файл уже переименован или загрузка прервалась
+            if self.error is not None:
+                raise CacheFillError(f"Cache fill failed: {self.error}")
+            return os.open(self.cache_path, os.O_RDONLY)
+
+    async def iter_range(self, start: int, end: Optional[int], chunk_size: int) -> AsyncIterator[bytes]:
+        """
+        Чтение диапазона [start, end] по мере записи
+
+        Уже записанная часть отдается сразу, остальное - как только
+        она поступит из хранилища.
+        """
+        fd = await self._open()
+        try:
+            offset = start
+            while end is None or offset <= end:
+                await self.wait_for(offset)
+
+                available = self.written - offset
+                if available <= 0:
+                    # Загрузка завершилась раньше конца диапазона
+                    break
+
+                length = min(chunk_size, available)
+                if end is not None:
+                    length = min(length, end - offset + 1)
+
+                chunk = await asyncio.to_thread(os.pread, fd, length, offset)
+                if not chunk:
+                    break
+
+                offset += len(chunk)
+                yield chunk
+        finally:
+            os.close(fd)
+
+class CacheFillEngine:
+    """
+    Дедупликация загрузок в кэш
+
+    На каждый ключ в процессе выполняется не больше одной загрузки.
+    Загрузка живет независимо от запроса, который ее начал: отключение
+    первого клиента не прерывает заполнение кэша для остальных.
+    """
+
+    def __init__(self, chunk_size: int = 1024 * 1024):
+        self.chunk_size = chunk_size
+        self._fills: Dict[str, CacheFill] = {}
+
+    def get_fill(self, file_key: str) -> Optional[CacheFill]:
+        """Текущее заполнение ключа, если оно идет"""
+        return self._fills.get(file_key)
+
+    def start(self, file_key: str, cache_path: Path, expected_size: Optional[int] = None) -> Optional[CacheFill]:
+        """
+        Запуск или присоединение к заполнению кэша
+
+        Returns:
+            Заполнение ключа или None, если файл уже есть в кэше
+        """
+        fill = self._fills.get(file_key)
+        if fill:
+            return fill
+
+        if cache_path.exists():
+            return None
+
+        fill = CacheFill(file_key, cache_path, expected_size)
+        fill.task = asyncio.create_task(fill.run(self.chunk_size))
+        fill.task.add_done_callback(lambda _: self._forget(file_key, fill))
+        self._fills[file_key] = fill
+        return fill
+
+    def _forget(self, file_key: str, fill: CacheFill):
+        if self._fills.get(file_key) is fill:
+            del self._fills[file_key]
+
+        # Исключение уже залогировано и сохранено в fill.error
+        if fill.task and not fill.task.cancelled():
+            fill.task.exception()
+
+    async def shutdown(self):
+        """Отмена незавершенных загрузок"""
+        tasks = [fill.task for fill in self._fills.values() if fill.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._fills.clear()
+
+# Глобальный экземпляр
+cache_fill_engine = CacheFillEngine()
@@ -0,0 +1,298 @@
+"""
+VideoBot Pro - CDN Cache Index
+Постоянный индекс локального кэша CDN: размер и время последнего
+доступа каждого файла плюс общий размер кэша
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+import structlog
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = structlog.get_logger(__name__)
+
+# Максимальное время заполнения одного файла кэша (секунды). Временный
+# .part файл старше этого оставлен упавшим процессом и удаляется
+FILL_TIMEOUT = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    filled_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_last_access ON cache_entries (last_access);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_filled_at ON cache_entries (filled_at);
+
+CREATE TABLE IF NOT EXISTS cache_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('total_size', 0);
+INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('total_files', 0);
+
+CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN
+    UPDATE cache_meta SET value = value + NEW.size WHERE key = 'total_size';
+    UPDATE cache_meta SET value = value + 1 WHERE key = 'total_files';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_update AFTER UPDATE OF size ON cache_entries BEGIN
+    UPDATE cache_meta SET value = value + NEW.size - OLD.size WHERE key = 'total_size';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN
+    UPDATE cache_meta SET value = value - OLD.size WHERE key = 'total_size';
+    UPDATE cache_meta SET value = value - 1 WHERE key = 'total_files';
+END;
+"""
+
+class CacheIndex:
+    """
+    Индекс файлов кэша в SQLite
+
+    Общий размер поддерживается триггерами, поэтому проверка лимита - это
+    чтение одной строки. Вытеснение выбирает самые старые записи по индексу
+    last_access, не обходя дерево каталогов. Отметки доступа копятся в
+    памяти и записываются пачкой, чтобы отдача файла не ждала SQLite.
+    """
+
+    DB_NAME = ".cache_index.sqlite3"
+
+    def __init__(self):
+        self.cache_root: Optional[Path] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending_access: Dict[str, float] = {}
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    async def open(self, cache_root: Path):
+        """
+        Открытие индекса
+
+        Индекс перестраивается сканированием каталога только если файла
+        базы еще нет (первый запуск или база удалена вручную).
+        """
+        if self._conn:
+            return
+
+        self.cache_root = Path(cache_root)
+        self.cache_root.mkdir(parents=True, exist_ok=True)
+        db_path = self.cache_root / self.DB_NAME
+        needs_rebuild = not db_path.exists()
+
+        def _open():
+            conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            return conn
+
+        self._conn = await asyncio.to_thread(_open)
+
+        if needs_rebuild:
+            count = await asyncio.to_thread(self._rebuild)
+            logger.info("Cache index rebuilt", files=count, cache_root=str(self.cache_root))
+
+    async def close(self):
+        """Запись отложенных отметок доступа и закрытие базы"""
+        if not self._conn:
+            return
+
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+
+    def relative_key(self, path: Path) -> Optional[str]:
+        """Ключ индекса для файла внутри кэша"""
+        if self.cache_root is None:
+            return None
+        try:
+            return Path(path).relative_to(self.cache_root).as_posix()
+        except ValueError:
+            return None
+
+    def touch(self, key: str):
+        """Отметка доступа к файлу (без обращения к базе)"""
+        if self._conn:
+            self._pending_access[key] = time.time()
+
+    async def record(self, key: str, size: int):
+        """Добавление или обновление файла после заполнения кэша"""
+        if not self._conn:
+            return
+
+        now = time.time()
+        self._pending_access.pop(key, None)
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO cache_entries (path, size, filled_at, last_access) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, "
+            "filled_at = excluded.filled_at, last_access = excluded.last_access",
+            (key, size, now, now)
+        )
+
+    async def remove(self, keys: List[str]):
+        """Удаление записей"""
+        if not self._conn or not keys:
+            return
+
+        for key in keys:
+            self._pending_access.pop(key, None)
+        await asyncio.to_thread(
+            self._executemany, "DELETE FROM cache_entries WHERE path = ?", [(key,) for key in keys]
+        )
+
+    async def flush(self):
+        """Запись накопленных отметок доступа"""
+        if not self._conn or not self._pending_access:
+            return
+
+        pending, self._pending_access = self._pending_access, {}
+        await asyncio.to_thread(
+            self._executemany,
+            "UPDATE cache_entries SET last_access = ? WHERE path = ? AND last_access < ?",
+            [(ts, key, ts) for key, ts in pending.items()]
+        )
+
+    async def get_totals(self) -> Tuple[int, int]:
+        """Общий размер (байты) и количество файлов кэша"""
+        if not self._conn:
+            return 0, 0
+
+        rows = await asyncio.to_thread(self._fetchall, "SELECT key, value FROM cache_meta")
+        meta = dict(rows)
+        return int(meta.get('total_size', 0)), int(meta.get('total_files', 0))
+
+    async def oldest(self, limit: int = 100) -> List[Tuple[str, int]]:
+        """Самые давно использованные файлы"""
+        if not self._conn:
+            return []
+
+        await self.flush()
+        return await asyncio.to_thread(
+            self._fetchall,
+            "SELECT path, size FROM cache_entries ORDER BY last_access LIMIT ?",
+            (limit,)
+        )
+
+    async def filled_before(self, cutoff: float, limit: int = 100) -> List[Tuple[str, int]]:
+        """Файлы, загруженные в кэш раньше указанного времени"""
+        if not self._conn:
+            return []
+
+        return await asyncio.to_thread(
+            self._fetchall,
+            "SELECT path, size FROM cache_entries WHERE filled_at < ? ORDER BY filled_at LIMIT ?",
+            (cutoff, limit)
+        )
+
+    async def delete_entries(self, entries: List[Tuple[str, int]]) -> int:
+        """
+        Удаление файлов кэша вместе с их записями
+
+        Returns:
+            Освобожденное место в байтах
+        """
+        def _unlink():
+            freed = 0
+            for key, size in entries:
+                try:
+                    (self.cache_root / key).unlink()
+                except FileNotFoundError:
+                    pass
+                freed += size
+            return freed
+
+        freed = await asyncio.to_thread(_unlink)
+        await self.remove([key for key, _ in entries])
+        return freed
+
+    async def remove_stale_parts(self, max_age: float = FILL_TIMEOUT) -> Tuple[int, int]:
+        """
+        Удаление временных файлов брошенных заполнений кэша
+
+        Returns:
+            Количество удаленных файлов и освобожденное место в байтах
+        """
+        if self.cache_root is None:
+            return 0, 0
+        return await asyncio.to_thread(self._sweep_parts, max_age)
+
+    def _sweep_parts(self, max_age: float) -> Tuple[int, int]:
+        """Удаление .part файлов, которые не менялись дольше max_age"""
+        cutoff = time.time() - max_age
+        deleted = freed = 0
+        for root, _, files in os.walk(self.cache_root):
+            for name in files:
+                if not (name.startswith('.') and name.endswith('.part')):
+                    continue
+                path = Path(root) / name
+                try:
+                    stat = path.stat()
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    path.unlink()
+                except OSError:
+                    continue
+                deleted += 1
+                freed += stat.st_size
+
+        if deleted:
+            logger.info("Stale cache fill files removed", files=deleted, freed_bytes=freed)
+        return deleted, freed
+
+    def _rebuild(self) -> int:
+        """Заполнение индекса по содержимому каталога кэша"""
+        self._sweep_parts(FILL_TIMEOUT)
+
+        rows = []
+        for root, _, files in os.walk(self.cache_root):
+            for name in files:
+                # Служебные файлы: база индекса и незавершенные загрузки
+                if name.startswith('.'):
+                    continue
+                path = Path(root) / name
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                rows.append((
+                    path.relative_to(self.cache_root).as_posix(),
+                    stat.st_size,
+                    stat.st_mtime,
+                    max(stat.st_atime, stat.st_mtime)
+                ))
+
+        self._executemany(
+            "INSERT OR IGNORE INTO cache_entries (path, size, filled_at, last_access) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        return len(rows)
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def _executemany(self, sql: str, rows: list):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+# Глобальный экземпляр индекса
+cache_index = CacheIndex()
@@ -11,6 +11,7 @@ from typing import Dict, List, Optional
 
 from shared.config.storage import storage_config
 from ..config import cdn_config
+from .cache_index import cache_index
 
 logger = structlog.get_logger(__name__)
 
@@ -300,22 +301,22 @@ class CleanupService:
         
         try:
             cache_ttl = timedelta(hours=cdn_config.cache_settings['cache_ttl_hours'])
-            cutoff_time = datetime.utcnow() - cache_ttl
+            cutoff = (datetime.now() - cache_ttl).timestamp()
             
-            async for cache_file in self._scan_files(cdn_config.cache_path):
-                try:
-                    file_stat = cache_file.stat()
-                    file_mtime = datetime.fromtimestamp(file_stat.st_mtime)
-                    
-                    if file_mtime < cutoff_time:
-                        file_size = file_stat.st_size
-                        cache_file.unlink()
-                        
-                        deleted_count += 1
-                        freed_space_gb += file_size / (1024**3)
-                        
-                except Exception as e:
-                    logger.error(f"Error deleting cache file {cache_file}: {e}")
+            # Просроченные файлы выбираются по индексу filled_at
+            while True:
+                entries = await cache_index.filled_before(cutoff, limit=self.batch_size)
+                if not entries:
+                    break
+                
+                freed_bytes = await cache_index.delete_entries(entries)
+                deleted_count += len(entries)
+                freed_space_gb += freed_bytes / (1024**3)
+            
+            # Временные файлы заполнений, прерванных падением процесса
+            parts_deleted, parts_freed = await cache_index.remove_stale_parts()
+            deleted_count += parts_deleted
+            freed_space_gb += parts_freed / (1024**3)
             
             # Проверяем размер кэша
             await self._enforce_cache_size_limit()
@@ -383,44 +384,37 @@ class CleanupService:
         }
     
     async def _enforce_cache_size_limit(self):
-        """Принудительное ограничение размера кэша"""
+        """
+        Принудительное ограничение размера кэша
+        
+        Текущий размер читается из индекса кэша за O(1), вытесняются самые
+        давно использованные файлы - без обхода каталога и без atime.
+        """
         try:
             max_size_bytes = cdn_config.cache_settings['max_cache_size_gb'] * (1024**3)
-            current_size = await self._calculate_directory_size(cdn_config.cache_path)
+            current_size, _ = await cache_index.get_totals()
             
             if current_size <= max_size_bytes:
                 return
             
             logger.info(f"Cache size {current_size / (1024**3):.2f} GB exceeds limit, cleaning...")
             
-            # Получаем все файлы кэша с временем доступа
-            cache_files = []
-            async for cache_file in self._scan_files(cdn_config.cache_path):
-                try:
-                    stat = cache_file.stat()
-                    cache_files.append({
-                        'path': cache_file,
-                        'size': stat.st_size,
-                        'atime': stat.st_atime  # Время последнего доступа
-                    })
-                except Exception:
-                    continue
-            
-            # Сортируем по времени доступа (старые первыми)
-            cache_files.sort(key=lambda x: x['atime'])
-            
-            # Удаляем файлы пока не достигнем лимита
             freed_space = 0
-            for file_info in cache_files:
-                if current_size - freed_space <= max_size_bytes:
+            while current_size - freed_space > max_size_bytes:
+                entries = await cache_index.oldest(limit=self.batch_size)
+                if not entries:
                     break
                 
-                try:
-                    file_info['path'].unlink()
-                    freed_space += file_info['size']
-                    logger.debug(f"Removed cache file: {file_info['path']}")
-                except Exception as e:
-                    logger.error(f"Error removing cache file: {e}")
+                # Берем ровно столько файлов, сколько нужно до лимита
+                to_delete = []
+                excess = current_size - freed_space - max_size_bytes
+                for key, size in entries:
+                    if excess <= 0:
+                        break
+                    to_delete.append((key, size))
+                    excess -= size
+                
+                freed_space += await cache_index.delete_entries(to_delete)
             
             logger.info(f"Cache cleanup completed, freed {freed_space / (1024**3):.2f} GB")
             
@@ -442,22 +436,6 @@ class CleanupService:
         except Exception as e:
             logger.error(f"Error scanning directory {directory}: {e}")
     
-    async def _calculate_directory_size(self, directory: Path) -> int:
-        """Вычисление размера директории"""
-        total_size = 0
-        
-        try:
-            async for file_path in self._scan_files(directory):
-                try:
-                    total_size += file_path.stat().st_size
-                except Exception:
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"Error calculating directory size {directory}: {e}")
-        
-        return total_size
-    
     def _get_user_folders(self, user_type: str) -> List[str]:
         """Получение папок для проверки по типу пользователя"""
         if user_type == 'free':
@@ -0,0 +1,232 @@
+"""
+VideoBot Pro - CDN File Response
+Отдача локальных файлов без копирования через Python-код там, где это
+позволяет сервер, с поддержкой одиночных и множественных Range
+"""
+
+import os
+import asyncio
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Ограничение на количество диапазонов в одном запросе
+MAX_RANGES = 16
+
+ByteRange = Tuple[int, int]
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """Сильный ETag из времени изменения и размера файла"""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def make_last_modified(stat_result: os.stat_result) -> str:
+    """Значение Last-Modified в формате HTTP-даты"""
+    return formatdate(stat_result.st_mtime, usegmt=True)
+
+def _etag_matches(header_value: str, etag: str, weak: bool) -> bool:
+    """Проверка списка ETag из заголовка If-None-Match / If-Range"""
+    header_value = header_value.strip()
+    if header_value == '*':
+        return True
+
+    for candidate in header_value.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def _not_later_than(header_value: str, stat_result: os.stat_result) -> bool:
+    """Файл не изменялся после даты из заголовка"""
+    try:
+        since = parsedate_to_datetime(header_value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return False
+    return int(stat_result.st_mtime) <= since
+
+def is_not_modified(request_headers: Mapping[str, str], stat_result: os.stat_result) -> bool:
+    """
+    Условный GET (RFC 9110, 13.2.2)
+
+    If-None-Match имеет приоритет над If-Modified-Since.
+    """
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match:
+        return _etag_matches(if_none_match, make_etag(stat_result), weak=True)
+
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since:
+        return _not_later_than(if_modified_since, stat_result)
+
+    return False
+
+def if_range_matches(request_headers: Mapping[str, str], stat_result: os.stat_result) -> bool:
+    """
+    Проверка If-Range: если представление изменилось, Range игнорируется
+    и клиент получает файл целиком
+    """
+    if_range = request_headers.get('if-range')
+    if not if_range:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Для If-Range допустимо только сильное сравнение
+        return _etag_matches(if_range, make_etag(stat_result), weak=False)
+
+    try:
+        return int(stat_result.st_mtime) == int(parsedate_to_datetime(if_range).timestamp())
+    except (TypeError, ValueError, IndexError):
+        return False
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[ByteRange]]:
+    """
+    Парсинг Range заголовка
+
+    Поддерживаются формы "a-b", "a-" и "-n" в любом количестве через запятую.
+    Пересекающиеся и соседние диапазоны объединяются.
+
+    Returns:
+        Список (start, end) включительно или None если запрос невыполним
+    """
+    if not range_header or not range_header.startswith('bytes=') or file_size <= 0:
+        return None
+
+    ranges: List[ByteRange] = []
+    for spec in range_header[6:].split(','):
+        spec = spec.strip()
+        if not spec or '-' not in spec:
+            return None
+
+        start_str, end_str = spec.split('-', 1)
+        try:
+            if not start_str:
+                # Суффиксная форма: последние N байт
+                length = int(end_str)
+                if length <= 0:
+                    continue
+                start, end = max(file_size - length, 0), file_size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else file_size - 1
+        except ValueError:
+            return None
+
+        if start >= file_size or start > end:
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+
+    if not ranges or len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+class ZeroCopyFileResponse(Response):
+    """
+    Ответ с телом из локального файла
+
+    Если ASGI-сервер поддерживает расширение http.response.zerocopysend,
+    данные передаются ядром через sendfile. Иначе файл читается через
+    os.pread в пуле потоков крупными блоками - без файлового объекта
+    aiofiles и промежуточного генератора.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        stat_result: os.stat_result,
+        ranges: Optional[List[ByteRange]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        media_type: str = 'application/octet-stream',
+        chunk_size: int = 1024 * 1024
+    ):
+        self.path = path
+        self.file_size = stat_result.st_size
+        self.chunk_size = chunk_size
+        self.segments: List[Tuple[bytes, int, int]] = []
+        self.epilogue = b''
+
+        headers = dict(headers or {})
+
+        if not ranges:
+            status_code = 200
+            self.segments.append((b'', 0, self.file_size))
+            content_length = self.file_size
+            content_type = media_type
+        elif len(ranges) == 1:
+            status_code = 206
+            start, end = ranges[0]
+            self.segments.append((b'', start, end - start + 1))
+            headers['Content-Range'] = f"bytes {start}-{end}/{self.file_size}"
+            content_length = end - start + 1
+            content_type = media_type
+        else:
+            status_code = 206
+            boundary = secrets.token_hex(16)
+            for index, (start, end) in enumerate(ranges):
+                part_header = (b'' if index == 0 else b'\r\n') + (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{self.file_size}\r\n\r\n"
+                ).encode('latin-1')
+                self.segments.append((part_header, start, end - start + 1))
+            self.epilogue = f"\r\n--{boundary}--\r\n".encode('latin-1')
+            content_length = sum(len(h) + count for h, _, count in self.segments) + len(self.epilogue)
+            content_type = f"multipart/byteranges; boundary={boundary}"
+
+        # Content-Length рассчитан заранее: базовый класс не перезапишет его
+        headers['Content-Length'] = str(content_length)
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=content_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        zerocopy = 'http.response.zerocopysend' in (scope.get('extensions') or {})
+
+        # Открываем файл до отправки заголовков, чтобы ошибка стала 500
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': self.status_code,
+                'headers': self.raw_headers,
+            })
+
+            for part_header, offset, count in self.segments:
+                if part_header:
+                    await send({'type': 'http.response.body', 'body': part_header, 'more_body': True})
+
+                if zerocopy:
+                    await send({
+                        'type': 'http.response.zerocopysend',
+                        'file': fd,
+                        'offset': offset,
+                        'count': count,
+                        'more_body': True,
+                    })
+                    continue
+
+                end = offset + count
+                while offset < end:
+                    chunk = await asyncio.to_thread(os.pread, fd, min(self.chunk_size, end - offset), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+            await send({'type': 'http.response.body', 'body': self.epilogue, 'more_body': False})
+        finally:
+            os.close(fd)
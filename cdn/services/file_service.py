@@ -5,17 +5,27 @@ VideoBot Pro - Updated CDN File Service
 
 import os
 import asyncio
-import aiofiles
 import structlog
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Mapping, Optional, Any
 from fastapi import HTTPException
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi.responses import Response, StreamingResponse, RedirectResponse
 
+from shared.config.settings import settings
 from shared.models.user import User
 from .config import cdn_config
 from .storage_integration import cdn_storage_manager
+from .file_response import (
+    ZeroCopyFileResponse,
+    make_etag,
+    make_last_modified,
+    is_not_modified,
+    if_range_matches,
+    parse_range_header,
+)
+from .cache_fill import CacheFill, CacheFillError, cache_fill_engine
+from .cache_index import cache_index
 
 logger = structlog.get_logger(__name__)
 
@@ -30,6 +40,10 @@ class FileService:
         # Размеры чанков для стриминга
         self.chunk_size = 8192  # 8KB
         self.stream_chunk_size = 1024 * 1024  # 1MB для видео
+        
+        # Режим отдачи локальных файлов: sendfile или x-accel (через nginx)
+        self.serve_mode = settings.CDN_SERVE_MODE
+        self.x_accel_prefix = settings.CDN_X_ACCEL_PREFIX.rstrip('/')
     
     async def initialize(self):
         """Инициализация файлового сервиса"""
@@ -43,6 +57,9 @@ class FileService:
             self.storage_path.mkdir(parents=True, exist_ok=True)
             self.cache_path.mkdir(parents=True, exist_ok=True)
             
+            # Открываем индекс кэша (перестраивается только при его отсутствии)
+            await cache_index.open(self.cache_path)
+            
             # Инициализируем менеджер хранилищ
             await cdn_storage_manager.initialize()
             
@@ -56,6 +73,8 @@ class FileService:
     async def shutdown(self):
         """Завершение работы сервиса"""
         logger.info("Shutting down Enhanced File Service...")
+        await cache_fill_engine.shutdown()
+        await cache_index.close()
         self.initialized = False
     
     async def upload_file_to_cloud(
@@ -159,7 +178,13 @@ class FileService:
             logger.error(f"Error getting file info {file_path}: {e}")
             return None
     
-    async def serve_file(self, file_path: str, file_info: Dict[str, Any], user: Optional[User] = None) -> Any:
+    async def serve_file(
+        self,
+        file_path: str,
+        file_info: Dict[str, Any],
+        user: Optional[User] = None,
+        request_headers: Optional[Mapping[str, str]] = None
+    ) -> Any:
         """Обслуживание файла с умной маршрутизацией"""
         try:
             storage_type = file_info.get('storage_type', 'unknown')
@@ -178,69 +203,115 @@ class FileService:
             
             # Для локальных файлов - стримим напрямую
             if storage_type == 'local':
-                return await self._serve_local_file(file_path, file_info)
+                return await self._serve_local_file(file_path, file_info, request_headers)
             
             # Fallback - пытаемся скачать и отдать
-            return await self._serve_cloud_file_direct(file_path, file_info, user)
+            return await self._serve_cloud_file_direct(file_path, file_info, user, request_headers)
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error serving file {file_path}: {e}")
             raise HTTPException(status_code=500, detail="Failed to serve file")
     
-    async def _serve_local_file(self, file_path: str, file_info: Dict[str, Any]) -> StreamingResponse:
-        """Прямая подача локального файла"""
+    async def _serve_local_file(
+        self,
+        file_path: str,
+        file_info: Dict[str, Any],
+        request_headers: Optional[Mapping[str, str]] = None,
+        range_header: Optional[str] = None
+    ) -> Response:
+        """
+        Прямая подача локального файла
+        
+        Обрабатывает условные запросы (ETag/Last-Modified -> 304) и Range,
+        включая несколько диапазонов. Тело отдается через sendfile либо
+        передается nginx через X-Accel-Redirect.
+        """
         try:
             local_path = file_info.get('local_path') or str(self.storage_path / file_path)
+            request_headers = request_headers or {}
             
-            # Подготавливаем заголовки
+            try:
+                stat_result = await asyncio.to_thread(os.stat, local_path)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="File not found")
+            
+            content_type = file_info.get('content_type', 'application/octet-stream')
+            
+            # Отмечаем обращение к файлу кэша для LRU-вытеснения
+            index_key = cache_index.relative_key(Path(local_path))
+            if index_key:
+                cache_index.touch(index_key)
+            
+            # Валидаторы кэша
             headers = {
-                "Content-Length": str(file_info['size']),
-                "Content-Type": file_info.get('content_type', 'application/octet-stream'),
+                "ETag": make_etag(stat_result),
+                "Last-Modified": make_last_modified(stat_result),
                 "Accept-Ranges": "bytes",
                 "Cache-Control": "public, max-age=3600"
             }
             
+            if is_not_modified(request_headers, stat_result):
+                return Response(status_code=304, headers=headers)
+            
             # Определяем имя файла для скачивания
             filename = Path(file_path).name
             headers["Content-Disposition"] = f'attachment; filename="{filename}"'
             
-            # Создаем генератор для потокового чтения
-            async def generate():
-                async with aiofiles.open(local_path, 'rb') as f:
-                    while True:
-                        chunk = await f.read(self.stream_chunk_size)
-                        if not chunk:
-                            break
-                        yield chunk
-            
-            return StreamingResponse(
-                generate(),
-                status_code=200,
+            # nginx сам обработает Range и условные заголовки исходного запроса
+            if self.serve_mode == 'x-accel':
+                headers["X-Accel-Redirect"] = self._get_x_accel_uri(local_path)
+                return Response(status_code=200, headers=headers, media_type=content_type)
+            
+            ranges = None
+            if range_header and if_range_matches(request_headers, stat_result):
+                ranges = parse_range_header(range_header, stat_result.st_size)
+                if ranges is None:
+                    return Response(
+                        status_code=416,
+                        headers={"Content-Range": f"bytes */{stat_result.st_size}"}
+                    )
+            
+            return ZeroCopyFileResponse(
+                path=local_path,
+                stat_result=stat_result,
+                ranges=ranges,
                 headers=headers,
-                media_type=file_info.get('content_type', 'application/octet-stream')
+                media_type=content_type,
+                chunk_size=self.stream_chunk_size
             )
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error serving local file {file_path}: {e}")
             raise HTTPException(status_code=500, detail="Failed to serve local file")
     
-    async def _serve_cloud_file_direct(self, file_path: str, file_info: Dict[str, Any], user: Optional[User]) -> StreamingResponse:
-        """Прямая подача файла из облачного хранилища"""
+    async def _serve_cloud_file_direct(
+        self,
+        file_path: str,
+        file_info: Dict[str, Any],
+        user: Optional[User],
+        request_headers: Optional[Mapping[str, str]] = None,
+        range_header: Optional[str] = None
+    ) -> Response:
+        """Прямая подача файла из облачного хранилища через локальный кэш"""
         try:
-            # Создаем временный файл для кэширования
             cache_path = self.cache_path / file_path
-            cache_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Скачиваем файл если его нет в кэше
-            if not cache_path.exists():
-                success = await cdn_storage_manager.download_file(
-                    file_key=file_path,
-                    local_path=str(cache_path),
-                    user=user
+            
+            # Запускаем заполнение кэша или присоединяемся к уже идущему
+            fill = cache_fill_engine.start(file_path, cache_path, file_info.get('size'))
+            
+            if fill:
+                response = await self._serve_filling_file(
+                    fill, file_path, file_info, request_headers, range_header
                 )
+                if response:
+                    return response
                 
-                if not success:
-                    raise HTTPException(status_code=404, detail="File not found in storage")
+                # Запрос нельзя обслужить потоково - дожидаемся файла целиком
+                await fill.wait_complete()
             
             # Обновляем информацию о файле
             cache_info = {
@@ -250,69 +321,91 @@ class FileService:
             }
             
             # Отдаем из кэша
-            return await self._serve_local_file(file_path, cache_info)
+            return await self._serve_local_file(file_path, cache_info, request_headers, range_header)
             
+        except CacheFillError as e:
+            logger.warning(f"Cache fill failed for {file_path}: {e}")
+            raise HTTPException(status_code=404, detail="File not found in storage")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error serving cloud file {file_path}: {e}")
             raise HTTPException(status_code=500, detail="Failed to serve cloud file")
     
-    async def serve_file_range(self, file_path: str, range_header: str, file_info: Dict[str, Any], user: Optional[User] = None) -> StreamingResponse:
-        """Обслуживание файла с поддержкой Range запросов"""
+    async def _serve_filling_file(
+        self,
+        fill: CacheFill,
+        file_path: str,
+        file_info: Dict[str, Any],
+        request_headers: Optional[Mapping[str, str]] = None,
+        range_header: Optional[str] = None
+    ) -> Optional[Response]:
+        """
+        Отдача файла, который еще загружается в кэш
+        
+        Байты передаются клиенту по мере записи в кэш; Range отвечается
+        сразу, если диапазон уже загружен.
+        
+        Returns:
+            Ответ или None, если нужен полный файл (неизвестен размер,
+            несколько диапазонов)
+        """
+        total_size = fill.expected_size
+        if not total_size:
+            return None
+        
+        # До завершения загрузки валидаторов нет - If-Range не может совпасть
+        ranges = None
+        if range_header and not (request_headers or {}).get('if-range'):
+            ranges = parse_range_header(range_header, total_size)
+            if ranges is None:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{total_size}"})
+            if len(ranges) > 1:
+                return None
+        
+        start, end = ranges[0] if ranges else (0, total_size - 1)
+        
+        # Ждем первый байт, чтобы ошибка хранилища стала статусом ответа, а не обрывом
+        await fill.wait_for(start)
+        
+        headers = {
+            "Content-Length": str(end - start + 1),
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "public, max-age=3600",
+            "Content-Disposition": f'attachment; filename="{Path(file_path).name}"'
+        }
+        if ranges:
+            headers["Content-Range"] = f"bytes {start}-{end}/{total_size}"
+        
+        return StreamingResponse(
+            fill.iter_range(start, end, self.stream_chunk_size),
+            status_code=206 if ranges else 200,
+            headers=headers,
+            media_type=file_info.get('content_type', 'application/octet-stream')
+        )
+    
+    async def serve_file_range(
+        self,
+        file_path: str,
+        range_header: str,
+        file_info: Dict[str, Any],
+        user: Optional[User] = None,
+        request_headers: Optional[Mapping[str, str]] = None
+    ) -> Response:
+        """Обслуживание файла с поддержкой Range запросов (в том числе нескольких диапазонов)"""
         try:
-            # Парсим Range заголовок
-            start, end = self._parse_range_header(range_header, file_info['size'])
-            
-            if start is None:
-                raise HTTPException(status_code=416, detail="Range not satisfiable")
-            
             storage_type = file_info.get('storage_type', 'unknown')
             
             # Для облачных файлов сначала кэшируем
             if storage_type == 'cloud':
-                cache_path = self.cache_path / file_path
-                if not cache_path.exists():
-                    cache_path.parent.mkdir(parents=True, exist_ok=True)
-                    await cdn_storage_manager.download_file(file_path, str(cache_path), user)
-                
-                local_path = str(cache_path)
-            else:
-                local_path = file_info.get('local_path') or str(self.storage_path / file_path)
-            
-            # Вычисляем размер части
-            content_length = end - start + 1
-            
-            # Подготавливаем заголовки
-            headers = {
-                "Content-Range": f"bytes {start}-{end}/{file_info['size']}",
-                "Content-Length": str(content_length),
-                "Content-Type": file_info.get('content_type', 'application/octet-stream'),
-                "Accept-Ranges": "bytes",
-                "Cache-Control": "public, max-age=3600"
-            }
+                return await self._serve_cloud_file_direct(
+                    file_path, file_info, user, request_headers, range_header
+                )
             
-            # Создаем генератор для чтения части файла
-            async def generate():
-                async with aiofiles.open(local_path, 'rb') as f:
-                    await f.seek(start)
-                    remaining = content_length
-                    
-                    while remaining > 0:
-                        chunk_size = min(self.stream_chunk_size, remaining)
-                        chunk = await f.read(chunk_size)
-                        
-                        if not chunk:
-                            break
-                        
-                        remaining -= len(chunk)
-                        yield chunk
-            
-            return StreamingResponse(
-                generate(),
-                status_code=206,  # Partial Content
-                headers=headers,
-                media_type=file_info.get('content_type', 'application/octet-stream')
-            )
+            return await self._serve_local_file(file_path, file_info, request_headers, range_header)
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error serving file range {file_path}: {e}")
             raise HTTPException(status_code=500, detail="Failed to serve file range")
@@ -377,6 +470,9 @@ class FileService:
             cache_path = self.cache_path / file_path
             if cache_path.exists():
                 cache_path.unlink()
+                index_key = cache_index.relative_key(cache_path)
+                if index_key:
+                    await cache_index.remove([index_key])
             
             success = cloud_result.get('success', False) or local_deleted
             
@@ -492,15 +588,16 @@ class FileService:
             local_freed_gb = 0.0
             
             try:
-                for cache_file in self.cache_path.rglob("*"):
-                    if cache_file.is_file():
-                        # Удаляем файлы кэша старше 24 часов
-                        file_age = datetime.now() - datetime.fromtimestamp(cache_file.stat().st_mtime)
-                        if file_age > timedelta(hours=24):
-                            file_size = cache_file.stat().st_size
-                            cache_file.unlink()
-                            local_deleted += 1
-                            local_freed_gb += file_size / (1024**3)
+                # Файлы кэша старше 24 часов берем из индекса, без обхода каталога
+                cutoff = (datetime.now() - timedelta(hours=24)).timestamp()
+                while True:
+                    entries = await cache_index.filled_before(cutoff)
+                    if not entries:
+                        break
+                    
+                    freed_bytes = await cache_index.delete_entries(entries)
+                    local_deleted += len(entries)
+                    local_freed_gb += freed_bytes / (1024**3)
                             
             except Exception as e:
                 logger.warning(f"Cache cleanup failed: {e}")
@@ -544,13 +641,7 @@ class FileService:
     async def _get_cache_statistics(self) -> Dict[str, Any]:
         """Получение статистики локального кэша"""
         try:
-            total_files = 0
-            total_size = 0
-            
-            for cache_file in self.cache_path.rglob("*"):
-                if cache_file.is_file():
-                    total_files += 1
-                    total_size += cache_file.stat().st_size
+            total_size, total_files = await cache_index.get_totals()
             
             return {
                 'total_files': total_files,
@@ -609,29 +700,18 @@ class FileService:
         content_type, _ = mimetypes.guess_type(filename)
         return content_type or 'application/octet-stream'
     
-    def _parse_range_header(self, range_header: str, file_size: int) -> Tuple[Optional[int], Optional[int]]:
-        """Парсинг Range заголовка"""
-        try:
-            if not range_header.startswith('bytes='):
-                return None, None
-            
-            range_spec = range_header[6:]
-            
-            if '-' not in range_spec:
-                return None, None
-            
-            start_str, end_str = range_spec.split('-', 1)
-            
-            start = int(start_str) if start_str else 0
-            end = int(end_str) if end_str else file_size - 1
-            
-            if start >= file_size or end >= file_size or start > end:
-                return None, None
-            
-            return start, end
-            
-        except Exception:
-            return None, None
+    def _get_x_accel_uri(self, local_path: str) -> str:
+        """Внутренний URI nginx для файла из хранилища или кэша"""
+        path = Path(local_path)
+        
+        for location, root in (('cache', self.cache_path), ('storage', self.storage_path)):
+            try:
+                relative = path.resolve().relative_to(Path(root).resolve())
+            except ValueError:
+                continue
+            return f"{self.x_accel_prefix}/{location}/{relative.as_posix()}"
+        
+        raise HTTPException(status_code=404, detail="File not found")
     
     async def _is_user_file(self, file_path: str, user_id: int) -> bool:
         """Проверка, принадлежит ли файл пользователю"""
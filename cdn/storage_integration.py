@@ -6,7 +6,7 @@ VideoBot Pro - CDN Storage Integration
 import asyncio
 import structlog
 from pathlib import Path
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, Optional, Union, AsyncIterator
 from datetime import datetime, timedelta
 
 from shared.config.settings import settings
@@ -303,6 +303,47 @@ class CDNStorageManager:
             logger.error(f"File download failed: {e}")
             return False
     
+    async def stream_file(
+        self,
+        file_key: str,
+        chunk_size: int = 1024 * 1024
+    ) -> AsyncIterator[bytes]:
+        """
+        Потоковое скачивание файла из хранилища
+        
+        Хранилища перебираются в том же порядке, что и в download_file;
+        переключение на следующее возможно только до первого полученного чанка.
+        
+        Args:
+            file_key: Ключ файла
+            chunk_size: Размер чанка в байтах
+            
+        Yields:
+            Очередной чанк содержимого файла
+        """
+        for storage in (self.primary_storage, self.backup_storage):
+            if not storage:
+                continue
+            
+            started = False
+            try:
+                async for chunk in storage.download_stream(file_key, chunk_size):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                logger.warning(f"Storage stream failed: {e}", file_key=file_key)
+        
+        # Локальное хранилище
+        file_data = await self.local_storage.download_bytes(file_key)
+        if not file_data:
+            raise FileNotFoundError(file_key)
+        
+        for offset in range(0, len(file_data), chunk_size):
+            yield file_data[offset:offset + chunk_size]
+    
     async def delete_file(
         self,
         file_key: str,
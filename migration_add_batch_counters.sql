@@ -0,0 +1,20 @@
+ALTER TABLE download_batches ADD COLUMN processing_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE download_batches ADD COLUMN cancelled_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE download_batches ADD CONSTRAINT check_processing_count_positive CHECK (processing_count >= 0);
+ALTER TABLE download_batches ADD CONSTRAINT check_cancelled_count_positive CHECK (cancelled_count >= 0);
+UPDATE download_batches b SET
+    completed_count = t.completed,
+    failed_count = t.failed,
+    processing_count = t.processing,
+    cancelled_count = t.cancelled
+FROM (
+    SELECT batch_id,
+        COUNT(*) FILTER (WHERE status = 'completed') AS completed,
+        COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+        COUNT(*) FILTER (WHERE status = 'processing') AS processing,
+        COUNT(*) FILTER (WHERE status = 'cancelled') AS cancelled
+    FROM download_tasks
+    WHERE batch_id IS NOT NULL
+    GROUP BY batch_id
+) t
+WHERE b.id = t.batch_id;
@@ -37,12 +37,25 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379/0"
     REDIS_PREFIX: str = Field(default="videobot:", description="Redis key prefix")
     REDIS_EXPIRE_TIME: int = Field(default=3600, description="Default Redis expiration time")
+    USER_CACHE_TTL: int = Field(default=300, description="User snapshot TTL in Redis (seconds)")
+    USER_CACHE_LOCAL_TTL: int = Field(default=60, description="User snapshot TTL in process memory (seconds)")
+    USER_CACHE_SIZE: int = Field(default=10000, description="Max user snapshots kept in process memory")
+    PROGRESS_PUBLISH_INTERVAL: float = Field(default=1.0, description="Min interval between progress events of one task (seconds)")
+    PROGRESS_STATE_TTL: int = Field(default=3600, description="TTL of the latest task progress event in Redis (seconds)")
     
     # Telegram Bot Configuration
     BOT_TOKEN: str
     WEBHOOK_URL: Optional[str] = Field(default=None, description="Webhook URL for production")
     WEBHOOK_PATH: str = Field(default="/webhook", description="Webhook endpoint path")
     WEBHOOK_SECRET: Optional[str] = Field(default=None, description="Webhook secret token")
+    WEBHOOK_MAX_CONNECTIONS: int = Field(default=40, description="Max concurrent webhook connections from Telegram")
+    UPDATE_QUEUE_WORKERS: int = Field(default=64, description="Concurrent update handlers in webhook mode")
+    UPDATE_QUEUE_MAX_SIZE: int = Field(default=10000, description="Max queued webhook updates before backpressure")
+    UPDATE_QUEUE_PUT_TIMEOUT: float = Field(default=5.0, description="Max wait for queue space before rejecting an update (seconds)")
+    BOT_SHARDS: int = Field(default=0, description="Number of update shards across bot processes (0 disables sharding)")
+    BOT_SHARD_LEASE_TTL: int = Field(default=15, description="Shard ownership lease TTL in Redis (seconds)")
+    BOT_SHARD_STREAM_MAX: int = Field(default=100000, description="Max unconsumed updates per shard stream before the router rejects")
+    PROGRESS_EDIT_INTERVAL: float = Field(default=3.0, description="Min interval between edits of one progress message (seconds)")
     BOT_PARSE_MODE: str = Field(default="HTML", description="Default parse mode for messages")
     
     # Security Configuration
@@ -75,9 +88,16 @@ class Settings(BaseSettings):
     TRIAL_ENABLED: bool = Field(default=True, description="Enable trial system for new users")
     TRIAL_DURATION_MINUTES: int = Field(default=60, description="Trial duration in minutes")
     REQUIRED_SUBS_ENABLED: bool = Field(default=True, description="Enable required subscriptions")
+    SUBSCRIPTION_CACHE_TTL: int = Field(default=3600, description="TTL of a cached 'subscribed' status (seconds)")
+    SUBSCRIPTION_NEGATIVE_CACHE_TTL: int = Field(default=60, description="TTL of a cached 'not subscribed' status (seconds)")
+    SUBSCRIPTION_CHECK_CONCURRENCY: int = Field(default=10, description="Max concurrent getChatMember calls")
     BATCH_PROCESSING_ENABLED: bool = Field(default=True, description="Enable batch downloads")
+    BATCH_COUNTERS_ENABLED: bool = Field(default=True, description="Read batch task stats from counters on the batch row (backfilled by migration) instead of aggregating download_tasks")
     PREMIUM_SYSTEM_ENABLED: bool = Field(default=True, description="Enable premium subscriptions")
     ANALYTICS_ENABLED: bool = Field(default=True, description="Enable analytics tracking")
+    ANALYTICS_BATCH_SIZE: int = Field(default=500, description="Analytics events per bulk insert")
+    ANALYTICS_FLUSH_INTERVAL: float = Field(default=2.0, description="Max seconds an analytics event waits in the buffer")
+    ANALYTICS_BUFFER_MAX: int = Field(default=20000, description="Max buffered analytics events before backpressure")
     
     FREE_DAILY_LIMIT: int = Field(default=10, description="Free user daily download limit")
     TRIAL_DAILY_LIMIT: int = Field(default=999, description="Trial user daily limit (unlimited)")
@@ -131,6 +151,9 @@ class Settings(BaseSettings):
     CDN_HOST: str = Field(default="0.0.0.0", description="CDN API host")
     CDN_PORT: int = Field(default=8090, description="CDN API port")
     CDN_MAX_BANDWIDTH_MBPS: int = Field(default=1000, description="Max CDN bandwidth in Mbps")
+    CDN_UPLOAD_CHUNK_SIZE: int = Field(default=1024 * 1024, description="Chunk size in bytes for streaming uploads to CDN")
+    CDN_SERVE_MODE: str = Field(default="sendfile", description="Local file serving mode: sendfile or x-accel (nginx X-Accel-Redirect)")
+    CDN_X_ACCEL_PREFIX: str = Field(default="/internal", description="Internal nginx location for X-Accel-Redirect")
     
     STRIPE_PUBLIC_KEY: Optional[str] = Field(default=None, description="Stripe public key")
     STRIPE_SECRET_KEY: Optional[str] = Field(default=None, description="Stripe secret key")
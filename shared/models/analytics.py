@@ -293,26 +293,43 @@ class AnalyticsEvent(BaseModel):
                    duration_seconds: int = None, platform: str = None,
                    user_type: str = None, source: str = "bot", **kwargs) -> 'AnalyticsEvent':
         """Создать событие аналитики"""
-        now = datetime.utcnow()
-        
-        # Определяем категорию по типу события
-        category = cls._get_event_category(event_type)
-        
-        return cls(
+        return cls(**cls.build_row(
             event_type=event_type,
-            event_category=category,
             user_id=user_id,
             telegram_user_id=telegram_user_id,
-            event_data=event_data or {},
+            event_data=event_data,
             value=value,
             duration_seconds=duration_seconds,
             platform=platform,
             user_type=user_type,
             source=source,
-            event_date=now.date(),
-            event_hour=now.hour,
             **kwargs
-        )
+        ))
+    
+    @classmethod
+    def build_row(cls, event_type: str, user_id: int = None, telegram_user_id: int = None,
+                  event_data: Dict[str, Any] = None, value: float = None,
+                  duration_seconds: int = None, platform: str = None,
+                  user_type: str = None, source: str = "bot", **kwargs) -> Dict[str, Any]:
+        """Значения колонок события для массовой вставки"""
+        now = datetime.utcnow()
+        
+        return {
+            'event_type': event_type,
+            # Определяем категорию по типу события
+            'event_category': cls._get_event_category(event_type),
+            'user_id': user_id,
+            'telegram_user_id': telegram_user_id,
+            'event_data': event_data or {},
+            'value': value,
+            'duration_seconds': duration_seconds,
+            'platform': platform,
+            'user_type': user_type,
+            'source': source,
+            'event_date': now.date(),
+            'event_hour': now.hour,
+            **kwargs
+        }
     
     @staticmethod
     def _get_event_category(event_type: str) -> str:
@@ -597,11 +614,11 @@ class DailyStats(BaseModel):
 
 async def track_user_event(event_type: str, user_id: int, telegram_user_id: int,
                           user_type: str = None, **kwargs):
-    """Отследить событие пользователя"""
-    from shared.config.database import get_async_session
+    """Отследить событие пользователя (через буфер массовой вставки)"""
+    from shared.services.analytics_buffer import analytics_buffer
     
     try:
-        event = AnalyticsEvent.track_event(
+        row = AnalyticsEvent.build_row(
             event_type=event_type,
             user_id=user_id,
             telegram_user_id=telegram_user_id,
@@ -609,10 +626,8 @@ async def track_user_event(event_type: str, user_id: int, telegram_user_id: int,
             **kwargs
         )
         
-        async with get_async_session() as session:
-            session.add(event)
-            await session.commit()
-            return event
+        await analytics_buffer.add(row)
+        return row
     except Exception as e:
         import structlog
         logger = structlog.get_logger(__name__)
@@ -622,11 +637,11 @@ async def track_user_event(event_type: str, user_id: int, telegram_user_id: int,
 async def track_download_event(event_type: str, user_id: int, platform: str,
                               file_size_mb: float = None, duration_seconds: int = None,
                               **kwargs):
-    """Отследить событие скачивания"""
-    from shared.config.database import get_async_session
+    """Отследить событие скачивания (через буфер массовой вставки)"""
+    from shared.services.analytics_buffer import analytics_buffer
     
     try:
-        event = AnalyticsEvent.track_event(
+        row = AnalyticsEvent.build_row(
             event_type=event_type,
             user_id=user_id,
             platform=platform,
@@ -635,10 +650,8 @@ async def track_download_event(event_type: str, user_id: int, platform: str,
             **kwargs
         )
         
-        async with get_async_session() as session:
-            session.add(event)
-            await session.commit()
-            return event
+        await analytics_buffer.add(row)
+        return row
     except Exception as e:
         import structlog
         logger = structlog.get_logger(__name__)
@@ -659,6 +672,7 @@ async def track_payment_event(event_type: str, user_id: int, payment_amount: flo
             **kwargs
         )
         
+        # Платежные события пишутся сразу, без буфера
         async with get_async_session() as session:
             session.add(event)
             await session.commit()
@@ -672,15 +686,15 @@ async def track_payment_event(event_type: str, user_id: int, payment_amount: flo
 async def track_system_event(event_type: str, event_data: Dict[str, Any] = None,
                             error_message: str = None, duration_seconds: int = None,
                             **kwargs):
-    """Отследить системное событие"""
-    from shared.config.database import get_async_session
+    """Отследить системное событие (через буфер массовой вставки)"""
+    from shared.services.analytics_buffer import analytics_buffer
     
     try:
         data = event_data or {}
         if error_message:
             data['error_message'] = error_message
 
-        event = AnalyticsEvent.track_event(
+        row = AnalyticsEvent.build_row(
             event_type=event_type,
             event_data=data,
             duration_seconds=duration_seconds,
@@ -688,12 +702,10 @@ async def track_system_event(event_type: str, event_data: Dict[str, Any] = None,
             **kwargs
         )
         
-        async with get_async_session() as session:
-            session.add(event)
-            await session.commit()
-            return event
+        await analytics_buffer.add(row)
+        return row
     except Exception as e:
         import structlog
         logger = structlog.get_logger(__name__)
         logger.error(f"Error tracking system event: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -7,8 +7,9 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 from sqlalchemy import (
     BigInteger, String, Integer, Boolean, DateTime, 
-    Text, JSON, ForeignKey, Index, CheckConstraint, Float
+    Text, JSON, ForeignKey, Index, CheckConstraint, Float, update
 )
+from sqlalchemy.sql.dml import Update
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -93,6 +94,20 @@ class DownloadBatch(BaseModel):
         comment="Количество пропущенных URL (дубликаты, неподдерживаемые)"
     )
     
+    processing_count: Mapped[int] = mapped_column(
+        Integer,
+        default=0,
+        nullable=False,
+        comment="Количество URL в обработке"
+    )
+    
+    cancelled_count: Mapped[int] = mapped_column(
+        Integer,
+        default=0,
+        nullable=False,
+        comment="Количество отмененных URL"
+    )
+    
     # Временные метки процесса
     started_at: Mapped[Optional[datetime]] = mapped_column(
         DateTime(timezone=True),
@@ -278,6 +293,14 @@ class DownloadBatch(BaseModel):
             'skipped_count >= 0',
             name='check_skipped_count_positive'
         ),
+        CheckConstraint(
+            'processing_count >= 0',
+            name='check_processing_count_positive'
+        ),
+        CheckConstraint(
+            'cancelled_count >= 0',
+            name='check_cancelled_count_positive'
+        ),
         CheckConstraint(
             'total_size_mb >= 0',
             name='check_total_size_positive'
@@ -361,6 +384,39 @@ class DownloadBatch(BaseModel):
             
         return None
     
+    @property
+    def pending_count(self) -> int:
+        """Количество URL, ожидающих обработки"""
+        return max(0, self.total_urls - self.completed_count - self.failed_count
+                   - self.skipped_count - self.processing_count - self.cancelled_count)
+    
+    def get_task_counters(self) -> Dict[str, int]:
+        """Счетчики задач batch'а без обращения к download_tasks"""
+        return {
+            'completed_tasks': self.completed_count,
+            'failed_tasks': self.failed_count,
+            'processing_tasks': self.processing_count,
+            'pending_tasks': self.pending_count,
+            'cancelled_tasks': self.cancelled_count,
+            'total_size_bytes': int((self.total_size_mb or 0) * 1024 * 1024)
+        }
+    
+    @classmethod
+    def counters_update(cls, batch_id: int, **deltas: int) -> Update:
+        """
+        Атомарное изменение счетчиков: UPDATE ... SET completed_count =
+        completed_count + 1. Конкурирующие callback'и worker'ов не
+        перезаписывают друг друга.
+        
+        Пример: DownloadBatch.counters_update(batch_id, processing_count=-1, completed_count=1)
+        """
+        # Не уходим ниже нуля, если callback пришел после отмены batch'а
+        values = {
+            name: func.greatest(getattr(cls, name) + delta, 0)
+            for name, delta in deltas.items() if delta
+        }
+        return update(cls).where(cls.id == batch_id).values(**values)
+    
     def start_processing(self, worker_id: str = None, task_id: str = None):
         """Начать обработку batch'а"""
         self.status = DownloadStatus.PROCESSING
@@ -234,22 +234,24 @@ class DownloadTask(BaseModel):
     @classmethod
     def create_from_url(cls, url: str, user_id: int, telegram_user_id: int, **kwargs) -> 'DownloadTask':
         """Создать задачу из URL"""
-        # Определяем платформу по URL
-        platform = cls._detect_platform(url)
-        
+        return cls(**cls.values_from_url(url, user_id, telegram_user_id, **kwargs))
+    
+    @classmethod
+    def values_from_url(cls, url: str, user_id: int, telegram_user_id: int, **kwargs) -> Dict[str, Any]:
+        """Значения колонок задачи для URL (для массовой вставки)"""
         # Генерируем уникальный task_id
         import uuid
         task_id = f"task_{uuid.uuid4().hex[:16]}"
         
-        return cls(
-            task_id=task_id,
-            original_url=url,
-            cleaned_url=cls._clean_url(url),
-            platform=platform,
-            user_id=user_id,
-            telegram_user_id=telegram_user_id,
+        return {
+            'task_id': task_id,
+            'original_url': url,
+            'cleaned_url': cls._clean_url(url),
+            'platform': cls._detect_platform(url),
+            'user_id': user_id,
+            'telegram_user_id': telegram_user_id,
             **kwargs
-        )
+        }
     
     @staticmethod
     def _detect_platform(url: str) -> str:
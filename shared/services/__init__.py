@@ -27,6 +27,29 @@ try:
 except ImportError:
     AnalyticsService = None
 
+try:
+    from .analytics_buffer import AnalyticsEventBuffer, analytics_buffer
+except ImportError:
+    AnalyticsEventBuffer = None
+    analytics_buffer = None
+
+try:
+    from .user_cache import UserCache, user_cache
+except ImportError:
+    UserCache = None
+    user_cache = None
+
+try:
+    from .progress import (
+        ProgressPublisher, progress_publisher, get_progress, request_cancel, is_cancel_requested
+    )
+except ImportError:
+    ProgressPublisher = None
+    progress_publisher = None
+    get_progress = None
+    request_cancel = None
+    is_cancel_requested = None
+
 # Глобальные экземпляры сервисов
 database_service = None
 redis_service = None
@@ -70,6 +93,9 @@ async def shutdown_services():
     if analytics_service:
         await analytics_service.shutdown()
     
+    if analytics_buffer:
+        await analytics_buffer.stop()
+    
     if redis_service:
         await redis_service.shutdown()
         
@@ -91,11 +117,17 @@ __all__ = [
     'RedisService', 
     'AuthService',
     'AnalyticsService',
+    'AnalyticsEventBuffer',
+    'UserCache',
+    'ProgressPublisher',
     
     # Утилиты
     'get_db_session',
     'get_redis_client',
     'health_check',
+    'get_progress',
+    'request_cancel',
+    'is_cancel_requested',
     
     # Управление сервисами
     'initialize_services',
@@ -106,5 +138,8 @@ __all__ = [
     'database_service',
     'redis_service',
     'auth_service', 
-    'analytics_service'
+    'analytics_service',
+    'analytics_buffer',
+    'user_cache',
+    'progress_publisher'
 ]
\ No newline at end of file
@@ -0,0 +1,284 @@
+"""
+VideoBot Pro - Analytics Event Buffer
+Буфер событий аналитики: события копятся в памяти процесса и
+записываются в БД пачками одним INSERT на пачку
+"""
+
+import asyncio
+import structlog
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from shared.config.settings import settings
+
+logger = structlog.get_logger(__name__)
+
+# Ошибки соединения с БД: пачка возвращается в очередь и пишется позже.
+# Остальные ошибки (IntegrityError, DataError, несериализуемые значения)
+# относятся к данным - такие строки отбрасываются по одной
+_TRANSIENT_ERRORS = (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка соединения, после которой пачку стоит повторить"""
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class AnalyticsEventBuffer:
+    """
+    Буфер событий аналитики
+
+    Сброс происходит при достижении batch_size или не реже, чем раз в
+    flush_interval секунд. Память ограничена max_events: при переполнении
+    add() ждет ближайшего сброса, а если БД не успевает - событие
+    отбрасывается и учитывается в статистике. Обработчик бота платит
+    только за добавление в список, а не за транзакцию на каждое событие.
+
+    Если пачка не записалась из-за данных, она пишется построчно и
+    ошибочные строки отбрасываются, чтобы одна строка не блокировала
+    очередь. При ошибке соединения пачка возвращается в очередь, но не
+    больше max_retries раз подряд.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None,
+                 max_events: int = None, backpressure_timeout: float = 1.0,
+                 max_retries: int = 5):
+        self.batch_size = batch_size or settings.ANALYTICS_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.ANALYTICS_FLUSH_INTERVAL
+        self.max_events = max_events or settings.ANALYTICS_BUFFER_MAX
+        self.backpressure_timeout = backpressure_timeout
+        self.max_retries = max_retries
+
+        # Подряд неудачных попыток записи из-за соединения с БД
+        self._retries = 0
+
+        self._events: List[Dict[str, Any]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flushed: Optional[asyncio.Event] = None
+
+        self.stats = {'enqueued': 0, 'written': 0, 'dropped': 0, 'rejected': 0,
+                      'flushes': 0, 'failed_flushes': 0}
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    def _bind_loop(self):
+        """
+        Привязка примитивов синхронизации к текущему event loop
+
+        Задачи worker'а создают новый loop на каждый вызов asyncio.run,
+        поэтому примитивы пересоздаются при смене loop. Накопленные
+        события при этом сохраняются.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flushed = asyncio.Event()
+
+    def _ensure_started(self):
+        """Запуск фонового сброса в текущем event loop"""
+        self._bind_loop()
+        if not self._flush_task or self._flush_task.done():
+            self._flush_task = self._loop.create_task(self._flush_loop())
+
+    async def start(self):
+        """Явный запуск буфера"""
+        self._ensure_started()
+
+    async def add(self, row: Dict[str, Any]) -> bool:
+        """
+        Добавление события
+
+        Args:
+            row: Значения колонок из AnalyticsEvent.build_row
+
+        Returns:
+            True если событие принято в буфер
+        """
+        if not settings.ANALYTICS_ENABLED:
+            return False
+
+        self._ensure_started()
+
+        if len(self._events) >= self.max_events:
+            # Обратное давление: даем фоновой задаче освободить место
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._flushed.wait(), timeout=self.backpressure_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            if len(self._events) >= self.max_events:
+                self.stats['dropped'] += 1
+                if self.stats['dropped'] % 1000 == 1:
+                    logger.warning("Analytics buffer full, dropping events",
+                                   dropped=self.stats['dropped'], pending=len(self._events))
+                return False
+
+        self._events.append(row)
+        self.stats['enqueued'] += 1
+
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+        return True
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Analytics flush loop error: {e}")
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных событий пачками по batch_size
+
+        Returns:
+            Количество записанных событий
+        """
+        if not self._events:
+            return 0
+
+        self._bind_loop()
+        written = 0
+
+        async with self._flush_lock:
+            while self._events:
+                batch = self._events[:self.batch_size]
+                del self._events[:self.batch_size]
+
+                try:
+                    await self._write_batch(batch)
+                    batch_written = len(batch)
+                except asyncio.CancelledError:
+                    # Остановка во время записи: пачку запишет stop()
+                    self._events[:0] = batch
+                    raise
+                except Exception as e:
+                    self.stats['failed_flushes'] += 1
+                    if _is_transient(e):
+                        logger.error(f"Error flushing analytics events: {e}", batch=len(batch))
+                        self._requeue(batch)
+                        break
+
+                    logger.warning(f"Analytics batch rejected, writing rows one by one: {e}",
+                                   batch=len(batch))
+                    try:
+                        batch_written = await self._write_rows(batch)
+                    except Exception:
+                        # Ошибка соединения: остаток пачки уже в очереди
+                        break
+
+                self._retries = 0
+                written += batch_written
+                self.stats['written'] += batch_written
+                self.stats['flushes'] += 1
+
+        # Будим производителей, ожидающих места в буфере
+        event, self._flushed = self._flushed, asyncio.Event()
+        event.set()
+
+        return written
+
+    def _requeue(self, rows: List[Dict[str, Any]]):
+        """Возврат строк в начало очереди после ошибки соединения"""
+        self._retries += 1
+        if self._retries > self.max_retries:
+            logger.error("Analytics batch dropped after retries",
+                         batch=len(rows), retries=self.max_retries)
+            self.stats['dropped'] += len(rows)
+            self._retries = 0
+            return
+
+        room = self.max_events - len(self._events)
+        if room > 0:
+            self._events[:0] = rows[:room]
+        self.stats['dropped'] += max(0, len(rows) - max(room, 0))
+
+    async def _write_rows(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Построчная запись пачки, отклоненной БД
+
+        Строки с ошибками данных отбрасываются. При ошибке соединения
+        оставшиеся строки возвращаются в очередь и ошибка пробрасывается.
+
+        Returns:
+            Количество записанных строк
+        """
+        written = 0
+        for index, row in enumerate(batch):
+            try:
+                await self._write_batch([row])
+                written += 1
+            except asyncio.CancelledError:
+                self.stats['written'] += written
+                self._events[:0] = batch[index:]
+                raise
+            except Exception as e:
+                if _is_transient(e):
+                    logger.error(f"Error writing analytics event: {e}")
+                    self.stats['written'] += written
+                    self._requeue(batch[index:])
+                    raise
+                self.stats['rejected'] += 1
+                logger.error(f"Analytics event rejected: {e}",
+                             event_type=row.get('event_type'), user_id=row.get('user_id'))
+        return written
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]):
+        """Многострочный INSERT одной транзакцией"""
+        from shared.config.database import get_async_session
+        from shared.models.analytics import AnalyticsEvent
+
+        async with get_async_session() as session:
+            await session.execute(insert(AnalyticsEvent.__table__), batch)
+            await session.commit()
+
+    async def stop(self):
+        """Остановка фонового сброса и запись оставшихся событий"""
+        task, self._flush_task = self._flush_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            written = await self.flush()
+            if written:
+                logger.info("Analytics buffer flushed on shutdown", events=written)
+        except Exception as e:
+            logger.error(f"Error flushing analytics on shutdown: {e}")
+
+        if self._events:
+            logger.warning("Analytics events lost on shutdown", events=len(self._events))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика буфера"""
+        return {**self.stats, 'pending': len(self._events)}
+
+# Глобальный экземпляр буфера
+analytics_buffer = AnalyticsEventBuffer()
@@ -0,0 +1,137 @@
+"""
+VideoBot Pro - Task Progress Events
+Публикация прогресса задач через Redis pub/sub вместо записи каждого
+промежуточного статуса в download_tasks
+"""
+
+import time
+import structlog
+from typing import Any, Dict, Optional, Tuple
+
+from shared.config.settings import settings
+from shared.services.redis import get_redis_client
+
+logger = structlog.get_logger(__name__)
+
+PROGRESS_CHANNEL = "task_progress"
+
+# Статусы, которые сохраняются в Postgres; остальные живут только в Redis
+TERMINAL_STATUSES = frozenset({'completed', 'failed', 'cancelled'})
+
+def _state_key(task_id: Any) -> str:
+    return f"task_progress:{task_id}"
+
+class ProgressPublisher:
+    """
+    Публикация событий прогресса задач
+
+    Событие - компактный словарь (task_id, status, message, percent, ts).
+    Последнее событие задачи хранится в Redis с TTL для запросов статуса,
+    каждое событие рассылается в канал для подписчиков (бота).
+    Ограничение частоты min_interval действует только на обновления
+    процента: смена статуса или текста этапа, завершение и события с
+    force=True отправляются всегда.
+    """
+
+    def __init__(self, min_interval: float = None, state_ttl: int = None):
+        self.min_interval = min_interval if min_interval is not None else settings.PROGRESS_PUBLISH_INTERVAL
+        self.state_ttl = state_ttl or settings.PROGRESS_STATE_TTL
+
+        # task_id -> (время последней отправки, статус, текст этапа)
+        self._last: Dict[Any, Tuple[float, str, Optional[str]]] = {}
+
+        self.stats = {'published': 0, 'throttled': 0, 'errors': 0}
+
+    async def publish(self, task_id: Any, status: str, message: Optional[str] = None,
+                      percent: Optional[float] = None, force: bool = False, **extra: Any) -> bool:
+        """
+        Отправка события прогресса
+
+        Args:
+            task_id: ID задачи
+            status: Статус задачи
+            message: Текст этапа
+            percent: Прогресс в процентах (0-100)
+            force: Отправить без ограничения частоты
+            **extra: Дополнительные поля события
+
+        Returns:
+            False, если событие пропущено ограничением частоты или не отправлено
+        """
+        now = time.monotonic()
+        terminal = status in TERMINAL_STATUSES
+
+        last = self._last.get(task_id)
+        if (last and not terminal and not force and last[1:] == (status, message)
+                and now - last[0] < self.min_interval):
+            self.stats['throttled'] += 1
+            return False
+
+        if terminal:
+            self._last.pop(task_id, None)
+        else:
+            self._last[task_id] = (now, status, message)
+
+        event = {'task_id': task_id, 'status': status, 'ts': time.time()}
+        if message:
+            event['message'] = message
+        if percent is not None:
+            event['percent'] = round(float(percent), 1)
+        event.update(extra)
+
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.set(_state_key(task_id), event, expire=self.state_ttl)
+            await redis_client.publish(PROGRESS_CHANNEL, event)
+            self.stats['published'] += 1
+            return True
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Failed to publish task progress: {e}", task_id=task_id)
+            return False
+
+    def forget(self, task_id: Any):
+        """Сброс ограничения частоты для задачи"""
+        self._last.pop(task_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'active_tasks': len(self._last)}
+
+async def get_progress(task_id: Any) -> Optional[Dict[str, Any]]:
+    """Последнее событие прогресса задачи (None, если его нет или истек TTL)"""
+    try:
+        redis_client = await get_redis_client()
+        event = await redis_client.get(_state_key(task_id))
+        return event if isinstance(event, dict) else None
+    except Exception as e:
+        logger.warning(f"Failed to read task progress: {e}", task_id=task_id)
+        return None
+
+def _cancel_key(task_id: Any) -> str:
+    return f"task_cancel:{task_id}"
+
+async def request_cancel(task_id: Any) -> bool:
+    """
+    Запрос остановки обработки задачи
+
+    Флаг читают worker'ы: запущенные для задачи процессы ffmpeg/ffprobe
+    останавливаются, новые не запускаются.
+    """
+    try:
+        redis_client = await get_redis_client()
+        await redis_client.set(_cancel_key(task_id), True, expire=settings.PROGRESS_STATE_TTL)
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to request task cancel: {e}", task_id=task_id)
+        return False
+
+async def is_cancel_requested(task_id: Any) -> bool:
+    try:
+        redis_client = await get_redis_client()
+        return bool(await redis_client.get(_cancel_key(task_id)))
+    except Exception as e:
+        logger.warning(f"Failed to read task cancel flag: {e}", task_id=task_id)
+        return False
+
+# Глобальный экземпляр публикатора
+progress_publisher = ProgressPublisher()
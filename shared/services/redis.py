@@ -8,7 +8,7 @@ import json
 import structlog
 import uuid
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import redis.asyncio as redis
 
@@ -126,6 +126,30 @@ class RedisService:
             logger.error(f"Redis GET operation failed for key {key}: {e}")
             return default
 
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        """Чтение нескольких ключей одним MGET (None для отсутствующих)"""
+        if not keys:
+            return []
+        try:
+            self.operation_count += 1
+            values = await self.client.mget([self._get_key(key) for key in keys])
+            result = []
+            for value in values:
+                if value is None:
+                    self.cache_misses += 1
+                    result.append(None)
+                    continue
+                self.cache_hits += 1
+                try:
+                    result.append(json.loads(value))
+                except (json.JSONDecodeError, TypeError):
+                    result.append(value)
+            return result
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis MGET operation failed for {len(keys)} keys: {e}")
+            return [None] * len(keys)
+
     async def set(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
         try:
             self.operation_count += 1
@@ -139,6 +163,30 @@ class RedisService:
             logger.error(f"Redis SET operation failed for key {key}: {e}")
             return False
 
+    async def set_if_not_exists(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
+        try:
+            self.operation_count += 1
+            full_key = self._get_key(key)
+            if not isinstance(value, str):
+                value = json.dumps(value, default=str)
+            expire_time = expire or settings.REDIS_EXPIRE_TIME
+            return bool(await self.client.set(full_key, value, ex=expire_time, nx=True))
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis SET NX operation failed for key {key}: {e}")
+            return False
+
+    async def eval_script(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        """Выполнить Lua скрипт (ключи получают prefix)"""
+        try:
+            self.operation_count += 1
+            full_keys = [self._get_key(key) for key in keys]
+            return await self.client.eval(script, len(full_keys), *full_keys, *args)
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis EVAL operation failed for keys {keys}: {e}")
+            return None
+
     async def delete(self, key: str) -> bool:
         try:
             self.operation_count += 1
@@ -400,6 +448,16 @@ class RedisService:
             logger.error(f"Redis UNSUBSCRIBE operation failed for channel {channel}: {e}")
             return False
 
+    async def create_subscription(self, channel: str) -> Optional[redis.client.PubSub]:
+        """Создать отдельную подписку на канал (не разделяемую с другими потребителями)"""
+        try:
+            pubsub = self.client.pubsub()
+            await pubsub.subscribe(self._get_key(f"channel:{channel}"))
+            return pubsub
+        except Exception as e:
+            logger.error(f"Redis SUBSCRIBE operation failed for channel {channel}: {e}")
+            return None
+
     async def get_message(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
         try:
             if not self.pubsub:
@@ -415,6 +473,79 @@ class RedisService:
         except Exception as e:
             logger.error(f"Redis GET_MESSAGE operation failed: {e}")
             return None
+
+# ------------------------------
+# Streams
+# ------------------------------
+
+    async def stream_add(self, key: str, fields: Dict[str, Any], maxlen: Optional[int] = None) -> Optional[str]:
+        """Добавить запись в stream (возвращает ID записи)"""
+        try:
+            self.operation_count += 1
+            values = {
+                name: value if isinstance(value, str) else json.dumps(value, default=str)
+                for name, value in fields.items()
+            }
+            return await self.client.xadd(self._get_key(key), values, maxlen=maxlen, approximate=True)
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis XADD operation failed for key {key}: {e}")
+            return None
+
+    async def stream_length(self, key: str) -> int:
+        try:
+            self.operation_count += 1
+            return await self.client.xlen(self._get_key(key))
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis XLEN operation failed for key {key}: {e}")
+            return 0
+
+    async def stream_create_group(self, key: str, group: str, start_id: str = "0") -> bool:
+        """Создать группу потребителей (вместе со stream, если его нет)"""
+        try:
+            self.operation_count += 1
+            await self.client.xgroup_create(self._get_key(key), group, id=start_id, mkstream=True)
+            return True
+        except redis.ResponseError as e:
+            if "BUSYGROUP" in str(e):
+                return True
+            self.error_count += 1
+            logger.error(f"Redis XGROUP CREATE operation failed for key {key}: {e}")
+            return False
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis XGROUP CREATE operation failed for key {key}: {e}")
+            return False
+
+    async def stream_read_group(self, key: str, group: str, consumer: str, last_id: str = ">",
+                                count: int = 100, block: Optional[int] = None) -> Optional[List[Tuple[str, Dict[str, str]]]]:
+        """
+        Прочитать записи группой потребителей
+
+        last_id=">" - новые записи, "0" - неподтвержденные записи этого
+        потребителя. Возвращает список (ID, поля) или None при ошибке.
+        """
+        try:
+            self.operation_count += 1
+            result = await self.client.xreadgroup(
+                group, consumer, {self._get_key(key): last_id}, count=count, block=block
+            )
+            return result[0][1] if result else []
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis XREADGROUP operation failed for key {key}: {e}")
+            return None
+
+    async def stream_ack(self, key: str, group: str, *ids: str) -> Optional[int]:
+        try:
+            self.operation_count += 1
+            return await self.client.xack(self._get_key(key), group, *ids)
+        except Exception as e:
+            self.error_count += 1
+            logger.error(f"Redis XACK operation failed for key {key}: {e}")
+            return None
+
 # ------------------------------
 # Декоратор кэширования
 # ------------------------------
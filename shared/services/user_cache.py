@@ -0,0 +1,228 @@
+"""
+VideoBot Pro - User Cache
+Двухуровневый кэш снимков пользователей (память процесса + Redis)
+с межпроцессной инвалидацией через pub/sub
+"""
+
+import time
+import json
+import asyncio
+import structlog
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import DateTime
+
+from shared.config.settings import settings
+from shared.models import User
+from shared.services.redis import get_redis_client
+
+logger = structlog.get_logger(__name__)
+
+class UserCache:
+    """
+    Кэш пользователей по telegram_id
+
+    Первый уровень - ограниченный LRU в памяти процесса, второй - Redis,
+    общий для всех реплик бота. Любое изменение статуса (бан, Premium,
+    trial, удаление) должно вызывать invalidate(): запись удаляется из
+    Redis, а всем процессам рассылается сообщение, по которому они
+    выбрасывают локальную копию. Короткий локальный TTL - страховка на
+    случай потерянного сообщения.
+    """
+
+    KEY_PREFIX = "user_cache"
+    CHANNEL = "user_cache:invalidate"
+
+    def __init__(self, max_entries: int = None, ttl: int = None, local_ttl: int = None):
+        self.max_entries = max_entries or settings.USER_CACHE_SIZE
+        self.ttl = ttl or settings.USER_CACHE_TTL
+        self.local_ttl = local_ttl or settings.USER_CACHE_LOCAL_TTL
+
+        self._local: 'OrderedDict[int, Tuple[float, User]]' = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._datetime_columns = {
+            column.name for column in User.__table__.columns if isinstance(column.type, DateTime)
+        }
+
+        self.stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _key(self, telegram_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{telegram_id}"
+
+    def _ensure_listener(self):
+        """Запуск подписчика на инвалидации в текущем event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._listener and not self._listener.done():
+            return
+
+        if self._loop is not loop:
+            # Сообщения, пришедшие без подписчика, потеряны
+            self._local.clear()
+
+        self._loop = loop
+        self._listener = loop.create_task(self._listen())
+
+    def get_local(self, telegram_id: int) -> Optional[User]:
+        """Поиск только в памяти процесса"""
+        item = self._local.get(telegram_id)
+        if not item:
+            return None
+
+        expires_at, user = item
+        if expires_at <= time.monotonic():
+            self._local.pop(telegram_id, None)
+            return None
+
+        self._local.move_to_end(telegram_id)
+        return user
+
+    def _set_local(self, telegram_id: int, user: User):
+        self._local[telegram_id] = (time.monotonic() + self.local_ttl, user)
+        self._local.move_to_end(telegram_id)
+
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, telegram_id: int) -> Optional[User]:
+        """
+        Поиск снимка пользователя
+
+        Args:
+            telegram_id: Telegram ID пользователя
+
+        Returns:
+            Объект User (не привязан к сессии) или None
+        """
+        self._ensure_listener()
+
+        user = self.get_local(telegram_id)
+        if user is not None:
+            self.stats['local_hits'] += 1
+            return user
+
+        try:
+            redis_client = await get_redis_client()
+            data = await redis_client.get(self._key(telegram_id))
+        except Exception as e:
+            logger.warning(f"User cache lookup failed: {e}", telegram_id=telegram_id)
+            data = None
+
+        if isinstance(data, dict):
+            user = self._restore(data)
+            if user is not None:
+                self.stats['redis_hits'] += 1
+                self._set_local(telegram_id, user)
+                return user
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, user: User):
+        """Сохранение снимка в оба уровня"""
+        if not user or not user.telegram_id:
+            return
+
+        self._ensure_listener()
+        self._set_local(user.telegram_id, user)
+
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.set(self._key(user.telegram_id), user.to_dict(), expire=self.ttl)
+        except Exception as e:
+            logger.warning(f"User cache store failed: {e}", telegram_id=user.telegram_id)
+
+    async def invalidate(self, telegram_id: int):
+        """
+        Удаление снимка во всех процессах
+
+        Вызывается после commit изменения пользователя.
+        """
+        self.discard_local(telegram_id)
+        self.stats['invalidations'] += 1
+
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.delete(self._key(telegram_id))
+            await redis_client.publish(self.CHANNEL, {'telegram_id': telegram_id})
+        except Exception as e:
+            logger.warning(f"User cache invalidate failed: {e}", telegram_id=telegram_id)
+
+    async def _listen(self):
+        """Прием сообщений об инвалидации от других процессов"""
+        while True:
+            pubsub = None
+            try:
+                redis_client = await get_redis_client()
+                pubsub = await redis_client.create_subscription(self.CHANNEL)
+                if not pubsub:
+                    await asyncio.sleep(5)
+                    continue
+
+                # Пока подписки не было, сообщения могли потеряться
+                self._local.clear()
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if not message or message.get('type') != 'message':
+                        continue
+
+                    try:
+                        telegram_id = json.loads(message['data']).get('telegram_id')
+                    except (json.JSONDecodeError, TypeError, AttributeError):
+                        continue
+
+                    if telegram_id is not None:
+                        self.discard_local(int(telegram_id))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User cache subscription error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                if pubsub:
+                    try:
+                        await pubsub.unsubscribe()
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    def _restore(self, data: Dict[str, Any]) -> Optional[User]:
+        """Восстановление объекта User из словаря to_dict()"""
+        try:
+            values = dict(data)
+            for name in self._datetime_columns:
+                if isinstance(values.get(name), str):
+                    values[name] = datetime.fromisoformat(values[name])
+            return User.from_dict(values)
+        except Exception as e:
+            logger.warning(f"Broken user cache entry: {e}")
+            return None
+
+    def discard_local(self, telegram_id: int):
+        """Удаление снимка только из памяти процесса"""
+        self._local.pop(telegram_id, None)
+
+    def clear_local(self):
+        """Очистка кэша в памяти процесса"""
+        self._local.clear()
+
+    async def stop(self):
+        """Остановка подписчика"""
+        task, self._listener = self._listener, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кэша"""
+        return {**self.stats, 'local_entries': len(self._local)}
+
+# Глобальный экземпляр кэша
+user_cache = UserCache()
@@ -56,6 +56,9 @@ from .rate_limiter import (
     RateLimiter,
     MemoryRateLimiter,
     RedisRateLimiter,
+    RedisRateLimitEngine,
+    RateLimitResult,
+    TokenBucketRateLimiter,
     UserRateLimiter,
     GlobalRateLimiter
 )
@@ -88,6 +91,7 @@ __all__ = [
     
     # Rate Limiting
     'RateLimiter', 'MemoryRateLimiter', 'RedisRateLimiter',
+    'RedisRateLimitEngine', 'RateLimitResult', 'TokenBucketRateLimiter',
     'UserRateLimiter', 'GlobalRateLimiter',
     
     # Encryption
@@ -3,13 +3,19 @@ VideoBot Pro - Rate Limiting Utilities
 Утилиты для ограничения частоты запросов
 """
 
+import math
 import time
 import asyncio
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, Any, Union
+from dataclasses import dataclass
+from typing import Dict, Optional, Any, Union, List
 from datetime import datetime, timedelta
 from collections import defaultdict, deque
 import structlog
+from redis.exceptions import NoScriptError
+
+from ..config.settings import settings
 
 logger = structlog.get_logger(__name__)
 
@@ -20,6 +26,218 @@ class RateLimitExceeded(Exception):
         self.retry_after = retry_after
         super().__init__(message)
 
+@dataclass
+class RateLimitResult:
+    """Результат проверки лимита"""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float = 0.0  # Секунды до момента, когда запрос будет разрешен
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'allowed': self.allowed,
+            'limit': self.limit,
+            'remaining': self.remaining,
+            'retry_after': self.retry_after
+        }
+
+# Скользящее окно со счетчиками: в hash хранятся начало текущего окна,
+# счетчик текущего и счетчик предыдущего окна. Оценка числа запросов -
+# счетчик предыдущего окна, взвешенный долей, которая еще попадает в
+# скользящее окно, плюс счетчик текущего. Время берется у Redis, чтобы
+# реплики с разными часами считали одинаково.
+# ARGV: limit, window (мс), cost. Возвращает {allowed, remaining, retry_after_ms}
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window_start = now - (now % window)
+
+local state = redis.call('HMGET', key, 'start', 'cur', 'prev')
+local start = tonumber(state[1])
+local cur = tonumber(state[2]) or 0
+local prev = tonumber(state[3]) or 0
+
+if start ~= window_start then
+    if start == window_start - window then
+        prev = cur
+    else
+        prev = 0
+    end
+    cur = 0
+end
+
+local elapsed = now - window_start
+local estimated = prev * (window - elapsed) / window + cur
+
+if estimated + cost <= limit then
+    if cost > 0 then
+        redis.call('HSET', key, 'start', window_start, 'cur', cur + cost, 'prev', prev)
+        redis.call('PEXPIRE', key, window * 2)
+    end
+    return {1, math.floor(limit - estimated - cost), 0}
+end
+
+-- Вклад предыдущего окна убывает линейно, поэтому момент, когда запрос
+-- поместится в лимит, вычисляется точно
+local wait
+if cur + cost <= limit then
+    wait = window - (limit - cur - cost) * window / prev - elapsed
+else
+    local carry = 0
+    if cur > 0 then
+        carry = math.max(0, window - (limit - cost) * window / cur)
+    end
+    wait = window - elapsed + carry
+end
+
+return {0, math.max(0, math.floor(limit - estimated)), math.ceil(wait)}
+"""
+
+# GCRA (эквивалент token bucket): в ключе хранится одно число -
+# теоретическое время прибытия (TAT) следующего запроса в микросекундах.
+# ARGV: интервал между токенами (мкс), емкость, cost, apply (1 - списать,
+# 0 - только посчитать). Возвращает {allowed, remaining, retry_after_us}
+GCRA_SCRIPT = """
+local key = KEYS[1]
+local emission = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local apply = tonumber(ARGV[4])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+
+local tat = tonumber(redis.call('GET', key)) or now
+if tat < now then
+    tat = now
+end
+
+local capacity = emission * burst
+local new_tat = tat + emission * cost
+local allow_at = new_tat - capacity
+
+if allow_at > now then
+    local remaining = math.floor((capacity - (tat - now)) / emission)
+    return {0, math.max(0, remaining), math.ceil(allow_at - now)}
+end
+
+if apply == 1 and cost > 0 then
+    local ttl = math.max(1, math.ceil((new_tat - now) / 1000))
+    redis.call('SET', key, string.format('%d', new_tat), 'PX', ttl)
+end
+
+return {1, math.floor((capacity - (new_tat - now)) / emission), 0}
+"""
+
+class _LuaScript:
+    """Lua скрипт, выполняемый через EVALSHA с загрузкой при NOSCRIPT"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    async def __call__(self, client, key: str, *args) -> List[int]:
+        try:
+            return await client.evalsha(self.sha, 1, key, *args)
+        except NoScriptError:
+            return await client.eval(self.source, 1, key, *args)
+
+_sliding_window_script = _LuaScript(SLIDING_WINDOW_SCRIPT)
+_gcra_script = _LuaScript(GCRA_SCRIPT)
+
+class RedisRateLimitEngine:
+    """
+    Движок ограничения частоты запросов на Lua скриптах
+
+    Каждая проверка - один EVALSHA: чтение состояния, решение и запись
+    выполняются атомарно на стороне Redis. На ключ хранится O(1) данных
+    (три числа для скользящего окна, одно для GCRA), а retry_after
+    вычисляется точно, а не округляется до размера окна.
+    """
+
+    def __init__(self, redis_client=None, key_prefix: str = "rate_limit:"):
+        """
+        Args:
+            redis_client: Клиент redis.asyncio; по умолчанию общий
+                клиент RedisService (ключи получают REDIS_PREFIX)
+            key_prefix: Префикс ключей лимитов
+        """
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+
+    async def _client(self):
+        if self.redis is not None:
+            return self.redis, self.key_prefix
+
+        from shared.services.redis import get_redis_client
+        service = await get_redis_client()
+        return service.client, f"{settings.REDIS_PREFIX}{self.key_prefix}"
+
+    async def sliding_window(self, key: str, limit: int, window: float,
+                             cost: int = 1) -> RateLimitResult:
+        """
+        Проверка лимита скользящим окном
+
+        Args:
+            key: Ключ клиента
+            limit: Лимит запросов в окне
+            window: Размер окна в секундах
+            cost: Стоимость запроса (0 - только узнать остаток)
+        """
+        if cost > limit:
+            raise ValueError(f"Request cost {cost} exceeds limit {limit}")
+
+        client, prefix = await self._client()
+        allowed, remaining, retry_ms = await _sliding_window_script(
+            client, f"{prefix}{key}", limit, max(1, int(window * 1000)), cost
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=limit,
+            remaining=int(remaining),
+            retry_after=int(retry_ms) / 1000
+        )
+
+    async def gcra(self, key: str, limit: int, period: float, burst: int = None,
+                   cost: int = 1, apply: bool = True) -> RateLimitResult:
+        """
+        Проверка лимита алгоритмом GCRA (token bucket без фонового пополнения)
+
+        Args:
+            key: Ключ клиента
+            limit: Количество токенов, пополняемых за period
+            period: Период пополнения в секундах
+            burst: Емкость bucket (по умолчанию limit)
+            cost: Количество запрашиваемых токенов
+            apply: False - только рассчитать, не списывая токены
+        """
+        burst = burst or limit
+        if cost > burst:
+            raise ValueError(f"Request cost {cost} exceeds burst {burst}")
+
+        emission_us = max(1, int(period * 1_000_000 / limit))
+        client, prefix = await self._client()
+        allowed, remaining, retry_us = await _gcra_script(
+            client, f"{prefix}{key}", emission_us, burst, cost, 1 if apply else 0
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=burst,
+            remaining=int(remaining),
+            retry_after=int(retry_us) / 1_000_000
+        )
+
+    async def reset(self, key: str):
+        """Сброс состояния ключа"""
+        client, prefix = await self._client()
+        await client.delete(f"{prefix}{key}")
+
 class RateLimiter(ABC):
     """Абстрактный базовый класс для rate limiter'ов"""
     
@@ -48,6 +266,22 @@ class RateLimiter(ABC):
         """Сбрасывает лимит для ключа"""
         pass
 
+    async def check(self, key: str, limit: int, window: int, cost: int = 1) -> RateLimitResult:
+        """
+        Проверка лимита с остатком и временем ожидания
+
+        Реализации переопределяют метод, чтобы получать все значения
+        за одно обращение к хранилищу.
+        """
+        allowed = await self.is_allowed(key, limit, window)
+        remaining = await self.get_remaining(key, limit, window)
+        return RateLimitResult(
+            allowed=allowed,
+            limit=limit,
+            remaining=remaining,
+            retry_after=0.0 if allowed else float(window)
+        )
+
 class MemoryRateLimiter(RateLimiter):
     """Rate limiter в памяти (для одного процесса)"""
     
@@ -57,22 +291,39 @@ class MemoryRateLimiter(RateLimiter):
     
     async def is_allowed(self, key: str, limit: int, window: int) -> bool:
         """Проверка лимита запросов"""
+        result = await self.check(key, limit, window)
+        return result.allowed
+
+    async def check(self, key: str, limit: int, window: int, cost: int = 1) -> RateLimitResult:
+        """Проверка лимита с точным временем ожидания"""
         async with self._lock:
             now = time.time()
             request_times = self._requests[key]
-            
+
             # Удаляем старые запросы
             while request_times and request_times[0] <= now - window:
                 request_times.popleft()
-            
+
             # Проверяем лимит
-            if len(request_times) >= limit:
-                return False
-            
+            if len(request_times) + cost > limit:
+                # Ждем, пока из окна выйдет достаточно старых запросов
+                index = min(len(request_times), len(request_times) + cost - limit) - 1
+                retry_after = request_times[index] + window - now if index >= 0 else float(window)
+                return RateLimitResult(
+                    allowed=False,
+                    limit=limit,
+                    remaining=max(0, limit - len(request_times)),
+                    retry_after=max(0.0, retry_after)
+                )
+
             # Добавляем текущий запрос
-            request_times.append(now)
-            return True
-    
+            request_times.extend([now] * cost)
+            return RateLimitResult(
+                allowed=True,
+                limit=limit,
+                remaining=limit - len(request_times)
+            )
+
     async def get_remaining(self, key: str, limit: int, window: int) -> int:
         """Получает оставшиеся запросы"""
         async with self._lock:
@@ -110,70 +361,59 @@ class MemoryRateLimiter(RateLimiter):
                 del self._requests[key]
 
 class RedisRateLimiter(RateLimiter):
-    """Rate limiter с использованием Redis"""
+    """Rate limiter с использованием Redis (скользящее окно на Lua)"""
     
-    def __init__(self, redis_client):
-        self.redis = redis_client
+    def __init__(self, redis_client=None, engine: RedisRateLimitEngine = None):
+        self.engine = engine or RedisRateLimitEngine(redis_client)
     
     async def is_allowed(self, key: str, limit: int, window: int) -> bool:
         """Проверка с использованием Redis sliding window"""
-        now = time.time()
-        pipeline = self.redis.pipeline()
-        
-        # Удаляем старые записи
-        pipeline.zremrangebyscore(key, 0, now - window)
-        
-        # Получаем текущее количество запросов
-        pipeline.zcard(key)
-        
-        # Добавляем текущий запрос
-        pipeline.zadd(key, {str(now): now})
-        
-        # Устанавливаем TTL
-        pipeline.expire(key, window + 1)
-        
-        results = await pipeline.execute()
-        current_requests = results[1]
-        
-        return current_requests < limit
+        result = await self.engine.sliding_window(key, limit, window)
+        return result.allowed
+    
+    async def check(self, key: str, limit: int, window: int, cost: int = 1) -> RateLimitResult:
+        """Проверка лимита за один EVALSHA"""
+        return await self.engine.sliding_window(key, limit, window, cost)
     
     async def get_remaining(self, key: str, limit: int, window: int) -> int:
-        """Получает оставшиеся запросы через Redis"""
-        now = time.time()
-        
-        # Удаляем старые записи
-        await self.redis.zremrangebyscore(key, 0, now - window)
-        
-        # Получаем текущее количество
-        current = await self.redis.zcard(key)
-        
-        return max(0, limit - current)
+        """Получает оставшиеся запросы без списания"""
+        result = await self.engine.sliding_window(key, limit, window, cost=0)
+        return result.remaining
     
     async def reset_key(self, key: str):
         """Сбрасывает ключ в Redis"""
-        await self.redis.delete(key)
-    
-    async def get_window_requests(self, key: str, window: int) -> list:
-        """Получает все запросы в текущем окне"""
-        now = time.time()
-        return await self.redis.zrangebyscore(key, now - window, now)
+        await self.engine.reset(key)
 
 class TokenBucketRateLimiter:
     """Rate limiter на основе алгоритма Token Bucket"""
     
-    def __init__(self, capacity: int, refill_rate: float):
+    def __init__(self, capacity: int, refill_rate: float,
+                 engine: RedisRateLimitEngine = None):
         """
         Args:
             capacity: Максимальная емкость bucket
             refill_rate: Скорость пополнения токенов в секунду
+            engine: Движок Redis; без него bucket хранится в памяти процесса
         """
         self.capacity = capacity
         self.refill_rate = refill_rate
+        self.engine = engine
         self._buckets: Dict[str, Dict[str, float]] = {}
         self._lock = asyncio.Lock()
     
+    async def _gcra(self, key: str, tokens: int, apply: bool) -> RateLimitResult:
+        # refill_rate токенов в секунду = один токен за 1/refill_rate секунд
+        return await self.engine.gcra(
+            key, limit=1, period=1 / self.refill_rate, burst=self.capacity,
+            cost=tokens, apply=apply
+        )
+    
     async def is_allowed(self, key: str, tokens_requested: int = 1) -> bool:
         """Проверяет доступность токенов"""
+        if self.engine:
+            result = await self._gcra(key, tokens_requested, apply=True)
+            return result.allowed
+        
         async with self._lock:
             now = time.time()
             
@@ -200,6 +440,10 @@ class TokenBucketRateLimiter:
     
     async def get_available_tokens(self, key: str) -> float:
         """Получает количество доступных токенов"""
+        if self.engine:
+            result = await self._gcra(key, 0, apply=False)
+            return float(result.remaining)
+        
         async with self._lock:
             now = time.time()
             
@@ -214,6 +458,10 @@ class TokenBucketRateLimiter:
     
     async def wait_for_tokens(self, key: str, tokens_needed: int = 1) -> float:
         """Рассчитывает время ожидания для получения токенов"""
+        if self.engine:
+            result = await self._gcra(key, tokens_needed, apply=False)
+            return result.retry_after
+        
         available = await self.get_available_tokens(key)
         
         if available >= tokens_needed:
@@ -252,25 +500,21 @@ class UserRateLimiter:
         limits = self.user_limits.get(user_type, self.user_limits['free'])
         key = f"user:{user_id}:{action}"
         
-        allowed = await self.limiter.is_allowed(
-            key, limits['requests'], limits['window']
-        )
-        
-        remaining = await self.limiter.get_remaining(
+        check = await self.limiter.check(
             key, limits['requests'], limits['window']
         )
         
         result = {
-            'allowed': allowed,
-            'remaining': remaining,
+            'allowed': check.allowed,
+            'remaining': check.remaining,
             'limit': limits['requests'],
             'window': limits['window'],
             'user_type': user_type,
             'reset_time': int(time.time()) + limits['window']
         }
         
-        if not allowed:
-            result['retry_after'] = limits['window']
+        if not check.allowed:
+            result['retry_after'] = math.ceil(check.retry_after)
         
         return result
     
@@ -286,20 +530,16 @@ class UserRateLimiter:
         limits = download_limits.get(user_type, download_limits['free'])
         key = f"download:{user_id}"
         
-        allowed = await self.limiter.is_allowed(
-            key, limits['requests'], limits['window']
-        )
-        
-        remaining = await self.limiter.get_remaining(
+        check = await self.limiter.check(
             key, limits['requests'], limits['window']
         )
         
         return {
-            'allowed': allowed,
-            'remaining': remaining,
+            'allowed': check.allowed,
+            'remaining': check.remaining,
             'limit': limits['requests'],
             'window_minutes': limits['window'] // 60,
-            'retry_after': limits['window'] if not allowed else 0
+            'retry_after': math.ceil(check.retry_after) if not check.allowed else 0
         }
 
 class GlobalRateLimiter:
@@ -327,20 +567,20 @@ class GlobalRateLimiter:
         
         # Проверяем глобальный лимит
         global_key = f"global:{action}"
-        global_allowed = await self.limiter.is_allowed(
+        global_check = await self.limiter.check(
             global_key, limits['requests'], limits['window']
         )
         
         result = {
-            'allowed': global_allowed,
+            'allowed': global_check.allowed,
             'action': action,
             'global_limit': limits['requests'],
             'window': limits['window']
         }
         
-        if not global_allowed:
+        if not global_check.allowed:
             result['reason'] = 'global_limit_exceeded'
-            result['retry_after'] = limits['window']
+            result['retry_after'] = math.ceil(global_check.retry_after)
             return result
         
         # Если есть IP, проверяем лимит по IP
@@ -348,14 +588,14 @@ class GlobalRateLimiter:
             ip_limit = limits['requests'] // 10  # IP лимит в 10 раз меньше глобального
             ip_key = f"ip:{ip_address}:{action}"
             
-            ip_allowed = await self.limiter.is_allowed(
+            ip_check = await self.limiter.check(
                 ip_key, ip_limit, limits['window']
             )
             
-            if not ip_allowed:
+            if not ip_check.allowed:
                 result['allowed'] = False
                 result['reason'] = 'ip_limit_exceeded'
-                result['retry_after'] = limits['window']
+                result['retry_after'] = math.ceil(ip_check.retry_after)
         
         return result
     
@@ -493,10 +733,11 @@ def rate_limit(key_func: callable, limit: int, window: int,
         async def wrapper(*args, **kwargs):
             key = key_func(*args, **kwargs)
             
-            if not await limiter.is_allowed(key, limit, window):
+            result = await limiter.check(key, limit, window)
+            if not result.allowed:
                 raise RateLimitExceeded(
                     f"Rate limit exceeded for key: {key}",
-                    retry_after=window
+                    retry_after=math.ceil(result.retry_after)
                 )
             
             return await func(*args, **kwargs)
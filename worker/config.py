@@ -42,6 +42,46 @@ class WorkerConfig:
     # Настройки хранилища
     local_storage_path: str = field(default_factory=lambda: str(Path.cwd() / "storage"))
     
+    # Multipart загрузка больших файлов
+    multipart_threshold_mb: int = 100
+    multipart_part_size_mb: int = 16
+    multipart_concurrency: int = 4
+    
+    # Конвейерная обработка после загрузки видео
+    download_pipeline_enabled: bool = True
+    pipeline_stage_limits: Dict[str, int] = field(default_factory=lambda: {
+        'processing': 1,
+        'audio': 2,
+        'thumbnail': 2,
+        'upload': 3,
+    })
+    
+    # Параллелизм пакетной загрузки по типу пользователя
+    batch_parallelism: Dict[str, int] = field(default_factory=lambda: {
+        'free': 2,
+        'trial': 4,
+        'premium': 20,
+        'admin': 20,
+    })
+    
+    # Кэш загрузок: доля срока ссылки пользователя, которую должна
+    # прожить ссылка из кэша (1.0 - не короче ссылки новой загрузки)
+    download_cache_min_ttl_ratio: float = 0.5
+    
+    # Процессы ffmpeg/ffprobe: лимит на процесс worker'а (дочерний процесс
+    # prefork). 0 - ядра хоста делятся между worker_concurrency процессами
+    media_concurrency: int = 0
+    media_poll_interval: float = 1.0  # Проверка таймаута и отмены, секунды
+    
+    # Кэш ffprobe
+    probe_cache_size: int = 512
+    probe_cache_shared: bool = False  # Обмен через Redis по хэшу содержимого
+    probe_cache_ttl: int = 86400
+    
+    # Кэш метаданных yt-dlp
+    metadata_cache_ttl: int = 600  # 10 минут - ссылки на форматы быстро истекают
+    metadata_cache_size: int = 256
+    
     def __post_init__(self):
         """Инициализация после создания"""
         # Создаем директории
@@ -178,6 +218,12 @@ def validate_config() -> List[str]:
         if worker_config.max_file_size_mb < 1:
             errors.append("Max file size must be at least 1 MB")
         
+        if worker_config.multipart_part_size_mb < 5:
+            errors.append("Multipart part size must be at least 5 MB")
+        
+        if worker_config.multipart_concurrency < 1:
+            errors.append("Multipart concurrency must be at least 1")
+        
         # Проверяем доступность инструментов
         try:
             import subprocess
@@ -243,6 +289,17 @@ def load_config_from_env():
         'WORKER_BASE_DIR': 'base_dir',
         'WORKER_TEMP_DIR': 'download_temp_dir',
         'WORKER_STORAGE_PATH': 'local_storage_path',
+        'MULTIPART_THRESHOLD_MB': ('multipart_threshold_mb', int),
+        'MULTIPART_PART_SIZE_MB': ('multipart_part_size_mb', int),
+        'MULTIPART_CONCURRENCY': ('multipart_concurrency', int),
+        'DOWNLOAD_CACHE_MIN_TTL_RATIO': ('download_cache_min_ttl_ratio', float),
+        'MEDIA_CONCURRENCY': ('media_concurrency', int),
+        'MEDIA_POLL_INTERVAL': ('media_poll_interval', float),
+        'PROBE_CACHE_SIZE': ('probe_cache_size', int),
+        'PROBE_CACHE_SHARED': ('probe_cache_shared', lambda value: value.lower() in ('1', 'true', 'yes')),
+        'PROBE_CACHE_TTL': ('probe_cache_ttl', int),
+        'METADATA_CACHE_TTL': ('metadata_cache_ttl', int),
+        'METADATA_CACHE_SIZE': ('metadata_cache_size', int),
     }
     
     updates = {}
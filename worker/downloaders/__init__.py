@@ -15,6 +15,9 @@ from .base import (
     QualityNotAvailableError,
 )
 
+# Кэш метаданных
+from .metadata_cache import MetadataCache, metadata_cache
+
 # Реализации downloaders
 from .youtube import YouTubeDownloader
 from .tiktok import TikTokDownloader
@@ -272,6 +275,10 @@ __all__ = [
     'DownloadTimeoutError',
     'QualityNotAvailableError',
     
+    # Кэш метаданных
+    'MetadataCache',
+    'metadata_cache',
+    
     # Downloaders
     'YouTubeDownloader',
     'TikTokDownloader',
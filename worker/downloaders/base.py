@@ -4,6 +4,7 @@ VideoBot Pro - Base Downloader
 """
 
 import os
+import copy
 import asyncio
 import tempfile
 from abc import ABC, abstractmethod
@@ -13,6 +14,8 @@ from datetime import datetime
 from pathlib import Path
 import structlog
 
+from .metadata_cache import metadata_cache
+
 logger = structlog.get_logger(__name__)
 
 # Исключения
@@ -247,6 +250,79 @@ class BaseDownloader(ABC):
         # Базовая реализация - переопределяется в наследниках
         return None
     
+    def _metadata_key(self, url: str) -> str:
+        """Ключ кэша метаданных для URL"""
+        return metadata_cache.make_key(self.platform_name, url, self._extract_video_id(url))
+    
+    def _get_cached_info(self, url: str) -> Optional[Dict[str, Any]]:
+        """Метаданные из памяти процесса без обращения к сети"""
+        return metadata_cache.get_local(self._metadata_key(url))
+    
+    async def _extract_info(self, url: str, ydl_opts: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        Получение info-словаря yt-dlp через кэш метаданных
+        
+        Args:
+            url: URL видео
+            ydl_opts: Дополнительные настройки yt-dlp
+            
+        Returns:
+            Санитизированный info-словарь или None
+        """
+        key = self._metadata_key(url)
+        info = await metadata_cache.get(key)
+        if info is not None:
+            return info
+        
+        import yt_dlp
+        
+        opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'user-agent': self.user_agent,
+        }
+        if self.session_cookies:
+            opts['cookiefile'] = self.session_cookies
+        if ydl_opts:
+            opts.update(ydl_opts)
+        
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = await asyncio.to_thread(ydl.extract_info, url, download=False)
+        
+        if not info:
+            return None
+        
+        # Тот же формат, что и у --load-info-json: словарь можно сериализовать
+        # и повторно передать в process_ie_result
+        info = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+        await metadata_cache.set(key, info)
+        return info
+    
+    async def _download_with_info(self, ydl, url: str, info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Скачивание по уже извлеченному info-словарю
+        
+        Выбор формата выполняется настройками переданного YoutubeDL без
+        повторного извлечения метаданных. Если ссылки в закэшированном
+        словаре истекли, запись сбрасывается и видео извлекается заново.
+        
+        Returns:
+            Обработанный info-словарь с выбранными форматами
+        """
+        try:
+            return await asyncio.to_thread(ydl.process_ie_result, copy.deepcopy(info), True)
+        except Exception as e:
+            self.logger.warning(f"Download from cached info failed, re-extracting: {e}")
+            
+            key = self._metadata_key(url)
+            await metadata_cache.invalidate(key)
+            
+            fresh_info = await asyncio.to_thread(ydl.extract_info, url, download=True)
+            if fresh_info:
+                await metadata_cache.set(key, ydl.sanitize_info(fresh_info, remove_private_keys=True))
+            return fresh_info
+    
     async def _download_with_progress(
         self,
         download_func: Callable,
@@ -12,6 +12,7 @@ from urllib.parse import urlparse, parse_qs
 from datetime import datetime
 
 from .base import BaseDownloader, DownloadResult, VideoInfo, DownloadError
+from .metadata_cache import metadata_cache
 from worker.config import get_downloader_config
 
 logger = structlog.get_logger(__name__)
@@ -69,15 +70,24 @@ class InstagramDownloader(BaseDownloader):
             if not video_id:
                 raise DownloadError(f"Cannot extract video ID from URL: {url}")
             
+            # Загрузчик синхронный, поэтому используется только кэш в памяти процесса
+            cache_key = metadata_cache.make_key(self.PLATFORM, url, video_id)
+            video_info = metadata_cache.get_local(cache_key)
+            if video_info:
+                return video_info
+            
             # Определяем тип контента
             if '/stories/' in url:
-                return self._get_story_info(url, video_id)
+                video_info = self._get_story_info(url, video_id)
             elif '/reel/' in url:
-                return self._get_reel_info(url, video_id)
+                video_info = self._get_reel_info(url, video_id)
             elif '/tv/' in url:
-                return self._get_igtv_info(url, video_id)
+                video_info = self._get_igtv_info(url, video_id)
             else:
-                return self._get_post_info(url, video_id)
+                video_info = self._get_post_info(url, video_id)
+            
+            metadata_cache.set_local(cache_key, video_info)
+            return video_info
                 
         except Exception as e:
             logger.error(f"Error getting Instagram video info: {e}", url=url)
@@ -0,0 +1,131 @@
+"""
+VideoBot Pro - Metadata Cache
+Кэш результатов извлечения метаданных (yt-dlp extract_info), общий
+для всех загрузчиков: получение информации, выбор качества и скачивание
+используют один и тот же info-словарь
+"""
+
+import time
+import hashlib
+import structlog
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from shared.services.redis import get_redis_client
+from worker.config import worker_config
+
+logger = structlog.get_logger(__name__)
+
+class MetadataCache:
+    """
+    Двухуровневый кэш метаданных видео
+
+    Первый уровень - LRU в памяти процесса с TTL, второй - Redis с тем же
+    TTL. Ключ строится из платформы и ID видео, поэтому бот может прогреть
+    кэш до постановки задачи, а worker найдет запись по тому же ключу.
+    TTL короткий: ссылки на форматы в info-словаре со временем истекают.
+    """
+
+    KEY_PREFIX = "video_metadata"
+
+    def __init__(self, max_entries: int = None, ttl: int = None):
+        self.max_entries = max_entries or worker_config.metadata_cache_size
+        self.ttl = ttl or worker_config.metadata_cache_ttl
+        self._local: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self.stats = {'local_hits': 0, 'redis_hits': 0, 'misses': 0}
+
+    def make_key(self, platform: str, url: str, video_id: Optional[str] = None) -> str:
+        """Построение ключа по ID видео, а при его отсутствии - по URL"""
+        identifier = video_id or hashlib.sha1(url.encode()).hexdigest()
+        return f"{self.KEY_PREFIX}:{platform}:{identifier}"
+
+    def get_local(self, key: str) -> Optional[Any]:
+        """Поиск только в памяти процесса (для синхронного кода)"""
+        item = self._local.get(key)
+        if not item:
+            return None
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._local.pop(key, None)
+            return None
+
+        self._local.move_to_end(key)
+        return value
+
+    def set_local(self, key: str, value: Any, ttl: int = None):
+        """Сохранение только в памяти процесса"""
+        self._local[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._local.move_to_end(key)
+
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Поиск метаданных
+
+        Args:
+            key: Ключ из make_key
+
+        Returns:
+            info-словарь или None
+        """
+        info = self.get_local(key)
+        if info is not None:
+            self.stats['local_hits'] += 1
+            return info
+
+        try:
+            redis_client = await get_redis_client()
+            info = await redis_client.get(key)
+        except Exception as e:
+            logger.warning(f"Metadata cache lookup failed: {e}", key=key)
+            info = None
+
+        if isinstance(info, dict):
+            self.stats['redis_hits'] += 1
+            self.set_local(key, info)
+            return info
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, key: str, info: Dict[str, Any], ttl: int = None) -> bool:
+        """
+        Сохранение метаданных в оба уровня
+
+        Args:
+            key: Ключ из make_key
+            info: JSON-сериализуемый info-словарь
+            ttl: Время жизни в секундах
+
+        Returns:
+            True если запись попала в Redis
+        """
+        ttl = ttl or self.ttl
+        self.set_local(key, info, ttl)
+
+        try:
+            redis_client = await get_redis_client()
+            return await redis_client.set(key, info, expire=ttl)
+        except Exception as e:
+            logger.warning(f"Metadata cache store failed: {e}", key=key)
+            return False
+
+    async def invalidate(self, key: str):
+        """Удаление записи из обоих уровней"""
+        self._local.pop(key, None)
+
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.delete(key)
+        except Exception as e:
+            logger.warning(f"Metadata cache invalidate failed: {e}", key=key)
+
+    def clear_local(self):
+        """Очистка кэша в памяти процесса"""
+        self._local.clear()
+
+# Глобальный экземпляр кэша
+metadata_cache = MetadataCache()
@@ -5,7 +5,6 @@ VideoBot Pro - TikTok Downloader
 
 import re
 import os
-import asyncio
 import aiohttp
 from typing import Optional, List, Callable, Dict, Any
 from urllib.parse import urlparse
@@ -117,36 +116,26 @@ class TikTokDownloader(BaseDownloader):
     async def _get_info_via_yt_dlp(self, url: str) -> Optional[VideoInfo]:
         """Получение информации через yt-dlp"""
         try:
-            import yt_dlp
+            info = await self._extract_info(url)
             
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'user-agent': self.user_agent,
-            }
+            if not info:
+                return None
+            
+            return VideoInfo(
+                title=info.get('title', 'TikTok Video'),
+                author=info.get('uploader', 'Unknown'),
+                duration_seconds=info.get('duration', 0),
+                view_count=info.get('view_count'),
+                like_count=info.get('like_count'),
+                description=info.get('description'),
+                thumbnail_url=info.get('thumbnail'),
+                upload_date=info.get('upload_date'),
+                filesize_mb=self._estimate_tiktok_size(info),
+                available_qualities=['720p', '480p'],  # TikTok обычно 720p
+                is_live=False,
+                is_age_restricted=False,
+            )
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = await asyncio.to_thread(ydl.extract_info, url, download=False)
-                
-                if not info:
-                    return None
-                
-                return VideoInfo(
-                    title=info.get('title', 'TikTok Video'),
-                    author=info.get('uploader', 'Unknown'),
-                    duration_seconds=info.get('duration', 0),
-                    view_count=info.get('view_count'),
-                    like_count=info.get('like_count'),
-                    description=info.get('description'),
-                    thumbnail_url=info.get('thumbnail'),
-                    upload_date=info.get('upload_date'),
-                    filesize_mb=self._estimate_tiktok_size(info),
-                    available_qualities=['720p', '480p'],  # TikTok обычно 720p
-                    is_live=False,
-                    is_age_restricted=False,
-                )
-                
         except Exception as e:
             self.logger.debug(f"yt-dlp method failed: {e}")
             raise
@@ -271,15 +260,15 @@ class TikTokDownloader(BaseDownloader):
                 
                 ydl_opts['progress_hooks'] = [progress_hook]
             
+            # Метаданные уже извлечены при получении информации о видео
+            info = kwargs.get('info') or await self._extract_info(url)
+            
+            if not info:
+                raise Exception("Could not extract video info")
+            
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Получаем информацию
-                info = await asyncio.to_thread(ydl.extract_info, url, download=False)
-                
-                if not info:
-                    raise Exception("Could not extract video info")
-                
-                # Скачиваем
-                await asyncio.to_thread(ydl.download, [url])
+                # Скачиваем по готовому info-словарю
+                await self._download_with_info(ydl, url, info)
                 
                 # Находим скачанный файл
                 downloaded_file = self._find_downloaded_file(output_template)
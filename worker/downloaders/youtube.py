@@ -65,58 +65,52 @@ class YouTubeDownloader(BaseDownloader):
     async def get_video_info(self, url: str) -> Optional[VideoInfo]:
         """Получение информации о YouTube видео"""
         try:
-            import yt_dlp
+            # Получаем информацию без скачивания (через кэш метаданных)
+            info = await self._extract_info(url)
             
-            # Настройки для yt-dlp
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'user-agent': self.user_agent,
-            }
+            if not info:
+                return None
             
-            # Добавляем cookies если есть
-            if self.session_cookies:
-                ydl_opts['cookiefile'] = self.session_cookies
+            # Проверяем доступность видео
+            if info.get('availability') not in [None, 'public', 'unlisted']:
+                self.logger.warning(f"Video not available: {info.get('availability')}")
+                return None
+            
+            # Получаем доступные качества
+            formats = info.get('formats', [])
+            available_qualities = self._extract_available_qualities(formats)
+            
+            # Вычисляем примерный размер файла
+            filesize_mb = self._estimate_file_size(formats)
+            
+            return VideoInfo(
+                title=info.get('title', 'Unknown'),
+                author=info.get('uploader', 'Unknown'),
+                duration_seconds=info.get('duration', 0),
+                view_count=info.get('view_count'),
+                like_count=info.get('like_count'),
+                description=info.get('description'),
+                thumbnail_url=self._get_best_thumbnail(info.get('thumbnails', [])),
+                upload_date=info.get('upload_date'),
+                filesize_mb=filesize_mb,
+                available_qualities=available_qualities,
+                is_live=info.get('is_live', False),
+                is_age_restricted=info.get('age_limit', 0) > 0,
+            )
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Получаем информацию без скачивания
-                info = await asyncio.to_thread(ydl.extract_info, url, download=False)
-                
-                if not info:
-                    return None
-                
-                # Проверяем доступность видео
-                if info.get('availability') not in [None, 'public', 'unlisted']:
-                    self.logger.warning(f"Video not available: {info.get('availability')}")
-                    return None
-                
-                # Получаем доступные качества
-                formats = info.get('formats', [])
-                available_qualities = self._extract_available_qualities(formats)
-                
-                # Вычисляем примерный размер файла
-                filesize_mb = self._estimate_file_size(formats)
-                
-                return VideoInfo(
-                    title=info.get('title', 'Unknown'),
-                    author=info.get('uploader', 'Unknown'),
-                    duration_seconds=info.get('duration', 0),
-                    view_count=info.get('view_count'),
-                    like_count=info.get('like_count'),
-                    description=info.get('description'),
-                    thumbnail_url=self._get_best_thumbnail(info.get('thumbnails', [])),
-                    upload_date=info.get('upload_date'),
-                    filesize_mb=filesize_mb,
-                    available_qualities=available_qualities,
-                    is_live=info.get('is_live', False),
-                    is_age_restricted=info.get('age_limit', 0) > 0,
-                )
-                
         except Exception as e:
             self.logger.error(f"Error getting YouTube video info: {e}")
             return None
     
+    def get_available_qualities(self, url: str) -> List[str]:
+        """Доступные качества из кэша метаданных без повторного извлечения"""
+        info = self._get_cached_info(url)
+        if info:
+            qualities = self._extract_available_qualities(info.get('formats', []))
+            if qualities:
+                return qualities
+        return ["best"]
+    
     async def download_video(
         self,
         url: str,
@@ -177,24 +171,25 @@ class YouTubeDownloader(BaseDownloader):
                 
                 ydl_opts['progress_hooks'] = [progress_hook]
             
+            # Используем переданные или закэшированные метаданные,
+            # чтобы не извлекать их повторно
+            info = kwargs.get('info') or await self._extract_info(url)
+            
+            if not info:
+                return DownloadResult(success=False, error_message="Could not extract video info")
+            
+            # Проверяем размер файла
+            estimated_size = self._estimate_file_size(info.get('formats', []))
+            if estimated_size and estimated_size > self.max_file_size_mb:
+                return DownloadResult(
+                    success=False,
+                    error_message=f"File too large: {estimated_size:.1f}MB > {self.max_file_size_mb}MB"
+                )
+            
             # Выполняем скачивание
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Получаем информацию для финального имени файла
-                info = await asyncio.to_thread(ydl.extract_info, url, download=False)
-                
-                if not info:
-                    return DownloadResult(success=False, error_message="Could not extract video info")
-                
-                # Проверяем размер файла
-                estimated_size = self._estimate_file_size(info.get('formats', []))
-                if estimated_size and estimated_size > self.max_file_size_mb:
-                    return DownloadResult(
-                        success=False,
-                        error_message=f"File too large: {estimated_size:.1f}MB > {self.max_file_size_mb}MB"
-                    )
-                
-                # Скачиваем файл
-                await asyncio.to_thread(ydl.download, [url])
+                # Скачиваем файл по готовому info-словарю
+                info = await self._download_with_info(ydl, url, info) or info
                 
                 # Находим скачанный файл
                 downloaded_file = self._find_downloaded_file(output_template, info)
@@ -8,7 +8,7 @@ import aiohttp
 import aiofiles
 import structlog
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 from datetime import datetime
 
 from shared.config.settings import settings
@@ -25,6 +25,7 @@ class CDNUploadClient:
         self.cdn_base_url = f"http://{settings.CDN_HOST}:{settings.CDN_PORT}"
         self.timeout = aiohttp.ClientTimeout(total=600)  # 10 минут на загрузку
         self.max_retries = 3
+        self.chunk_size = settings.CDN_UPLOAD_CHUNK_SIZE
     
     async def upload_file(
         self,
@@ -32,7 +33,8 @@ class CDNUploadClient:
         task: DownloadTask,
         user: User,
         file_type: str = "video",
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        cleanup_local: bool = True
     ) -> Dict[str, Any]:
         """
         Загрузка файла в CDN
@@ -43,6 +45,7 @@ class CDNUploadClient:
             user: Пользователь
             file_type: Тип файла (video, audio, archive)
             metadata: Дополнительные метаданные
+            cleanup_local: Удалить локальный файл после успешной загрузки
             
         Returns:
             Результат загрузки с URL'ами
@@ -86,7 +89,8 @@ class CDNUploadClient:
                 )
                 
                 # Удаляем локальный файл после успешной загрузки
-                await self._cleanup_local_file(file_path)
+                if cleanup_local:
+                    await self._cleanup_local_file(file_path)
             
             return result
             
@@ -273,15 +277,13 @@ class CDNUploadClient:
             # Подготавливаем данные для загрузки
             data = aiohttp.FormData()
             
-            # Добавляем файл
-            async with aiofiles.open(file_path, 'rb') as f:
-                file_content = await f.read()
-                data.add_field(
-                    'file',
-                    file_content,
-                    filename=filename,
-                    content_type='application/octet-stream'
-                )
+            # Добавляем файл потоком: в памяти держим не больше одного чанка
+            data.add_field(
+                'file',
+                self._file_sender(file_path),
+                filename=filename,
+                content_type='application/octet-stream'
+            )
             
             # Добавляем метаданные
             data.add_field('user_type', user.user_type)
@@ -294,7 +296,8 @@ class CDNUploadClient:
             headers = {
                 'Authorization': f'Bearer {auth_token}',
                 'X-User-ID': str(user.id),
-                'X-Upload-Source': 'worker'
+                'X-Upload-Source': 'worker',
+                'X-File-Size': str(Path(file_path).stat().st_size)
             }
             
             # Выполняем загрузку
@@ -310,6 +313,15 @@ class CDNUploadClient:
                 
                 return result
     
+    async def _file_sender(self, file_path: str) -> AsyncIterator[bytes]:
+        """Чтение файла чанками фиксированного размера для потоковой загрузки"""
+        async with aiofiles.open(file_path, 'rb') as f:
+            while True:
+                chunk = await f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    
     async def _get_system_auth_token(self) -> str:
         """Получение системного токена аутентификации"""
         try:
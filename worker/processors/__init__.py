@@ -4,6 +4,11 @@ VideoBot Pro - Processors Package
 """
 
 from .base import BaseProcessor, ProcessingError, ValidationError, ResourceError, TimeoutError
+from .media_executor import (
+    MediaExecutor, MediaJob, MediaCancelledError, MediaTimeoutError,
+    media_executor, current_media_job
+)
+from .probe_cache import ProbeCache, ProbeRecord, probe_cache
 from .video_processor import VideoProcessor
 from .thumbnail_generator import ThumbnailGenerator
 from .quality_optimizer import QualityOptimizer
@@ -17,6 +22,17 @@ __all__ = [
     'ResourceError',
     'TimeoutError',
     
+    # Запуск ffmpeg/ffprobe
+    'MediaExecutor',
+    'MediaJob',
+    'MediaCancelledError',
+    'MediaTimeoutError',
+    'media_executor',
+    'current_media_job',
+    'ProbeCache',
+    'ProbeRecord',
+    'probe_cache',
+    
     # Процессоры
     'VideoProcessor',
     'ThumbnailGenerator',
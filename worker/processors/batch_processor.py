@@ -18,6 +18,7 @@ from .base import BaseProcessor
 from .video_processor import VideoProcessor
 from .thumbnail_generator import ThumbnailGenerator
 from .quality_optimizer import QualityOptimizer
+from .probe_cache import probe_cache
 
 try:
     from ..utils.progress_tracker import ProgressTracker
@@ -565,25 +566,16 @@ class BatchProcessor(BaseProcessor):
             file_size = os.path.getsize(file_path)
             
             # Получаем информацию о видео
-            cmd = [
-                'ffprobe', '-v', 'quiet', '-print_format', 'json',
-                '-show_format', '-show_streams', file_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            record = await probe_cache.probe(file_path)
             
             info = {
                 'size_mb': file_size / (1024 * 1024),
                 'size_bytes': file_size
             }
             
-            if process.returncode == 0:
+            if record:
                 try:
-                    probe_data = json.loads(stdout.decode())
+                    probe_data = record.to_probe_data()
                     format_info = probe_data.get('format', {})
                     
                     info.update({
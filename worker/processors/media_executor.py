@@ -0,0 +1,313 @@
+"""
+VideoBot Pro - Media Executor
+Асинхронный запуск ffmpeg/ffprobe: общий лимит процессов по числу ядер,
+таймауты, отмена по задаче загрузки и учет процессорного времени
+"""
+
+import os
+import time
+import asyncio
+import weakref
+import contextvars
+import structlog
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from shared.services.progress import is_cancel_requested
+from ..config import worker_config
+from .base import ProcessingError, TimeoutError as ProcessingTimeoutError
+
+logger = structlog.get_logger(__name__)
+
+# Задача загрузки, к которой относятся запускаемые процессы. Устанавливается
+# задачей Celery и наследуется всеми корутинами и asyncio-задачами внутри нее
+current_media_job: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar(
+    'current_media_job', default=None
+)
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+class MediaCancelledError(ProcessingError):
+    """Процесс остановлен из-за отмены задачи"""
+    pass
+
+class MediaTimeoutError(ProcessingTimeoutError):
+    """Процесс превысил таймаут"""
+    pass
+
+class MediaJob:
+    """Запущенный процесс ffmpeg/ffprobe"""
+
+    __slots__ = ('job_id', 'name', 'process', 'started', 'wall_time', 'cpu_time', 'timed_out', 'cancelled')
+
+    def __init__(self, job_id: Optional[Any], name: str, process: asyncio.subprocess.Process):
+        self.job_id = job_id
+        self.name = name
+        self.process = process
+        self.started = time.monotonic()
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.timed_out = False
+        self.cancelled = False
+
+    def sample_cpu(self):
+        """
+        Процессорное время процесса и его потомков из /proc
+
+        Процесс забирает child watcher asyncio, поэтому rusage после
+        завершения недоступен; значение - последний замер, с точностью до
+        интервала опроса.
+        """
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            # utime, stime, cutime, cstime (поля 14-17 в proc(5))
+            ticks = sum(int(value) for value in fields[11:15])
+            self.cpu_time = max(self.cpu_time, ticks / _CLOCK_TICKS)
+        except (OSError, ValueError, IndexError):
+            pass
+
+    def kill(self):
+        if self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+
+class MediaExecutor:
+    """
+    Исполнитель процессов ffmpeg/ffprobe
+
+    Процессы запускаются без блокировки event loop, одновременно работает
+    не больше max_concurrency процессов на процесс worker'а, остальные ждут
+    слота. Лимит действует внутри процесса: в пуле prefork у каждого из
+    worker_concurrency дочерних процессов свой исполнитель, поэтому по
+    умолчанию ядра хоста делятся между ними (cpu_count // worker_concurrency). Процесс с несколькими кодировщиками
+    может занять несколько слотов (slots). Фоновый сторож каждого процесса
+    замеряет CPU, останавливает его по таймауту и по отмене задачи
+    загрузки (флаг request_cancel в Redis или cancel() в этом процессе).
+    """
+
+    def __init__(self, max_concurrency: int = None, poll_interval: float = None):
+        self.max_concurrency = max_concurrency or worker_config.media_concurrency or self._default_concurrency()
+        self.poll_interval = poll_interval or worker_config.media_poll_interval
+
+        # Semaphore и Lock привязаны к event loop, у каждого loop свои
+        self._semaphores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = (
+            weakref.WeakKeyDictionary()
+        )
+        self._acquire_locks: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]' = (
+            weakref.WeakKeyDictionary()
+        )
+        self._jobs: Set[MediaJob] = set()
+
+        self.stats = {
+            'jobs': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'cancelled': 0,
+            'cpu_seconds': 0.0,
+            'wall_seconds': 0.0,
+            'wait_seconds': 0.0,
+        }
+
+    @staticmethod
+    def _default_concurrency() -> int:
+        """Доля ядер хоста на один процесс worker'а"""
+        cpu_count = os.cpu_count() or 2
+        if worker_config.worker_pool != 'prefork':
+            return cpu_count
+        return max(1, cpu_count // max(1, worker_config.worker_concurrency))
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @asynccontextmanager
+    async def _slots(self, count: int) -> AsyncIterator[None]:
+        """
+        Занятие count слотов общего лимита
+
+        Слоты набираются под общим Lock: два процесса, набравшие слоты
+        частично, не ждут друг друга бесконечно.
+        """
+        semaphore = self._semaphore()
+        loop = asyncio.get_running_loop()
+        lock = self._acquire_locks.get(loop)
+        if lock is None:
+            lock = self._acquire_locks[loop] = asyncio.Lock()
+
+        acquired = 0
+        try:
+            async with lock:
+                for _ in range(count):
+                    await semaphore.acquire()
+                    acquired += 1
+            yield
+        finally:
+            for _ in range(acquired):
+                semaphore.release()
+
+    @asynccontextmanager
+    async def start(self, cmd: List[str], timeout: Optional[float] = None,
+                    job_id: Optional[Any] = None, name: str = None,
+                    slots: int = 1,
+                    stdin: int = asyncio.subprocess.DEVNULL,
+                    stdout: int = asyncio.subprocess.PIPE,
+                    stderr: int = asyncio.subprocess.PIPE) -> AsyncIterator[MediaJob]:
+        """
+        Запуск процесса в слоте общего лимита
+
+        Для потоковой обработки вывода: процесс доступен как job.process,
+        при выходе из блока незавершенный процесс убивается.
+
+        Args:
+            cmd: Команда
+            timeout: Максимальное время работы процесса в секундах
+            job_id: Задача загрузки (по умолчанию - current_media_job)
+            name: Имя для логов и статистики (по умолчанию - имя программы)
+            slots: Сколько слотов занимает процесс (например, по числу
+                выходов с отдельным кодировщиком), не больше max_concurrency
+
+        Raises:
+            MediaTimeoutError: Процесс остановлен по таймауту
+            MediaCancelledError: Задача отменена
+        """
+        if job_id is None:
+            job_id = current_media_job.get()
+        name = name or os.path.basename(cmd[0])
+        slots = max(1, min(slots, self.max_concurrency))
+
+        queued = time.monotonic()
+        async with self._slots(slots):
+            self.stats['wait_seconds'] += time.monotonic() - queued
+
+            if job_id is not None and await is_cancel_requested(job_id):
+                self.stats['cancelled'] += 1
+                raise MediaCancelledError(f"{name} not started: task cancelled",
+                                          processor=name, details={'job_id': job_id})
+
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=stdin, stdout=stdout, stderr=stderr
+            )
+            job = MediaJob(job_id, name, process)
+            self._jobs.add(job)
+            watchdog = asyncio.create_task(self._watch(job, timeout))
+
+            try:
+                yield job
+            except Exception:
+                # Ошибки чтения после kill() - следствие остановки
+                if not (job.timed_out or job.cancelled):
+                    raise
+            finally:
+                watchdog.cancel()
+                job.kill()
+                await process.wait()
+                self._jobs.discard(job)
+                self._finish(job)
+
+        if job.cancelled:
+            raise MediaCancelledError(f"{name} stopped: task cancelled",
+                                      processor=name, details={'job_id': job_id})
+        if job.timed_out:
+            raise MediaTimeoutError(f"{name} timed out after {timeout}s",
+                                    processor=name, details={'job_id': job_id})
+
+    async def run(self, cmd: List[str], timeout: Optional[float] = None,
+                  job_id: Optional[Any] = None, name: str = None,
+                  text: bool = False) -> Dict[str, Any]:
+        """
+        Запуск процесса с полным чтением вывода
+
+        Returns:
+            {'returncode', 'stdout', 'stderr', 'cpu_time', 'wall_time'}
+        """
+        async with self.start(cmd, timeout=timeout, job_id=job_id, name=name) as job:
+            stdout, stderr = await job.process.communicate()
+
+        if text:
+            stdout = stdout.decode('utf-8', errors='replace')
+            stderr = stderr.decode('utf-8', errors='replace')
+
+        return {
+            'returncode': job.process.returncode,
+            'stdout': stdout,
+            'stderr': stderr,
+            'cpu_time': job.cpu_time,
+            'wall_time': job.wall_time
+        }
+
+    async def _watch(self, job: MediaJob, timeout: Optional[float]):
+        """Замер CPU, таймаут и отмена задачи для одного процесса"""
+        deadline = job.started + timeout if timeout else None
+
+        while job.process.returncode is None:
+            job.sample_cpu()
+
+            if deadline and time.monotonic() >= deadline:
+                job.timed_out = True
+                job.kill()
+                return
+
+            if job.job_id is not None and await is_cancel_requested(job.job_id):
+                job.cancelled = True
+                job.kill()
+                return
+
+            delay = self.poll_interval
+            if deadline:
+                delay = max(0.0, min(delay, deadline - time.monotonic()))
+            await asyncio.sleep(delay)
+
+    def _finish(self, job: MediaJob):
+        job.wall_time = time.monotonic() - job.started
+
+        self.stats['jobs'] += 1
+        self.stats['cpu_seconds'] += job.cpu_time
+        self.stats['wall_seconds'] += job.wall_time
+        if job.timed_out:
+            self.stats['timeouts'] += 1
+        elif job.cancelled:
+            self.stats['cancelled'] += 1
+        elif job.process.returncode != 0:
+            self.stats['failed'] += 1
+
+        logger.debug(
+            "Media job finished",
+            name=job.name,
+            job_id=job.job_id,
+            returncode=job.process.returncode,
+            cpu_time=round(job.cpu_time, 2),
+            wall_time=round(job.wall_time, 2),
+            timed_out=job.timed_out,
+            cancelled=job.cancelled
+        )
+
+    def cancel(self, job_id: Any) -> int:
+        """
+        Остановка процессов задачи в этом процессе worker'а
+
+        Returns:
+            Количество остановленных процессов
+        """
+        stopped = 0
+        for job in list(self._jobs):
+            if job.job_id == job_id and job.process.returncode is None:
+                job.cancelled = True
+                job.kill()
+                stopped += 1
+        return stopped
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'running': len(self._jobs),
+            'max_concurrency': self.max_concurrency
+        }
+
+# Глобальный экземпляр исполнителя
+media_executor = MediaExecutor()
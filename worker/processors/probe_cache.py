@@ -0,0 +1,273 @@
+"""
+VideoBot Pro - Probe Cache
+Общий кэш результатов ffprobe для процессоров: один запуск ffprobe на
+файл вместо отдельного в каждом процессоре
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import structlog
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from shared.services.redis import get_redis_client
+from ..config import worker_config
+from .media_executor import media_executor
+
+logger = structlog.get_logger(__name__)
+
+# Поля ffprobe, которые используют процессоры; остальное не хранится
+_FORMAT_FIELDS = ('duration', 'size', 'bit_rate', 'format_name')
+_FORMAT_TAGS = ('title', 'artist', 'comment', 'description', 'creation_time', 'encoder')
+_VIDEO_FIELDS = (
+    'codec_name', 'width', 'height', 'bit_rate', 'r_frame_rate', 'pix_fmt',
+    'display_aspect_ratio', 'duration', 'color_space', 'color_transfer', 'field_order'
+)
+_AUDIO_FIELDS = ('codec_name', 'bit_rate', 'sample_rate', 'channels', 'duration')
+
+# Хэш содержимого - начало и конец файла вместе с размером
+_HASH_CHUNK = 1024 * 1024
+
+def _pick(source: Dict[str, Any], fields: Tuple[str, ...]) -> Optional[tuple]:
+    return tuple(source.get(name) for name in fields) if source else None
+
+def _unpick(values: Optional[tuple], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    if not values:
+        return {}
+    return {name: value for name, value in zip(fields, values) if value is not None}
+
+class ProbeRecord:
+    """
+    Метаданные файла из ffprobe
+
+    Хранит только поля из _*_FIELDS в виде кортежей; to_probe_data()
+    собирает из них словарь в формате вывода ffprobe, поэтому разбор в
+    процессорах не меняется.
+    """
+
+    __slots__ = ('format', 'tags', 'video', 'video_tags', 'side_data', 'audio')
+
+    def __init__(self, format: tuple, tags: Optional[tuple] = None, video: Optional[tuple] = None,
+                 video_tags: Optional[tuple] = None, side_data: Optional[tuple] = None,
+                 audio: Optional[tuple] = None):
+        self.format = format
+        self.tags = tags
+        self.video = video
+        self.video_tags = video_tags
+        self.side_data = side_data
+        self.audio = audio
+
+    @classmethod
+    def from_probe_data(cls, probe_data: Dict[str, Any]) -> 'ProbeRecord':
+        """Запись из JSON-вывода ffprobe (-show_format -show_streams)"""
+        format_info = probe_data.get('format', {})
+        video_stream = None
+        audio_stream = None
+
+        for stream in probe_data.get('streams', []):
+            if stream.get('codec_type') == 'video' and video_stream is None:
+                video_stream = stream
+            elif stream.get('codec_type') == 'audio' and audio_stream is None:
+                audio_stream = stream
+
+        side_data = None
+        if video_stream:
+            rotations = [item['rotation'] for item in video_stream.get('side_data_list', []) if 'rotation' in item]
+            side_data = tuple(rotations) or None
+
+        return cls(
+            format=_pick(format_info, _FORMAT_FIELDS),
+            tags=_pick(format_info.get('tags'), _FORMAT_TAGS),
+            video=_pick(video_stream, _VIDEO_FIELDS),
+            video_tags=_pick((video_stream or {}).get('tags'), ('rotate',)),
+            side_data=side_data,
+            audio=_pick(audio_stream, _AUDIO_FIELDS)
+        )
+
+    def to_probe_data(self) -> Dict[str, Any]:
+        """Словарь в формате вывода ffprobe"""
+        format_info = _unpick(self.format, _FORMAT_FIELDS)
+        if self.tags:
+            format_info['tags'] = _unpick(self.tags, _FORMAT_TAGS)
+
+        streams = []
+        if self.video:
+            video_stream = {'codec_type': 'video', **_unpick(self.video, _VIDEO_FIELDS)}
+            if self.video_tags:
+                video_stream['tags'] = _unpick(self.video_tags, ('rotate',))
+            if self.side_data:
+                video_stream['side_data_list'] = [{'rotation': rotation} for rotation in self.side_data]
+            streams.append(video_stream)
+        if self.audio:
+            streams.append({'codec_type': 'audio', **_unpick(self.audio, _AUDIO_FIELDS)})
+
+        return {'format': format_info, 'streams': streams}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ProbeRecord':
+        return cls(**{
+            name: tuple(value) if isinstance(value, list) else value
+            for name, value in data.items() if name in cls.__slots__
+        })
+
+class ProbeCache:
+    """
+    LRU-кэш ffprobe по идентичности файла
+
+    Ключ - (устройство, inode, размер, mtime): перезаписанный файл получает
+    новый ключ, поэтому инвалидация не нужна. Одновременные запросы одного
+    файла (этапы конвейера идут параллельно) ждут один запуск ffprobe.
+
+    С shared=True записи также хранятся в Redis по хэшу содержимого
+    (размер, первый и последний мегабайт), и другой worker находит их для
+    той же копии файла.
+    """
+
+    KEY_PREFIX = "probe"
+
+    def __init__(self, max_entries: int = None, shared: bool = None, ttl: int = None):
+        self.max_entries = max_entries or worker_config.probe_cache_size
+        self.shared = worker_config.probe_cache_shared if shared is None else shared
+        self.ttl = ttl or worker_config.probe_cache_ttl
+
+        self._records: 'OrderedDict[tuple, ProbeRecord]' = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+        self.stats = {'hits': 0, 'shared_hits': 0, 'waits': 0, 'misses': 0, 'errors': 0}
+
+    @staticmethod
+    def file_key(file_path: str) -> tuple:
+        stat = os.stat(file_path)
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def content_key(file_path: str) -> str:
+        """Ключ по содержимому для обмена между хостами"""
+        digest = hashlib.sha1()
+        size = os.path.getsize(file_path)
+        digest.update(str(size).encode())
+        with open(file_path, 'rb') as f:
+            digest.update(f.read(_HASH_CHUNK))
+            if size > _HASH_CHUNK:
+                f.seek(max(_HASH_CHUNK, size - _HASH_CHUNK))
+                digest.update(f.read(_HASH_CHUNK))
+        return digest.hexdigest()
+
+    async def probe(self, file_path: str, ffprobe_path: str = 'ffprobe') -> Optional[ProbeRecord]:
+        """
+        Метаданные файла
+
+        Args:
+            file_path: Путь к файлу
+            ffprobe_path: Путь к FFprobe
+
+        Returns:
+            ProbeRecord или None, если ffprobe не смог разобрать файл
+        """
+        key = self.file_key(file_path)
+
+        record = self._records.get(key)
+        if record is not None:
+            self._records.move_to_end(key)
+            self.stats['hits'] += 1
+            return record
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['waits'] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            record = await self._load(file_path, ffprobe_path)
+            if record is not None:
+                self._store(key, record)
+            future.set_result(record)
+            return record
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Ошибку получат ожидающие; если их нет, не логируем как необработанную
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load(self, file_path: str, ffprobe_path: str) -> Optional[ProbeRecord]:
+        redis_key = None
+        if self.shared:
+            redis_key = f"{self.KEY_PREFIX}:{await asyncio.to_thread(self.content_key, file_path)}"
+            record = await self._get_shared(redis_key)
+            if record is not None:
+                self.stats['shared_hits'] += 1
+                return record
+
+        self.stats['misses'] += 1
+        cmd = [
+            ffprobe_path,
+            '-v', 'error',
+            '-print_format', 'json',
+            '-show_format',
+            '-show_streams',
+            file_path
+        ]
+        result = await media_executor.run(cmd, timeout=30, name='ffprobe')
+
+        if result['returncode'] != 0:
+            self.stats['errors'] += 1
+            logger.warning(
+                "ffprobe failed",
+                file_path=file_path,
+                error=result['stderr'].decode('utf-8', errors='ignore')[-500:]
+            )
+            return None
+
+        try:
+            record = ProbeRecord.from_probe_data(json.loads(result['stdout']))
+        except (json.JSONDecodeError, AttributeError, TypeError) as e:
+            self.stats['errors'] += 1
+            logger.warning(f"Failed to parse ffprobe output: {e}", file_path=file_path)
+            return None
+
+        if redis_key:
+            await self._set_shared(redis_key, record)
+        return record
+
+    def _store(self, key: tuple, record: ProbeRecord):
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+    async def _get_shared(self, redis_key: str) -> Optional[ProbeRecord]:
+        try:
+            redis_client = await get_redis_client()
+            data = await redis_client.get(redis_key)
+            return ProbeRecord.from_dict(data) if isinstance(data, dict) else None
+        except Exception as e:
+            logger.warning(f"Probe cache lookup failed: {e}", key=redis_key)
+            return None
+
+    async def _set_shared(self, redis_key: str, record: ProbeRecord):
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.set(redis_key, record.to_dict(), expire=self.ttl)
+        except Exception as e:
+            logger.warning(f"Probe cache store failed: {e}", key=redis_key)
+
+    def clear(self):
+        self._records.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'entries': len(self._records), 'max_entries': self.max_entries}
+
+# Глобальный экземпляр кэша
+probe_cache = ProbeCache()
@@ -4,27 +4,44 @@ VideoBot Pro - Quality Optimizer
 """
 
 import os
-import re
 import tempfile
 import asyncio
 import structlog
 from typing import Dict, Any, Optional, List, Tuple
 from pathlib import Path
-import json
 import math
+from collections import deque
 
+from shared.services.progress import progress_publisher
 from .base import BaseProcessor
+from .media_executor import media_executor, MediaCancelledError, current_media_job
+from .probe_cache import probe_cache
+from ..config import worker_config
 from ..utils.quality_selector import QualitySelector
+from ..utils.progress_tracker import ProgressTracker
+from ..utils.ffmpeg_progress import FFmpegProgressParser
 
 logger = structlog.get_logger(__name__)
 
 class QualityOptimizer(BaseProcessor):
     """Оптимизатор качества видео"""
     
-    def __init__(self):
-        """Инициализация оптимизатора"""
+    # Строк stderr ffmpeg, сохраняемых для сообщения об ошибке
+    STDERR_TAIL_LINES = 50
+    
+    # Минимальный интервал обновления прогресса, секунды
+    PROGRESS_INTERVAL = 2.0
+    
+    def __init__(self, progress_tracker: ProgressTracker = None):
+        """
+        Инициализация оптимизатора
+        
+        Args:
+            progress_tracker: Трекер прогресса перекодирования
+        """
         super().__init__()
         self.quality_selector = QualitySelector()
+        self.progress_tracker = progress_tracker or ProgressTracker()
         
         # Предустановки качества
         self.quality_presets = {
@@ -271,7 +288,10 @@ class QualityOptimizer(BaseProcessor):
             cmd = await self._build_ffmpeg_command(input_path, output_path, preset, video_info)
             
             # Выполняем оптимизацию с отслеживанием прогресса
-            result = await self._execute_ffmpeg_with_progress(cmd, video_info.get('duration', 0))
+            try:
+                result = await self._execute_ffmpeg_with_progress(cmd, video_info.get('duration', 0))
+            finally:
+                self._remove_transforms([output_path])
             
             return result
             
@@ -284,32 +304,96 @@ class QualityOptimizer(BaseProcessor):
         """Строит команду ffmpeg для оптимизации"""
         cmd = ['ffmpeg', '-i', input_path]
         
-        # Видео параметры
-        target_width, target_height = preset['resolution']
-        
-        # Фильтр масштабирования с сохранением пропорций
-        video_filters = []
-        
-        # Масштабирование
-        scale_filter = f"scale={target_width}:{target_height}:force_original_aspect_ratio=decrease"
-        video_filters.append(scale_filter)
-        
-        # Добавляем отступы если нужно
-        pad_filter = f"pad={target_width}:{target_height}:(ow-iw)/2:(oh-ih)/2"
-        video_filters.append(pad_filter)
+        video_filters = self._build_video_filters(preset, output_path)
         
         # Деинтерлейсинг если нужно
         if video_info.get('interlaced', False):
             video_filters.append('yadif')
         
-        # Стабилизация если включена
-        if preset.get('stabilize', False):
-            video_filters.append('vidstabdetect=stepsize=6:shakiness=8:accuracy=9:result=/tmp/transforms.trf')
-        
         # Применяем фильтры
         if video_filters:
             cmd.extend(['-vf', ','.join(video_filters)])
         
+        cmd.extend(self._build_output_args(preset, output_path))
+        
+        return cmd
+    
+    async def _build_multi_output_command(self, input_path: str,
+                                        outputs: List[Tuple[str, Dict[str, Any]]],
+                                        video_info: Dict[str, Any]) -> List[str]:
+        """
+        Строит одну команду ffmpeg для нескольких качеств
+        
+        Источник декодируется один раз, кадры через split расходятся по
+        цепочкам scale/pad каждого выхода. Параметры кодирования выходов
+        те же, что и при отдельной оптимизации.
+        
+        Args:
+            outputs: Список (путь выходного файла, пресет)
+        """
+        cmd = ['ffmpeg', '-i', input_path]
+        
+        source = '[0:v]'
+        graph = []
+        
+        # Деинтерлейсинг выполняется один раз до разделения
+        if video_info.get('interlaced', False):
+            graph.append('[0:v]yadif[src]')
+            source = '[src]'
+        
+        branches = ''.join(f'[s{i}]' for i in range(len(outputs)))
+        graph.append(f'{source}split={len(outputs)}{branches}')
+        
+        for i, (output_path, preset) in enumerate(outputs):
+            graph.append(f"[s{i}]{','.join(self._build_video_filters(preset, output_path))}[v{i}]")
+        
+        cmd.extend(['-filter_complex', ';'.join(graph)])
+        
+        for i, (output_path, preset) in enumerate(outputs):
+            # Аудио кодируется для каждого выхода со своим битрейтом
+            cmd.extend(['-map', f'[v{i}]', '-map', '0:a:0?'])
+            cmd.extend(self._build_output_args(preset, output_path))
+        
+        return cmd
+    
+    def _build_video_filters(self, preset: Dict[str, Any], output_path: str) -> List[str]:
+        """Фильтры масштабирования под пресет"""
+        target_width, target_height = preset['resolution']
+        
+        # Масштабирование с сохранением пропорций
+        video_filters = [
+            f"scale={target_width}:{target_height}:force_original_aspect_ratio=decrease",
+            # Добавляем отступы если нужно
+            f"pad={target_width}:{target_height}:(ow-iw)/2:(oh-ih)/2"
+        ]
+        
+        # Стабилизация если включена; у каждого выхода свой файл трансформаций
+        if preset.get('stabilize', False):
+            video_filters.append(
+                f'vidstabdetect=stepsize=6:shakiness=8:accuracy=9:result={self._transforms_path(output_path)}'
+            )
+        
+        return video_filters
+    
+    @staticmethod
+    def _transforms_path(output_path: str) -> str:
+        """Файл трансформаций vidstabdetect для выходного файла"""
+        return f"{output_path}.trf"
+    
+    def _remove_transforms(self, output_paths: List[str]):
+        """Удаление файлов трансформаций после кодирования"""
+        for output_path in output_paths:
+            try:
+                os.unlink(self._transforms_path(output_path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to remove transforms file: {e}", output_path=output_path)
+    
+    def _build_output_args(self, preset: Dict[str, Any], output_path: str) -> List[str]:
+        """Параметры кодирования одного выходного файла"""
+        cmd = []
+        
         # Кодек и настройки
         cmd.extend(['-c:v', 'libx264'])
         
@@ -342,80 +426,122 @@ class QualityOptimizer(BaseProcessor):
         
         return cmd
     
-    async def _execute_ffmpeg_with_progress(self, cmd: List[str], duration: float) -> Dict[str, Any]:
-        """Выполняет ffmpeg с отслеживанием прогресса"""
+    async def _execute_ffmpeg_with_progress(self, cmd: List[str], duration: float,
+                                           progress_id: str = None, slots: int = 1) -> Dict[str, Any]:
+        """
+        Выполняет ffmpeg с отслеживанием прогресса
+        
+        Прогресс читается из машиночитаемого потока -progress в stdout и
+        передается в progress_tracker не чаще PROGRESS_INTERVAL, а для задачи
+        загрузки - в progress_publisher (его частоту ограничивает publisher).
+        Из stderr хранятся только последние STDERR_TAIL_LINES строк для ошибки.
+        
+        Args:
+            cmd: Команда ffmpeg
+            duration: Длительность входа в секундах
+            progress_id: ID в трекере (по умолчанию по текущей задаче загрузки)
+            slots: Слотов media_executor на процесс (по числу кодировщиков)
+        """
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+        
+        job_id = current_media_job.get()
+        if progress_id is None:
+            progress_id = f"transcode:{job_id}" if job_id is not None else None
+        if progress_id:
+            self.progress_tracker.start_task(progress_id, task_name='ffmpeg transcode')
+        
+        parser = FFmpegProgressParser(duration)
+        stderr_tail = deque(maxlen=self.STDERR_TAIL_LINES)
+        
         try:
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            # Отслеживаем прогресс через stderr
-            progress_data = {'progress': 0, 'speed': '1x', 'eta': None}
-            
-            stderr_output = b''
-            while True:
+            async with media_executor.start(cmd, timeout=worker_config.task_timeout, slots=slots) as job:
+                process = job.process
+                stderr_task = asyncio.create_task(self._drain_stderr(process.stderr, stderr_tail))
+                
                 try:
-                    line = await asyncio.wait_for(process.stderr.readline(), timeout=1.0)
-                    if not line:
-                        break
-                    
-                    stderr_output += line
-                    line_str = line.decode('utf-8', errors='ignore').strip()
+                    async for line in process.stdout:
+                        snapshot = parser.feed(line.decode('utf-8', errors='ignore'))
+                        if snapshot and snapshot['percent'] is not None:
+                            if progress_id:
+                                self._report_progress(progress_id, snapshot)
+                            if job_id is not None:
+                                await self._publish_progress(job_id, snapshot)
                     
-                    # Парсим прогресс
-                    if 'time=' in line_str and duration > 0:
-                        try:
-                            time_match = re.search(r'time=(\d+):(\d+):(\d+\.\d+)', line_str)
-                            if time_match:
-                                hours = int(time_match.group(1))
-                                minutes = int(time_match.group(2))
-                                seconds = float(time_match.group(3))
-                                current_time = hours * 3600 + minutes * 60 + seconds
-                                
-                                progress = min(100, (current_time / duration) * 100)
-                                progress_data['progress'] = progress
-                                
-                                # Извлекаем скорость
-                                speed_match = re.search(r'speed=([0-9.]+)x', line_str)
-                                if speed_match:
-                                    progress_data['speed'] = f"{speed_match.group(1)}x"
-                                
-                                logger.debug(f"Optimization progress: {progress:.1f}%")
-                        except:
-                            pass
+                    await stderr_task
+                finally:
+                    stderr_task.cancel()
                 
-                except asyncio.TimeoutError:
-                    # Проверяем, завершился ли процесс
-                    if process.returncode is not None:
-                        break
-            
-            # Ждем завершения
-            stdout, stderr = await process.communicate()
+                # Ждем завершения
+                await process.wait()
             
             if process.returncode == 0:
+                if progress_id:
+                    self.progress_tracker.complete_task(progress_id, 'Transcoding completed')
                 return {
                     'success': True,
                     'progress': 100,
-                    'returncode': 0
+                    'returncode': 0,
+                    'cpu_time': job.cpu_time
                 }
             else:
-                error_output = stderr_output.decode('utf-8', errors='ignore')
+                error_output = '\n'.join(stderr_tail)
+                if progress_id:
+                    self.progress_tracker.fail_task(progress_id, error_output[-500:])
                 return {
                     'success': False,
                     'error': error_output,
-                    'returncode': process.returncode
+                    'returncode': process.returncode,
+                    'cpu_time': job.cpu_time
                 }
-                
+        
+        except MediaCancelledError as e:
+            if progress_id:
+                self.progress_tracker.cancel_task(progress_id, str(e))
+            return {
+                'success': False,
+                'error': str(e),
+                'returncode': -1,
+                'cancelled': True
+            }
         except Exception as e:
             logger.error(f"Error executing ffmpeg: {e}")
+            if progress_id:
+                self.progress_tracker.fail_task(progress_id, str(e))
             return {
                 'success': False,
                 'error': str(e),
                 'returncode': -1
             }
     
+    @staticmethod
+    async def _drain_stderr(stream: asyncio.StreamReader, tail: deque):
+        """Чтение stderr, чтобы ffmpeg не блокировался, с хранением хвоста"""
+        async for line in stream:
+            tail.append(line.decode('utf-8', errors='ignore').rstrip())
+    
+    def _report_progress(self, progress_id: str, snapshot: Dict[str, Any]):
+        try:
+            speed = f"{snapshot['speed']}x" if snapshot['speed'] is not None else None
+            self.progress_tracker.update_progress(
+                progress_id,
+                progress=snapshot['percent'],
+                message=f"Transcoding ({speed})" if speed else "Transcoding",
+                metadata={'out_time': snapshot['out_time'], 'fps': snapshot['fps'], 'speed': speed},
+                min_interval=0 if snapshot['done'] else self.PROGRESS_INTERVAL
+            )
+        except Exception as e:
+            logger.debug(f"Progress update failed: {e}")
+    
+    @staticmethod
+    async def _publish_progress(job_id: Any, snapshot: Dict[str, Any]):
+        """Событие прогресса задачи загрузки для бота"""
+        await progress_publisher.publish(
+            job_id, 'processing', 'Transcoding...',
+            percent=snapshot['percent'],
+            force=snapshot['done'],
+            speed=snapshot['speed']
+        )
+    
     async def batch_optimize(self, input_files: List[str], output_dir: str,
                            quality_settings: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -477,7 +603,7 @@ class QualityOptimizer(BaseProcessor):
             raise
     
     async def create_multiple_qualities(self, input_path: str, output_dir: str,
-                                      qualities: List[str]) -> Dict[str, str]:
+                                      qualities: List[str], single_pass: bool = True) -> Dict[str, str]:
         """
         Создает файлы нескольких качеств из одного источника
         
@@ -485,50 +611,76 @@ class QualityOptimizer(BaseProcessor):
             input_path: Путь к исходному файлу
             output_dir: Директория для сохранения
             qualities: Список качеств для создания
+            single_pass: Кодировать все качества одним запуском ffmpeg
+                (источник декодируется один раз)
             
         Returns:
             Словарь {quality: output_path}
         """
         try:
             os.makedirs(output_dir, exist_ok=True)
-            results = {}
             
+            if not single_pass:
+                return await self._create_qualities_separately(input_path, output_dir, qualities)
+            
+            video_info = await self._get_video_info(input_path)
+            if not video_info:
+                raise ValueError("Could not analyze input video")
+            
+            results = {}
+            outputs = []
             input_name = Path(input_path).stem
             
-            # Создаем задачи для параллельной обработки
-            tasks = []
             for quality in qualities:
+                preset = self._get_quality_preset(quality, False)
+                if not preset:
+                    logger.error(f"Unknown quality preset: {quality}")
+                    continue
+                
                 output_file = os.path.join(output_dir, f"{input_name}_{quality}.mp4")
-                task = self.optimize_video(input_path, output_file, target_quality=quality)
-                tasks.append((quality, output_file, task))
-            
-            # Выполняем оптимизацию параллельно (но ограничиваем количество)
-            semaphore = asyncio.Semaphore(2)  # Максимум 2 параллельные задачи
-            
-            async def process_quality(quality, output_file, task):
-                async with semaphore:
-                    try:
-                        await task
+                
+                if not await self._check_optimization_needed(video_info, preset):
+                    # Как и в optimize_video: исходник уже подходит
+                    import shutil
+                    shutil.copy2(input_path, output_file)
+                    results[quality] = output_file
+                    continue
+                
+                outputs.append((quality, output_file, preset))
+            
+            if len(outputs) == 1:
+                quality, output_file, _ = outputs[0]
+                await self.optimize_video(input_path, output_file, target_quality=quality)
+                if os.path.exists(output_file):
+                    results[quality] = output_file
+            
+            elif outputs:
+                cmd = await self._build_multi_output_command(
+                    input_path,
+                    [(output_file, preset) for _, output_file, preset in outputs],
+                    video_info
+                )
+                # Каждый выход кодируется своим x264 - процесс занимает слот на выход
+                try:
+                    result = await self._execute_ffmpeg_with_progress(
+                        cmd, video_info.get('duration', 0), slots=len(outputs)
+                    )
+                finally:
+                    self._remove_transforms([output_file for _, output_file, _ in outputs])
+                
+                if result.get('success'):
+                    for quality, output_file, _ in outputs:
                         if os.path.exists(output_file):
-                            return quality, output_file
-                    except Exception as e:
-                        logger.error(f"Error creating {quality} version: {e}")
-                    return quality, None
-            
-            # Запускаем все задачи
-            quality_tasks = [
-                process_quality(quality, output_file, task)
-                for quality, output_file, task in tasks
-            ]
-            
-            completed_tasks = await asyncio.gather(*quality_tasks, return_exceptions=True)
-            
-            # Обрабатываем результаты
-            for result in completed_tasks:
-                if isinstance(result, tuple):
-                    quality, output_path = result
-                    if output_path:
-                        results[quality] = output_path
+                            results[quality] = output_file
+                elif not result.get('cancelled'):
+                    # Например, нехватка памяти на несколько кодировщиков сразу
+                    logger.warning(
+                        "Single-pass transcoding failed, encoding qualities separately",
+                        error=result.get('error', '')[-500:]
+                    )
+                    results.update(await self._create_qualities_separately(
+                        input_path, output_dir, [quality for quality, _, _ in outputs]
+                    ))
             
             logger.info(f"Created {len(results)} quality versions", qualities=list(results.keys()))
             
@@ -538,6 +690,50 @@ class QualityOptimizer(BaseProcessor):
             logger.error(f"Error creating multiple qualities: {e}")
             return {}
     
+    async def _create_qualities_separately(self, input_path: str, output_dir: str,
+                                         qualities: List[str]) -> Dict[str, str]:
+        """Отдельный запуск optimize_video на каждое качество"""
+        results = {}
+        
+        input_name = Path(input_path).stem
+        
+        # Создаем задачи для параллельной обработки
+        tasks = []
+        for quality in qualities:
+            output_file = os.path.join(output_dir, f"{input_name}_{quality}.mp4")
+            task = self.optimize_video(input_path, output_file, target_quality=quality)
+            tasks.append((quality, output_file, task))
+        
+        # Выполняем оптимизацию параллельно (но ограничиваем количество)
+        semaphore = asyncio.Semaphore(2)  # Максимум 2 параллельные задачи
+        
+        async def process_quality(quality, output_file, task):
+            async with semaphore:
+                try:
+                    await task
+                    if os.path.exists(output_file):
+                        return quality, output_file
+                except Exception as e:
+                    logger.error(f"Error creating {quality} version: {e}")
+                return quality, None
+        
+        # Запускаем все задачи
+        quality_tasks = [
+            process_quality(quality, output_file, task)
+            for quality, output_file, task in tasks
+        ]
+        
+        completed_tasks = await asyncio.gather(*quality_tasks, return_exceptions=True)
+        
+        # Обрабатываем результаты
+        for result in completed_tasks:
+            if isinstance(result, tuple):
+                quality, output_path = result
+                if output_path:
+                    results[quality] = output_path
+        
+        return results
+    
     def _parse_bitrate(self, bitrate_str: str) -> int:
         """Парсит строку битрейта в bps"""
         try:
@@ -559,25 +755,10 @@ class QualityOptimizer(BaseProcessor):
     async def _get_video_info(self, video_path: str) -> Dict[str, Any]:
         """Получает подробную информацию о видео"""
         try:
-            cmd = [
-                'ffprobe',
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_format',
-                '-show_streams',
-                video_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            record = await probe_cache.probe(video_path)
             
-            if process.returncode == 0:
-                info = json.loads(stdout.decode())
+            if record:
+                info = record.to_probe_data()
                 
                 format_info = info.get('format', {})
                 video_stream = None
@@ -4,6 +4,8 @@ VideoBot Pro - Thumbnail Generator
 """
 
 import os
+import re
+import math
 import tempfile
 import subprocess
 import structlog
@@ -15,6 +17,8 @@ import aiofiles
 import aiohttp
 
 from .base import BaseProcessor
+from .media_executor import media_executor
+from .probe_cache import probe_cache
 from ..utils.file_manager import FileManager
 
 logger = structlog.get_logger(__name__)
@@ -22,6 +26,15 @@ logger = structlog.get_logger(__name__)
 class ThumbnailGenerator(BaseProcessor):
     """Генератор превью изображений для видео"""
     
+    # Ограничение размера кадров GIF
+    GIF_MAX_SIZE = (480, 270)
+    
+    # Максимальное время извлечения кадров, секунды
+    EXTRACT_TIMEOUT = 600
+    
+    # Время кадра в выводе фильтра showinfo
+    _SHOWINFO_TIME = re.compile(r"Parsed_showinfo.*\bpts_time:\s*(-?[\d.]+)")
+    
     def __init__(self, storage_handler=None):
         """
         Инициализация генератора превью
@@ -74,20 +87,11 @@ class ThumbnailGenerator(BaseProcessor):
             if not video_info:
                 raise ValueError("Could not extract video information")
             
-            thumbnails = {}
-            
-            # Генерируем превью для каждого размера
-            for size in sizes:
-                if size not in self.thumbnail_sizes:
-                    logger.warning(f"Unknown thumbnail size: {size}")
-                    continue
-                
-                thumbnail_path = await self._generate_single_thumbnail(
-                    video_path, output_dir, size, video_info
-                )
-                
-                if thumbnail_path:
-                    thumbnails[size] = thumbnail_path
+            # Все размеры из одного кадра за один запуск ffmpeg
+            media = await self.extract_media(
+                video_path, output_dir, sizes=sizes, video_info=video_info
+            )
+            thumbnails = media['thumbnails']
             
             logger.info(f"Generated {len(thumbnails)} thumbnails", 
                        video_path=video_path, sizes=list(thumbnails.keys()))
@@ -98,87 +102,281 @@ class ThumbnailGenerator(BaseProcessor):
             logger.error(f"Error generating thumbnails: {e}", video_path=video_path)
             raise
     
-    async def _generate_single_thumbnail(self, video_path: str, output_dir: str,
-                                       size: str, video_info: Dict[str, Any]) -> Optional[str]:
-        """Генерирует одно превью указанного размера"""
-        try:
-            width, height = self.thumbnail_sizes[size]
-            duration = video_info.get('duration', 0)
-            
-            # Выбираем лучшую позицию для кадра (середина видео)
-            timestamp = duration * 0.5 if duration > 0 else 0
-            
-            # Имя выходного файла
-            output_filename = f"thumbnail_{size}_{int(timestamp)}s.jpg"
-            output_path = os.path.join(output_dir, output_filename)
+    async def extract_media(self, video_path: str, output_dir: str = None,
+                          sizes: List[str] = None, frame_count: int = 0,
+                          save_frames: bool = False,
+                          grid_size: Optional[Tuple[int, int]] = None, grid_path: str = None,
+                          gif: bool = False, gif_path: str = None, gif_duration: float = 3.0,
+                          gif_fps: int = 10, gif_start: float = None,
+                          video_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Превью, кадры, сетка и GIF за один проход по видео
+        
+        Один запуск ffmpeg: select оставляет только нужные кадры (кадр
+        превью, равномерно распределенные кадры и кадры GIF с частотой
+        gif_fps), кадры приходят в память как rawvideo через pipe и
+        режутся под все размеры в Pillow. На диск пишутся только итоговые
+        файлы.
+        
+        Args:
+            video_path: Путь к видеофайлу
+            output_dir: Директория для сохранения
+            sizes: Размеры превью из thumbnail_sizes (кадр из середины видео)
+            frame_count: Количество равномерно распределенных кадров
+            save_frames: Сохранять кадры в файлы (иначе только для сетки)
+            grid_size: Сетка из кадров (столбцы, строки)
+            grid_path: Путь сетки (по умолчанию preview_grid.jpg в output_dir)
+            gif: Создать анимированный GIF
+            gif_path: Путь GIF (по умолчанию preview.gif в output_dir)
+            gif_duration: Длительность GIF в секундах
+            gif_fps: Кадров в секунду в GIF
+            gif_start: Начало GIF (по умолчанию середина видео)
+            video_info: Результат _get_video_info, если уже получен
             
-            # Извлекаем кадр с помощью ffmpeg
-            success = await self._extract_frame_ffmpeg(
-                video_path, output_path, timestamp, width, height
+        Returns:
+            {'thumbnails': {size: path}, 'frames': [path], 'grid': path, 'gif': path}
+        """
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video file not found: {video_path}")
+        
+        if output_dir is None:
+            output_dir = tempfile.mkdtemp(prefix="thumbnails_")
+        os.makedirs(output_dir, exist_ok=True)
+        
+        if video_info is None:
+            video_info = await self._get_video_info(video_path)
+        if not video_info:
+            raise ValueError("Could not extract video information")
+        
+        duration = video_info.get('duration', 0)
+        
+        sizes = [size for size in (sizes or []) if self._known_size(size)]
+        if grid_size:
+            frame_count = max(frame_count, grid_size[0] * grid_size[1])
+        if frame_count and duration <= 0:
+            raise ValueError("Invalid video duration")
+        
+        result = {'thumbnails': {}, 'frames': [], 'grid': None, 'gif': None}
+        
+        # Моменты кадров: (время, назначение, индекс)
+        targets = []
+        thumbnail_time = duration * 0.5 if duration > 0 else 0
+        if sizes:
+            targets.append((thumbnail_time, 'thumbnail', 0))
+        for i in range(frame_count):
+            # Избегаем самого начала и конца
+            targets.append((duration * (i + 1) / (frame_count + 1), 'frame', i))
+        targets.sort()
+        
+        gif_window = None
+        if gif:
+            if gif_start is None:
+                gif_start = max(0, (duration - gif_duration) / 2)
+            gif_window = (gif_start, gif_start + gif_duration)
+        
+        if not targets and not gif_window:
+            return result
+        
+        # Размер кадров из ffmpeg - наибольший из нужных, дальше только уменьшение
+        boxes = [self.thumbnail_sizes[size] for size in sizes]
+        if frame_count:
+            boxes.append(self.thumbnail_sizes['medium'])
+        if gif_window:
+            boxes.append(self.GIF_MAX_SIZE)
+        width, height, scale_filter = self._working_frame_size(video_info, boxes)
+        
+        select = '+'.join(
+            [f"gte(t,{time:.6f})*(isnan(prev_pts)+lt(prev_pts*TB,{time:.6f}))"
+             for time in sorted({time for time, _, _ in targets})] +
+            ([f"gte(t,{gif_window[0]:.6f})*lt(t,{gif_window[1]:.6f})*"
+              f"(isnan(prev_selected_t)+gt(floor((t-{gif_window[0]:.6f})*{gif_fps}),"
+              f"floor((prev_selected_t-{gif_window[0]:.6f})*{gif_fps})))"] if gif_window else [])
+        )
+        
+        cmd = ['ffmpeg', '-nostdin', '-nostats']
+        if duration > 0:
+            # Дальше последнего нужного кадра видео не декодируется
+            last_needed = max([time for time, _, _ in targets] + ([gif_window[1]] if gif_window else []))
+            cmd.extend(['-t', f"{last_needed + 1:.3f}"])
+        cmd.extend([
+            '-i', video_path,
+            '-an', '-sn',
+            '-vf', f"select='{select}',{scale_filter},showinfo",
+            '-vsync', '0',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'rgb24',
+            'pipe:1'
+        ])
+        
+        frames: List[Image.Image] = []
+        gif_frames: List[Image.Image] = []
+        pending = list(targets)
+        last_selected = None
+        
+        async for time, img in self._read_raw_frames(cmd, width, height):
+            # Кадр, впервые достигший момента, закрывает все моменты до него
+            while pending and pending[0][0] <= time:
+                target_time, role, index = pending.pop(0)
+                if role == 'thumbnail':
+                    for size in sizes:
+                        thumbnail = await self._enhance_thumbnail(
+                            self._fit_image(img, self.thumbnail_sizes[size]), size
+                        )
+                        path = os.path.join(output_dir, f"thumbnail_{size}_{int(target_time)}s.jpg")
+                        thumbnail.save(path, 'JPEG', quality=85, optimize=True)
+                        result['thumbnails'][size] = path
+                else:
+                    frame = self._fit_image(img, self.thumbnail_sizes['medium'])
+                    frames.append(frame)
+                    if save_frames:
+                        path = os.path.join(output_dir, f"frame_{index + 1:02d}_{int(target_time)}s.jpg")
+                        frame.save(path, 'JPEG', quality=90)
+                        result['frames'].append(path)
+            
+            # То же правило, что и в select: первый кадр каждого интервала 1/gif_fps
+            if gif_window and gif_window[0] <= time < gif_window[1] and (
+                last_selected is None or
+                math.floor((time - gif_window[0]) * gif_fps) > math.floor((last_selected - gif_window[0]) * gif_fps)
+            ):
+                gif_frame = img.copy()
+                gif_frame.thumbnail(self.GIF_MAX_SIZE, Image.Resampling.LANCZOS)
+                gif_frames.append(gif_frame)
+            
+            last_selected = time
+        
+        if grid_size and frames:
+            if len(frames) >= grid_size[0] * grid_size[1]:
+                grid_path = grid_path or os.path.join(output_dir, "preview_grid.jpg")
+                self._compose_grid(frames, grid_size).save(grid_path, 'JPEG', quality=90, optimize=True)
+                result['grid'] = grid_path
+            else:
+                logger.warning(f"Not enough frames for grid: {len(frames)}")
+        
+        if gif_frames:
+            gif_path = gif_path or os.path.join(output_dir, "preview.gif")
+            gif_frames[0].save(
+                gif_path, 'GIF', save_all=True, append_images=gif_frames[1:],
+                duration=int(1000 / gif_fps), loop=0, optimize=True
             )
-            
-            if success and os.path.exists(output_path):
-                # Применяем постобработку
-                await self._post_process_thumbnail(output_path, size)
-                return output_path
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error generating single thumbnail: {e}", size=size)
-            return None
+            result['gif'] = gif_path
+        
+        return result
     
-    async def _extract_frame_ffmpeg(self, video_path: str, output_path: str,
-                                  timestamp: float, width: int, height: int) -> bool:
-        """Извлекает кадр из видео с помощью ffmpeg"""
-        try:
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-ss', str(timestamp),
-                '-vframes', '1',
-                '-vf', f'scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2',
-                '-q:v', '2',  # Высокое качество
-                '-y',  # Перезаписать файл
-                output_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+    async def _read_raw_frames(self, cmd: List[str], width: int, height: int):
+        """
+        Запуск ffmpeg и чтение кадров rawvideo из stdout
+        
+        Время кадра берется из строк showinfo в stderr; stderr читается
+        параллельно, чтобы ffmpeg не блокировался на заполненном pipe.
+        
+        Yields:
+            (время кадра в секундах, Image)
+        """
+        async with media_executor.start(cmd, timeout=self.EXTRACT_TIMEOUT) as job:
+            process = job.process
             
-            stdout, stderr = await process.communicate()
+            times: List[float] = []
+            tail: List[str] = []
+            time_arrived = asyncio.Event()
             
-            if process.returncode == 0:
-                return True
-            else:
-                logger.error(f"ffmpeg error: {stderr.decode()}")
-                return False
+            async def read_stderr():
+                try:
+                    async for line in process.stderr:
+                        text = line.decode('utf-8', errors='ignore')
+                        match = self._SHOWINFO_TIME.search(text)
+                        if match:
+                            times.append(float(match.group(1)))
+                            time_arrived.set()
+                        else:
+                            tail.append(text)
+                            del tail[:-20]
+                finally:
+                    time_arrived.set()
+            
+            stderr_task = asyncio.create_task(read_stderr())
+            frame_size = width * height * 3
+            index = 0
+            
+            try:
+                while True:
+                    try:
+                        data = await process.stdout.readexactly(frame_size)
+                    except asyncio.IncompleteReadError:
+                        break
+                    
+                    # showinfo печатает время до выдачи кадра, ожидание короткое
+                    while len(times) <= index and not stderr_task.done():
+                        time_arrived.clear()
+                        await time_arrived.wait()
+                    if len(times) <= index:
+                        break
+                    
+                    yield times[index], Image.frombytes('RGB', (width, height), data)
+                    index += 1
                 
-        except Exception as e:
-            logger.error(f"Error extracting frame: {e}")
+                await process.wait()
+                await stderr_task
+                
+                if process.returncode != 0:
+                    logger.error(f"ffmpeg error extracting frames: {''.join(tail)[-1000:]}")
+            
+            finally:
+                stderr_task.cancel()
+    
+    def _known_size(self, size: str) -> bool:
+        if size not in self.thumbnail_sizes:
+            logger.warning(f"Unknown thumbnail size: {size}")
             return False
+        return True
+    
+    def _working_frame_size(self, video_info: Dict[str, Any],
+                            boxes: List[Tuple[int, int]]) -> Tuple[int, int, str]:
+        """
+        Размер кадров, которые ffmpeg отдает в pipe
+        
+        Пропорции исходника сохраняются, кадр вписывается в наибольший из
+        нужных размеров. Без размеров исходника кадр дополняется полями.
+        
+        Returns:
+            (ширина, высота, фильтр масштабирования)
+        """
+        box_width = max(box[0] for box in boxes)
+        box_height = max(box[1] for box in boxes)
+        
+        source_width = video_info.get('width') or 0
+        source_height = video_info.get('height') or 0
+        if abs(video_info.get('rotation', 0)) in (90, 270):
+            source_width, source_height = source_height, source_width
+        
+        if not source_width or not source_height:
+            return box_width, box_height, (
+                f"scale={box_width}:{box_height}:force_original_aspect_ratio=decrease,"
+                f"pad={box_width}:{box_height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+            )
+        
+        factor = min(1.0, box_width / source_width, box_height / source_height)
+        width = max(2, int(source_width * factor) // 2 * 2)
+        height = max(2, int(source_height * factor) // 2 * 2)
+        return width, height, f"scale={width}:{height},setsar=1"
+    
+    @staticmethod
+    def _fit_image(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """Вписывание кадра в размер с полями (как scale+pad в ffmpeg)"""
+        width, height = size
+        factor = min(width / img.width, height / img.height)
+        resized = img.resize(
+            (max(1, round(img.width * factor)), max(1, round(img.height * factor))),
+            Image.Resampling.LANCZOS
+        )
+        canvas = Image.new('RGB', size, (0, 0, 0))
+        canvas.paste(resized, ((width - resized.width) // 2, (height - resized.height) // 2))
+        return canvas
     
     async def _post_process_thumbnail(self, thumbnail_path: str, size: str):
         """Постобработка превью (улучшение качества, водяные знаки)"""
         try:
             with Image.open(thumbnail_path) as img:
-                # Улучшение контраста и резкости
-                from PIL import ImageEnhance
-                
-                # Увеличиваем контраст
-                enhancer = ImageEnhance.Contrast(img)
-                img = enhancer.enhance(1.1)
-                
-                # Увеличиваем резкость
-                enhancer = ImageEnhance.Sharpness(img)
-                img = enhancer.enhance(1.1)
-                
-                # Добавляем водяной знак (опционально)
-                if size in ['large', 'medium']:
-                    img = await self._add_watermark(img)
+                img = await self._enhance_thumbnail(img, size)
                 
                 # Сохраняем с оптимизацией
                 img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
@@ -186,6 +384,28 @@ class ThumbnailGenerator(BaseProcessor):
         except Exception as e:
             logger.error(f"Error post-processing thumbnail: {e}")
     
+    async def _enhance_thumbnail(self, img: Image.Image, size: str) -> Image.Image:
+        """Улучшение контраста и резкости, водяной знак для крупных размеров"""
+        try:
+            from PIL import ImageEnhance
+            
+            # Увеличиваем контраст
+            enhancer = ImageEnhance.Contrast(img)
+            img = enhancer.enhance(1.1)
+            
+            # Увеличиваем резкость
+            enhancer = ImageEnhance.Sharpness(img)
+            img = enhancer.enhance(1.1)
+            
+            # Добавляем водяной знак (опционально)
+            if size in ['large', 'medium']:
+                img = await self._add_watermark(img)
+            
+        except Exception as e:
+            logger.error(f"Error post-processing thumbnail: {e}")
+        
+        return img
+    
     async def _add_watermark(self, img: Image.Image) -> Image.Image:
         """Добавляет водяной знак на превью"""
         try:
@@ -248,31 +468,10 @@ class ThumbnailGenerator(BaseProcessor):
             Список путей к сгенерированным кадрам
         """
         try:
-            os.makedirs(output_dir, exist_ok=True)
-            
-            video_info = await self._get_video_info(video_path)
-            duration = video_info.get('duration', 0)
-            
-            if duration <= 0:
-                raise ValueError("Invalid video duration")
-            
-            frames = []
-            width, height = self.thumbnail_sizes['medium']
-            
-            # Генерируем кадры в равномерно распределенных позициях
-            for i in range(count):
-                position = (i + 1) / (count + 1)  # Избегаем самого начала и конца
-                timestamp = duration * position
-                
-                output_filename = f"frame_{i+1:02d}_{int(timestamp)}s.jpg"
-                output_path = os.path.join(output_dir, output_filename)
-                
-                success = await self._extract_frame_ffmpeg(
-                    video_path, output_path, timestamp, width, height
-                )
-                
-                if success and os.path.exists(output_path):
-                    frames.append(output_path)
+            media = await self.extract_media(
+                video_path, output_dir, frame_count=count, save_frames=True
+            )
+            frames = media['frames']
             
             logger.info(f"Generated {len(frames)} frames from video", 
                        video_path=video_path)
@@ -317,40 +516,7 @@ class ThumbnailGenerator(BaseProcessor):
             if not images:
                 return False
             
-            # Определяем размер каждой ячейки
-            cell_width = 320
-            cell_height = 180
-            
-            # Создаем сетку
-            grid_width = cols * cell_width
-            grid_height = rows * cell_height
-            grid_image = Image.new('RGB', (grid_width, grid_height), (0, 0, 0))
-            
-            # Размещаем изображения в сетке
-            for i, img in enumerate(images):
-                if i >= total_cells:
-                    break
-                
-                # Изменяем размер изображения
-                img_resized = img.resize((cell_width, cell_height), Image.Resampling.LANCZOS)
-                
-                # Вычисляем позицию в сетке
-                col = i % cols
-                row = i // cols
-                x = col * cell_width
-                y = row * cell_height
-                
-                # Вставляем в сетку
-                grid_image.paste(img_resized, (x, y))
-            
-            # Добавляем рамки между ячейками
-            draw = ImageDraw.Draw(grid_image)
-            for i in range(1, cols):
-                x = i * cell_width
-                draw.line([(x, 0), (x, grid_height)], fill=(255, 255, 255), width=2)
-            for i in range(1, rows):
-                y = i * cell_height
-                draw.line([(0, y), (grid_width, y)], fill=(255, 255, 255), width=2)
+            grid_image = self._compose_grid(images, grid_size)
             
             # Сохраняем сетку
             grid_image.save(output_path, 'JPEG', quality=90, optimize=True)
@@ -366,6 +532,45 @@ class ThumbnailGenerator(BaseProcessor):
             logger.error(f"Error creating preview grid: {e}")
             return False
     
+    @staticmethod
+    def _compose_grid(images: List[Image.Image], grid_size: Tuple[int, int]) -> Image.Image:
+        """Сборка сетки из кадров с рамками между ячейками"""
+        cols, rows = grid_size
+        
+        # Определяем размер каждой ячейки
+        cell_width = 320
+        cell_height = 180
+        
+        # Создаем сетку
+        grid_width = cols * cell_width
+        grid_height = rows * cell_height
+        grid_image = Image.new('RGB', (grid_width, grid_height), (0, 0, 0))
+        
+        # Размещаем изображения в сетке
+        for i, img in enumerate(images[:cols * rows]):
+            # Изменяем размер изображения
+            img_resized = img.resize((cell_width, cell_height), Image.Resampling.LANCZOS)
+            
+            # Вычисляем позицию в сетке
+            col = i % cols
+            row = i // cols
+            x = col * cell_width
+            y = row * cell_height
+            
+            # Вставляем в сетку
+            grid_image.paste(img_resized, (x, y))
+        
+        # Добавляем рамки между ячейками
+        draw = ImageDraw.Draw(grid_image)
+        for i in range(1, cols):
+            x = i * cell_width
+            draw.line([(x, 0), (x, grid_height)], fill=(255, 255, 255), width=2)
+        for i in range(1, rows):
+            y = i * cell_height
+            draw.line([(0, y), (grid_width, y)], fill=(255, 255, 255), width=2)
+        
+        return grid_image
+    
     async def extract_animated_gif(self, video_path: str, output_path: str,
                                  duration: float = 3.0, fps: int = 10,
                                  start_time: float = None) -> bool:
@@ -383,42 +588,17 @@ class ThumbnailGenerator(BaseProcessor):
             True если GIF создан успешно
         """
         try:
-            video_info = await self._get_video_info(video_path)
-            video_duration = video_info.get('duration', 0)
-            
-            if start_time is None:
-                # Начинаем с середины видео
-                start_time = max(0, (video_duration - duration) / 2)
-            
-            # Ограничиваем размер для GIF
-            max_width = 480
-            max_height = 270
-            
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-ss', str(start_time),
-                '-t', str(duration),
-                '-vf', f'fps={fps},scale={max_width}:{max_height}:force_original_aspect_ratio=decrease',
-                '-loop', '0',  # Бесконечный цикл
-                '-y',  # Перезаписать файл
-                output_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            media = await self.extract_media(
+                video_path, os.path.dirname(output_path) or None, gif=True, gif_path=output_path,
+                gif_duration=duration, gif_fps=fps, gif_start=start_time
             )
             
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode == 0 and os.path.exists(output_path):
+            if media['gif'] and os.path.exists(output_path):
                 logger.info(f"Created animated GIF", output_path=output_path)
                 return True
-            else:
-                logger.error(f"ffmpeg error creating GIF: {stderr.decode()}")
-                return False
+            
+            logger.error("No frames extracted for GIF", video_path=video_path)
+            return False
                 
         except Exception as e:
             logger.error(f"Error creating animated GIF: {e}")
@@ -476,29 +656,27 @@ class ThumbnailGenerator(BaseProcessor):
             except Exception as e:
                 logger.error(f"Error cleaning up temp file: {e}", path=path)
     
+    @staticmethod
+    def _stream_rotation(stream: Dict[str, Any]) -> int:
+        """Поворот видео из тега rotate или display matrix"""
+        try:
+            rotation = stream.get('tags', {}).get('rotate')
+            if rotation is None:
+                for side_data in stream.get('side_data_list', []):
+                    if 'rotation' in side_data:
+                        rotation = side_data['rotation']
+                        break
+            return int(float(rotation or 0)) % 360
+        except (TypeError, ValueError):
+            return 0
+    
     async def _get_video_info(self, video_path: str) -> Dict[str, Any]:
         """Получает информацию о видео с помощью ffprobe"""
         try:
-            cmd = [
-                'ffprobe',
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_format',
-                '-show_streams',
-                video_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            record = await probe_cache.probe(video_path)
             
-            if process.returncode == 0:
-                import json
-                info = json.loads(stdout.decode())
+            if record:
+                info = record.to_probe_data()
                 
                 # Извлекаем основную информацию
                 format_info = info.get('format', {})
@@ -523,6 +701,7 @@ class ThumbnailGenerator(BaseProcessor):
                         'height': video_stream.get('height'),
                         'fps': eval(video_stream.get('r_frame_rate', '0/1')),
                         'codec': video_stream.get('codec_name'),
+                        'rotation': self._stream_rotation(video_stream),
                     })
                 
                 return video_info
@@ -5,13 +5,15 @@ VideoBot Pro - Video Processor
 
 import structlog
 import subprocess
-import json
 import tempfile
 import shutil
 from pathlib import Path
 from typing import Dict, Any, Optional, Tuple, List
 from datetime import datetime
 
+from .media_executor import media_executor, MediaCancelledError, MediaTimeoutError
+from .probe_cache import probe_cache
+
 logger = structlog.get_logger(__name__)
 
 class VideoProcessorError(Exception):
@@ -21,6 +23,9 @@ class VideoProcessorError(Exception):
 class VideoProcessor:
     """Основной класс для обработки видео файлов"""
     
+    # Результат проверки FFmpeg/FFprobe, одной на процесс
+    _tools_available: Optional[bool] = None
+    
     def __init__(self, ffmpeg_path: str = "ffmpeg", ffprobe_path: str = "ffprobe"):
         """
         Инициализация процессора
@@ -39,17 +44,20 @@ class VideoProcessor:
     
     def _check_tools_availability(self):
         """Проверка доступности FFmpeg и FFprobe"""
+        if VideoProcessor._tools_available:
+            return
         try:
             subprocess.run([self.ffmpeg_path, "-version"], 
                          capture_output=True, check=True, timeout=10)
             subprocess.run([self.ffprobe_path, "-version"], 
                          capture_output=True, check=True, timeout=10)
+            VideoProcessor._tools_available = True
             logger.info("FFmpeg and FFprobe are available")
         except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired) as e:
             logger.error(f"FFmpeg/FFprobe not available: {e}")
             raise VideoProcessorError("FFmpeg/FFprobe not found or not working")
     
-    def get_video_info(self, file_path: str) -> Dict[str, Any]:
+    async def get_video_info(self, file_path: str) -> Dict[str, Any]:
         """
         Получение информации о видео файле
         
@@ -60,21 +68,12 @@ class VideoProcessor:
             Словарь с информацией о видео
         """
         try:
-            cmd = [
-                self.ffprobe_path,
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_format",
-                "-show_streams",
-                file_path
-            ]
+            record = await probe_cache.probe(file_path, ffprobe_path=self.ffprobe_path)
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            if record is None:
+                raise VideoProcessorError("FFprobe failed")
             
-            if result.returncode != 0:
-                raise VideoProcessorError(f"FFprobe failed: {result.stderr}")
-            
-            probe_data = json.loads(result.stdout)
+            probe_data = record.to_probe_data()
             
             # Извлекаем информацию о видео
             video_info = self._extract_video_metadata(probe_data)
@@ -82,10 +81,12 @@ class VideoProcessor:
             logger.info(f"Extracted video info: {video_info}")
             return video_info
             
-        except subprocess.TimeoutExpired:
+        except MediaCancelledError:
+            raise
+        except MediaTimeoutError:
             raise VideoProcessorError("Video analysis timeout")
-        except json.JSONDecodeError as e:
-            raise VideoProcessorError(f"Failed to parse FFprobe output: {e}")
+        except VideoProcessorError:
+            raise
         except Exception as e:
             logger.error(f"Error getting video info: {e}")
             raise VideoProcessorError(f"Failed to analyze video: {e}")
@@ -196,7 +197,7 @@ class VideoProcessor:
         return any(indicator in color_space or indicator in color_transfer 
                   for indicator in hdr_indicators)
     
-    def optimize_video(self, input_path: str, output_path: str, 
+    async def optimize_video(self, input_path: str, output_path: str, 
                       target_quality: str = "720p", 
                       target_format: str = "mp4",
                       max_file_size_mb: Optional[int] = None) -> Dict[str, Any]:
@@ -217,7 +218,7 @@ class VideoProcessor:
             logger.info(f"Starting video optimization: {input_path} -> {output_path}")
             
             # Получаем информацию об исходном файле
-            input_info = self.get_video_info(input_path)
+            input_info = await self.get_video_info(input_path)
             
             # Определяем параметры кодирования
             encoding_params = self._get_encoding_params(
@@ -234,30 +235,24 @@ class VideoProcessor:
             # Запускаем конвертацию
             start_time = datetime.now()
             
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            stdout, stderr = process.communicate(timeout=3600)  # 1 час максимум
+            ffmpeg_result = await media_executor.run(cmd, timeout=3600, text=True)  # 1 час максимум
             
-            if process.returncode != 0:
-                logger.error(f"FFmpeg failed with stderr: {stderr}")
-                raise VideoProcessorError(f"Video optimization failed: {stderr}")
+            if ffmpeg_result['returncode'] != 0:
+                logger.error(f"FFmpeg failed with stderr: {ffmpeg_result['stderr']}")
+                raise VideoProcessorError(f"Video optimization failed: {ffmpeg_result['stderr']}")
             
             end_time = datetime.now()
             processing_time = (end_time - start_time).total_seconds()
             
             # Получаем информацию о результате
-            output_info = self.get_video_info(output_path)
+            output_info = await self.get_video_info(output_path)
             
             result = {
                 'success': True,
                 'input_file': input_path,
                 'output_file': output_path,
                 'processing_time_seconds': processing_time,
+                'cpu_time_seconds': ffmpeg_result['cpu_time'],
                 'input_info': input_info,
                 'output_info': output_info,
                 'compression_ratio': input_info['file_size'] / output_info['file_size'] if output_info['file_size'] > 0 else 1,
@@ -267,7 +262,9 @@ class VideoProcessor:
             logger.info(f"Video optimization completed: {result}")
             return result
             
-        except subprocess.TimeoutExpired:
+        except MediaCancelledError:
+            raise
+        except MediaTimeoutError:
             logger.error("Video optimization timeout")
             raise VideoProcessorError("Video optimization timeout")
         except Exception as e:
@@ -376,7 +373,7 @@ class VideoProcessor:
         
         return cmd
     
-    def extract_thumbnail(self, video_path: str, output_path: str, 
+    async def extract_thumbnail(self, video_path: str, output_path: str, 
                          timestamp: str = "00:00:05",
                          width: int = 320, height: int = 240) -> Dict[str, Any]:
         """
@@ -406,10 +403,10 @@ class VideoProcessor:
                 output_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            result = await media_executor.run(cmd, timeout=30, text=True)
             
-            if result.returncode != 0:
-                raise VideoProcessorError(f"Thumbnail extraction failed: {result.stderr}")
+            if result['returncode'] != 0:
+                raise VideoProcessorError(f"Thumbnail extraction failed: {result['stderr']}")
             
             # Проверяем что файл создан
             output_file = Path(output_path)
@@ -428,13 +425,15 @@ class VideoProcessor:
             logger.info(f"Thumbnail extracted successfully: {thumbnail_info}")
             return thumbnail_info
             
-        except subprocess.TimeoutExpired:
+        except MediaCancelledError:
+            raise
+        except MediaTimeoutError:
             raise VideoProcessorError("Thumbnail extraction timeout")
         except Exception as e:
             logger.error(f"Error extracting thumbnail: {e}")
             raise VideoProcessorError(f"Failed to extract thumbnail: {e}")
     
-    def convert_to_audio(self, video_path: str, output_path: str,
+    async def convert_to_audio(self, video_path: str, output_path: str,
                         audio_format: str = "mp3", 
                         bitrate: str = "192k") -> Dict[str, Any]:
         """
@@ -472,13 +471,13 @@ class VideoProcessor:
                 output_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+            result = await media_executor.run(cmd, timeout=600, text=True)
             
-            if result.returncode != 0:
-                raise VideoProcessorError(f"Audio conversion failed: {result.stderr}")
+            if result['returncode'] != 0:
+                raise VideoProcessorError(f"Audio conversion failed: {result['stderr']}")
             
             # Получаем информацию об аудио файле
-            audio_info = self.get_video_info(output_path)
+            audio_info = await self.get_video_info(output_path)
             
             conversion_result = {
                 'success': True,
@@ -487,19 +486,22 @@ class VideoProcessor:
                 'codec': codec,
                 'bitrate': bitrate,
                 'duration': audio_info.get('duration', 0),
-                'file_size': audio_info.get('file_size', 0)
+                'file_size': audio_info.get('file_size', 0),
+                'cpu_time_seconds': result['cpu_time']
             }
             
             logger.info(f"Audio conversion completed: {conversion_result}")
             return conversion_result
             
-        except subprocess.TimeoutExpired:
+        except MediaCancelledError:
+            raise
+        except MediaTimeoutError:
             raise VideoProcessorError("Audio conversion timeout")
         except Exception as e:
             logger.error(f"Error converting to audio: {e}")
             raise VideoProcessorError(f"Failed to convert to audio: {e}")
     
-    def create_preview_gif(self, video_path: str, output_path: str,
+    async def create_preview_gif(self, video_path: str, output_path: str,
                           start_time: str = "00:00:05", 
                           duration: int = 3,
                           width: int = 320, fps: int = 10) -> Dict[str, Any]:
@@ -531,10 +533,10 @@ class VideoProcessor:
                 output_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            result = await media_executor.run(cmd, timeout=120, text=True)
             
-            if result.returncode != 0:
-                raise VideoProcessorError(f"GIF creation failed: {result.stderr}")
+            if result['returncode'] != 0:
+                raise VideoProcessorError(f"GIF creation failed: {result['stderr']}")
             
             output_file = Path(output_path)
             if not output_file.exists():
@@ -553,7 +555,9 @@ class VideoProcessor:
             logger.info(f"GIF preview created successfully: {gif_info}")
             return gif_info
             
-        except subprocess.TimeoutExpired:
+        except MediaCancelledError:
+            raise
+        except MediaTimeoutError:
             raise VideoProcessorError("GIF creation timeout")
         except Exception as e:
             logger.error(f"Error creating GIF: {e}")
@@ -573,10 +577,10 @@ class VideoProcessor:
         """Получить путь для временного файла"""
         return str(self.temp_dir / filename)
     
-    def is_valid_video(self, file_path: str) -> bool:
+    async def is_valid_video(self, file_path: str) -> bool:
         """Проверка является ли файл валидным видео"""
         try:
-            info = self.get_video_info(file_path)
+            info = await self.get_video_info(file_path)
             return info.get('duration', 0) > 0 and info.get('width', 0) > 0
         except VideoProcessorError:
             return False
\ No newline at end of file
@@ -6,7 +6,7 @@ VideoBot Pro - Backblaze B2 Storage
 import os
 import hashlib
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, AsyncIterator
 import aiohttp
 import structlog
 
@@ -324,6 +324,30 @@ class BackblazeStorage(BaseStorage):
         except Exception as e:
             raise StorageDownloadError(f"Download from Backblaze B2 failed: {e}")
     
+    async def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """Скачать файл из Backblaze B2 потоком чанков"""
+        if not self._connected:
+            await self.connect()
+        
+        download_url = f"{self._download_url}/file/{self.config.bucket_name}/{key}"
+        
+        try:
+            async with self._session.get(download_url) as response:
+                if response.status == 404:
+                    raise StorageNotFoundError(f"File not found: {key}")
+                elif response.status != 200:
+                    raise StorageDownloadError(
+                        f"Download failed: {response.status}"
+                    )
+                
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    yield chunk
+                
+        except (StorageNotFoundError, StorageDownloadError):
+            raise
+        except Exception as e:
+            raise StorageDownloadError(f"Download from Backblaze B2 failed: {e}")
+    
     async def delete_file(self, key: str) -> bool:
         """Удалить файл из Backblaze B2"""
         if not self._connected:
@@ -7,7 +7,7 @@ import os
 import hashlib
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List, Union, BinaryIO
+from typing import Optional, Dict, Any, List, Union, BinaryIO, AsyncIterator
 from dataclasses import dataclass
 from pathlib import Path
 import structlog
@@ -196,6 +196,24 @@ class BaseStorage(ABC):
         """
         pass
     
+    async def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """
+        Скачать файл потоком чанков
+        
+        Базовая реализация загружает файл целиком через download_bytes;
+        хранилища с потоковой выдачей переопределяют метод.
+        
+        Args:
+            key: Ключ файла
+            chunk_size: Размер чанка в байтах
+            
+        Yields:
+            Очередной чанк содержимого файла
+        """
+        data = await self.download_bytes(key)
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+    
     @abstractmethod
     async def delete_file(self, key: str) -> bool:
         """
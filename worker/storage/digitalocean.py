@@ -4,7 +4,7 @@ VideoBot Pro - DigitalOcean Spaces Storage
 """
 
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, AsyncIterator
 from botocore.exceptions import ClientError, NoCredentialsError
 import aioboto3
 import structlog
@@ -255,6 +255,32 @@ class DigitalOceanStorage(BaseStorage):
             else:
                 raise StorageDownloadError(f"Failed to download from DigitalOcean Spaces: {e}")
     
+    async def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """Скачать файл из DigitalOcean Spaces потоком чанков"""
+        if not self._connected:
+            await self.connect()
+        
+        try:
+            async with self._s3_client as client:
+                response = await client.get_object(
+                    Bucket=self.config.bucket_name,
+                    Key=key
+                )
+                
+                body = response['Body']
+                while True:
+                    chunk = await body.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code')
+            if error_code == 'NoSuchKey':
+                raise StorageNotFoundError(f"File not found in DigitalOcean Spaces: {key}")
+            else:
+                raise StorageDownloadError(f"Failed to download from DigitalOcean Spaces: {e}")
+    
     async def delete_file(self, key: str) -> bool:
         """Удалить файл из DigitalOcean Spaces"""
         if not self._connected:
@@ -4,6 +4,9 @@ VideoBot Pro - Storage Manager
 """
 
 import os
+import math
+import uuid
+import asyncio
 import hashlib
 import shutil
 from datetime import datetime, timedelta
@@ -15,10 +18,23 @@ import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
 
 from shared.config.settings import settings
-from worker.config import get_storage_config
+from shared.services.redis import get_redis_client
+from worker.config import get_storage_config, worker_config
+from worker.utils.download_cache import download_cache
 
 logger = structlog.get_logger(__name__)
 
+# Время жизни состояния незавершенной multipart загрузки (секунды).
+# Брошенные в хранилище части удаляет lifecycle-правило бакета
+# (AbortIncompleteMultipartUpload) со сроком не меньше этого
+MULTIPART_STATE_TTL = 24 * 3600
+
+# Коды ошибок S3, после которых продолжать multipart загрузку бессмысленно
+NON_RETRYABLE_MULTIPART_ERRORS = {
+    "NoSuchUpload", "InvalidPart", "InvalidPartOrder", "EntityTooSmall",
+    "EntityTooLarge", "AccessDenied", "NoSuchBucket", "InvalidAccessKeyId",
+}
+
 class StorageManager:
     """Менеджер для управления различными типами хранилищ"""
     
@@ -61,7 +77,8 @@ class StorageManager:
         task_id: int,
         user_type: str = "free",
         metadata: Optional[Dict[str, Any]] = None,
-        preferred_provider: str = "wasabi"
+        preferred_provider: str = "wasabi",
+        final_attempt: bool = False
     ) -> Dict[str, Any]:
         """
         Загрузка файла в облачное хранилище
@@ -72,6 +89,8 @@ class StorageManager:
             user_type: Тип пользователя
             metadata: Метаданные файла
             preferred_provider: Предпочтительный провайдер
+            final_attempt: Последняя попытка задачи - незавершенную
+                multipart загрузку не нужно сохранять для продолжения
             
         Returns:
             Результат загрузки с URL'ами
@@ -100,24 +119,45 @@ class StorageManager:
             if metadata:
                 upload_metadata.update(metadata)
             
-            # Загружаем файл
-            upload_result = await provider.upload_file(
-                local_path=file_path,
-                remote_key=file_key,
-                metadata=upload_metadata
-            )
+            # Загружаем файл (большие файлы - частями, с возможностью продолжения)
+            if self._should_use_multipart(provider, file_path):
+                upload_result = await self._multipart_upload(
+                    provider=provider,
+                    file_path=file_path,
+                    file_key=file_key,
+                    metadata=upload_metadata,
+                    task_id=task_id,
+                    final_attempt=final_attempt
+                )
+            else:
+                upload_result = await provider.upload_file(
+                    local_path=file_path,
+                    remote_key=file_key,
+                    metadata=upload_metadata
+                )
             
             if not upload_result.get("success"):
+                primary_result = upload_result
+                
                 # Пробуем резервный провайдер
                 backup_provider = self._get_backup_provider(preferred_provider)
                 if backup_provider:
-                    logger.warning(f"Primary upload failed, trying backup provider")
+                    logger.warning("Primary upload failed, trying backup provider")
                     upload_result = await backup_provider.upload_file(
                         local_path=file_path,
                         remote_key=file_key,
                         metadata=upload_metadata
                     )
                     upload_result["provider"] = "backup"
+                    
+                    # Файл уже в резервном хранилище - продолжать загрузку не нужно
+                    pending = primary_result.get("multipart", {})
+                    if upload_result.get("success") and pending.get("resumable"):
+                        await self._abort_multipart_upload(
+                            provider, file_key, pending["upload_id"],
+                            await self._get_state_store(),
+                            self._multipart_state_key(task_id, file_key)
+                        )
             
             if upload_result.get("success"):
                 # Генерируем подписанные URL'ы
@@ -142,7 +182,7 @@ class StorageManager:
                 raise Exception(f"Upload failed: {upload_result.get('error')}")
                 
         except Exception as e:
-            logger.error(f"File upload failed", error=str(e), file_path=file_path)
+            logger.error("File upload failed", error=str(e), file_path=file_path)
             return {
                 "success": False,
                 "error": str(e)
@@ -152,7 +192,8 @@ class StorageManager:
         self,
         file_key: Optional[str] = None,
         cdn_url: Optional[str] = None,
-        file_name: Optional[str] = None
+        file_name: Optional[str] = None,
+        force: bool = False
     ) -> Dict[str, Any]:
         """
         Удаление файла из хранилища
@@ -161,6 +202,7 @@ class StorageManager:
             file_key: Ключ файла в хранилище
             cdn_url: URL файла в CDN
             file_name: Имя файла
+            force: Удалить даже если на файл ссылается кэш загрузок
             
         Returns:
             Результат удаления
@@ -172,6 +214,15 @@ class StorageManager:
             if not file_key:
                 raise ValueError("File key or CDN URL required")
             
+            # Объект из кэша загрузок может быть нужен другим задачам
+            if not force and await download_cache.is_file_referenced(file_key):
+                logger.info("File is still referenced, skipping deletion", file_key=file_key)
+                return {
+                    "success": False,
+                    "skipped": True,
+                    "error": "File is still referenced by other downloads"
+                }
+            
             # Пробуем удалить из всех доступных провайдеров
             deletion_results = {}
             
@@ -196,7 +247,7 @@ class StorageManager:
             }
             
         except Exception as e:
-            logger.error(f"File deletion failed", error=str(e), file_key=file_key)
+            logger.error("File deletion failed", error=str(e), file_key=file_key)
             return {
                 "success": False,
                 "error": str(e)
@@ -389,6 +440,10 @@ class StorageManager:
                             # Файл не найден в БД - это сирота
                             orphaned_files += 1
                             
+                            # Объекты кэша загрузок не удаляем, как и в delete_file
+                            if await download_cache.is_file_referenced(file_key):
+                                continue
+                            
                             try:
                                 delete_result = await provider.delete_file(file_key)
                                 if delete_result.get("success"):
@@ -440,6 +495,192 @@ class StorageManager:
                 "error": str(e)
             }
     
+    def _should_use_multipart(self, provider, file_path: str) -> bool:
+        """Проверка, нужно ли загружать файл частями"""
+        threshold = worker_config.multipart_threshold_mb * 1024 * 1024
+        return provider.supports_multipart and os.path.getsize(file_path) >= threshold
+    
+    async def _multipart_upload(
+        self,
+        provider,
+        file_path: str,
+        file_key: str,
+        metadata: Dict[str, Any],
+        task_id: int,
+        final_attempt: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Загрузка файла частями с сохранением состояния в Redis
+        
+        Подтвержденные части записываются в Redis, поэтому повторный запуск
+        задачи продолжает загрузку с последней подтвержденной части. При
+        временной ошибке (сбой части, таймаут, неудачное завершение)
+        upload_id и состояние сохраняются для повтора. Загрузка отменяется
+        (abort) только при неустранимой ошибке или на последней попытке.
+        
+        Args:
+            provider: Провайдер хранилища с поддержкой multipart
+            file_path: Путь к локальному файлу
+            file_key: Ключ файла в хранилище
+            metadata: Метаданные файла
+            task_id: ID задачи
+            final_attempt: Последняя попытка - отменять загрузку при любой ошибке
+            
+        Returns:
+            Результат загрузки
+        """
+        file_size = os.path.getsize(file_path)
+        part_size = worker_config.multipart_part_size_mb * 1024 * 1024
+        total_parts = max(1, math.ceil(file_size / part_size))
+        state_key = self._multipart_state_key(task_id, file_key)
+        
+        state_store = await self._get_state_store()
+        upload_id = None
+        
+        try:
+            completed_parts: Dict[int, str] = {}
+            
+            # Пробуем продолжить ранее начатую загрузку
+            state = await state_store.hash_get_all(state_key) if state_store else {}
+            upload_info = state.get("upload")
+            if (
+                isinstance(upload_info, dict)
+                and upload_info.get("part_size") == part_size
+                and await provider.multipart_upload_exists(file_key, upload_info["upload_id"])
+            ):
+                upload_id = upload_info["upload_id"]
+                for field_name, part_info in state.items():
+                    if field_name.startswith("part:") and isinstance(part_info, dict):
+                        completed_parts[int(field_name.split(":", 1)[1])] = part_info["etag"]
+                
+                logger.info(
+                    "Resuming multipart upload",
+                    file_key=file_key,
+                    completed_parts=len(completed_parts),
+                    total_parts=total_parts
+                )
+            
+            if not upload_id:
+                upload_id = await provider.create_multipart_upload(file_key, metadata)
+                if state_store:
+                    await state_store.delete(state_key)
+                    await state_store.hash_set(
+                        state_key, "upload", {"upload_id": upload_id, "part_size": part_size}
+                    )
+            
+            if state_store:
+                await state_store.expire(state_key, MULTIPART_STATE_TTL)
+            
+            semaphore = asyncio.Semaphore(worker_config.multipart_concurrency)
+            
+            async def upload_single_part(part_number: int):
+                async with semaphore:
+                    data = await asyncio.to_thread(
+                        self._read_file_part, file_path, (part_number - 1) * part_size, part_size
+                    )
+                    etag = await provider.upload_part(file_key, upload_id, part_number, data)
+                    completed_parts[part_number] = etag
+                    
+                    if state_store:
+                        await state_store.hash_set(state_key, f"part:{part_number}", {"etag": etag})
+            
+            pending_parts = [n for n in range(1, total_parts + 1) if n not in completed_parts]
+            part_tasks = [asyncio.create_task(upload_single_part(n)) for n in pending_parts]
+            try:
+                # При первой ошибке остальные части не догружаем
+                done, _ = await asyncio.wait(part_tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            finally:
+                for task in part_tasks:
+                    task.cancel()
+                await asyncio.gather(*part_tasks, return_exceptions=True)
+            
+            parts = [
+                {"PartNumber": number, "ETag": completed_parts[number]}
+                for number in sorted(completed_parts)
+            ]
+            upload_result = await provider.complete_multipart_upload(file_key, upload_id, parts, metadata)
+            resumable = False
+            
+            if upload_result.get("success"):
+                if state_store:
+                    await state_store.delete(state_key)
+            elif final_attempt or upload_result.get("error_code") in NON_RETRYABLE_MULTIPART_ERRORS:
+                await self._abort_multipart_upload(provider, file_key, upload_id, state_store, state_key)
+            else:
+                resumable = True
+                logger.warning(
+                    "Multipart upload completion failed, state kept for retry",
+                    file_key=file_key, error=upload_result.get("error")
+                )
+            
+            upload_result["multipart"] = {
+                "upload_id": upload_id,
+                "total_parts": total_parts,
+                "resumed_parts": total_parts - len(pending_parts),
+                "resumable": resumable
+            }
+            return upload_result
+            
+        except Exception as e:
+            logger.error("Multipart upload failed", error=str(e), file_key=file_key)
+            if not upload_id:
+                return {"success": False, "error": str(e)}
+            
+            if final_attempt or not self._is_retryable_multipart_error(e):
+                await self._abort_multipart_upload(provider, file_key, upload_id, state_store, state_key)
+                return {"success": False, "error": str(e)}
+            
+            # Подтвержденные части остаются в Redis - повтор задачи продолжит загрузку
+            return {
+                "success": False,
+                "error": str(e),
+                "multipart": {"upload_id": upload_id, "resumable": True}
+            }
+    
+    @staticmethod
+    def _multipart_state_key(task_id: int, file_key: str) -> str:
+        """Ключ состояния multipart загрузки в Redis"""
+        return f"multipart_upload:{task_id}:{file_key}"
+    
+    @staticmethod
+    def _is_retryable_multipart_error(error: Exception) -> bool:
+        """Можно ли продолжить multipart загрузку после ошибки"""
+        if isinstance(error, ClientError):
+            code = error.response.get("Error", {}).get("Code")
+            return code not in NON_RETRYABLE_MULTIPART_ERRORS
+        
+        # Локальный файл пропал или поврежден - повтор не поможет
+        return not isinstance(error, (FileNotFoundError, PermissionError, ValueError, KeyError))
+    
+    async def _abort_multipart_upload(self, provider, file_key: str, upload_id: str,
+                                      state_store, state_key: str):
+        """Отмена multipart загрузки и удаление ее состояния"""
+        if not await provider.abort_multipart_upload(file_key, upload_id):
+            logger.warning("Multipart upload was not aborted", file_key=file_key, upload_id=upload_id)
+        
+        if state_store:
+            try:
+                await state_store.delete(state_key)
+            except Exception as e:
+                logger.warning(f"Failed to delete multipart upload state: {e}", file_key=file_key)
+    
+    async def _get_state_store(self):
+        """Получение Redis клиента для хранения состояния загрузок"""
+        try:
+            return await get_redis_client()
+        except Exception as e:
+            logger.warning(f"Redis unavailable, multipart upload will not be resumable: {e}")
+            return None
+    
+    @staticmethod
+    def _read_file_part(file_path: str, offset: int, size: int) -> bytes:
+        """Чтение части файла"""
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+    
     def _select_provider(self, preferred: str, user_type: str):
         """Выбор провайдера хранилища"""
         # Для Premium пользователей предпочтительно Wasabi
@@ -470,9 +711,12 @@ class StorageManager:
         file_name = os.path.basename(file_path)
         file_ext = os.path.splitext(file_name)[1]
         
-        # Создаем хеш на основе содержимого файла
+        # Создаем хеш на основе содержимого файла (читаем блоками)
+        hash_md5 = hashlib.md5()
         with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()[:12]
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hash_md5.update(chunk)
+        file_hash = hash_md5.hexdigest()[:12]
         
         # Формируем путь: user_type/year/month/hash_taskid.ext
         now = datetime.utcnow()
@@ -480,7 +724,8 @@ class StorageManager:
         
         return f"{user_type}/{year_month}/{file_hash}_{task_id}{file_ext}"
     
-    def _get_expiration_time(self, user_type: str) -> int:
+    @staticmethod
+    def _get_expiration_time(user_type: str) -> int:
         """Получение времени истечения ссылки в секундах"""
         expiration_hours = {
             "premium": 7 * 24,  # 7 дней
@@ -504,6 +749,9 @@ class StorageManager:
 class BaseStorageProvider:
     """Базовый класс для провайдеров хранилища"""
     
+    # Поддерживает ли провайдер загрузку частями
+    supports_multipart = False
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.logger = logger.bind(provider=self.__class__.__name__)
@@ -525,10 +773,33 @@ class BaseStorageProvider:
     
     async def list_files(self, prefix: str = "") -> List[Dict[str, Any]]:
         raise NotImplementedError
+    
+    async def create_multipart_upload(self, remote_key: str, metadata: Dict[str, Any]) -> str:
+        raise NotImplementedError
+    
+    async def upload_part(self, remote_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        raise NotImplementedError
+    
+    async def complete_multipart_upload(
+        self,
+        remote_key: str,
+        upload_id: str,
+        parts: List[Dict[str, Any]],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+    
+    async def abort_multipart_upload(self, remote_key: str, upload_id: str) -> bool:
+        raise NotImplementedError
+    
+    async def multipart_upload_exists(self, remote_key: str, upload_id: str) -> bool:
+        raise NotImplementedError
 
 class WasabiStorage(BaseStorageProvider):
     """Провайдер для Wasabi S3"""
     
+    supports_multipart = True
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         try:
@@ -679,14 +950,108 @@ class WasabiStorage(BaseStorageProvider):
             self.logger.error(f"Error listing files: {e}")
             return []
 
+    async def create_multipart_upload(self, remote_key: str, metadata: Dict[str, Any]) -> str:
+        if not self.s3_client:
+            raise RuntimeError("S3 client not initialized")
+        
+        response = await asyncio.to_thread(
+            self.s3_client.create_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=remote_key,
+            Metadata=metadata,
+            ServerSideEncryption='AES256'
+        )
+        return response['UploadId']
+    
+    async def upload_part(self, remote_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        if not self.s3_client:
+            raise RuntimeError("S3 client not initialized")
+        
+        # boto3 клиент синхронный - выполняем в потоке, чтобы части шли параллельно
+        response = await asyncio.to_thread(
+            self.s3_client.upload_part,
+            Bucket=self.bucket_name,
+            Key=remote_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return response['ETag']
+    
+    async def complete_multipart_upload(
+        self,
+        remote_key: str,
+        upload_id: str,
+        parts: List[Dict[str, Any]],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if not self.s3_client:
+            return {"success": False, "error": "Client not initialized"}
+        
+        try:
+            await asyncio.to_thread(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=remote_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+            
+            return {
+                "success": True,
+                "provider": "wasabi",
+                "bucket": self.bucket_name,
+                "key": remote_key
+            }
+            
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            self.logger.error(f"Wasabi multipart completion failed: {error_code}")
+            return {"success": False, "error": f"AWS Error: {error_code}", "error_code": error_code}
+    
+    async def abort_multipart_upload(self, remote_key: str, upload_id: str) -> bool:
+        if not self.s3_client:
+            return False
+        
+        try:
+            await asyncio.to_thread(
+                self.s3_client.abort_multipart_upload,
+                Bucket=self.bucket_name,
+                Key=remote_key,
+                UploadId=upload_id
+            )
+            return True
+        except Exception as e:
+            self.logger.warning(f"Failed to abort multipart upload: {e}")
+            return False
+    
+    async def multipart_upload_exists(self, remote_key: str, upload_id: str) -> bool:
+        try:
+            await asyncio.to_thread(
+                self.s3_client.list_parts,
+                Bucket=self.bucket_name,
+                Key=remote_key,
+                UploadId=upload_id,
+                MaxParts=1
+            )
+            return True
+        except ClientError:
+            return False
+
 class LocalStorage(BaseStorageProvider):
     """Локальный провайдер хранилища"""
     
+    # Части эмулируются файлами во временной директории
+    supports_multipart = True
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.base_path = Path(config.get('base_path', './storage'))
         self.base_path.mkdir(parents=True, exist_ok=True)
         self.url_prefix = config.get('url_prefix', 'http://localhost:8000/files')
+        self.multipart_path = Path(
+            config.get('multipart_path', Path(worker_config.download_temp_dir) / 'multipart')
+        )
     
     async def upload_file(self, local_path: str, remote_key: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
         try:
@@ -811,6 +1176,70 @@ class LocalStorage(BaseStorageProvider):
             return hash_md5.hexdigest()
         except Exception:
             return ""
+    
+    async def create_multipart_upload(self, remote_key: str, metadata: Dict[str, Any]) -> str:
+        upload_id = uuid.uuid4().hex
+        (self.multipart_path / upload_id).mkdir(parents=True, exist_ok=True)
+        return upload_id
+    
+    async def upload_part(self, remote_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        upload_dir = self.multipart_path / upload_id
+        if not upload_dir.exists():
+            raise FileNotFoundError(f"Multipart upload not found: {upload_id}")
+        
+        # Пишем во временный файл и переименовываем, чтобы часть не была видна недописанной
+        part_path = upload_dir / f"{part_number:05d}.part"
+        tmp_path = part_path.with_suffix('.tmp')
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(data)
+        os.replace(tmp_path, part_path)
+        
+        return hashlib.md5(data).hexdigest()
+    
+    async def complete_multipart_upload(
+        self,
+        remote_key: str,
+        upload_id: str,
+        parts: List[Dict[str, Any]],
+        metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        try:
+            upload_dir = self.multipart_path / upload_id
+            target_path = self.base_path / remote_key
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            
+            def assemble():
+                with open(target_path, 'wb') as target:
+                    for part in sorted(parts, key=lambda p: p["PartNumber"]):
+                        part_path = upload_dir / f"{part['PartNumber']:05d}.part"
+                        with open(part_path, 'rb') as source:
+                            shutil.copyfileobj(source, target, 1024 * 1024)
+                shutil.rmtree(upload_dir, ignore_errors=True)
+            
+            await asyncio.to_thread(assemble)
+            
+            # Создаем файл метаданных
+            metadata_path = target_path.with_suffix(target_path.suffix + '.meta')
+            async with aiofiles.open(metadata_path, 'w') as f:
+                import json
+                await f.write(json.dumps(metadata))
+            
+            return {
+                "success": True,
+                "provider": "local",
+                "path": str(target_path),
+                "public_url": f"{self.url_prefix}/{remote_key}"
+            }
+            
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    async def abort_multipart_upload(self, remote_key: str, upload_id: str) -> bool:
+        shutil.rmtree(self.multipart_path / upload_id, ignore_errors=True)
+        return True
+    
+    async def multipart_upload_exists(self, remote_key: str, upload_id: str) -> bool:
+        return (self.multipart_path / upload_id).is_dir()
 
 # Заглушки для других провайдеров
 class BackblazeStorage(BaseStorageProvider):
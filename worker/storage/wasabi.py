@@ -5,7 +5,7 @@ VideoBot Pro - Wasabi Storage
 
 import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, AsyncIterator
 from botocore.exceptions import ClientError, NoCredentialsError
 import aioboto3
 import structlog
@@ -251,6 +251,32 @@ class WasabiStorage(BaseStorage):
             else:
                 raise StorageDownloadError(f"Failed to download from Wasabi: {e}")
     
+    async def download_stream(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """Скачать файл из Wasabi потоком чанков"""
+        if not self._connected:
+            await self.connect()
+        
+        try:
+            async with self._s3_client as client:
+                response = await client.get_object(
+                    Bucket=self.config.bucket_name,
+                    Key=key
+                )
+                
+                body = response['Body']
+                while True:
+                    chunk = await body.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code')
+            if error_code == 'NoSuchKey':
+                raise StorageNotFoundError(f"File not found in Wasabi: {key}")
+            else:
+                raise StorageDownloadError(f"Failed to download from Wasabi: {e}")
+    
     async def delete_file(self, key: str) -> bool:
         """Удалить файл из Wasabi"""
         if not self._connected:
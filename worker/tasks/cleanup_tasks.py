@@ -14,6 +14,7 @@ from sqlalchemy import text
 
 from worker.celery_app import celery_app
 from worker.tasks.base import async_task_wrapper
+from worker.utils.download_cache import download_cache
 
 logger = structlog.get_logger(__name__)
 
@@ -160,10 +161,11 @@ async def _cleanup_cdn_links_async() -> Dict[str, Any]:
     cleaned_count = 0
     
     async with get_async_session() as session:
-        # Находим истекшие CDN ссылки
+        # Находим истекшие CDN ссылки: срок задачи совпадает со сроком ссылки
+        # и записи кэша загрузок, у старых задач без expires_at - 24 часа
         expired_links = await session.execute(text("""
             SELECT id, cdn_url FROM download_tasks 
-            WHERE created_at < NOW() - INTERVAL '24 hours'
+            WHERE COALESCE(expires_at, created_at + INTERVAL '24 hours') < NOW()
             AND cdn_url IS NOT NULL
             AND status = 'completed'
             LIMIT 500
@@ -171,6 +173,9 @@ async def _cleanup_cdn_links_async() -> Dict[str, Any]:
         
         for link_record in expired_links.fetchall():
             try:
+                # Освобождаем ссылку на объект в кэше загрузок
+                await download_cache.release_url(link_record.cdn_url)
+                
                 # Обновляем запись в БД
                 await session.execute(text("""
                     UPDATE download_tasks 
@@ -3,21 +3,34 @@ VideoBot Pro - Updated Worker Tasks with CDN Integration
 Обновленные задачи Worker'а с интеграцией CDN
 """
 
+import json
 import asyncio
+import time
+import weakref
+from pathlib import Path
 import structlog
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
 from celery import Task
 
 from shared.models.download_task import DownloadTask
 from shared.models.user import User
 from shared.config.database import get_async_session
+from shared.services.redis import get_redis_client
+from shared.services.progress import progress_publisher, is_cancel_requested, TERMINAL_STATUSES
 from worker.celery_app import celery_app
+from worker.config import worker_config
 from worker.downloaders.factory import DownloaderFactory
+from worker.processors.media_executor import current_media_job, MediaCancelledError
 from worker.processors.video_processor import VideoProcessor
 from worker.processors.thumbnail_generator import ThumbnailGenerator
 from worker.storage.local import local_storage
-from worker.integrations.cdn_upload import upload_to_cdn, upload_thumbnail_to_cdn, is_cdn_available
+from worker.storage.manager import StorageManager
+from worker.utils.download_cache import download_cache
+from worker.utils.single_flight import FlightLease, single_flight
+from worker.integrations.cdn_upload import (
+    upload_to_cdn, upload_thumbnail_to_cdn, is_cdn_available, cdn_integration
+)
 
 logger = structlog.get_logger(__name__)
 
@@ -42,7 +55,8 @@ async def download_video_task(
     url: str,
     quality: str = "best",
     extract_audio: bool = False,
-    generate_thumbnail: bool = True
+    generate_thumbnail: bool = True,
+    pipeline: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     Основная задача загрузки видео с интеграцией CDN
@@ -54,6 +68,8 @@ async def download_video_task(
         quality: Качество видео
         extract_audio: Извлекать ли аудио
         generate_thumbnail: Генерировать ли превью
+        pipeline: Выполнять этапы после загрузки параллельно
+            (по умолчанию - worker_config.download_pipeline_enabled)
         
     Returns:
         Результат выполнения задачи
@@ -63,11 +79,20 @@ async def download_video_task(
         'success': False,
         'files': [],
         'cdn_urls': [],
-        'errors': []
+        'errors': [],
+        'stage_timings': {}
     }
     
+    if pipeline is None:
+        pipeline = worker_config.download_pipeline_enabled
+    
+    flight_lease = None
+    
+    # Процессы ffmpeg/ffprobe этой задачи останавливаются при ее отмене
+    media_job_token = current_media_job.set(task_id)
+    
     try:
-        logger.info(f"Starting video download task", task_id=task_id, url=url)
+        logger.info("Starting video download task", task_id=task_id, url=url)
         
         # Получаем задачу и пользователя из базы данных
         async with get_async_session() as session:
@@ -77,6 +102,9 @@ async def download_video_task(
             if not task or not user:
                 raise ValueError("Task or user not found")
         
+        if task.batch_id:
+            await _start_batch_task(task_id)
+        
         # Обновляем статус задачи
         await _update_task_status(task_id, 'downloading', 'Starting download...')
         
@@ -85,6 +113,28 @@ async def download_video_task(
         if not downloader:
             raise ValueError(f"Unsupported platform for URL: {url}")
         
+        # Срок жизни выданной ссылки - по нему же истекают запись кэша и задача
+        link_ttl = StorageManager._get_expiration_time(user.user_type)
+        
+        # Проверяем кэш загрузок: то же видео могло быть уже загружено в CDN.
+        # Ссылка из кэша должна прожить заметную часть срока, положенного пользователю
+        cache_key = None
+        min_cache_ttl = int(link_ttl * worker_config.download_cache_min_ttl_ratio)
+        video_id = downloader._extract_video_id(url)
+        if video_id:
+            cache_key = download_cache.make_key(downloader.platform_name, video_id, quality, extract_audio)
+            cached_entry = await download_cache.lookup(cache_key, min_ttl=min_cache_ttl)
+            if cached_entry:
+                return await _complete_from_cache(task_id, cached_entry, result)
+            
+            # Одинаковую загрузку уже выполняет другой worker - ждем его результат
+            flight_lease = await single_flight.acquire(cache_key)
+            if not flight_lease:
+                await _update_task_status(task_id, 'downloading', 'Waiting for identical download...')
+                flight_lease, cached_entry = await _wait_for_flight(cache_key, min_cache_ttl)
+                if cached_entry:
+                    return await _complete_from_cache(task_id, cached_entry, result)
+        
         # 2. ЭТАП: Получаем информацию о видео
         await _update_task_status(task_id, 'downloading', 'Getting video info...')
         video_info = await downloader.get_video_info(url)
@@ -94,11 +144,13 @@ async def download_video_task(
         
         # 3. ЭТАП: Загружаем видео
         await _update_task_status(task_id, 'downloading', 'Downloading video file...')
+        download_started = time.monotonic()
         download_result = await downloader.download(
             url=url,
             quality=quality,
             output_path=local_storage.downloads_dir
         )
+        result['stage_timings']['download'] = round(time.monotonic() - download_started, 3)
         
         if not download_result.get('success'):
             raise ValueError(f"Download failed: {download_result.get('error')}")
@@ -118,132 +170,177 @@ async def download_video_task(
             }
         })
         
-        # 4. ЭТАП: Обработка видео (если нужно)
-        if user.user_type in ['premium', 'admin'] and quality != 'best':
-            await _update_task_status(task_id, 'processing', 'Processing video...')
-            processor = VideoProcessor()
-            
-            processed_file = await processor.process_video(
-                input_path=video_file_path,
+        if pipeline:
+            # 4-7. ЭТАПЫ: Обработка, аудио, превью и загрузка в CDN параллельно
+            await _update_task_status(task_id, 'processing', 'Processing and uploading...')
+            cdn_result, thumbnail_cdn_url = await _run_post_download_pipeline(
+                task=task,
+                user=user,
+                video_file_path=video_file_path,
+                downloaded_files=downloaded_files,
                 quality=quality,
-                user_type=user.user_type
-            )
-            
-            if processed_file:
-                downloaded_files.append({
-                    'path': processed_file,
-                    'type': 'video_processed',
-                    'metadata': {
-                        'processed_quality': quality,
-                        'original_file': video_file_path
-                    }
-                })
-        
-        # 5. ЭТАП: Извлечение аудио (если нужно)
-        if extract_audio:
-            await _update_task_status(task_id, 'processing', 'Extracting audio...')
-            processor = VideoProcessor()
-            
-            audio_file = await processor.extract_audio(
-                video_path=video_file_path,
-                output_format='mp3'
-            )
-            
-            if audio_file:
-                downloaded_files.append({
-                    'path': audio_file,
-                    'type': 'audio',
-                    'metadata': {
-                        'format': 'mp3',
-                        'extracted_from': video_file_path
-                    }
-                })
-        
-        # 6. ЭТАП: Генерация превью (если нужно)
-        thumbnail_cdn_url = None
-        if generate_thumbnail:
-            await _update_task_status(task_id, 'processing', 'Generating thumbnail...')
-            thumbnail_generator = ThumbnailGenerator()
-            
-            thumbnail_path = await thumbnail_generator.generate_thumbnail(
-                video_path=video_file_path,
-                timestamp=30  # Превью на 30-й секунде
+                extract_audio=extract_audio,
+                generate_thumbnail=generate_thumbnail,
+                result=result
             )
+        else:
+            # 4. ЭТАП: Обработка видео (если нужно)
+            if user.user_type in ['premium', 'admin'] and quality != 'best':
+                await _update_task_status(task_id, 'processing', 'Processing video...')
+                processed_file = await _render_quality(video_file_path, quality)
+                
+                if processed_file:
+                    downloaded_files.append({
+                        'path': processed_file,
+                        'type': 'video_processed',
+                        'metadata': {
+                            'processed_quality': quality,
+                            'original_file': video_file_path
+                        }
+                    })
             
-            if thumbnail_path:
-                # Загружаем превью в CDN отдельно
-                if await is_cdn_available():
-                    thumbnail_result = await upload_thumbnail_to_cdn(
-                        thumbnail_path, task, user
-                    )
-                    
-                    if thumbnail_result.get('success'):
-                        thumbnail_cdn_url = thumbnail_result.get('cdn_url')
+            # 5. ЭТАП: Извлечение аудио (если нужно)
+            if extract_audio:
+                await _update_task_status(task_id, 'processing', 'Extracting audio...')
+                audio_file = await _extract_audio(video_file_path)
                 
-                downloaded_files.append({
-                    'path': thumbnail_path,
-                    'type': 'thumbnail',
-                    'metadata': {
-                        'timestamp': 30,
-                        'format': 'jpg'
-                    }
-                })
-        
-        # 7. ЭТАП: Загрузка в CDN
-        cdn_result = None
-        if await is_cdn_available():
-            await _update_task_status(task_id, 'uploading', 'Uploading to cloud storage...')
+                if audio_file:
+                    downloaded_files.append({
+                        'path': audio_file,
+                        'type': 'audio',
+                        'metadata': {
+                            'format': 'mp3',
+                            'extracted_from': video_file_path
+                        }
+                    })
             
-            cdn_result = await upload_to_cdn(task, user, downloaded_files)
+            # 6. ЭТАП: Генерация превью (если нужно)
+            thumbnail_cdn_url = None
+            if generate_thumbnail:
+                await _update_task_status(task_id, 'processing', 'Generating thumbnail...')
+                thumbnail_path = await _generate_thumbnail(video_file_path)
+                
+                if thumbnail_path:
+                    # Загружаем превью в CDN отдельно
+                    if await is_cdn_available():
+                        thumbnail_result = await upload_thumbnail_to_cdn(
+                            thumbnail_path, task, user
+                        )
+                        
+                        if thumbnail_result.get('success'):
+                            thumbnail_cdn_url = thumbnail_result.get('cdn_url')
+                    
+                    downloaded_files.append({
+                        'path': thumbnail_path,
+                        'type': 'thumbnail',
+                        'metadata': {
+                            'size': 'medium',
+                            'format': 'jpg'
+                        }
+                    })
             
-            if cdn_result.get('success'):
-                result['cdn_urls'] = [cdn_result.get('cdn_url')]
-                result['direct_urls'] = [cdn_result.get('direct_url')]
-                result['storage_type'] = cdn_result.get('storage_type')
+            # 7. ЭТАП: Загрузка в CDN
+            cdn_result = None
+            if await is_cdn_available():
+                await _update_task_status(task_id, 'uploading', 'Uploading to cloud storage...')
                 
-                logger.info(
-                    "Files uploaded to CDN",
-                    task_id=task_id,
-                    storage_type=cdn_result.get('storage_type'),
-                    cdn_url=cdn_result.get('cdn_url')
-                )
+                cdn_result = await upload_to_cdn(task, user, downloaded_files)
+                
+                if cdn_result.get('success'):
+                    result['cdn_urls'] = [cdn_result.get('cdn_url')]
+                    result['direct_urls'] = [cdn_result.get('direct_url')]
+                    result['storage_type'] = cdn_result.get('storage_type')
+                    
+                    logger.info(
+                        "Files uploaded to CDN",
+                        task_id=task_id,
+                        storage_type=cdn_result.get('storage_type'),
+                        cdn_url=cdn_result.get('cdn_url')
+                    )
+                else:
+                    logger.warning(f"CDN upload failed: {cdn_result.get('error')}")
+                    result['errors'].append(f"CDN upload failed: {cdn_result.get('error')}")
             else:
-                logger.warning(f"CDN upload failed: {cdn_result.get('error')}")
-                result['errors'].append(f"CDN upload failed: {cdn_result.get('error')}")
-        else:
-            logger.warning("CDN not available, files stored locally only")
-            result['errors'].append("CDN not available")
+                logger.warning("CDN not available, files stored locally only")
+                result['errors'].append("CDN not available")
+            
+        # Отмененная задача не публикуется в кэш и не помечается завершенной
+        await _raise_if_cancelled(task_id)
+        
+        # Запоминаем загруженный объект для повторных запросов того же видео;
+        # оригинал вместо несостоявшейся обработки под ключом качества не кэшируем
+        processing_failed = 'processing' in result.get('failed_stages', [])
+        cached = False
+        if cache_key and cdn_result and cdn_result.get('success') and not processing_failed:
+            cached = await download_cache.store(
+                cache_key,
+                cdn_result,
+                expires_in=link_ttl,
+                extra={
+                    'cdn_urls': result['cdn_urls'],
+                    'thumbnail_url': thumbnail_cdn_url,
+                    'video_info': {
+                        'title': video_info.get('title'),
+                        'duration': video_info.get('duration'),
+                        'format': video_info.get('format')
+                    }
+                }
+            )
         
         # 8. ЭТАП: Обновление базы данных
-        await _update_task_completion(
+        failed_stages = result.get('failed_stages')
+        completed = await _update_task_completion(
             task_id=task_id,
             cdn_url=cdn_result.get('cdn_url') if cdn_result else None,
             direct_url=cdn_result.get('direct_url') if cdn_result else None,
             thumbnail_url=thumbnail_cdn_url,
-            file_size=download_result.get('file_size', 0),
-            video_info=video_info
+            file_size=(cdn_result or {}).get('file_size') or download_result.get('file_size', 0),
+            video_info=video_info,
+            expires_at=datetime.utcnow() + timedelta(seconds=link_ttl) if cdn_result else None,
+            error_message=f"Partially failed stages: {', '.join(failed_stages)}" if failed_stages else None
         )
         
+        # Первая ссылка записи кэша принадлежит этой задаче - без задачи ее некому освободить
+        if cached and not completed:
+            await download_cache.release_url(cdn_result['cdn_url'])
+        
         # 9. ЭТАП: Очистка локальных файлов (если загружено в CDN)
         if cdn_result and cdn_result.get('success'):
             await _cleanup_local_files([f['path'] for f in downloaded_files])
         
         result['success'] = True
+        result['partial'] = bool(failed_stages)
         result['files'] = downloaded_files
         result['video_info'] = video_info
         
-        logger.info(f"Video download task completed successfully", task_id=task_id)
+        logger.info("Video download task completed successfully", task_id=task_id)
         
         return result
         
+    except MediaCancelledError as e:
+        logger.info("Video download task cancelled", task_id=task_id, reason=str(e))
+        
+        await _update_task_status(task_id, 'cancelled', 'Cancelled')
+        
+        result['cancelled'] = True
+        result['errors'].append(str(e))
+        return result
+        
     except Exception as e:
-        logger.error(f"Video download task failed", task_id=task_id, error=str(e))
+        logger.error("Video download task failed", task_id=task_id, error=str(e))
         
         # Обновляем статус задачи как неудачной
         await _update_task_status(task_id, 'failed', f'Error: {str(e)}')
         
         result['errors'].append(str(e))
         return result
+    
+    finally:
+        current_media_job.reset(media_job_token)
+        
+        # Уведомляем задачи, ожидающие эту же загрузку
+        if flight_lease:
+            await flight_lease.release({'success': result['success'], 'task_id': task_id})
 
 @celery_app.task(bind=True, base=BaseWorkerTask, name='download_batch')
 async def download_batch_task(
@@ -257,6 +354,11 @@ async def download_batch_task(
     """
     Задача пакетной загрузки видео
     
+    Не ждет загрузки сама: ставит в очередь первые N задач download_video
+    (N зависит от типа пользователя), каждая завершенная задача через callback
+    запускает следующую. Когда завершены все, finalize_download_batch
+    собирает архив и обновляет пакет.
+    
     Args:
         batch_id: ID пакета в базе данных
         user_id: ID пользователя
@@ -265,20 +367,21 @@ async def download_batch_task(
         create_archive: Создавать ли архив
         
     Returns:
-        Результат выполнения пакетной загрузки
+        Результат постановки загрузок в очередь
     """
     result = {
         'batch_id': batch_id,
         'success': False,
-        'completed_downloads': 0,
-        'failed_downloads': 0,
-        'files': [],
-        'archive_url': None,
+        'total_downloads': len(urls),
+        'dispatched_downloads': 0,
         'errors': []
     }
     
     try:
-        logger.info(f"Starting batch download", batch_id=batch_id, urls_count=len(urls))
+        logger.info("Starting batch download", batch_id=batch_id, urls_count=len(urls))
+        
+        if not urls:
+            raise ValueError("No URLs in batch")
         
         # Получаем пользователя
         async with get_async_session() as session:
@@ -286,51 +389,121 @@ async def download_batch_task(
             if not user:
                 raise ValueError("User not found")
         
-        # Обновляем статус пакета
-        await _update_batch_status(batch_id, 'downloading', 'Starting batch download...')
+        parallelism = min(
+            len(urls),
+            max(1, worker_config.batch_parallelism.get(user.user_type, 1))
+        )
         
-        all_downloaded_files = []
+        # Сохраняем состояние пакета в Redis
+        config = {
+            'user_id': user_id,
+            'urls': urls,
+            'quality': quality,
+            'create_archive': create_archive
+        }
         
-        # Загружаем каждое видео
-        for i, url in enumerate(urls):
-            try:
-                await _update_batch_status(
-                    batch_id, 'downloading', 
-                    f'Downloading {i+1}/{len(urls)}: {url[:50]}...'
-                )
-                
-                # Создаем временную задачу для загрузки
-                temp_task = DownloadTask(
-                    id=f"batch_{batch_id}_{i}",
-                    url=url,
-                    user_id=user_id,
-                    platform=_detect_platform(url)
-                )
-                
-                # Загружаем видео
-                download_result = await download_video_task.apply_async(
-                    args=[temp_task.id, user_id, url, quality, False, True],
-                    countdown=0
-                ).get()
-                
-                if download_result.get('success'):
-                    all_downloaded_files.extend(download_result.get('files', []))
-                    result['completed_downloads'] += 1
-                else:
-                    result['failed_downloads'] += 1
-                    result['errors'].extend(download_result.get('errors', []))
-                    
-            except Exception as e:
-                logger.error(f"Failed to download {url}: {e}")
+        redis_client = await get_redis_client()
+        state_key = _batch_state_key(batch_id)
+        results_key = _batch_results_key(batch_id)
+        
+        await redis_client.delete(state_key)
+        await redis_client.delete(results_key)
+        await redis_client.hash_set(state_key, 'config', config)
+        await redis_client.hash_set(state_key, 'next_index', parallelism)
+        await redis_client.hash_set(state_key, 'finished', 0)
+        await redis_client.expire(state_key, BATCH_STATE_TTL)
+        
+        await _update_batch_status(
+            batch_id, 'downloading',
+            f'Downloading {len(urls)} videos, {parallelism} at a time...'
+        )
+        
+        for index in range(parallelism):
+            _dispatch_batch_item(batch_id, index, config)
+        
+        await _update_batch_counters(batch_id, processing_count=parallelism)
+        
+        result['success'] = True
+        result['dispatched_downloads'] = parallelism
+        
+        logger.info("Batch downloads dispatched", batch_id=batch_id, parallelism=parallelism)
+        
+        return result
+        
+    except Exception as e:
+        logger.error("Batch download task failed", batch_id=batch_id, error=str(e))
+        
+        await _update_batch_status(batch_id, 'failed', f'Error: {str(e)}')
+        
+        result['errors'].append(str(e))
+        return result
+
+@celery_app.task(name='download_batch_item_done')
+async def on_batch_item_done(item_result: Dict[str, Any], batch_id: int, index: int) -> None:
+    """Callback завершения одной загрузки пакета"""
+    await _complete_batch_item(batch_id, index, item_result)
+
+@celery_app.task(name='download_batch_item_failed')
+async def on_batch_item_failed(request, exc, traceback, batch_id: int, index: int) -> None:
+    """Errback загрузки пакета, упавшей вне обработчика ошибок задачи"""
+    await _complete_batch_item(batch_id, index, {'success': False, 'errors': [str(exc)]})
+
+@celery_app.task(bind=True, base=BaseWorkerTask, name='finalize_download_batch')
+async def finalize_download_batch_task(self, batch_id: int) -> Dict[str, Any]:
+    """
+    Завершение пакетной загрузки после выполнения всех задач
+    
+    Args:
+        batch_id: ID пакета в базе данных
+        
+    Returns:
+        Итоговый результат пакетной загрузки
+    """
+    result = {
+        'batch_id': batch_id,
+        'success': False,
+        'completed_downloads': 0,
+        'failed_downloads': 0,
+        'files': [],
+        'archive_url': None,
+        'errors': []
+    }
+    
+    try:
+        redis_client = await get_redis_client()
+        state_key = _batch_state_key(batch_id)
+        results_key = _batch_results_key(batch_id)
+        
+        config = await redis_client.hash_get(state_key, 'config')
+        if not config:
+            raise ValueError("Batch state not found")
+        
+        item_results = await redis_client.hash_get_all(results_key)
+        
+        all_downloaded_files = []
+        for index in sorted(item_results, key=int):
+            item_result = item_results[index]
+            if item_result.get('success'):
+                all_downloaded_files.extend(item_result.get('files', []))
+                result['completed_downloads'] += 1
+            else:
                 result['failed_downloads'] += 1
-                result['errors'].append(f"URL {url}: {str(e)}")
+                result['errors'].extend(item_result.get('errors', []))
         
         # Если есть загруженные файлы и нужно создать архив
-        if all_downloaded_files and create_archive:
+        if all_downloaded_files and config.get('create_archive'):
             await _update_batch_status(batch_id, 'processing', 'Creating archive...')
             
             try:
-                from worker.integrations.cdn_upload import cdn_integration
+                async with get_async_session() as session:
+                    user = await session.get(User, config['user_id'])
+                
+                archive_task = DownloadTask(
+                    id=f"batch_{batch_id}",
+                    url=config['urls'][0],
+                    user_id=config['user_id'],
+                    platform='batch'
+                )
                 
                 # Создаем архив и загружаем в CDN
                 file_paths = [f['path'] for f in all_downloaded_files if f.get('type') == 'video']
@@ -339,13 +512,13 @@ async def download_batch_task(
                 archive_result = await cdn_integration.cdn_client.create_archive_and_upload(
                     files=file_paths,
                     archive_name=archive_name,
-                    task=temp_task,  # Используем последнюю временную задачу
+                    task=archive_task,
                     user=user
                 )
                 
                 if archive_result.get('success'):
                     result['archive_url'] = archive_result.get('cdn_url')
-                    logger.info(f"Batch archive created", batch_id=batch_id, archive_url=result['archive_url'])
+                    logger.info("Batch archive created", batch_id=batch_id, archive_url=result['archive_url'])
                 else:
                     result['errors'].append(f"Archive creation failed: {archive_result.get('error')}")
                     
@@ -373,12 +546,15 @@ async def download_batch_task(
         if result.get('archive_url'):
             await _cleanup_local_files([f['path'] for f in all_downloaded_files])
         
-        logger.info(f"Batch download completed", batch_id=batch_id, **result)
+        await redis_client.delete(state_key)
+        await redis_client.delete(results_key)
+        
+        logger.info("Batch download completed", batch_id=batch_id, **result)
         
         return result
         
     except Exception as e:
-        logger.error(f"Batch download task failed", batch_id=batch_id, error=str(e))
+        logger.error("Batch finalization failed", batch_id=batch_id, error=str(e))
         
         await _update_batch_status(batch_id, 'failed', f'Error: {str(e)}')
         
@@ -405,7 +581,7 @@ async def cleanup_old_files_task(self, max_age_hours: int = 24) -> Dict[str, Any
     }
     
     try:
-        logger.info(f"Starting cleanup task", max_age_hours=max_age_hours)
+        logger.info("Starting cleanup task", max_age_hours=max_age_hours)
         
         # 1. Очистка локальных файлов
         try:
@@ -416,7 +592,7 @@ async def cleanup_old_files_task(self, max_age_hours: int = 24) -> Dict[str, Any
             }
             
             result['local_cleanup'] = local_result
-            logger.info(f"Local cleanup completed", **local_result)
+            logger.info("Local cleanup completed", **local_result)
             
         except Exception as e:
             logger.error(f"Local cleanup failed: {e}")
@@ -463,7 +639,7 @@ async def cleanup_old_files_task(self, max_age_hours: int = 24) -> Dict[str, Any
         result['total_freed_space_gb'] = round(total_freed, 2)
         result['success'] = len(result['errors']) == 0
         
-        logger.info(f"Cleanup task completed", **result)
+        logger.info("Cleanup task completed", **result)
         
         return result
         
@@ -492,7 +668,7 @@ async def migrate_files_to_cdn_task(self, limit: int = 100) -> Dict[str, Any]:
     }
     
     try:
-        logger.info(f"Starting file migration to CDN", limit=limit)
+        logger.info("Starting file migration to CDN", limit=limit)
         
         if not await is_cdn_available():
             raise ValueError("CDN is not available")
@@ -577,7 +753,7 @@ async def migrate_files_to_cdn_task(self, limit: int = 100) -> Dict[str, Any]:
         result['success'] = result['migrated_files'] > 0
         result['total_size_gb'] = round(result['total_size_gb'], 2)
         
-        logger.info(f"File migration completed", **result)
+        logger.info("File migration completed", **result)
         
         return result
         
@@ -588,12 +764,419 @@ async def migrate_files_to_cdn_task(self, limit: int = 100) -> Dict[str, Any]:
 
 # Вспомогательные функции
 
+async def _wait_for_flight(
+    cache_key: str,
+    min_cache_ttl: int = 0
+) -> Tuple[Optional[FlightLease], Optional[Dict[str, Any]]]:
+    """
+    Ожидание одинаковой загрузки, которую выполняет другой worker
+    
+    После каждого завершения владельца проверяет кэш и пробует занять
+    аренду: если ее успел занять другой ожидающий, ждет уже его. Без
+    аренды загрузка выполняется только после общего таймаута ожидания.
+    
+    Returns:
+        (аренда, None) - загрузку выполняет эта задача,
+        (None, запись кэша) - результат уже в кэше,
+        (None, None) - таймаут ожидания, загрузка без аренды
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + single_flight.wait_timeout
+    
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        
+        await single_flight.wait(cache_key, timeout=remaining)
+        
+        cached_entry = await download_cache.lookup(cache_key, min_ttl=min_cache_ttl)
+        if cached_entry:
+            return None, cached_entry
+        
+        flight_lease = await single_flight.acquire(cache_key)
+        if flight_lease:
+            return flight_lease, None
+        
+        # Аренду занял другой ожидающий или Redis недоступен - не крутимся вхолостую
+        await asyncio.sleep(min(single_flight.poll_interval, max(0, deadline - loop.time())))
+    
+    logger.warning("Single-flight wait deadline reached, downloading without lease", cache_key=cache_key)
+    return None, None
+
+async def _complete_from_cache(
+    task_id: int,
+    cached_entry: Dict[str, Any],
+    result: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Завершение задачи объектом из кэша загрузок без скачивания
+    
+    Ссылка, взятая lookup'ом, освобождается, если задача ее не получила:
+    иначе очистка задач не освободит ее и объект не будет удален.
+    """
+    video_info = cached_entry.get('video_info') or {}
+    
+    completed = False
+    try:
+        completed = await _update_task_completion(
+            task_id=task_id,
+            cdn_url=cached_entry.get('cdn_url'),
+            direct_url=cached_entry.get('direct_url'),
+            thumbnail_url=cached_entry.get('thumbnail_url'),
+            file_size=cached_entry.get('file_size', 0),
+            video_info=video_info,
+            # Ссылка общая с записью кэша и истекает вместе с ней
+            expires_at=datetime.fromisoformat(cached_entry['expires_at'])
+        )
+    finally:
+        if not completed:
+            await download_cache.release_url(cached_entry['cdn_url'])
+    
+    if not completed:
+        raise RuntimeError("Failed to complete task from download cache")
+    
+    result['success'] = True
+    result['cache_hit'] = True
+    result['cdn_urls'] = cached_entry.get('cdn_urls') or [cached_entry.get('cdn_url')]
+    result['direct_urls'] = [cached_entry.get('direct_url')]
+    result['storage_type'] = cached_entry.get('storage_type')
+    result['video_info'] = video_info
+    
+    logger.info("Video download task served from cache", task_id=task_id)
+    
+    return result
+
+# Время жизни состояния пакетной загрузки в Redis (секунды)
+BATCH_STATE_TTL = 24 * 3600
+
+def _batch_state_key(batch_id: int) -> str:
+    return f"batch_fanout:{batch_id}"
+
+def _batch_results_key(batch_id: int) -> str:
+    return f"batch_fanout:{batch_id}:results"
+
+# Атомарный учет результата: HSETNX по индексу и, если результат новый,
+# занятие следующего URL и увеличение счетчика завершенных. Возвращает
+# {next_index, finished} или 0 для повторного результата
+_COMPLETE_ITEM_SCRIPT = """
+if redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+local next_index = redis.call('HINCRBY', KEYS[1], 'next_index', 1) - 1
+local finished = redis.call('HINCRBY', KEYS[1], 'finished', 1)
+return {next_index, finished}
+"""
+
+def _dispatch_batch_item(batch_id: int, index: int, config: Dict[str, Any]):
+    """Постановка в очередь одной загрузки пакета с callback'ом завершения"""
+    download_video_task.apply_async(
+        args=[
+            f"batch_{batch_id}_{index}",
+            config['user_id'],
+            config['urls'][index],
+            config['quality'],
+            False,
+            True
+        ],
+        link=on_batch_item_done.s(batch_id, index),
+        link_error=on_batch_item_failed.s(batch_id, index)
+    )
+
+async def _complete_batch_item(batch_id: int, index: int, item_result: Dict[str, Any]):
+    """
+    Учет завершенной загрузки пакета
+    
+    Результат пишется в Redis один раз на индекс (HSETNX в одном скрипте со
+    счетчиками), поэтому повторный вызов callback'а не сдвигает счетчики.
+    Освободившийся слот занимает следующий URL, последняя завершенная загрузка
+    запускает finalize_download_batch.
+    """
+    try:
+        redis_client = await get_redis_client()
+        state_key = _batch_state_key(batch_id)
+        
+        config = await redis_client.hash_get(state_key, 'config')
+        if not config:
+            logger.warning("Batch state not found", batch_id=batch_id, index=index)
+            return
+        
+        summary = {
+            'success': bool(item_result.get('success')),
+            'files': item_result.get('files', []),
+            'errors': item_result.get('errors', [])
+        }
+        
+        claimed = await redis_client.eval_script(
+            _COMPLETE_ITEM_SCRIPT,
+            [state_key, _batch_results_key(batch_id)],
+            [str(index), json.dumps(summary, default=str), BATCH_STATE_TTL]
+        )
+        # eval_script возвращает None при ошибке Redis - отличаем ее от повтора
+        if claimed is None:
+            raise RuntimeError("Failed to record batch item result in Redis")
+        if not claimed:
+            return
+        
+        next_index, finished = (int(value) for value in claimed)
+        total = len(config['urls'])
+        
+        # Занимаем следующий URL
+        dispatched = next_index < total
+        if dispatched:
+            _dispatch_batch_item(batch_id, next_index, config)
+        
+        # Освободившийся слот сразу занят следующим URL - processing не меняется
+        await _update_batch_counters(
+            batch_id,
+            processing_count=0 if dispatched else -1,
+            completed_count=1 if summary['success'] else 0,
+            failed_count=0 if summary['success'] else 1
+        )
+        
+        await _update_batch_status(batch_id, 'downloading', f'Downloaded {finished}/{total}')
+        
+        if finished == total:
+            finalize_download_batch_task.delay(batch_id)
+            
+    except Exception as e:
+        logger.error("Failed to complete batch item", batch_id=batch_id, index=index, error=str(e))
+
+# Семафоры этапов конвейера (отдельный набор на каждый event loop)
+_stage_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def _get_stage_semaphore(stage: str) -> asyncio.Semaphore:
+    """Получение семафора, ограничивающего параллелизм этапа конвейера"""
+    loop = asyncio.get_running_loop()
+    semaphores = _stage_semaphores.setdefault(loop, {})
+    
+    if stage not in semaphores:
+        limit = worker_config.pipeline_stage_limits.get(stage, 1)
+        semaphores[stage] = asyncio.Semaphore(max(1, limit))
+    
+    return semaphores[stage]
+
+async def _run_post_download_pipeline(
+    task: DownloadTask,
+    user: User,
+    video_file_path: str,
+    downloaded_files: List[Dict[str, Any]],
+    quality: str,
+    extract_audio: bool,
+    generate_thumbnail: bool,
+    result: Dict[str, Any]
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Конвейерное выполнение этапов после загрузки видео
+    
+    Загрузка оригинала в CDN, обработка, извлечение аудио и генерация превью
+    стартуют одновременно, как только исходный файл готов. Каждый этап
+    ограничен своим семафором, время этапов пишется в result['stage_timings'].
+    Локальные файлы не удаляются при загрузке - их очищает вызывающий код.
+    
+    Ошибка загрузки оригинала прерывает задачу. Ошибки обработки, аудио и
+    превью не прерывают ее: этапы перечисляются в result['failed_stages'],
+    и задача завершается с пометкой о частичной ошибке.
+    
+    Returns:
+        Результат загрузки основного файла в CDN (обработанной версии, если
+        она получена, иначе оригинала) и URL превью
+    """
+    stage_timings = result['stage_timings']
+    cdn_available = await is_cdn_available()
+    cdn_client = cdn_integration.cdn_client
+    
+    async def run_stage(name: str, kind: str, coro_factory):
+        async with _get_stage_semaphore(kind):
+            started = time.monotonic()
+            try:
+                return await coro_factory()
+            finally:
+                stage_timings[name] = round(time.monotonic() - started, 3)
+    
+    async def upload_derived(name: str, file_path: str, file_type: str, metadata: Dict[str, Any]):
+        if not cdn_available:
+            return None
+        return await run_stage(
+            f'upload_{name}', 'upload',
+            lambda: cdn_client.upload_file(
+                file_path=file_path,
+                task=task,
+                user=user,
+                file_type=file_type,
+                metadata=metadata,
+                cleanup_local=False
+            )
+        )
+    
+    async def original_stage():
+        if not cdn_available:
+            return None
+        video_entry = downloaded_files[0]
+        return await run_stage(
+            'upload_original', 'upload',
+            lambda: cdn_client.upload_file(
+                file_path=video_file_path,
+                task=task,
+                user=user,
+                file_type=video_entry['type'],
+                metadata=video_entry['metadata'],
+                cleanup_local=False
+            )
+        )
+    
+    async def processing_stage():
+        processed_file = await run_stage(
+            'processing', 'processing',
+            lambda: _render_quality(video_file_path, quality)
+        )
+        if not processed_file:
+            return None
+        
+        metadata = {'processed_quality': quality, 'original_file': video_file_path}
+        downloaded_files.append({'path': processed_file, 'type': 'video_processed', 'metadata': metadata})
+        return await upload_derived('processed', processed_file, 'video_processed', metadata)
+    
+    async def audio_stage():
+        audio_file = await run_stage(
+            'audio', 'audio',
+            lambda: _extract_audio(video_file_path)
+        )
+        if not audio_file:
+            return None
+        
+        metadata = {'format': 'mp3', 'extracted_from': video_file_path}
+        downloaded_files.append({'path': audio_file, 'type': 'audio', 'metadata': metadata})
+        return await upload_derived('audio', audio_file, 'audio', metadata)
+    
+    async def thumbnail_stage():
+        thumbnail_path = await run_stage(
+            'thumbnail', 'thumbnail',
+            lambda: _generate_thumbnail(video_file_path)
+        )
+        if not thumbnail_path:
+            return None
+        
+        metadata = {'size': 'medium', 'format': 'jpg'}
+        downloaded_files.append({'path': thumbnail_path, 'type': 'thumbnail', 'metadata': metadata})
+        return await upload_derived(
+            'thumbnail', thumbnail_path, 'thumbnail',
+            {'is_thumbnail': 'true', 'parent_task_id': str(task.id)}
+        )
+    
+    stages = {'original': original_stage()}
+    if user.user_type in ['premium', 'admin'] and quality != 'best':
+        stages['processing'] = processing_stage()
+    if extract_audio:
+        stages['audio'] = audio_stage()
+    if generate_thumbnail:
+        stages['thumbnail'] = thumbnail_stage()
+    
+    outcomes = dict(zip(stages, await asyncio.gather(*stages.values(), return_exceptions=True)))
+    
+    # Отмена задачи не считается ошибкой этапа - прерываем всю задачу
+    for outcome in outcomes.values():
+        if isinstance(outcome, MediaCancelledError):
+            raise outcome
+    
+    # Без оригинала задаче нечего отдать - это ошибка задачи, а не этапа
+    if isinstance(outcomes['original'], Exception):
+        raise outcomes['original']
+    
+    failed_stages = result.setdefault('failed_stages', [])
+    for name, outcome in outcomes.items():
+        if isinstance(outcome, Exception):
+            logger.error("Pipeline stage failed", task_id=task.id, stage=name, error=str(outcome))
+            result['errors'].append(f"Stage {name} failed: {outcome}")
+            failed_stages.append(name)
+            outcomes[name] = None
+        elif isinstance(outcome, dict) and not outcome.get('success'):
+            result['errors'].append(f"CDN upload of {name} failed: {outcome.get('error')}")
+            failed_stages.append(name)
+    
+    original_result = outcomes['original']
+    processed_result = outcomes.get('processing')
+    
+    # Пользователь получает запрошенное качество, если оно получено
+    cdn_result = original_result
+    if processed_result and processed_result.get('success'):
+        cdn_result = processed_result
+    
+    if not cdn_available:
+        logger.warning("CDN not available, files stored locally only")
+        result['errors'].append("CDN not available")
+    elif cdn_result and cdn_result.get('success'):
+        result['cdn_urls'] = [cdn_result.get('cdn_url')]
+        result['direct_urls'] = [cdn_result.get('direct_url')]
+        result['storage_type'] = cdn_result.get('storage_type')
+        
+        for derived in (original_result, outcomes.get('audio')):
+            if derived is not cdn_result and derived and derived.get('success'):
+                result['cdn_urls'].append(derived.get('cdn_url'))
+    
+    thumbnail_result = outcomes.get('thumbnail')
+    thumbnail_cdn_url = None
+    if thumbnail_result and thumbnail_result.get('success'):
+        thumbnail_cdn_url = thumbnail_result.get('cdn_url')
+    
+    logger.info("Post-download pipeline completed", task_id=task.id, stage_timings=stage_timings)
+    
+    return cdn_result, thumbnail_cdn_url
+
+async def _render_quality(video_file_path: str, quality: str) -> Optional[str]:
+    """Перекодирование видео в запрошенное качество"""
+    processor = VideoProcessor()
+    output_path = processor.get_temp_path(f"{Path(video_file_path).stem}_{quality}.mp4")
+    
+    outcome = await processor.optimize_video(
+        input_path=video_file_path,
+        output_path=output_path,
+        target_quality=quality
+    )
+    return outcome.get('output_file') if outcome.get('success') else None
+
+async def _extract_audio(video_file_path: str) -> Optional[str]:
+    """Извлечение аудиодорожки в mp3"""
+    processor = VideoProcessor()
+    output_path = processor.get_temp_path(f"{Path(video_file_path).stem}.mp3")
+    
+    outcome = await processor.convert_to_audio(
+        video_path=video_file_path,
+        output_path=output_path,
+        audio_format='mp3'
+    )
+    return outcome.get('audio_path') if outcome.get('success') else None
+
+async def _generate_thumbnail(video_file_path: str) -> Optional[str]:
+    """Превью среднего размера из середины видео"""
+    thumbnails = await ThumbnailGenerator().generate_thumbnails(video_file_path, sizes=['medium'])
+    return thumbnails.get('medium')
+
+async def _raise_if_cancelled(task_id: int):
+    """Прерывание задачи, если пользователь ее отменил"""
+    if await is_cancel_requested(task_id):
+        raise MediaCancelledError("Task cancelled", processor='download', details={'job_id': task_id})
+
 async def _update_task_status(task_id: int, status: str, message: str = None):
-    """Обновление статуса задачи в базе данных"""
+    """
+    Обновление статуса задачи
+    
+    Событие публикуется в Redis для бота; в базу данных записываются только
+    завершающие статусы, промежуточные этапы не создают транзакций.
+    """
+    await progress_publisher.publish(task_id, status, message)
+    if status not in TERMINAL_STATUSES:
+        return
+    
     try:
         async with get_async_session() as session:
-            task = await session.get(DownloadTask, task_id)
-            if task:
+            task = await session.get(DownloadTask, task_id, with_for_update=True)
+            # Отмененную задачу не перезаписываем результатом обработки
+            if task and task.status != 'cancelled':
+                await _count_batch_task_finished(session, task, status)
                 task.status = status
                 if message:
                     task.progress_message = message
@@ -610,19 +1193,36 @@ async def _update_task_completion(
     direct_url: str = None,
     thumbnail_url: str = None,
     file_size: int = 0,
-    video_info: dict = None
-):
-    """Обновление завершенной задачи"""
+    video_info: dict = None,
+    expires_at: datetime = None,
+    error_message: str = None
+) -> bool:
+    """
+    Обновление завершенной задачи
+    
+    error_message задается, если часть этапов не выполнена: задача
+    завершена, но событие и запись помечаются partial.
+    
+    Returns:
+        True если ссылки записаны в задачу
+    """
+    completed = False
     try:
         async with get_async_session() as session:
-            task = await session.get(DownloadTask, task_id)
+            task = await session.get(DownloadTask, task_id, with_for_update=True)
+            if task and task.status == 'cancelled':
+                logger.info("Task was cancelled, completion skipped", task_id=task_id)
+                return False
             if task:
+                await _count_batch_task_finished(session, task, 'completed')
                 task.status = 'completed'
                 task.cdn_url = cdn_url
                 task.direct_url = direct_url
                 task.thumbnail_url = thumbnail_url
                 task.file_size = file_size
                 task.completed_at = datetime.utcnow()
+                task.expires_at = expires_at
+                task.error_message = error_message
                 
                 if video_info:
                     task.title = video_info.get('title')
@@ -630,9 +1230,14 @@ async def _update_task_completion(
                     task.format = video_info.get('format')
                 
                 await session.commit()
+                completed = True
                 
     except Exception as e:
         logger.error(f"Failed to update task completion: {e}")
+    
+    extra = {'partial': True, 'error': error_message} if error_message else {}
+    await progress_publisher.publish(task_id, 'completed', percent=100, cdn_url=cdn_url, **extra)
+    return completed
 
 async def _update_batch_status(batch_id: int, status: str, message: str = None):
     """Обновление статуса пакетной задачи"""
@@ -652,6 +1257,59 @@ async def _update_batch_status(batch_id: int, status: str, message: str = None):
     except Exception as e:
         logger.error(f"Failed to update batch status: {e}")
 
+# Счетчик пакета для каждого завершающего статуса задачи
+_BATCH_COUNTER_FIELDS = {
+    'completed': 'completed_count',
+    'failed': 'failed_count',
+    'cancelled': 'cancelled_count'
+}
+
+async def _start_batch_task(task_id: int):
+    """Перевод задачи пакета в processing с учетом в счетчиках пакета"""
+    try:
+        async with get_async_session() as session:
+            from shared.models.download_batch import DownloadBatch
+            
+            task = await session.get(DownloadTask, task_id, with_for_update=True)
+            # Повторный запуск (retry Celery) не учитывается второй раз
+            if task and task.batch_id and task.status == 'pending':
+                task.status = 'processing'
+                await session.execute(DownloadBatch.counters_update(task.batch_id, processing_count=1))
+                await session.commit()
+                
+    except Exception as e:
+        logger.error(f"Failed to start batch task: {e}", task_id=task_id)
+
+async def _count_batch_task_finished(session, task: DownloadTask, status: str):
+    """
+    Учет завершения задачи пакета в счетчиках пакета
+    
+    Выполняется в транзакции, которая меняет статус задачи (строка задачи
+    заблокирована), до записи нового статуса. Повторный завершающий статус
+    счетчики не меняет.
+    """
+    if not task.batch_id or task.status in TERMINAL_STATUSES:
+        return
+    
+    from shared.models.download_batch import DownloadBatch
+    
+    deltas = {_BATCH_COUNTER_FIELDS[status]: 1}
+    if task.status == 'processing':
+        deltas['processing_count'] = -1
+    await session.execute(DownloadBatch.counters_update(task.batch_id, **deltas))
+
+async def _update_batch_counters(batch_id: int, **deltas: int):
+    """Атомарное изменение счетчиков задач пакета (см. DownloadBatch.counters_update)"""
+    try:
+        async with get_async_session() as session:
+            from shared.models.download_batch import DownloadBatch
+            
+            await session.execute(DownloadBatch.counters_update(batch_id, **deltas))
+            await session.commit()
+            
+    except Exception as e:
+        logger.error(f"Failed to update batch counters: {e}", batch_id=batch_id)
+
 async def _update_batch_completion(
     batch_id: int,
     archive_url: str = None,
@@ -668,6 +1326,7 @@ async def _update_batch_completion(
                 batch.archive_url = archive_url
                 batch.completed_count = completed_count
                 batch.failed_count = failed_count
+                batch.processing_count = 0
                 batch.completed_at = datetime.utcnow()
                 
                 if completed_count > 0:
@@ -5,7 +5,10 @@ VideoBot Pro - Utils Package
 
 from .file_manager import FileManager, FileManagerError
 from .progress_tracker import ProgressTracker, ProgressTrackerError
+from .ffmpeg_progress import FFmpegProgressParser
 from .quality_selector import QualitySelector, QualitySelectorError
+from .download_cache import DownloadCache, DownloadCacheError, download_cache
+from .single_flight import SingleFlight, FlightLease, single_flight
 
 __all__ = [
     # File Manager
@@ -15,10 +18,21 @@ __all__ = [
     # Progress Tracker
     'ProgressTracker', 
     'ProgressTrackerError',
+    'FFmpegProgressParser',
     
     # Quality Selector
     'QualitySelector',
     'QualitySelectorError',
+    
+    # Download Cache
+    'DownloadCache',
+    'DownloadCacheError',
+    'download_cache',
+    
+    # Single Flight
+    'SingleFlight',
+    'FlightLease',
+    'single_flight',
 ]
 
 # Версия пакета utils
@@ -32,7 +46,10 @@ def get_utils_info():
         'modules': [
             'file_manager',
             'progress_tracker', 
-            'quality_selector'
+            'ffmpeg_progress',
+            'quality_selector',
+            'download_cache',
+            'single_flight'
         ],
         'description': 'VideoBot Pro Worker Utilities'
     }
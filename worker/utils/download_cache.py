@@ -0,0 +1,212 @@
+"""
+VideoBot Pro - Download Cache
+Контентно-адресуемый кэш загрузок: повторный запрос того же видео
+получает уже загруженный в CDN объект вместо нового скачивания
+"""
+
+import hashlib
+import structlog
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from shared.services.redis import get_redis_client
+
+logger = structlog.get_logger(__name__)
+
+# Новая ссылка на запись кэша
+_ACQUIRE_REF_SCRIPT = """
+return redis.call('HINCRBY', KEYS[1], 'refs', 1)
+"""
+
+# Освобождение ссылки без ухода счетчика ниже нуля; -1 - записи уже нет
+_RELEASE_REF_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local refs = redis.call('HINCRBY', KEYS[1], 'refs', -1)
+if refs < 0 then
+    redis.call('HSET', KEYS[1], 'refs', 0)
+    return 0
+end
+return refs
+"""
+
+class DownloadCacheError(Exception):
+    """Ошибки кэша загрузок"""
+    pass
+
+class DownloadCache:
+    """
+    Индекс (platform, video_id, quality, audio_only) -> объект в CDN
+
+    Запись хранится в Redis-хеше со счетчиком ссылок. Запись отдается только
+    до expires_at - срока жизни ссылки, выданной StorageManager, поэтому кэш
+    никогда не отдает просроченный URL. Ключи в Redis живут дольше на
+    REFERENCE_GRACE, и каждое попадание продлевает их: ссылки задач
+    освобождаются очисткой уже после истечения, и до этого счетчик должен
+    оставаться видимым. Пока счетчик больше нуля, очистка хранилища не
+    удаляет объект.
+    """
+
+    KEY_PREFIX = "download_cache"
+
+    # Запас времени жизни ключей сверх срока ссылки (секунды)
+    REFERENCE_GRACE = 24 * 3600
+
+    def make_key(self, platform: str, video_id: str, quality: str, audio_only: bool) -> str:
+        """Построение ключа кэша"""
+        quality = (quality or "best").lower()
+        return f"{self.KEY_PREFIX}:{platform}:{video_id}:{quality}:{int(bool(audio_only))}"
+
+    async def lookup(self, cache_key: str, min_ttl: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Поиск объекта в кэше
+
+        При попадании счетчик ссылок увеличивается - вызывающая задача
+        становится владельцем ссылки и должна освободить ее через release_url,
+        в том числе если не смогла ее использовать.
+
+        Args:
+            cache_key: Ключ из make_key
+            min_ttl: Минимальный оставшийся срок ссылки в секундах; запись,
+                которая истекает раньше, не отдается
+
+        Returns:
+            Запись кэша или None
+        """
+        try:
+            redis_client = await get_redis_client()
+            entry = await redis_client.hash_get(cache_key, "entry")
+            if not entry:
+                return None
+
+            expires_at = datetime.fromisoformat(entry["expires_at"])
+            if expires_at <= datetime.utcnow() + timedelta(seconds=max(min_ttl, 0)):
+                return None
+
+            entry["refs"] = await redis_client.eval_script(_ACQUIRE_REF_SCRIPT, [cache_key], [])
+            if entry["refs"] is None:
+                return None
+
+            # Новая ссылка держит объект до своего освобождения очисткой
+            ttl = int((expires_at - datetime.utcnow()).total_seconds()) + self.REFERENCE_GRACE
+            await self._expire_keys(redis_client, cache_key, entry, ttl)
+
+            logger.info("Download cache hit", cache_key=cache_key, refs=entry["refs"])
+            return entry
+
+        except Exception as e:
+            logger.warning(f"Download cache lookup failed: {e}", cache_key=cache_key)
+            return None
+
+    async def store(
+        self,
+        cache_key: str,
+        cdn_result: Dict[str, Any],
+        expires_in: int,
+        extra: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Сохранение загруженного объекта в кэш
+
+        Args:
+            cache_key: Ключ из make_key
+            cdn_result: Результат загрузки в CDN
+            expires_in: Срок жизни ссылки в секундах
+            extra: Дополнительные поля записи (thumbnail_url, video_info, ...)
+
+        Returns:
+            True если запись создана
+        """
+        if not cdn_result.get("cdn_url") or expires_in <= 0:
+            return False
+
+        try:
+            redis_client = await get_redis_client()
+
+            entry = {
+                "cdn_url": cdn_result.get("cdn_url"),
+                "direct_url": cdn_result.get("direct_url"),
+                "file_key": cdn_result.get("file_key"),
+                "file_size": cdn_result.get("file_size", 0),
+                "storage_type": cdn_result.get("storage_type"),
+                "created_at": datetime.utcnow().isoformat(),
+                "expires_at": (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat(),
+            }
+            if extra:
+                entry.update(extra)
+
+            await redis_client.delete(cache_key)
+            await redis_client.hash_set(cache_key, "entry", entry)
+            await redis_client.hash_set(cache_key, "refs", 1)
+
+            # Обратные индексы для освобождения ссылок и проверки при очистке
+            await redis_client.set(self._url_key(entry["cdn_url"]), cache_key)
+            if entry["file_key"]:
+                await redis_client.set(self._file_key(entry["file_key"]), cache_key)
+
+            await self._expire_keys(redis_client, cache_key, entry, expires_in + self.REFERENCE_GRACE)
+
+            logger.info("Download cached", cache_key=cache_key, expires_in=expires_in)
+            return True
+
+        except Exception as e:
+            logger.warning(f"Download cache store failed: {e}", cache_key=cache_key)
+            return False
+
+    async def release_url(self, cdn_url: str) -> Optional[int]:
+        """
+        Освобождение ссылки задачи на объект
+
+        Args:
+            cdn_url: URL, выданный задаче
+
+        Returns:
+            Оставшееся количество ссылок или None если объект не в кэше
+        """
+        try:
+            redis_client = await get_redis_client()
+            cache_key = await redis_client.get(self._url_key(cdn_url))
+            if not cache_key:
+                return None
+
+            refs = await redis_client.eval_script(_RELEASE_REF_SCRIPT, [cache_key], [])
+            if refs is None or refs < 0:
+                return None
+            return refs
+
+        except Exception as e:
+            logger.warning(f"Download cache release failed: {e}")
+            return None
+
+    async def is_file_referenced(self, file_key: str) -> bool:
+        """Проверка, ссылаются ли еще задачи на объект хранилища"""
+        try:
+            redis_client = await get_redis_client()
+            cache_key = await redis_client.get(self._file_key(file_key))
+            if not cache_key:
+                return False
+
+            refs = await redis_client.hash_get(cache_key, "refs", 0)
+            return int(refs or 0) > 0
+
+        except Exception as e:
+            # При недоступном Redis лучше не удалять файл
+            logger.warning(f"Download cache reference check failed: {e}", file_key=file_key)
+            return True
+
+    async def _expire_keys(self, redis_client, cache_key: str, entry: Dict[str, Any], ttl: int):
+        """Установка TTL записи и ее обратных индексов"""
+        await redis_client.expire(cache_key, ttl)
+        await redis_client.expire(self._url_key(entry["cdn_url"]), ttl)
+        if entry.get("file_key"):
+            await redis_client.expire(self._file_key(entry["file_key"]), ttl)
+
+    def _url_key(self, cdn_url: str) -> str:
+        return f"{self.KEY_PREFIX}:url:{hashlib.sha1(cdn_url.encode()).hexdigest()}"
+
+    def _file_key(self, file_key: str) -> str:
+        return f"{self.KEY_PREFIX}:file:{file_key}"
+
+# Глобальный экземпляр кэша
+download_cache = DownloadCache()
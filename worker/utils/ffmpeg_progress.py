@@ -0,0 +1,78 @@
+"""
+VideoBot Pro - FFmpeg Progress
+Разбор машиночитаемого прогресса ffmpeg (-progress pipe:1)
+"""
+
+from typing import Dict, Any, Optional
+
+class FFmpegProgressParser:
+    """
+    Разбор потока -progress
+
+    ffmpeg пишет блоки строк key=value; блок завершается строкой
+    progress=continue или progress=end. Парсер хранит только текущий
+    блок и отдает снимок при его завершении.
+    """
+
+    def __init__(self, duration: float = 0):
+        """
+        Args:
+            duration: Длительность входа в секундах (для процента)
+        """
+        self.duration = duration
+        self._block: Dict[str, str] = {}
+        self.last: Optional[Dict[str, Any]] = None
+
+    def feed(self, line: str) -> Optional[Dict[str, Any]]:
+        """
+        Обработка одной строки
+
+        Returns:
+            Снимок прогресса, если строка завершила блок, иначе None
+        """
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+
+        if key != 'progress':
+            self._block[key] = value.strip()
+            return None
+
+        block, self._block = self._block, {}
+        self.last = self._snapshot(block, done=value.strip() == 'end')
+        return self.last
+
+    def _snapshot(self, block: Dict[str, str], done: bool) -> Dict[str, Any]:
+        # out_time_ms исторически содержит микросекунды, как и out_time_us
+        out_time_us = _to_int(block.get('out_time_us', block.get('out_time_ms')))
+        out_time = out_time_us / 1_000_000 if out_time_us and out_time_us > 0 else 0.0
+
+        if done:
+            percent = 100.0
+        elif self.duration > 0:
+            percent = min(99.9, out_time / self.duration * 100)
+        else:
+            percent = None
+
+        speed = block.get('speed', '').rstrip('x')
+        return {
+            'out_time': out_time,
+            'percent': percent,
+            'frame': _to_int(block.get('frame')),
+            'fps': _to_float(block.get('fps')),
+            'speed': _to_float(speed),
+            'total_size': _to_int(block.get('total_size')),
+            'done': done
+        }
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
@@ -40,6 +40,7 @@ class ProgressTracker:
         self._local_storage = {}  # Локальное хранение если нет Redis
         self._callbacks = {}      # Колбэки для обновлений
         self._update_intervals = {}  # Интервалы обновления
+        self._last_updates = {}   # Время последнего обновления для min_interval
         
     def start_task(self, task_id: str, total_steps: int = 100, 
                    task_name: str = None, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -76,6 +77,7 @@ class ProgressTracker:
             
             # Сохраняем информацию
             self._save_task_info(task_id, task_info)
+            self._last_updates.pop(task_id, None)
             
             logger.info(f"Started tracking task: {task_id}", 
                        task_name=task_name, total_steps=total_steps)
@@ -88,7 +90,8 @@ class ProgressTracker:
     
     def update_progress(self, task_id: str, current_step: int = None, 
                        progress: float = None, message: str = None,
-                       metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+                       metadata: Dict[str, Any] = None,
+                       min_interval: float = 0.0) -> Dict[str, Any]:
         """
         Обновление прогресса задачи
         
@@ -98,11 +101,20 @@ class ProgressTracker:
             progress: Прогресс в процентах (0-100)
             message: Сообщение о текущем состоянии
             metadata: Дополнительные метаданные
+            min_interval: Пропускать обновления чаще этого интервала в секундах
+                (для частых источников вроде ffmpeg)
             
         Returns:
-            Обновленная информация о задаче
+            Обновленная информация о задаче (None, если обновление пропущено)
         """
         try:
+            if min_interval > 0:
+                last_update = self._last_updates.get(task_id)
+                now_monotonic = time.monotonic()
+                if last_update is not None and now_monotonic - last_update < min_interval:
+                    return None
+                self._last_updates[task_id] = now_monotonic
+            
             task_info = self._get_task_info(task_id)
             if not task_info:
                 raise ProgressTrackerError(f"Task {task_id} not found")
@@ -197,6 +209,7 @@ class ProgressTracker:
             
             # Сохраняем
             self._save_task_info(task_id, task_info)
+            self._last_updates.pop(task_id, None)
             
             # Вызываем колбэки
             self._trigger_callbacks(task_id, task_info)
@@ -248,6 +261,7 @@ class ProgressTracker:
             
             # Сохраняем
             self._save_task_info(task_id, task_info)
+            self._last_updates.pop(task_id, None)
             
             # Вызываем колбэки
             self._trigger_callbacks(task_id, task_info)
@@ -297,6 +311,7 @@ class ProgressTracker:
             
             # Сохраняем
             self._save_task_info(task_id, task_info)
+            self._last_updates.pop(task_id, None)
             
             # Вызываем колбэки
             self._trigger_callbacks(task_id, task_info)
@@ -656,6 +671,8 @@ class ProgressTracker:
                 if task_id in self._local_storage:
                     del self._local_storage[task_id]
             
+            self._last_updates.pop(task_id, None)
+            
             # Очищаем колбэки
             if task_id in self._callbacks:
                 del self._callbacks[task_id]
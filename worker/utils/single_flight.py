@@ -0,0 +1,189 @@
+"""
+VideoBot Pro - Single Flight
+Координация одинаковых загрузок между worker'ами: работу выполняет
+владелец Redis-аренды, остальные задачи ждут его завершения
+"""
+
+import asyncio
+import json
+import uuid
+import structlog
+from typing import Dict, Any, Optional
+
+from shared.services.redis import get_redis_client
+
+logger = structlog.get_logger(__name__)
+
+# Продление аренды, только если она все еще принадлежит владельцу
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Снятие аренды, только если она все еще принадлежит владельцу
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class FlightLease:
+    """Аренда ключа, удерживаемая задачей-владельцем"""
+
+    def __init__(self, single_flight: 'SingleFlight', key: str, token: str):
+        self.single_flight = single_flight
+        self.key = key
+        self.token = token
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def start_heartbeat(self):
+        """Периодическое продление аренды, пока идет работа"""
+        if not self._heartbeat:
+            self._heartbeat = asyncio.create_task(self._keep_alive())
+
+    async def _keep_alive(self):
+        interval = max(1, self.single_flight.lease_ttl // 3)
+        while True:
+            await asyncio.sleep(interval)
+            renewed = await self.single_flight.renew(self.key, self.token)
+            if renewed is False:
+                logger.warning("Single-flight lease lost", key=self.key)
+                return
+            if renewed is None:
+                # Сбой Redis - аренда, возможно, еще наша, пробуем в следующий раз
+                logger.warning("Single-flight lease renewal failed, retrying", key=self.key)
+
+    async def release(self, result: Dict[str, Any]):
+        """Снятие аренды и уведомление ожидающих задач"""
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+
+        await self.single_flight.release(self.key, self.token, result)
+
+class SingleFlight:
+    """
+    Single-flight на Redis
+
+    Первая задача для ключа получает аренду (SET NX EX) и выполняет работу,
+    продлевая аренду в фоне. Остальные подписываются на канал ключа и ждут
+    сообщения о завершении. Если владелец умер, аренда истекает без
+    сообщения и ожидающие получают None - они могут занять ее сами.
+    """
+
+    LEASE_PREFIX = "single_flight:lease"
+    CHANNEL_PREFIX = "single_flight"
+
+    def __init__(self, lease_ttl: int = 120, wait_timeout: int = 1800, poll_interval: float = 5.0):
+        self.lease_ttl = lease_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    async def acquire(self, key: str) -> Optional[FlightLease]:
+        """
+        Попытка стать владельцем ключа
+
+        Returns:
+            Аренда или None, если ключ уже обрабатывается
+        """
+        try:
+            redis_client = await get_redis_client()
+            token = uuid.uuid4().hex
+            if await redis_client.set_if_not_exists(self._lease_key(key), token, expire=self.lease_ttl):
+                lease = FlightLease(self, key, token)
+                lease.start_heartbeat()
+                return lease
+            return None
+
+        except Exception as e:
+            logger.warning(f"Single-flight acquire failed: {e}", key=key)
+            return None
+
+    async def renew(self, key: str, token: str) -> Optional[bool]:
+        """
+        Продление аренды
+
+        Returns:
+            True - продлена, False - аренда принадлежит другому или истекла,
+            None - ошибка Redis, результат неизвестен
+        """
+        try:
+            redis_client = await get_redis_client()
+            result = await redis_client.eval_script(
+                _RENEW_SCRIPT, [self._lease_key(key)], [token, self.lease_ttl]
+            )
+        except Exception as e:
+            logger.warning(f"Single-flight renew failed: {e}", key=key)
+            return None
+
+        if result is None:
+            return None
+        return bool(result)
+
+    async def release(self, key: str, token: str, result: Dict[str, Any]):
+        try:
+            redis_client = await get_redis_client()
+            await redis_client.eval_script(_RELEASE_SCRIPT, [self._lease_key(key)], [token])
+            await redis_client.publish(self._channel(key), result)
+        except Exception as e:
+            logger.warning(f"Single-flight release failed: {e}", key=key)
+
+    async def wait(self, key: str, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """
+        Ожидание завершения работы владельца
+
+        Args:
+            key: Ключ работы
+            timeout: Таймаут ожидания (по умолчанию - wait_timeout)
+
+        Returns:
+            Результат, опубликованный владельцем, или None если владелец
+            исчез, аренда уже снята или истек таймаут ожидания
+        """
+        redis_client = await get_redis_client()
+        pubsub = await redis_client.create_subscription(self._channel(key))
+        if not pubsub:
+            return None
+
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + (self.wait_timeout if timeout is None else timeout)
+
+            while loop.time() < deadline:
+                # Аренды нет - владелец завершил работу до подписки или умер
+                if not await redis_client.exists(self._lease_key(key)):
+                    return None
+
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=self.poll_interval
+                )
+                if message and message.get('type') == 'message':
+                    try:
+                        return json.loads(message['data'])
+                    except (json.JSONDecodeError, TypeError):
+                        return {'data': message['data']}
+
+            logger.warning("Single-flight wait timed out", key=key)
+            return None
+
+        finally:
+            try:
+                await pubsub.unsubscribe()
+                await pubsub.close()
+            except Exception:
+                pass
+
+    def _lease_key(self, key: str) -> str:
+        return f"{self.LEASE_PREFIX}:{key}"
+
+    def _channel(self, key: str) -> str:
+        return f"{self.CHANNEL_PREFIX}:{key}"
+
+# Глобальный экземпляр координатора
+single_flight = SingleFlight()